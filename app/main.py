@@ -11,6 +11,8 @@ from starlette.middleware.base import BaseHTTPMiddleware
 # 加载环境变量
 load_dotenv()
 
+from .metrics import HTTP_REQUEST_DURATION
+
 # 配置日志
 logging.basicConfig(
     level=logging.DEBUG,
@@ -47,8 +49,14 @@ class DetailedLoggingMiddleware(BaseHTTPMiddleware):
         # 处理请求
         response = await call_next(request)
         
-        # 计算处理时间
+        # 计算处理时间（按路由模板记录延迟，避免路径参数造成标签爆炸）
         process_time = time.time() - start_time
+        route = request.scope.get("route")
+        HTTP_REQUEST_DURATION.labels(
+            method=request.method,
+            route=getattr(route, "path", "unmatched"),
+            status=str(response.status_code)
+        ).observe(process_time)
         
         # 记录响应信息
         logger.info(f"🔴 RESPONSE: {response.status_code} - {process_time:.4f}s")
@@ -82,7 +90,7 @@ class DetailedLoggingMiddleware(BaseHTTPMiddleware):
         return response
 
 # 导入路由
-from .routes import upload, review, export, websocket
+from .routes import upload, review, export, websocket, usage
 from .database import init_db
 
 # 创建FastAPI应用
@@ -111,6 +119,7 @@ app.include_router(upload.router)
 app.include_router(review.router)
 app.include_router(export.router)
 app.include_router(websocket.router)
+app.include_router(usage.router)
 
 # 全局异常处理
 @app.exception_handler(HTTPException)
@@ -121,7 +130,8 @@ async def http_exception_handler(request, exc):
             "error": True,
             "message": exc.detail,
             "status_code": exc.status_code
-        }
+        },
+        headers=getattr(exc, "headers", None)
     )
 
 @app.exception_handler(Exception)
@@ -161,6 +171,12 @@ async def startup_event():
         os.makedirs(directory, exist_ok=True)
         logger.info(f"Directory ensured: {directory}")
     
+    # 嵌入式审查执行器：单进程部署时在Web进程内消费审查队列
+    if os.getenv("REVIEW_EXECUTOR_MODE", "embedded").lower() == "embedded":
+        from .worker import start_embedded_worker
+        start_embedded_worker()
+        logger.info("Embedded review worker started")
+    
     logger.info("ContractShield AI Backend started successfully")
 
 # 关闭事件
@@ -168,7 +184,23 @@ async def startup_event():
 async def shutdown_event():
     """应用关闭时执行"""
     logger.info("Shutting down ContractShield AI Backend...")
-    # 这里可以添加清理逻辑
+    
+    # 停止嵌入式审查执行器，未完成的作业心跳超时后重新入队
+    from .worker import stop_embedded_worker
+    await stop_embedded_worker()
+    
+    # 释放LLM连接池
+    from .services.llm_client import close_llm_client
+    await close_llm_client()
+    
+    # 关闭阻塞I/O线程池和CPU进程池
+    from .services.executors import shutdown_executors
+    shutdown_executors()
+    
+    # 多进程指标模式下清理本进程的live类指标
+    from .metrics import mark_process_dead
+    mark_process_dead()
+    
     logger.info("ContractShield AI Backend shut down successfully")
 
 # 根路径
@@ -184,6 +216,7 @@ async def root():
             "docs": "/docs",
             "redoc": "/redoc",
             "health": "/health",
+            "metrics": "/metrics",
             "api": "/api/v1"
         }
     }
@@ -221,6 +254,15 @@ async def health_check():
             }
         )
 
+# Prometheus指标
+@app.get("/metrics")
+async def metrics():
+    """Prometheus指标端点"""
+    from .metrics import render_metrics
+    
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
+
 # API信息
 @app.get("/api/v1")
 async def api_info():
@@ -232,7 +274,12 @@ async def api_info():
             "draft_roles": "/api/v1/draft_roles",
             "confirm_roles": "/api/v1/confirm_roles",
             "review": "/api/v1/review",
+            "cancel_review": "/api/v1/review/{task_id}/cancel",
+            "review_queue": "/api/v1/review_queue",
             "export": "/api/v1/export/{task_id}",
+            "usage": "/api/v1/usage/tasks/{task_id}",
+            "daily_usage": "/api/v1/usage/daily",
+            "model_stats": "/api/v1/usage/models",
             "websocket": "/ws/review/{task_id}"
         },
         "supported_formats": {
@@ -0,0 +1,203 @@
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CollectorRegistry, Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest, multiprocess
+)
+
+# 多进程部署（uvicorn多worker、独立审查worker）时设置PROMETHEUS_MULTIPROC_DIR，
+# 各进程把指标写入该目录，/metrics汇总所有进程；必须在进程启动前设置，且启动时清空目录
+MULTIPROCESS_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+# LLM调用弹性层指标
+LLM_REQUESTS = Counter(
+    "llm_requests_total",
+    "LLM调用次数（按最终结果）",
+    ["outcome"],
+)
+LLM_RETRIES = Counter(
+    "llm_retries_total",
+    "LLM调用重试次数（按原因）",
+    ["reason"],
+)
+LLM_CIRCUIT_STATE = Gauge(
+    "llm_circuit_breaker_state",
+    "LLM熔断器状态（按模型）：0=closed, 1=half_open, 2=open",
+    ["model"],
+    multiprocess_mode="livemax",
+)
+LLM_CIRCUIT_REJECTIONS = Counter(
+    "llm_circuit_breaker_rejections_total",
+    "熔断器打开时被直接拒绝的调用次数（按模型）",
+    ["model"],
+)
+LLM_RATE_LIMIT_WAIT = Counter(
+    "llm_rate_limit_wait_seconds_total",
+    "客户端限流器累计等待时间（秒）",
+)
+
+# LLM响应缓存指标
+LLM_CACHE_REQUESTS = Counter(
+    "llm_cache_requests_total",
+    "LLM缓存查询次数（按层级和结果）",
+    ["tier", "result"],
+)
+LLM_CACHE_LATENCY_SAVED = Counter(
+    "llm_cache_latency_saved_seconds_total",
+    "缓存命中累计节省的LLM调用时间（秒）",
+)
+
+# LLM用量指标
+LLM_TOKENS = Counter(
+    "llm_tokens_total",
+    "LLM消耗的token数（按模型和类型）",
+    ["model", "type"],
+)
+
+# 单飞去重指标
+SINGLE_FLIGHT_CALLS = Counter(
+    "single_flight_calls_total",
+    "单飞调用次数（leader执行计算，follower复用进行中的结果）",
+    ["operation", "role"],
+)
+
+# 模型路由指标
+LLM_MODEL_FALLBACKS = Counter(
+    "llm_model_fallbacks_total",
+    "模型调用失败后回退到下一个候选模型的次数",
+    ["stage", "model"],
+)
+LLM_MODEL_LATENCY_P95 = Gauge(
+    "llm_model_latency_p95_seconds",
+    "模型滚动窗口内的p95延迟（秒）",
+    ["model"],
+    multiprocess_mode="livemax",
+)
+LLM_CALL_DURATION = Histogram(
+    "llm_call_duration_seconds",
+    "单次LLM调用耗时（秒，按模型和结果，不含缓存命中）",
+    ["model", "outcome"],
+    buckets=(0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 180),
+)
+
+# 实体提取微批处理指标
+NER_BATCH_SIZE = Histogram(
+    "ner_batch_size",
+    "每次实体提取LLM调用合并的文档数",
+    buckets=(1, 2, 4, 8, 16, 32),
+)
+
+# 审查作业队列指标
+REVIEW_QUEUE_DEPTH = Gauge(
+    "review_queue_depth",
+    "排队等待执行的审查作业数（按优先级类别）",
+    ["priority"],
+    multiprocess_mode="livemostrecent",
+)
+REVIEW_JOBS_RUNNING = Gauge(
+    "review_jobs_running",
+    "正在执行的审查作业数（全局）",
+    multiprocess_mode="livemostrecent",
+)
+REVIEW_QUEUE_WAIT = Histogram(
+    "review_queue_wait_seconds",
+    "审查作业从入队到开始执行的等待时间（秒，按优先级类别）",
+    ["priority"],
+    buckets=(0.5, 1, 5, 15, 30, 60, 120, 300, 600, 1800),
+)
+REVIEW_QUEUE_REJECTIONS = Counter(
+    "review_queue_rejections_total",
+    "被拒绝的审查请求数（queue_full: 队列已满，user_quota: 用户排队数超限）",
+    ["reason"],
+)
+REVIEW_JOBS = Counter(
+    "review_jobs_total",
+    "结束的审查作业数（按结果）",
+    ["outcome"],
+)
+
+# 文档级审查结果缓存指标
+REVIEW_RESULT_CACHE_REQUESTS = Counter(
+    "review_result_cache_requests_total",
+    "审查结果缓存查询次数（按结果）",
+    ["result"],
+)
+
+# 审查流水线阶段耗时指标
+REVIEW_STAGE_DURATION = Histogram(
+    "review_stage_duration_seconds",
+    "审查流水线各阶段耗时（秒，检查点跳过的阶段不计；streaming为流式流水线整体耗时）",
+    ["stage"],
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600),
+)
+REVIEW_DURATION = Histogram(
+    "review_duration_seconds",
+    "单次审查从开始执行到完成的耗时（秒，按执行路径）",
+    ["mode"],
+    buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1200, 1800),
+)
+REVIEW_DEADLINE_EXCEEDED = Counter(
+    "review_deadline_exceeded_total",
+    "审查阶段超出截止时间的次数（按阶段）",
+    ["stage"],
+)
+REVIEW_DEGRADED = Counter(
+    "review_degraded_total",
+    "因时间预算不足降级完成的审查数（reduced: 精简LLM分析，rules: 仅规则标记）",
+    ["level"],
+)
+OCR_PAGES = Counter(
+    "ocr_pages_total",
+    "文本提取/OCR处理的页数",
+)
+OCR_PAGES_PER_SECOND = Histogram(
+    "ocr_pages_per_second",
+    "单个文件的文本提取吞吐（页/秒）",
+    buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 25, 50, 100),
+)
+
+# HTTP和WebSocket指标
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "HTTP请求处理耗时（秒，按方法、路由模板和状态码）",
+    ["method", "route", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+WEBSOCKET_CONNECTIONS = Gauge(
+    "websocket_connections_active",
+    "当前打开的WebSocket连接数",
+    multiprocess_mode="livesum",
+)
+
+
+@contextmanager
+def observe_stage(stage: str):
+    """记录一个审查阶段的耗时（阶段失败也记录）"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        REVIEW_STAGE_DURATION.labels(stage=stage).observe(time.perf_counter() - start)
+
+
+def record_ocr_throughput(pages: int, seconds: float):
+    """记录一次文件文本提取的页数和吞吐"""
+    OCR_PAGES.inc(pages)
+    if seconds > 0:
+        OCR_PAGES_PER_SECOND.observe(pages / seconds)
+
+
+def mark_process_dead():
+    """进程退出时清理本进程的live类指标（多进程模式）"""
+    if MULTIPROCESS_DIR:
+        multiprocess.mark_process_dead(os.getpid())
+
+
+def render_metrics():
+    """渲染Prometheus文本格式的指标（多进程模式下汇总所有进程）"""
+    if MULTIPROCESS_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, TIMESTAMP, JSON
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, TIMESTAMP, JSON, Float, Boolean, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from pgvector.sqlalchemy import Vector
@@ -45,6 +45,8 @@ class Task(Base):
     role = Column(String(50))  # buyer, seller, etc.
     entities_data = Column(JSON)  # 存储提取的实体数据
     entities_extracted_at = Column(TIMESTAMP)  # 实体提取时间
+    parent_task_id = Column(Integer, ForeignKey("tasks.id"), nullable=True, index=True)  # 上一版合同的任务，用于增量复审
+    document_id = Column(Integer, ForeignKey("documents.id"), nullable=True, index=True)  # 所属文档，同一文档的多次审查共享文本和段落向量
     
     # 关系（暂时注释掉user关系）
     # user = relationship("User", back_populates="tasks")
@@ -62,6 +64,7 @@ class File(Base):
     filename = Column(String(255))
     path = Column(String(500))
     file_type = Column(String(10))  # pdf, docx, etc.
+    content_hash = Column(String(64), index=True)  # 文件内容sha256，用于复用相同文件的OCR和实体结果
     ocr_text = Column(Text)
     created_at = Column(TIMESTAMP, server_default=func.now())
     
@@ -124,4 +127,90 @@ class Statute(Base):
     created_at = Column(TIMESTAMP, server_default=func.now())
     
     # 关系
-    risk = relationship("Risk", back_populates="statutes")
\ No newline at end of file
+    risk = relationship("Risk", back_populates="statutes")
+class LLMCacheEntry(Base):
+    """LLM响应缓存表"""
+    __tablename__ = "llm_cache"
+    
+    cache_key = Column(String(64), primary_key=True)  # sha256(model, messages, temperature)
+    model = Column(String(100))
+    response = Column(Text)  # 完整的补全文本
+    latency_ms = Column(Float)  # 原始调用耗时，用于统计节省的延迟
+    created_at = Column(TIMESTAMP, server_default=func.now())
+    expires_at = Column(TIMESTAMP, index=True)
+
+class LLMCall(Base):
+    """LLM调用记录表（用于成本核算和容量规划）"""
+    __tablename__ = "llm_calls"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    task_id = Column(Integer, ForeignKey("tasks.id"), nullable=True, index=True)
+    stage = Column(String(50))  # ner, risk_analysis 等
+    model = Column(String(100))
+    prompt_tokens = Column(Integer, default=0)
+    completion_tokens = Column(Integer, default=0)
+    cost = Column(Float)  # 上游返回的费用（美元），未返回时为NULL
+    latency_ms = Column(Float)
+    retries = Column(Integer, default=0)
+    cache_hit = Column(Boolean, default=False)
+    success = Column(Boolean, default=True)
+    error = Column(Text)
+    created_at = Column(TIMESTAMP, server_default=func.now(), index=True)
+
+class ReviewJob(Base):
+    """审查作业队列表（worker从中领取审查作业）"""
+    __tablename__ = "review_jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    task_id = Column(Integer, ForeignKey("tasks.id"), nullable=False, index=True)
+    user_id = Column(Integer, nullable=True, index=True)  # 入队时从任务复制，用于按用户公平调度
+    priority = Column(String(20), default="interactive")  # interactive, bulk
+    use_cache = Column(Boolean, default=True)  # False时审查跳过LLM响应缓存和审查结果缓存
+    status = Column(String(20), default="QUEUED", index=True)  # QUEUED, RUNNING, DONE, FAILED, CANCELLED
+    attempts = Column(Integer, default=0)
+    worker_id = Column(String(100))  # 领取作业的worker标识（主机:进程号）
+    error = Column(Text)
+    enqueued_at = Column(TIMESTAMP, index=True)
+    started_at = Column(TIMESTAMP)
+    heartbeat_at = Column(TIMESTAMP)  # 运行中作业的心跳，超时后重新入队
+    cancel_requested_at = Column(TIMESTAMP)  # 运行中作业的取消请求，执行它的worker轮询到后中止
+    finished_at = Column(TIMESTAMP)
+
+class ReviewCheckpoint(Base):
+    """审查流水线阶段检查点（重试或恢复时跳过已完成的阶段）"""
+    __tablename__ = "review_checkpoints"
+    __table_args__ = (UniqueConstraint("task_id", "stage", name="uq_review_checkpoints_task_stage"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    task_id = Column(Integer, ForeignKey("tasks.id"), nullable=False, index=True)
+    stage = Column(String(50), nullable=False)  # ocr, segmentation, vectorize, analysis
+    input_hash = Column(String(64))  # 阶段输入的sha256，输入变化时检查点失效
+    output = Column(JSON)  # 阶段产出摘要，如段落数、风险数
+    completed_at = Column(TIMESTAMP)
+
+class Document(Base):
+    """文档表（按文件内容去重，同一文档的不同角色/合同类型审查共享文本、段落和向量）"""
+    __tablename__ = "documents"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    content_hash = Column(String(64), unique=True, index=True, nullable=False)  # 文件内容sha256
+    ocr_text = Column(Text)
+    paragraphs_hash = Column(String(64))  # 段落切分结果的哈希
+    paragraphs_task_id = Column(Integer, ForeignKey("tasks.id", use_alter=True, ondelete="SET NULL"), nullable=True)  # 持有共享段落和向量的任务
+    paragraph_count = Column(Integer)
+    created_at = Column(TIMESTAMP, server_default=func.now())
+    vectorized_at = Column(TIMESTAMP)
+
+class ReviewResultCacheEntry(Base):
+    """审查结果缓存表（文档哈希、角色、合同类型、提示词版本相同的审查直接复用风险结果）"""
+    __tablename__ = "review_result_cache"
+    
+    cache_key = Column(String(64), primary_key=True)  # sha256(content_hash, role, contract_type, prompt_version, analysis_mode)
+    content_hash = Column(String(64), index=True)
+    role = Column(String(50))
+    contract_type = Column(String(100))
+    prompt_version = Column(String(50))
+    analysis_mode = Column(String(20))
+    risks = Column(JSON)  # 风险列表，段落引用存为段落序号（paragraph_index）
+    source_task_id = Column(Integer)  # 产生该结果的任务
+    created_at = Column(TIMESTAMP, server_default=func.now())
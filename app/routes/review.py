@@ -1,4 +1,5 @@
-from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
+from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import Response
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
@@ -6,6 +7,8 @@ import logging
 
 from ..database import get_db
 from ..services.review_service import review_service
+from ..services.executors import run_blocking
+from ..services.review_queue import get_review_queue, QueueFullError, UserQuotaExceededError, PRIORITY_CLASSES
 
 logger = logging.getLogger(__name__)
 
@@ -14,6 +17,7 @@ router = APIRouter(prefix="/api/v1", tags=["review"])
 # Pydantic模型
 class DraftRolesRequest(BaseModel):
     task_id: int
+    use_cache: bool = True  # False时重新提取实体不读取LLM响应缓存
 
 class ConfirmRolesRequest(BaseModel):
     task_id: int
@@ -28,6 +32,9 @@ class ManualPartyNamesRequest(BaseModel):
 
 class ReviewRequest(BaseModel):
     task_id: int
+    priority: str = "interactive"  # interactive: 在线等待结果，bulk: 批量提交
+    base_task_id: Optional[int] = None  # 上一版合同的任务ID，提供时只分析相对上一版改动的条款；不提供时沿用上传时的关联，传null清除
+    use_cache: bool = True  # False时不读取LLM响应缓存和审查结果缓存，重新调用模型
 
 @router.post("/draft_roles")
 async def get_draft_roles(
@@ -45,7 +52,7 @@ async def get_draft_roles(
         角色候选列表
     """
     try:
-        result = review_service.get_draft_roles(request.task_id)
+        result = await review_service.get_draft_roles_async(request.task_id, use_cache=request.use_cache)
         
         logger.info(f"Draft roles generated for task {request.task_id}")
         return result
@@ -210,19 +217,17 @@ async def set_manual_party_names(
 @router.post("/review")
 async def start_review(
     request: ReviewRequest,
-    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db)
 ):
     """
-    开始合同审查
+    开始合同审查（加入审查队列，由worker执行）
     
     Args:
         request: 审查请求
-        background_tasks: 后台任务
         db: 数据库会话
     
     Returns:
-        审查启动确认
+        入队确认及排队位置；队列已满时返回503、用户排队数超限时返回429，均带Retry-After
     """
     try:
         from ..models import Task
@@ -235,7 +240,7 @@ async def start_review(
                 detail=f"任务 {request.task_id} 不存在"
             )
         
-        if task.status not in ["READY", "PENDING"]:
+        if task.status not in ["READY", "PENDING", "FAILED", "CANCELLED"]:
             raise HTTPException(
                 status_code=400,
                 detail=f"任务状态不允许开始审查。当前状态: {task.status}"
@@ -247,18 +252,55 @@ async def start_review(
                 detail="请先确认角色信息"
             )
         
-        # 启动后台审查任务
-        background_tasks.add_task(
-            review_service.start_review,
-            request.task_id
-        )
+        if request.priority not in PRIORITY_CLASSES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"无效的优先级。支持的优先级: {', '.join(PRIORITY_CLASSES)}"
+            )
+        
+        # 上一版任务只能是同一用户的任务；未提供base_task_id时沿用上传时previous_task_id建立的关联，
+        # 显式传null时清除关联，按全量审查
+        if request.base_task_id is not None:
+            base_exists = db.query(Task.id).filter(
+                Task.id == request.base_task_id, Task.user_id == task.user_id
+            ).first()
+            if request.base_task_id == task.id or not base_exists:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"上一版任务 {request.base_task_id} 不存在"
+                )
+        if "base_task_id" in request.model_fields_set and task.parent_task_id != request.base_task_id:
+            task.parent_task_id = request.base_task_id
+            db.commit()
+        
+        # 加入持久化审查队列（失败任务重试时从检查点恢复，跳过已完成阶段）
+        try:
+            job = await run_blocking(get_review_queue().enqueue, request.task_id, priority=request.priority,
+                                     use_cache=request.use_cache)
+        except UserQuotaExceededError as e:
+            logger.warning(f"User {e.user_id} review quota exceeded, rejecting task {request.task_id}: {e}")
+            raise HTTPException(
+                status_code=429,
+                detail=f"您已有{e.queued}个审查任务排队中，请{e.retry_after}秒后重试",
+                headers={"Retry-After": str(e.retry_after)}
+            )
+        except QueueFullError as e:
+            logger.warning(f"Review queue full, rejecting task {request.task_id}: {e}")
+            raise HTTPException(
+                status_code=503,
+                detail=f"审查队列已满（{e.depth}个任务排队中），请{e.retry_after}秒后重试",
+                headers={"Retry-After": str(e.retry_after)}
+            )
         
-        logger.info(f"Review started for task {request.task_id}")
+        logger.info(f"Review queued for task {request.task_id}: {job}")
         
         return {
             "task_id": request.task_id,
-            "status": "IN_PROGRESS",
-            "message": "审查已开始，请通过WebSocket监听进度"
+            "job_id": job["job_id"],
+            "status": job["status"],
+            "priority": job["priority"],
+            "queue_position": job["position"],
+            "message": "审查已加入队列，请通过WebSocket监听进度"
         }
         
     except HTTPException:
@@ -270,6 +312,73 @@ async def start_review(
             detail=f"启动审查失败: {str(e)}"
         )
 
+@router.post("/review/{task_id}/cancel")
+async def cancel_review(
+    task_id: int,
+    db: Session = Depends(get_db)
+):
+    """
+    取消合同审查
+    
+    排队中的审查立即取消；运行中的审查由worker在下一个页、块或LLM调用之间中止，
+    进行中的LLM请求和进程池计算随之终止。任务最终状态为CANCELLED，已识别的风险保留
+    
+    Args:
+        task_id: 任务ID
+        db: 数据库会话
+    
+    Returns:
+        取消结果（CANCELLED: 已取消，CANCELLING: 正在中止）；没有进行中的审查时返回409
+    """
+    try:
+        from ..models import Task
+        
+        task = db.query(Task).filter(Task.id == task_id).first()
+        if not task:
+            raise HTTPException(
+                status_code=404,
+                detail=f"任务 {task_id} 不存在"
+            )
+        
+        result = await review_service.cancel_review(task_id)
+        if result is None:
+            raise HTTPException(
+                status_code=409,
+                detail=f"任务没有进行中的审查。当前状态: {task.status}"
+            )
+        
+        logger.info(f"Review cancel requested for task {task_id}: {result['status']}")
+        return {
+            **result,
+            "message": "审查已取消" if result["status"] == "CANCELLED" else "正在取消审查，请通过WebSocket监听结果"
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error cancelling review: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"取消审查失败: {str(e)}"
+        )
+
+@router.get("/review_queue")
+async def get_review_queue_stats():
+    """
+    获取审查队列状态
+    
+    Returns:
+        队列深度、运行中作业数、最长等待时间和等待时间分位数（总体及按优先级类别）
+    """
+    try:
+        return await run_blocking(get_review_queue().stats)
+    except Exception as e:
+        logger.error(f"Error getting review queue stats: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"获取审查队列状态失败: {str(e)}"
+        )
+
 @router.get("/review/{task_id}")
 async def get_review_result(
     task_id: int,
@@ -283,9 +392,14 @@ async def get_review_result(
         db: 数据库会话
     
     Returns:
-        审查结果
+        审查结果（已完成的任务直接返回完成时物化的JSON）
     """
     try:
+        content = review_service.load_review_result_json(db, task_id)
+        if content is not None:
+            logger.info(f"Materialized review result served for task {task_id}")
+            return Response(content=content, media_type="application/json")
+        
         result = review_service.get_review_result(task_id)
         
         logger.info(f"Review result retrieved for task {task_id}")
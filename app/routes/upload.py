@@ -1,9 +1,16 @@
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends
 from sqlalchemy.orm import Session
+from typing import Optional
 import logging
+import time
 
 from ..database import get_db
-from ..services.file_service import get_file_service
+from ..metrics import record_ocr_throughput
+from ..services.file_service import get_file_service, extract_text, count_pages
+from ..services.executors import run_cpu_bound
+from ..services.llm_usage import llm_call_scope
+from ..services.single_flight import get_single_flight, flight_key
+from ..services.document_service import get_document_service
 
 logger = logging.getLogger(__name__)
 
@@ -13,6 +20,7 @@ router = APIRouter(prefix="/api/v1", tags=["upload"])
 async def upload_contract(
     file: UploadFile = File(...),
     contract_type: str = Form(default="其他"),
+    previous_task_id: Optional[int] = Form(default=None),
     db: Session = Depends(get_db)
 ):
     """
@@ -21,6 +29,7 @@ async def upload_contract(
     Args:
         file: 上传的文件
         contract_type: 合同类型
+        previous_task_id: 上一版合同的任务ID（修订稿复审时只分析改动条款）
         db: 数据库会话
     
     Returns:
@@ -51,10 +60,24 @@ async def upload_contract(
                 detail="文件大小超过50MB限制"
             )
         
-        # 保存文件并创建任务（暂时不传入user_id，为后续账号体系预留）
+        # 上传用户（账号体系上线前为None，为后续账号体系预留）
+        user_id = None
+        
+        # 上一版任务只能是同一用户的任务，否则增量复审会复用其他用户的段落和风险
+        if previous_task_id is not None:
+            from ..models import Task
+            if not db.query(Task.id).filter(Task.id == previous_task_id, Task.user_id == user_id).first():
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"上一版任务 {previous_task_id} 不存在"
+                )
+        
+        # 保存文件并创建任务
         task_id = await get_file_service().save_and_enqueue(
             file=file,
-            contract_type=contract_type
+            contract_type=contract_type,
+            user_id=user_id,
+            parent_task_id=previous_task_id
         )
         
         # 自动进行文本提取和实体提取
@@ -71,14 +94,45 @@ async def upload_contract(
                     task.status = "EXTRACTING"
                     db.commit()
                 
-                # OCR文本提取
-                ocr_text = get_file_service().extract_text_from_file(file_record.path)
-                get_file_service().update_file_ocr_text(task_id, ocr_text)
+                # OCR文本提取（进程池执行；相同内容的并发/重复上传只提取一次）
+                file_service = get_file_service()
+                content_hash = file_record.content_hash
+                single_flight = get_single_flight()
+                
+                async def extract():
+                    start = time.perf_counter()
+                    text = await run_cpu_bound(extract_text, file_record.path)
+                    elapsed = time.perf_counter() - start
+                    record_ocr_throughput(await run_cpu_bound(count_pages, file_record.path), elapsed)
+                    return text
+                
+                ocr_text = await single_flight.run(
+                    flight_key("ocr", content_hash or f"task:{task_id}"),
+                    extract,
+                    lookup=lambda: file_service.find_ocr_text_by_hash(content_hash, exclude_task_id=task_id)
+                )
+                file_service.update_file_ocr_text(task_id, ocr_text)
+                # 关联到同内容文件共用的文档，后续审查可复用其段落向量和审查结果
+                get_document_service().ensure_task_document(task_id)
                 logger.info(f"Text extracted for task {task_id}")
                 
                 # 实体提取
                 if ocr_text and len(ocr_text.strip()) > 50:  # 确保有足够的文本内容
-                    entities = get_ai_service().extract_entities_ner(ocr_text)
+                    async def save_preview(preview_entities):
+                        # 首块结果先写入任务，轮询状态时可提前看到部分实体
+                        task.entities_data = preview_entities
+                        db.commit()
+                        logger.info(f"Preview entities saved for task {task_id}")
+
+                    async def extract_entities():
+                        with llm_call_scope(task_id, "ner"):
+                            return await get_ai_service().extract_entities_ner_async(ocr_text, on_preview=save_preview)
+                    
+                    entities = await single_flight.run(
+                        flight_key("ner", content_hash or f"task:{task_id}"),
+                        extract_entities,
+                        lookup=lambda: file_service.find_entities_by_hash(content_hash, exclude_task_id=task_id)
+                    )
                     
                     # 保存实体数据到任务表
                     task.entities_data = entities
@@ -108,6 +162,7 @@ async def upload_contract(
             "message": "文件上传成功，文本提取完成",
             "filename": file.filename,
             "contract_type": contract_type,
+            "previous_task_id": previous_task_id,
             "next_step": "请调用 /api/v1/draft_roles 获取角色识别结果"
         }
         
@@ -0,0 +1,53 @@
+from fastapi import APIRouter, HTTPException, Query
+import logging
+
+from ..services.llm_usage import get_task_usage, get_daily_usage
+from ..services.model_router import get_model_router
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/api/v1", tags=["usage"])
+
+@router.get("/usage/tasks/{task_id}")
+async def task_usage(task_id: int):
+    """
+    获取任务的LLM用量
+    
+    Args:
+        task_id: 任务ID
+    
+    Returns:
+        token、费用、延迟合计及按阶段拆分
+    """
+    try:
+        return get_task_usage(task_id)
+    except Exception as e:
+        logger.error(f"Failed to get LLM usage for task {task_id}: {e}")
+        raise HTTPException(status_code=500, detail=f"获取用量失败: {str(e)}")
+
+@router.get("/usage/daily")
+async def daily_usage(days: int = Query(default=30, ge=1, le=365)):
+    """
+    获取每日LLM用量
+    
+    Args:
+        days: 统计最近天数
+    
+    Returns:
+        按天汇总的用量列表
+    """
+    try:
+        return {"days": days, "usage": get_daily_usage(days)}
+    except Exception as e:
+        logger.error(f"Failed to get daily LLM usage: {e}")
+        raise HTTPException(status_code=500, detail=f"获取用量失败: {str(e)}")
+
+@router.get("/usage/models")
+async def model_stats():
+    """
+    获取模型路由表及各模型滚动延迟统计
+    
+    Returns:
+        各阶段的模型顺序、延迟预算，以及各模型的p50/p95延迟和错误率
+    """
+    return get_model_router().snapshot()
@@ -57,13 +57,16 @@ async def review_websocket(
                     elif message_type in ["status_request", "get_status"]:
                         # 客户端请求当前状态
                         await _send_current_status(websocket, task_id)
+                    elif message_type == "cancel":
+                        # 客户端请求取消审查
+                        await _cancel_review(websocket, task_id)
                     else:
                         logger.warning(f"Unknown message type: {message_type}")
                         # 发送错误响应给客户端
                         await websocket.send_text(json.dumps({
                             "type": "error",
                             "message": f"未知的消息类型: {message_type}",
-                            "supported_types": ["ping", "heartbeat", "get_status", "status_request"]
+                            "supported_types": ["ping", "heartbeat", "get_status", "status_request", "cancel"]
                         }))
                         
                 except json.JSONDecodeError:
@@ -124,6 +127,32 @@ async def _send_current_status(websocket: WebSocket, task_id: int):
             "message": "获取状态失败"
         }))
 
+async def _cancel_review(websocket: WebSocket, task_id: int):
+    """
+    取消任务的审查并回复取消结果（最终的cancelled进度消息在审查中止后推送）
+    
+    Args:
+        websocket: WebSocket连接
+        task_id: 任务ID
+    """
+    try:
+        from ..services.review_service import review_service
+        
+        result = await review_service.cancel_review(task_id)
+        if result is None:
+            await websocket.send_text(json.dumps({
+                "type": "error",
+                "message": f"任务 {task_id} 没有进行中的审查"
+            }))
+        else:
+            await websocket.send_text(json.dumps({"type": "cancel_ack", **result}))
+    except Exception as e:
+        logger.error(f"Error cancelling review for task {task_id}: {e}")
+        await websocket.send_text(json.dumps({
+            "type": "error",
+            "message": "取消审查失败"
+        }))
+
 @router.websocket("/ws/health")
 async def health_websocket(websocket: WebSocket):
     """
@@ -1,16 +1,53 @@
+import asyncio
+import contextvars
 import os
-import requests
-from typing import List, Dict, Any
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, Union
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 import logging
 import json
+from collections import defaultdict
 
 from ..models import Paragraph, Risk, Statute
 from ..database import SessionLocal
+from .retrieval_service import get_retrieval_service, reciprocal_rank_fusion
+from .llm_client import get_llm_client
+from .llm_resilience import get_llm_resilience
+from .llm_cache import get_llm_cache, make_cache_key
+from .llm_usage import record_llm_call
+from .model_router import get_model_router
+from .entity_extractor import get_entity_extractor, chunk_text, merge_entities
+from .ner_batcher import EntityBatcher
+from .executors import run_blocking, run_cpu_bound
+from .risk_analysis import (
+    chunk_paragraphs, ParagraphChunker, IncrementalRiskParser, RiskMerger, RISK_CATEGORIES,
+    select_chunks_by_keywords, rule_based_risks
+)
+from .clause_diff import diff_paragraphs, carry_over_risks
 
 logger = logging.getLogger(__name__)
 
+
+def hash_embedding(text: str) -> List[float]:
+    """简化版向量化：使用文本的hash值生成固定长度向量（模拟OpenAI embedding维度）"""
+    import hashlib
+    text_hash = hashlib.md5(text.encode()).hexdigest()
+    vector = []
+    for i in range(0, len(text_hash), 2):
+        vector.append(int(text_hash[i:i+2], 16) / 255.0)
+    # 补齐到1536维
+    while len(vector) < 1536:
+        vector.extend(vector[:min(len(vector), 1536-len(vector))])
+    return vector[:1536]
+
+
+def embed_texts(texts: List[str]) -> List[List[float]]:
+    """批量计算向量（模块级函数，供进程池调用）"""
+    return [hash_embedding(text) for text in texts]
+
+
 class AIService:
     """AI服务，处理OpenRouter API调用和向量检索"""
     
@@ -18,51 +55,208 @@ class AIService:
         self.api_key = os.getenv("OPENROUTER_API_KEY")
         if not self.api_key:
             raise ValueError("OPENROUTER_API_KEY environment variable is required")
-        self.base_url = "https://openrouter.ai/api/v1/chat/completions"
+        self.llm_client = get_llm_client(self.api_key)
+        self.resilience = get_llm_resilience()
+        self.cache = get_llm_cache()
+        self.base_url = self.llm_client.chat_url
         self.embedding_model = "text-embedding-ada-002"  # 保留用于向量化
-        self.chat_model = "qwen/qwen3-235b-a22b:free"
+        # 按阶段路由模型（实体提取优先用小模型），chat_model为未配置阶段的默认模型
+        self.model_router = get_model_router()
+        self.chat_model = self.model_router.default_model
+        # 首轮本地实体提取（规则+词典），置信度不足时才调用LLM
+        self.entity_extractor = get_entity_extractor()
+        self.local_ner_enabled = os.getenv("ENTITY_LOCAL_NER_ENABLED", "true").lower() == "true"
+        self.local_ner_threshold = float(os.getenv("ENTITY_LOCAL_CONFIDENCE_THRESHOLD", "0.8"))
+        # 全文分块实体提取
+        self.entity_chunk_chars = int(os.getenv("ENTITY_CHUNK_CHARS", "3000"))
+        self.entity_chunk_overlap = int(os.getenv("ENTITY_CHUNK_OVERLAP", "200"))
+        self.entity_chunk_concurrency = int(os.getenv("ENTITY_CHUNK_CONCURRENCY", "4"))
+        # 实体提取微批处理：突发上传时合并多个文档为一次LLM调用
+        self.ner_batching = os.getenv("NER_BATCHING_ENABLED", "false").lower() == "true"
+        self.entity_batcher = EntityBatcher(
+            lambda messages, use_cache: self._acall_openrouter_api(
+                messages, temperature=0.1, use_cache=use_cache, stage="ner"
+            ),
+            self._build_entity_messages
+        )
+        # 风险分析模式：single（单次调用，仅分析开头部分）、map_reduce（分块并发分析全文）
+        # 或 category（按关注领域检索相关条款后分类别并发分析）
+        self.analysis_mode = os.getenv("RISK_ANALYSIS_MODE", "map_reduce")
+        self.analysis_concurrency = int(os.getenv("RISK_ANALYSIS_CONCURRENCY", "4"))
+        self.chunk_chars = int(os.getenv("RISK_CHUNK_CHARS", "3500"))
+        self.category_top_k = int(os.getenv("RISK_CATEGORY_TOP_K", "6"))
+        # 流式输出：风险对象一闭合即入库推送
+        self.streaming = os.getenv("LLM_STREAMING", "true").lower() == "true"
+        # 增量复审：相似度不低于阈值的段落视为修改；改动比例超过上限时退回全量分析
+        self.incremental_similarity = float(os.getenv("REVIEW_INCREMENTAL_SIMILARITY", "0.6"))
+        self.incremental_max_change_ratio = float(os.getenv("REVIEW_INCREMENTAL_MAX_CHANGE_RATIO", "0.5"))
+        # 降级分析最多分析的块数
+        self.degraded_max_chunks = int(os.getenv("REVIEW_DEGRADED_MAX_CHUNKS", "3"))
     
-    def _call_openrouter_api(self, messages: List[Dict], temperature: float = 0.1) -> str:
-        """调用OpenRouter API"""
-        try:
-            response = requests.post(
-                url=self.base_url,
-                headers={
-                    "Authorization": f"Bearer {self.api_key}",
-                    "Content-Type": "application/json",
-                },
-                data=json.dumps({
-                    "model": self.chat_model,
-                    "messages": messages,
-                    "temperature": temperature
-                })
-            )
+    def _get_cached_response(self, cache_key: str, model: str, use_cache: bool) -> Optional[str]:
+        """查询响应缓存，命中时记录一次缓存调用"""
+        if not use_cache:
+            return None
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            logger.info("💾 LLM cache hit")
+            record_llm_call(model, cache_hit=True)
+        return cached
+    
+    def _finish_call(self, cache_key: str, model: str, content: str, usage: Optional[Dict],
+                     start_time: float, stats: Dict):
+        """调用成功后写缓存并记录用量和模型延迟"""
+        latency_ms = (time.time() - start_time) * 1000
+        self.model_router.record(model, latency_ms, success=True)
+        self.cache.put(cache_key, model, content, latency_ms)
+        record_llm_call(model, usage, latency_ms, stats.get("retries", 0))
+    
+    def _fail_call(self, model: str, error: Exception, start_time: float, stats: Dict):
+        """调用失败时记录"""
+        logger.error(f"Error calling OpenRouter API ({model}): {error}")
+        latency_ms = (time.time() - start_time) * 1000
+        self.model_router.record(model, latency_ms, success=False)
+        record_llm_call(
+            model,
+            latency_ms=latency_ms,
+            retries=stats.get("retries", 0),
+            success=False,
+            error=str(error)
+        )
+    
+    @staticmethod
+    def _remaining(deadline: Optional[float]) -> Optional[float]:
+        """当前候选模型剩余的延迟预算（秒），阶段没有预算时为None"""
+        if deadline is None:
+            return None
+        return max(0.001, deadline - time.monotonic())
+    
+    def _call_openrouter_api(self, messages: List[Dict], temperature: float = 0.1, use_cache: bool = True,
+                             stage: str = "default") -> str:
+        """
+        调用OpenRouter API，按阶段路由模型，失败时回退到下一个候选模型
+        
+        阶段延迟预算约束每个候选模型的全部尝试（含重试和退避），超出后立即回退
+        """
+        candidates = self.model_router.candidates(stage)
+        budget = self.model_router.budget_seconds(stage)
+        for index, model in enumerate(candidates):
+            cache_key = make_cache_key(model, messages, temperature)
+            cached = self._get_cached_response(cache_key, model, use_cache)
+            if cached is not None:
+                return cached
             
-            if response.status_code == 200:
-                result = response.json()
-                return result['choices'][0]['message']['content']
-            else:
-                logger.error(f"OpenRouter API error: {response.status_code} - {response.text}")
-                raise Exception(f"API call failed: {response.status_code}")
-                
-        except Exception as e:
-            logger.error(f"Error calling OpenRouter API: {e}")
-            raise
+            stats: Dict = {}
+            start_time = time.time()
+            deadline = time.monotonic() + budget if budget else None
+            try:
+                result = self.resilience.call(
+                    lambda: self.llm_client.chat(messages, model=model, temperature=temperature,
+                                                 timeout=self._remaining(deadline)),
+                    stats, model=model, deadline=deadline
+                )
+                content = result['choices'][0]['message']['content']
+            except Exception as e:
+                self._fail_call(model, e, start_time, stats)
+                if index == len(candidates) - 1:
+                    raise
+                self.model_router.record_fallback(stage, model)
+                continue
+            
+            self._finish_call(cache_key, model, content, result.get('usage'), start_time, stats)
+            return content
+    
+    async def _acall_openrouter_api(self, messages: List[Dict], temperature: float = 0.1, use_cache: bool = True,
+                                    stage: str = "default") -> str:
+        """异步调用OpenRouter API（不阻塞事件循环），模型路由同_call_openrouter_api"""
+        candidates = self.model_router.candidates(stage)
+        budget = self.model_router.budget_seconds(stage)
+        for index, model in enumerate(candidates):
+            cache_key = make_cache_key(model, messages, temperature)
+            cached = await run_blocking(self._get_cached_response, cache_key, model, use_cache)
+            if cached is not None:
+                return cached
+            
+            stats: Dict = {}
+            start_time = time.time()
+            deadline = time.monotonic() + budget if budget else None
+            try:
+                result = await self.resilience.acall(
+                    lambda: self.llm_client.achat(messages, model=model, temperature=temperature,
+                                                  timeout=self._remaining(deadline)),
+                    stats, model=model, deadline=deadline
+                )
+                content = result['choices'][0]['message']['content']
+            except Exception as e:
+                await run_blocking(self._fail_call, model, e, start_time, stats)
+                if index == len(candidates) - 1:
+                    raise
+                self.model_router.record_fallback(stage, model)
+                continue
+            
+            await run_blocking(self._finish_call, cache_key, model, content, result.get('usage'), start_time, stats)
+            return content
+    
+    async def _astream_openrouter_api(self, messages: List[Dict], temperature: float = 0.1,
+                                      on_delta: Optional[Callable[[str], Awaitable[None]]] = None,
+                                      on_retry: Optional[Callable[[], None]] = None,
+                                      use_cache: bool = True, stage: str = "default") -> str:
+        """
+        流式调用OpenRouter API，每收到一段增量文本即回调on_delta
+        
+        重试或回退到下一个模型都会从头重新生成，之前已输出过内容时先回调on_retry以便调用方重置解析状态
+        """
+        candidates = self.model_router.candidates(stage)
+        budget = self.model_router.budget_seconds(stage)
+        emitted = False
+        for index, model in enumerate(candidates):
+            cache_key = make_cache_key(model, messages, temperature)
+            cached = await run_blocking(self._get_cached_response, cache_key, model, use_cache)
+            if cached is not None:
+                if emitted and on_retry:
+                    on_retry()
+                if on_delta:
+                    await on_delta(cached)
+                return cached
+            
+            stats: Dict = {}
+            usage: Dict = {}
+            
+            async def consume() -> str:
+                nonlocal emitted
+                if emitted and on_retry:
+                    on_retry()
+                emitted = False
+                usage.clear()
+                parts = []
+                async for delta in self.llm_client.astream_chat(
+                    messages, model=model, temperature=temperature, usage=usage,
+                    timeout=self._remaining(deadline)
+                ):
+                    parts.append(delta)
+                    emitted = True
+                    if on_delta:
+                        await on_delta(delta)
+                return "".join(parts)
+            
+            start_time = time.time()
+            deadline = time.monotonic() + budget if budget else None
+            try:
+                content = await self.resilience.acall(consume, stats, model=model, deadline=deadline)
+            except Exception as e:
+                await run_blocking(self._fail_call, model, e, start_time, stats)
+                if index == len(candidates) - 1:
+                    raise
+                self.model_router.record_fallback(stage, model)
+                continue
+            
+            await run_blocking(self._finish_call, cache_key, model, content, usage, start_time, stats)
+            return content
     
     async def get_embedding(self, text: str) -> List[float]:
         """获取文本的向量表示（简化版，使用文本hash作为向量）"""
         try:
-            # 简化版向量化：使用文本的hash值生成固定长度向量
-            import hashlib
-            text_hash = hashlib.md5(text.encode()).hexdigest()
-            # 将hash转换为1536维向量（模拟OpenAI embedding维度）
-            vector = []
-            for i in range(0, len(text_hash), 2):
-                vector.append(int(text_hash[i:i+2], 16) / 255.0)
-            # 补齐到1536维
-            while len(vector) < 1536:
-                vector.extend(vector[:min(len(vector), 1536-len(vector))])
-            return vector[:1536]
+            return hash_embedding(text)
         except Exception as e:
             logger.error(f"Error getting embedding: {e}")
             raise
@@ -70,30 +264,63 @@ class AIService:
     def get_embedding_sync(self, text: str) -> List[float]:
         """同步获取文本的向量表示"""
         try:
-            # 简化版向量化：使用文本的hash值生成固定长度向量
-            import hashlib
-            text_hash = hashlib.md5(text.encode()).hexdigest()
-            # 将hash转换为1536维向量（模拟OpenAI embedding维度）
-            vector = []
-            for i in range(0, len(text_hash), 2):
-                vector.append(int(text_hash[i:i+2], 16) / 255.0)
-            # 补齐到1536维
-            while len(vector) < 1536:
-                vector.extend(vector[:min(len(vector), 1536-len(vector))])
-            return vector[:1536]
+            return hash_embedding(text)
         except Exception as e:
             logger.error(f"Error getting embedding: {e}")
             raise
     
     def vectorize_paragraphs(self, task_id: int, paragraphs: List[str]):
-        """对段落进行向量化并存储"""
+        """对段落进行向量化并存储（替换任务已有段落，重复执行结果一致）"""
+        embeddings = [self.get_embedding_sync(para_text) for para_text in paragraphs]
+        self._store_paragraphs(task_id, paragraphs, embeddings)
+    
+    async def avectorize_paragraphs(self, task_id: int, paragraphs: List[str]):
+        """异步向量化：向量计算在进程池中执行，入库在线程池中执行，不阻塞事件循环"""
+        embeddings = await run_cpu_bound(embed_texts, paragraphs)
+        await run_blocking(self._store_paragraphs, task_id, paragraphs, embeddings)
+    
+    def delete_task_paragraphs(self, task_id: int):
+        """删除任务已有段落（流式向量化开始前调用）"""
         db = SessionLocal()
         try:
-            for i, para_text in enumerate(paragraphs):
-                # 获取向量
-                embedding = self.get_embedding_sync(para_text)
-                
-                # 存储段落和向量
+            db.query(Paragraph).filter(Paragraph.task_id == task_id).delete(synchronize_session=False)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+    
+    def append_paragraphs(self, task_id: int, start_index: int, paragraphs: List[str],
+                          embeddings: List[List[float]]) -> List[Paragraph]:
+        """追加一批段落和向量，返回已入库（带ID）的段落对象"""
+        db = SessionLocal()
+        try:
+            rows = [
+                Paragraph(task_id=task_id, text=para_text, embedding=embedding, paragraph_index=start_index + i)
+                for i, (para_text, embedding) in enumerate(zip(paragraphs, embeddings))
+            ]
+            db.add_all(rows)
+            db.commit()
+            for row in rows:
+                db.refresh(row)
+                db.expunge(row)
+            get_retrieval_service().invalidate(task_id)
+            return rows
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error appending paragraphs for task {task_id}: {e}")
+            raise
+        finally:
+            db.close()
+    
+    def _store_paragraphs(self, task_id: int, paragraphs: List[str], embeddings: List[List[float]]):
+        """存储段落和向量"""
+        db = SessionLocal()
+        try:
+            # 与新段落在同一事务中删除旧段落，失败回滚时保留原有段落
+            db.query(Paragraph).filter(Paragraph.task_id == task_id).delete(synchronize_session=False)
+            for i, (para_text, embedding) in enumerate(zip(paragraphs, embeddings)):
                 paragraph = Paragraph(
                     task_id=task_id,
                     text=para_text,
@@ -103,6 +330,7 @@ class AIService:
                 db.add(paragraph)
             
             db.commit()
+            get_retrieval_service().invalidate(task_id)
             logger.info(f"Vectorized {len(paragraphs)} paragraphs for task {task_id}")
             
         except Exception as e:
@@ -152,7 +380,15 @@ class AIService:
         finally:
             db.close()
     
-    def extract_entities_ner(self, text: str) -> Dict[str, List[str]]:
+    def hybrid_search_paragraphs(self, query_text: str, task_id: int, limit: int = 5) -> List[Dict]:
+        """混合检索相关段落（字符二元组 + 向量，RRF融合）"""
+        return get_retrieval_service().search(query_text, task_id, limit)
+    
+    def hybrid_search_paragraphs_batch(self, queries: List[str], task_id: int, limit: int = 5) -> List[List[Dict]]:
+        """批量混合检索相关段落"""
+        return get_retrieval_service().search_batch(queries, task_id, limit)
+    
+    def extract_entities_ner(self, text: str, use_cache: bool = True) -> Dict[str, List[str]]:
         """使用NER提取实体（简化版，实际可用spaCy等）"""
         logger.info(f"🔍 Starting entity extraction for text length: {len(text)}")
         
@@ -162,14 +398,137 @@ class AIService:
                 logger.warning("⚠️ Text too short for entity extraction")
                 return self._get_fallback_entities(text)
             
-            prompt = f"""
+            # 本地提取置信度足够时不再调用LLM
+            local_entities = self._extract_entities_local(text)
+            if local_entities is not None:
+                return local_entities
+            
+            # 全文分块提取：首块先发，其余块并发，最后合并去重
+            chunks = chunk_text(text, self.entity_chunk_chars, self.entity_chunk_overlap)
+            if len(chunks) == 1:
+                results = [self._extract_chunk_entities(chunks[0], use_cache)]
+            else:
+                with ThreadPoolExecutor(max_workers=self.entity_chunk_concurrency) as executor:
+                    # 首块最先提交；线程复制当前上下文以保留用量归属
+                    futures = [executor.submit(contextvars.copy_context().run, self._extract_chunk_entities, chunk, use_cache)
+                               for chunk in chunks]
+                    results = [futures[0].result()]
+                    results.extend(self._collect_chunk_results(self._future_outcomes(futures[1:])))
+            return self._finish_entity_extraction(merge_entities(results), text, len(chunks))
+                
+        except Exception as e:
+            logger.error(f"❌ Error in NER extraction: {e}")
+            return self._extract_entities_regex(text)
+    
+    async def extract_entities_ner_async(self, text: str, use_cache: bool = True,
+                                         on_preview: Optional[Callable[[Dict], Awaitable[None]]] = None) -> Dict[str, List[str]]:
+        """
+        异步提取实体（全文分块）
+        
+        首块优先发出，首块结果作为预览通过on_preview回调；
+        其余块受ENTITY_CHUNK_CONCURRENCY限制并发提取，全部完成后合并去重
+        """
+        logger.info(f"🔍 Starting entity extraction for text length: {len(text)}")
+        
+        try:
+            if len(text.strip()) < 10:
+                logger.warning("⚠️ Text too short for entity extraction")
+                return self._get_fallback_entities(text)
+            
+            # 本地提取置信度足够时不再调用LLM
+            local_entities = self._extract_entities_local(text)
+            if local_entities is not None:
+                return local_entities
+            
+            chunks = chunk_text(text, self.entity_chunk_chars, self.entity_chunk_overlap)
+            first = asyncio.ensure_future(self._aextract_chunk_entities(chunks[0], use_cache))
+            semaphore = asyncio.Semaphore(self.entity_chunk_concurrency)
+            
+            async def extract_rest(chunk: str) -> Dict[str, List[str]]:
+                async with semaphore:
+                    return await self._aextract_chunk_entities(chunk, use_cache)
+            
+            # 首块先创建，其余块在限流器中排在它之后
+            rest = [asyncio.ensure_future(extract_rest(chunk)) for chunk in chunks[1:]]
+            try:
+                preview = await first
+                if on_preview and len(chunks) > 1:
+                    await on_preview(merge_entities([preview]))
+                rest_results = await asyncio.gather(*rest, return_exceptions=True)
+            finally:
+                for task in rest:
+                    task.cancel()
+            results = [preview] + self._collect_chunk_results(rest_results)
+            return self._finish_entity_extraction(merge_entities(results), text, len(chunks))
+                
+        except Exception as e:
+            logger.error(f"❌ Error in NER extraction: {e}")
+            return self._extract_entities_regex(text)
+    
+    def _extract_chunk_entities(self, chunk: str, use_cache: bool = True) -> Dict[str, List[str]]:
+        """同步提取单个文本块的实体"""
+        result_text = self._call_openrouter_api(
+            self._build_entity_messages(chunk), temperature=0.1, use_cache=use_cache, stage="ner"
+        )
+        logger.info(f"🤖 AI response: {result_text[:200]}...")
+        return self._parse_entities_response(result_text)
+    
+    async def _aextract_chunk_entities(self, chunk: str, use_cache: bool = True) -> Dict[str, List[str]]:
+        """异步提取单个文本块的实体"""
+        if self.ner_batching:
+            # 与窗口内的其他文本块合并为一次LLM调用
+            result_text = await self.entity_batcher.submit(chunk, use_cache)
+        else:
+            result_text = await self._acall_openrouter_api(
+                self._build_entity_messages(chunk), temperature=0.1, use_cache=use_cache, stage="ner"
+            )
+        logger.info(f"🤖 AI response: {result_text[:200]}...")
+        return self._parse_entities_response(result_text)
+    
+    def _collect_chunk_results(self, results) -> List[Dict[str, List[str]]]:
+        """收集其余块的结果，单个块失败只记录日志，不影响首块结果"""
+        collected = []
+        for result in results:
+            if isinstance(result, Exception):
+                logger.warning(f"⚠️ Entity extraction failed for a chunk: {result}")
+                continue
+            collected.append(result)
+        return collected
+
+    @staticmethod
+    def _future_outcomes(futures) -> List:
+        """取出线程池future的结果，异常作为结果返回（对应asyncio.gather的return_exceptions）"""
+        outcomes = []
+        for future in futures:
+            try:
+                outcomes.append(future.result())
+            except Exception as e:
+                outcomes.append(e)
+        return outcomes
+    
+    def _extract_entities_local(self, text: str) -> Optional[Dict[str, List[str]]]:
+        """本地首轮实体提取，置信度达到ENTITY_LOCAL_CONFIDENCE_THRESHOLD时返回结果，否则返回None"""
+        if not self.local_ner_enabled:
+            return None
+        start_time = time.time()
+        result = self.entity_extractor.extract(text)
+        elapsed_ms = (time.time() - start_time) * 1000
+        if result["confidence"] >= self.local_ner_threshold:
+            logger.info(f"⚡ Local entity extraction confident ({result['confidence']}) in {elapsed_ms:.1f}ms: {result['entities']}")
+            return result["entities"]
+        logger.info(f"🤔 Local entity extraction confidence {result['confidence']} below threshold, consulting LLM")
+        return None
+    
+    def _build_entity_messages(self, text: str) -> List[Dict]:
+        """构建实体提取的对话消息"""
+        prompt = f"""
             请仔细分析以下合同文本，提取所有可能的当事方名称。请特别注意：
             1. 公司名称（包含"有限公司"、"股份公司"、"集团"等）
             2. 个人姓名（通常在甲方、乙方、委托方、受托方等位置）
             3. 其他组织机构名称
             
             合同文本：
-            {text[:3000]}
+            {text[:self.entity_chunk_chars]}
             
             请严格按照以下JSON格式返回，不要添加任何其他内容：
             {{
@@ -178,29 +537,24 @@ class AIService:
                 "organizations": ["组织名称1", "组织名称2"]
             }}
             """
-            
-            messages = [
-                {"role": "system", "content": "你是一个专业的合同实体提取专家。请仔细分析文本并准确提取所有当事方信息。"},
-                {"role": "user", "content": prompt}
-            ]
-            
-            result_text = self._call_openrouter_api(messages, temperature=0.1)
-            logger.info(f"🤖 AI response: {result_text[:200]}...")
-            
-            # 尝试解析JSON
-            entities = self._parse_entities_response(result_text)
-            
-            # 如果AI提取失败，使用正则表达式备用方案
-            if not any(entities.values()):
-                logger.warning("⚠️ AI extraction returned empty, trying regex fallback")
-                entities = self._extract_entities_regex(text)
-            
-            logger.info(f"✅ Final entities extracted: {entities}")
-            return entities
-                
-        except Exception as e:
-            logger.error(f"❌ Error in NER extraction: {e}")
-            return self._extract_entities_regex(text)
+        
+        return [
+            {"role": "system", "content": "你是一个专业的合同实体提取专家。请仔细分析文本并准确提取所有当事方信息。"},
+            {"role": "user", "content": prompt}
+        ]
+    
+    def _finish_entity_extraction(self, entities: Dict[str, List[str]], text: str,
+                                  chunk_count: int = 1) -> Dict[str, List[str]]:
+        """检查合并后的实体，为空时使用本地规则备用方案"""
+        logger.info(f"🧩 Merged entities from {chunk_count} chunks")
+        
+        # 如果AI提取失败，使用正则表达式备用方案
+        if not any(entities.values()):
+            logger.warning("⚠️ AI extraction returned empty, trying regex fallback")
+            entities = self._extract_entities_regex(text)
+        
+        logger.info(f"✅ Final entities extracted: {entities}")
+        return entities
     
     def _parse_entities_response(self, result_text: str) -> Dict[str, List[str]]:
         """解析AI返回的实体提取结果"""
@@ -227,53 +581,10 @@ class AIService:
         return {"companies": [], "persons": [], "organizations": []}
     
     def _extract_entities_regex(self, text: str) -> Dict[str, List[str]]:
-        """使用正则表达式提取实体（备用方案）"""
-        logger.info("🔧 Using regex fallback for entity extraction")
-        
-        import re
-        companies = []
-        persons = []
-        organizations = []
-        
-        # 提取公司名称
-        company_patterns = [
-            r'([\u4e00-\u9fa5]+(?:有限公司|股份有限公司|集团|公司))',
-            r'(\w+(?:有限公司|股份有限公司|集团|公司))',
-        ]
-        
-        for pattern in company_patterns:
-            matches = re.findall(pattern, text)
-            companies.extend(matches)
-        
-        # 提取常见的合同角色标识后的名称
-        role_patterns = [
-            r'甲方[：:](\s*[\u4e00-\u9fa5]+(?:有限公司|公司|集团)?)',
-            r'乙方[：:](\s*[\u4e00-\u9fa5]+(?:有限公司|公司|集团)?)',
-            r'委托方[：:](\s*[\u4e00-\u9fa5]+(?:有限公司|公司|集团)?)',
-            r'受托方[：:](\s*[\u4e00-\u9fa5]+(?:有限公司|公司|集团)?)',
-        ]
-        
-        for pattern in role_patterns:
-            matches = re.findall(pattern, text)
-            for match in matches:
-                name = match.strip()
-                if '公司' in name or '集团' in name:
-                    companies.append(name)
-                else:
-                    persons.append(name)
-        
-        # 去重
-        companies = list(set(companies))
-        persons = list(set(persons))
-        organizations = list(set(organizations))
-        
-        result = {
-            "companies": companies,
-            "persons": persons,
-            "organizations": organizations
-        }
-        
-        logger.info(f"🎯 Regex extraction result: {result}")
+        """使用本地规则和词典提取实体（备用方案）"""
+        logger.info("🔧 Using local extractor fallback for entity extraction")
+        result = self.entity_extractor.extract(text)["entities"]
+        logger.info(f"🎯 Local extraction result: {result}")
         return result
     
     def _get_fallback_entities(self, text: str) -> Dict[str, List[str]]:
@@ -285,30 +596,17 @@ class AIService:
             "organizations": []
         }
     
-    def analyze_contract_risks(self, task_id: int, contract_type: str, role: str) -> List[Dict]:
+    def analyze_contract_risks(self, task_id: int, contract_type: str, role: str, use_cache: bool = True) -> List[Dict]:
         """分析合同风险"""
         db = SessionLocal()
         try:
-            # 获取所有段落
-            paragraphs = db.query(Paragraph).filter(Paragraph.task_id == task_id).all()
-            
-            if not paragraphs:
-                logger.warning(f"No paragraphs found for task {task_id}")
+            messages = self._build_risk_messages(db, task_id, contract_type, role)
+            if messages is None:
                 return []
             
-            # 构建完整文本
-            full_text = "\n\n".join([p.text for p in paragraphs])
-            
-            # 构建风险分析提示
-            prompt = self._build_risk_analysis_prompt(full_text, contract_type, role)
-            
-            # 调用LLM分析
-            messages = [
-                {"role": "system", "content": "你是一个专业的合同风险分析专家，具有丰富的法律知识和实务经验。"},
-                {"role": "user", "content": prompt}
-            ]
-            
-            result_text = self._call_openrouter_api(messages, temperature=0.2)
+            result_text = self._call_openrouter_api(
+                messages, temperature=0.2, use_cache=use_cache, stage="risk_analysis"
+            )
             
             # 解析风险分析结果
             risks = self._parse_risk_analysis_result(result_text)
@@ -319,11 +617,439 @@ class AIService:
             return risks
             
         except Exception as e:
+            # 向上抛出，避免分析失败的任务被标记为COMPLETED
+            logger.error(f"Error analyzing contract risks: {e}")
+            raise
+        finally:
+            db.close()
+    
+    async def analyze_contract_risks_async(self, task_id: int, contract_type: str, role: str,
+                                           use_cache: bool = True,
+                                           on_risk: Optional[Callable[[Dict, bool], Awaitable[None]]] = None,
+                                           paragraphs_task_id: Optional[int] = None) -> List[Dict]:
+        """
+        异步分析合同风险（按RISK_ANALYSIS_MODE选择分析模式）
+        
+        paragraphs_task_id为段落所属任务（共享文档段落时为持有者），风险始终写入task_id
+        """
+        if self.analysis_mode == "map_reduce":
+            return await self.analyze_contract_risks_map_reduce(task_id, contract_type, role, use_cache, on_risk,
+                                                                paragraphs_task_id)
+        if self.analysis_mode == "category":
+            return await self.analyze_contract_risks_by_category(task_id, contract_type, role, use_cache, on_risk,
+                                                                 paragraphs_task_id)
+        
+        db = SessionLocal()
+        try:
+            messages = await run_blocking(self._build_risk_messages, db, paragraphs_task_id or task_id,
+                                          contract_type, role)
+            if messages is None:
+                return []
+            
+            result_text = await self._acall_openrouter_api(
+                messages, temperature=0.2, use_cache=use_cache, stage="risk_analysis"
+            )
+            risks = self._parse_risk_analysis_result(result_text)
+            await run_blocking(self._save_risks_to_db, task_id, risks, db)
+            
+            return risks
+            
+        except Exception as e:
+            # 向上抛出，避免分析失败的任务被标记为COMPLETED
             logger.error(f"Error analyzing contract risks: {e}")
+            raise
+        finally:
+            db.close()
+    
+    async def analyze_contract_risks_map_reduce(self, task_id: int, contract_type: str, role: str,
+                                                use_cache: bool = True,
+                                                on_risk: Optional[Callable[[Dict, bool], Awaitable[None]]] = None,
+                                                paragraphs_task_id: Optional[int] = None) -> List[Dict]:
+        """
+        Map-Reduce模式分析整份合同
+        
+        按条款切块后并发分析（受RISK_ANALYSIS_CONCURRENCY限制），
+        再合并去重，每条风险关联到来源段落ID。
+        开启流式输出时，每个风险对象一闭合即入库并回调on_risk(risk, is_new)
+        """
+        paragraphs = await run_blocking(self._load_paragraphs, paragraphs_task_id or task_id)
+        if not paragraphs:
+            logger.warning(f"No paragraphs found for task {task_id}")
+            return []
+        
+        chunks = chunk_paragraphs(paragraphs, self.chunk_chars)
+        logger.info(f"🧩 Map-reduce analysis for task {task_id}: {len(paragraphs)} paragraphs in {len(chunks)} chunks")
+        
+        shards = [(chunk, self._build_chunk_risk_messages(chunk, contract_type, role)) for chunk in chunks]
+        return await self._run_sharded_analysis(task_id, shards, use_cache, on_risk)
+    
+    async def analyze_contract_risks_by_category(self, task_id: int, contract_type: str, role: str,
+                                                 use_cache: bool = True,
+                                                 on_risk: Optional[Callable[[Dict, bool], Awaitable[None]]] = None,
+                                                 paragraphs_task_id: Optional[int] = None) -> List[Dict]:
+        """
+        按风险类别分片分析
+        
+        每个关注领域从任务段落索引中混合检索top-k相关条款，
+        构建一个只含这些条款的小提示，各类别并发执行
+        """
+        source_task_id = paragraphs_task_id or task_id
+        paragraphs = await run_blocking(self._load_paragraphs, source_task_id)
+        if not paragraphs:
+            logger.warning(f"No paragraphs found for task {task_id}")
+            return []
+        
+        by_id = {p.id: p for p in paragraphs}
+        keywords = [kw for category in RISK_CATEGORIES for kw in category["keywords"]]
+        keyword_results = iter(await run_blocking(
+            self.hybrid_search_paragraphs_batch, keywords, source_task_id, self.category_top_k
+        ))
+        
+        shards = []
+        for category in RISK_CATEGORIES:
+            rankings = [[hit["id"] for hit in next(keyword_results)] for _ in category["keywords"]]
+            selected = [by_id[doc_id] for doc_id, _ in reciprocal_rank_fusion(rankings)[:self.category_top_k]
+                        if doc_id in by_id]
+            if not selected:
+                continue
+            selected.sort(key=lambda p: p.paragraph_index)
+            shards.append((selected, self._build_category_risk_messages(selected, category, contract_type, role)))
+        
+        logger.info(f"🗂️ Category analysis for task {task_id}: {len(shards)} categories, top_k={self.category_top_k}")
+        return await self._run_sharded_analysis(task_id, shards, use_cache, on_risk)
+    
+    async def analyze_contract_risks_reduced(self, task_id: int, contract_type: str, role: str,
+                                             use_cache: bool = True,
+                                             on_risk: Optional[Callable[[Dict, bool], Awaitable[None]]] = None,
+                                             paragraphs_task_id: Optional[int] = None) -> List[Dict]:
+        """
+        降级分析：只分析关注领域关键词命中最多的REVIEW_DEGRADED_MAX_CHUNKS个块，
+        使用risk_analysis_degraded路由（通常为更小更快的模型），审查时间预算紧张时使用
+        """
+        paragraphs = await run_blocking(self._load_paragraphs, paragraphs_task_id or task_id)
+        if not paragraphs:
+            logger.warning(f"No paragraphs found for task {task_id}")
             return []
+        
+        chunks = chunk_paragraphs(paragraphs, self.chunk_chars)
+        selected = select_chunks_by_keywords(chunks, self.degraded_max_chunks)
+        logger.info(f"⏬ Degraded analysis for task {task_id}: {len(selected)}/{len(chunks)} chunks")
+        
+        shards = [(chunk, self._build_chunk_risk_messages(chunk, contract_type, role)) for chunk in selected]
+        return await self._run_sharded_analysis(task_id, shards, use_cache, on_risk, stage="risk_analysis_degraded")
+    
+    async def analyze_contract_risks_rules(self, task_id: int,
+                                           on_risk: Optional[Callable[[Dict, bool], Awaitable[None]]] = None,
+                                           paragraphs_task_id: Optional[int] = None) -> List[Dict]:
+        """
+        仅按规则标记需人工复核的条款（不调用LLM）
+        
+        保留任务已入库的风险（如超时前流式写入的部分结果），只为其未覆盖的领域补充规则风险，返回全部风险
+        """
+        paragraphs = await run_blocking(self._load_paragraphs, paragraphs_task_id or task_id)
+        existing = await run_blocking(self._load_task_risks, task_id)
+        covered = [ref for risk in existing for ref in risk["paragraph_refs"]]
+        risks = await run_blocking(self.save_task_risks, task_id, rule_based_risks(paragraphs, covered))
+        logger.info(f"📏 Rule-based analysis for task {task_id}: {len(risks)} risks added to {len(existing)} kept")
+        if on_risk:
+            for risk in risks:
+                await on_risk(risk, True)
+        return existing + risks
+    
+    async def analyze_contract_risks_incremental(self, task_id: int, base_task_id: int, contract_type: str, role: str,
+                                                 use_cache: bool = True,
+                                                 on_risk: Optional[Callable[[Dict, bool], Awaitable[None]]] = None,
+                                                 paragraphs_task_id: Optional[int] = None,
+                                                 base_paragraphs_task_id: Optional[int] = None
+                                                 ) -> Tuple[List[Dict], Dict]:
+        """
+        增量复审：与上一版合同按段落比对，只分析修改和新增的条款
+        
+        只涉及未改动段落的旧风险直接沿用（段落引用换成新版段落ID），改动条款按块分析后与沿用风险合并去重。
+        旧版风险缺少段落引用（single模式）或改动比例过大时退回全量分析
+        
+        Returns:
+            (风险列表, 比对摘要)
+        """
+        paragraphs = await run_blocking(self._load_paragraphs, paragraphs_task_id or task_id)
+        base_paragraphs = await run_blocking(self._load_paragraphs, base_paragraphs_task_id or base_task_id)
+        base_risks = await run_blocking(self._load_task_risks, base_task_id)
+        
+        diff = await run_cpu_bound(
+            diff_paragraphs, [p.text for p in base_paragraphs], [p.text for p in paragraphs],
+            self.incremental_similarity
+        )
+        summary = {"base_task_id": base_task_id, **diff.summary()}
+        
+        fallback_reason = None
+        if not base_paragraphs:
+            fallback_reason = "base task has no paragraphs"
+        elif any(not risk["paragraph_refs"] for risk in base_risks):
+            fallback_reason = "base risks are not linked to paragraphs"
+        elif diff.change_ratio > self.incremental_max_change_ratio:
+            fallback_reason = f"change ratio {diff.change_ratio:.0%} exceeds limit"
+        if fallback_reason:
+            logger.info(f"Incremental review of task {task_id} falls back to full analysis: {fallback_reason}")
+            risks = await self.analyze_contract_risks_async(task_id, contract_type, role, use_cache, on_risk,
+                                                            paragraphs_task_id)
+            return risks, {**summary, "mode": "full", "reason": fallback_reason}
+        
+        id_map = {base_paragraphs[old].id: paragraphs[new].id for new, old in diff.unchanged.items()}
+        carried = carry_over_risks(base_risks, id_map)
+        for risk in carried:
+            risk["id"] = await run_blocking(self._upsert_risk, task_id, risk)
+            if on_risk:
+                await on_risk(risk, True)
+        
+        changed = [paragraphs[i] for i in diff.changed]
+        shards = [(chunk, self._build_chunk_risk_messages(chunk, contract_type, role))
+                  for chunk in chunk_paragraphs(changed, self.chunk_chars)]
+        logger.info(f"♻️ Incremental review of task {task_id} against task {base_task_id}: {diff.summary()}, "
+                    f"carried {len(carried)}/{len(base_risks)} risks, {len(shards)} chunks to analyze")
+        
+        risks = await self._run_sharded_analysis(task_id, shards, use_cache, on_risk, known_risks=carried)
+        return risks, {**summary, "mode": "incremental", "carried_risks": len(carried), "analyzed_chunks": len(shards)}
+    
+    def _load_task_risks(self, task_id: int) -> List[Dict]:
+        """读取任务已保存的风险（含法规引用），格式与分析结果一致"""
+        db = SessionLocal()
+        try:
+            risks = db.query(Risk).filter(Risk.task_id == task_id).order_by(Risk.id).all()
+            statutes = defaultdict(list)
+            if risks:
+                for statute in db.query(Statute).filter(Statute.risk_id.in_([r.id for r in risks])).order_by(Statute.id):
+                    statutes[statute.risk_id].append(statute.statute_ref)
+            return [{
+                "id": risk.id,
+                "clause_id": risk.clause_id,
+                "title": risk.title,
+                "risk_level": risk.risk_level,
+                "summary": risk.summary,
+                "suggestion": risk.suggestion,
+                "related_laws": statutes[risk.id],
+                "paragraph_refs": risk.paragraph_refs or [],
+            } for risk in risks]
         finally:
             db.close()
     
+    def _load_paragraphs(self, task_id: int) -> List[Paragraph]:
+        """按文档顺序加载任务的全部段落"""
+        db = SessionLocal()
+        try:
+            return db.query(Paragraph).filter(
+                Paragraph.task_id == task_id
+            ).order_by(Paragraph.paragraph_index).all()
+        finally:
+            db.close()
+    
+    async def analyze_paragraph_stream(self, task_id: int, paragraphs: AsyncIterator[Paragraph],
+                                       contract_type: str, role: str, use_cache: bool = True,
+                                       on_risk: Optional[Callable[[Dict, bool], Awaitable[None]]] = None) -> List[Dict]:
+        """
+        流式Map-Reduce分析：段落边入库边到达，每凑满一块立即开始分析
+        
+        切块规则与analyze_contract_risks_map_reduce一致，文档其余部分仍在提取时前面的块已在分析
+        """
+        async def shards():
+            chunker = ParagraphChunker(self.chunk_chars)
+            async for paragraph in paragraphs:
+                chunk = chunker.add(paragraph)
+                if chunk:
+                    yield chunk, self._build_chunk_risk_messages(chunk, contract_type, role)
+            chunk = chunker.flush()
+            if chunk:
+                yield chunk, self._build_chunk_risk_messages(chunk, contract_type, role)
+        
+        return await self._run_sharded_analysis(task_id, shards(), use_cache, on_risk)
+    
+    async def _run_sharded_analysis(self, task_id: int,
+                                    shards: Union[List[Tuple[List[Paragraph], List[Dict]]],
+                                                  AsyncIterator[Tuple[List[Paragraph], List[Dict]]]],
+                                    use_cache: bool = True,
+                                    on_risk: Optional[Callable[[Dict, bool], Awaitable[None]]] = None,
+                                    known_risks: Optional[List[Dict]] = None,
+                                    stage: str = "risk_analysis") -> List[Dict]:
+        """
+        并发执行各分片的风险分析并合并去重（shards可以是列表，也可以是逐个到达的异步迭代器）
+        
+        known_risks为已入库的风险（如增量复审沿用的风险），新结果与其合并而不是重复写入；
+        stage决定模型路由（降级分析使用risk_analysis_degraded路由到更小的模型）
+        """
+        pending: List[asyncio.Future] = []
+        try:
+            semaphore = asyncio.Semaphore(self.analysis_concurrency)
+            merger = RiskMerger()
+            for risk in known_risks or []:
+                merger.add(risk)
+            
+            async def handle_risk(risk: Dict, shard: List[Paragraph]):
+                self._link_chunk_risks([risk], shard)
+                is_new, merged = merger.add(risk)
+                if self.streaming:
+                    merged["id"] = await run_blocking(self._upsert_risk, task_id, merged)
+                    if on_risk:
+                        await on_risk(merged, is_new)
+            
+            async def analyze_shard(shard: List[Paragraph], messages: List[Dict]):
+                async with semaphore:
+                    if not self.streaming:
+                        result_text = await self._acall_openrouter_api(
+                            messages, temperature=0.2, use_cache=use_cache, stage=stage
+                        )
+                        for risk in self._parse_risk_analysis_result(result_text):
+                            await handle_risk(risk, shard)
+                        return
+                    
+                    parser = IncrementalRiskParser()
+                    
+                    async def on_delta(delta: str):
+                        for risk in parser.feed(delta):
+                            await handle_risk(risk, shard)
+                    
+                    def on_retry():
+                        nonlocal parser
+                        parser = IncrementalRiskParser()
+                    
+                    await self._astream_openrouter_api(
+                        messages, temperature=0.2, on_delta=on_delta, on_retry=on_retry,
+                        use_cache=use_cache, stage=stage
+                    )
+            
+            if hasattr(shards, "__aiter__"):
+                async for shard, messages in shards:
+                    pending.append(asyncio.ensure_future(analyze_shard(shard, messages)))
+                    # 已有分片失败时不再等待后续分片到达
+                    failed = next((f for f in pending if f.done() and not f.cancelled() and f.exception()), None)
+                    if failed is not None:
+                        raise failed.exception()
+            else:
+                pending = [asyncio.ensure_future(analyze_shard(shard, messages)) for shard, messages in shards]
+            await asyncio.gather(*pending)
+            
+            risks = merger.risks
+            if not self.streaming:
+                await run_blocking(self._save_risks_in_new_session, task_id, [r for r in risks if not r.get("id")])
+                # 已入库的风险可能合并了新的段落引用和法规
+                for risk in risks:
+                    if risk.get("id"):
+                        await run_blocking(self._upsert_risk, task_id, risk)
+            return risks
+            
+        except Exception as e:
+            logger.error(f"Error analyzing contract risks: {e}")
+            raise
+        finally:
+            # 某个分片失败或上游取消时，不留下仍在调用LLM的分片
+            for future in pending:
+                future.cancel()
+    
+    def _build_chunk_risk_messages(self, chunk: List[Paragraph], contract_type: str, role: str) -> List[Dict]:
+        """构建单个合同片段的风险分析消息，段落带编号便于回溯"""
+        numbered_text = "\n\n".join(f"[P{p.id}] {p.text}" for p in chunk)
+        prompt = f"""
+        以下是一份{contract_type}合同的片段，每个段落以[P编号]开头。我的角色是{role}。
+        请仅针对该片段进行风险分析。
+        
+        合同片段：
+        {numbered_text}
+        
+        请以JSON格式返回结果：
+        
+        {{
+            "risks": [
+                {{
+                    "clause_id": "条款编号或标识",
+                    "title": "风险标题",
+                    "risk_level": "HIGH/MEDIUM/LOW",
+                    "summary": "风险描述和分析",
+                    "suggestion": "应对建议",
+                    "related_laws": ["相关法律法规"],
+                    "paragraph_ids": [风险所在段落的P编号数字]
+                }}
+            ]
+        }}
+        
+        重点关注：
+        1. 付款条款和违约责任
+        2. 交付时间和质量标准
+        3. 知识产权条款
+        4. 免责和限责条款
+        5. 争议解决机制
+        6. 合同变更和终止条件
+        """
+        return [
+            {"role": "system", "content": "你是一个专业的合同风险分析专家，具有丰富的法律知识和实务经验。"},
+            {"role": "user", "content": prompt}
+        ]
+    
+    def _build_category_risk_messages(self, paragraphs: List[Paragraph], category: Dict,
+                                      contract_type: str, role: str) -> List[Dict]:
+        """构建单个风险类别的分析消息，只包含检索到的相关条款"""
+        numbered_text = "\n\n".join(f"[P{p.id}] {p.text}" for p in paragraphs)
+        prompt = f"""
+        以下是从一份{contract_type}合同中检索出的与“{category['label']}”相关的条款，每个段落以[P编号]开头。
+        我的角色是{role}。请只针对“{category['label']}”方面进行风险分析，其他方面无需分析。
+        
+        相关条款：
+        {numbered_text}
+        
+        请以JSON格式返回结果：
+        
+        {{
+            "risks": [
+                {{
+                    "clause_id": "条款编号或标识",
+                    "title": "风险标题",
+                    "risk_level": "HIGH/MEDIUM/LOW",
+                    "summary": "风险描述和分析",
+                    "suggestion": "应对建议",
+                    "related_laws": ["相关法律法规"],
+                    "paragraph_ids": [风险所在段落的P编号数字]
+                }}
+            ]
+        }}
+        """
+        return [
+            {"role": "system", "content": "你是一个专业的合同风险分析专家，具有丰富的法律知识和实务经验。"},
+            {"role": "user", "content": prompt}
+        ]
+    
+    def _link_chunk_risks(self, risks: List[Dict], chunk: List[Paragraph]) -> List[Dict]:
+        """将风险关联到片段内的段落ID，模型未给出或越界时关联整个片段"""
+        chunk_ids = [p.id for p in chunk]
+        valid_ids = set(chunk_ids)
+        for risk in risks:
+            refs = []
+            for ref in risk.pop("paragraph_ids", None) or []:
+                try:
+                    ref = int(str(ref).lstrip("Pp"))
+                except ValueError:
+                    continue
+                if ref in valid_ids:
+                    refs.append(ref)
+            risk["paragraph_refs"] = refs or chunk_ids
+        return risks
+    
+    def _build_risk_messages(self, db: Session, task_id: int, contract_type: str, role: str):
+        """构建风险分析的对话消息，无段落时返回None"""
+        # 获取所有段落
+        paragraphs = db.query(Paragraph).filter(Paragraph.task_id == task_id).all()
+        
+        if not paragraphs:
+            logger.warning(f"No paragraphs found for task {task_id}")
+            return None
+        
+        # 构建完整文本
+        full_text = "\n\n".join([p.text for p in paragraphs])
+        
+        # 构建风险分析提示
+        prompt = self._build_risk_analysis_prompt(full_text, contract_type, role)
+        
+        return [
+            {"role": "system", "content": "你是一个专业的合同风险分析专家，具有丰富的法律知识和实务经验。"},
+            {"role": "user", "content": prompt}
+        ]
+    
     def _build_risk_analysis_prompt(self, text: str, contract_type: str, role: str) -> str:
         """构建风险分析提示"""
         return f"""
@@ -386,7 +1112,8 @@ class AIService:
                     title=risk_data.get('title', ''),
                     risk_level=risk_data.get('risk_level', 'MEDIUM'),
                     summary=risk_data.get('summary', ''),
-                    suggestion=risk_data.get('suggestion', '')
+                    suggestion=risk_data.get('suggestion', ''),
+                    paragraph_refs=risk_data.get('paragraph_refs')
                 )
                 db.add(risk)
                 db.flush()  # 获取risk.id
@@ -408,6 +1135,74 @@ class AIService:
             db.rollback()
             logger.error(f"Error saving risks to database: {e}")
             raise
+    
+    def clear_task_risks(self, task_id: int) -> int:
+        """删除任务已有的风险及其法规引用（重新分析前调用，避免重复写入）"""
+        db = SessionLocal()
+        try:
+            risk_ids = [row.id for row in db.query(Risk.id).filter(Risk.task_id == task_id).all()]
+            if risk_ids:
+                db.query(Statute).filter(Statute.risk_id.in_(risk_ids)).delete(synchronize_session=False)
+                db.query(Risk).filter(Risk.id.in_(risk_ids)).delete(synchronize_session=False)
+            db.commit()
+            return len(risk_ids)
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error clearing risks for task {task_id}: {e}")
+            raise
+        finally:
+            db.close()
+    
+    def save_task_risks(self, task_id: int, risks: List[Dict]) -> List[Dict]:
+        """逐条写入已有的风险结果（如审查结果缓存命中），返回带新风险ID的副本"""
+        saved = []
+        for risk in risks:
+            risk = {k: v for k, v in risk.items() if k != "id"}
+            risk["id"] = self._upsert_risk(task_id, risk)
+            saved.append(risk)
+        return saved
+    
+    def _save_risks_in_new_session(self, task_id: int, risks: List[Dict]):
+        """在独立会话中保存风险（供线程池调用）"""
+        db = SessionLocal()
+        try:
+            self._save_risks_to_db(task_id, risks, db)
+        finally:
+            db.close()
+    
+    def _upsert_risk(self, task_id: int, risk_data: Dict) -> int:
+        """写入或更新单条风险（流式分析时逐条入库），返回风险ID"""
+        db = SessionLocal()
+        try:
+            risk = None
+            if risk_data.get('id'):
+                risk = db.query(Risk).filter(Risk.id == risk_data['id']).first()
+            if risk is None:
+                risk = Risk(task_id=task_id)
+                db.add(risk)
+            
+            risk.clause_id = risk_data.get('clause_id', '')
+            risk.title = risk_data.get('title', '')
+            risk.risk_level = risk_data.get('risk_level', 'MEDIUM')
+            risk.summary = risk_data.get('summary', '')
+            risk.suggestion = risk_data.get('suggestion', '')
+            risk.paragraph_refs = risk_data.get('paragraph_refs')
+            db.flush()
+            
+            # 合并后的法规列表整体替换
+            db.query(Statute).filter(Statute.risk_id == risk.id).delete()
+            for law in risk_data.get('related_laws', []):
+                db.add(Statute(risk_id=risk.id, statute_ref=law, statute_text=""))
+            
+            db.commit()
+            return risk.id
+            
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error upserting risk for task {task_id}: {e}")
+            raise
+        finally:
+            db.close()
 
 # 全局AI服务实例 - 延迟初始化
 ai_service = None
@@ -0,0 +1,136 @@
+import hashlib
+import re
+import unicodedata
+from collections import defaultdict
+from difflib import SequenceMatcher
+from typing import Dict, List, Sequence
+import logging
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+
+# 未匹配段落两两比较相似度的上限，超过时剩余段落直接视为新增（改动过大，增量复审无意义）
+MAX_SIMILARITY_COMPARISONS = 10000
+
+
+def paragraph_hash(text: str) -> str:
+    """段落内容哈希（全半角、空白差异不视为修改）"""
+    normalized = _WHITESPACE_PATTERN.sub("", unicodedata.normalize("NFKC", text or ""))
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+class ClauseDiff:
+    """新旧两版合同的段落对应关系（均为段落在文档中的下标）"""
+
+    def __init__(self, unchanged: Dict[int, int], modified: Dict[int, int],
+                 added: List[int], removed: List[int], old_count: int, new_count: int):
+        self.unchanged = unchanged  # 新下标 -> 旧下标，内容相同
+        self.modified = modified  # 新下标 -> 最相似的旧下标，内容有改动
+        self.added = added
+        self.removed = removed
+        self.old_count = old_count
+        self.new_count = new_count
+
+    @property
+    def changed(self) -> List[int]:
+        """需要重新分析的新段落下标（修改和新增），按文档顺序"""
+        return sorted(list(self.modified) + self.added)
+
+    @property
+    def change_ratio(self) -> float:
+        return len(self.changed) / self.new_count if self.new_count else 0.0
+
+    def summary(self) -> Dict:
+        return {
+            "unchanged": len(self.unchanged),
+            "modified": len(self.modified),
+            "added": len(self.added),
+            "removed": len(self.removed),
+            "change_ratio": round(self.change_ratio, 4),
+        }
+
+
+def diff_paragraphs(old_texts: Sequence[str], new_texts: Sequence[str],
+                    similarity_threshold: float = 0.6) -> ClauseDiff:
+    """
+    按内容哈希和文本相似度比对新旧两版段落
+
+    先按哈希序列做最长公共子序列匹配，再把顺序调整过的相同段落配对，
+    剩余段落中相似度不低于similarity_threshold的视为修改，其余为新增/删除
+
+    Args:
+        old_texts: 旧版段落文本
+        new_texts: 新版段落文本
+        similarity_threshold: 视为同一条款修改的最低相似度
+
+    Returns:
+        段落对应关系
+    """
+    old_hashes = [paragraph_hash(text) for text in old_texts]
+    new_hashes = [paragraph_hash(text) for text in new_texts]
+
+    unchanged: Dict[int, int] = {}
+    matcher = SequenceMatcher(None, old_hashes, new_hashes, autojunk=False)
+    for old_start, new_start, size in matcher.get_matching_blocks():
+        for offset in range(size):
+            unchanged[new_start + offset] = old_start + offset
+
+    # 位置移动但内容未变的段落
+    matched_old = set(unchanged.values())
+    old_by_hash = defaultdict(list)
+    for i, h in enumerate(old_hashes):
+        if i not in matched_old:
+            old_by_hash[h].append(i)
+    for j, h in enumerate(new_hashes):
+        if j not in unchanged and old_by_hash.get(h):
+            unchanged[j] = old_by_hash[h].pop(0)
+
+    matched_old = set(unchanged.values())
+    remaining_old = [i for i in range(len(old_texts)) if i not in matched_old]
+    remaining_new = [j for j in range(len(new_texts)) if j not in unchanged]
+
+    modified: Dict[int, int] = {}
+    if len(remaining_old) * len(remaining_new) <= MAX_SIMILARITY_COMPARISONS:
+        for j in remaining_new:
+            best_ratio, best_old = 0.0, None
+            for i in remaining_old:
+                candidate = SequenceMatcher(None, old_texts[i], new_texts[j], autojunk=False)
+                if candidate.quick_ratio() < max(best_ratio, similarity_threshold):
+                    continue
+                ratio = candidate.ratio()
+                if ratio > best_ratio:
+                    best_ratio, best_old = ratio, i
+            if best_old is not None and best_ratio >= similarity_threshold:
+                modified[j] = best_old
+                remaining_old.remove(best_old)
+    else:
+        logger.info(f"Too many unmatched paragraphs ({len(remaining_new)} new, {len(remaining_old)} old), "
+                    f"skipping similarity matching")
+
+    added = [j for j in remaining_new if j not in modified]
+    return ClauseDiff(unchanged, modified, added, remaining_old, len(old_texts), len(new_texts))
+
+
+def carry_over_risks(base_risks: List[Dict], paragraph_id_map: Dict[int, int]) -> List[Dict]:
+    """
+    沿用旧版中只涉及未改动段落的风险，段落引用换成新版段落ID
+
+    涉及修改或删除段落的风险不沿用，由重新分析改动条款得出
+
+    Args:
+        base_risks: 旧版风险（含paragraph_refs）
+        paragraph_id_map: 旧段落ID -> 新段落ID（仅未改动段落）
+
+    Returns:
+        可沿用的风险（不含旧风险ID）
+    """
+    carried = []
+    for risk in base_risks:
+        refs = risk.get("paragraph_refs") or []
+        if not refs or any(ref not in paragraph_id_map for ref in refs):
+            continue
+        copied = {key: value for key, value in risk.items() if key != "id"}
+        copied["paragraph_refs"] = sorted(paragraph_id_map[ref] for ref in refs)
+        carried.append(copied)
+    return carried
@@ -0,0 +1,223 @@
+import hashlib
+import json
+import os
+from datetime import datetime
+from typing import Dict, List, Optional
+import logging
+
+from sqlalchemy.exc import IntegrityError
+
+from ..database import SessionLocal
+from ..metrics import REVIEW_RESULT_CACHE_REQUESTS
+from ..models import Document, File, Paragraph, ReviewResultCacheEntry, Task
+
+logger = logging.getLogger(__name__)
+
+# 风险分析提示词版本，修改提示词或解析规则时递增，使旧的审查结果缓存失效
+RISK_PROMPT_VERSION = os.getenv("RISK_PROMPT_VERSION", "2026.10")
+
+
+def review_cache_key(content_hash: str, role: str, contract_type: str, prompt_version: str,
+                     analysis_mode: str) -> str:
+    """审查结果缓存键"""
+    payload = json.dumps([content_hash, role, contract_type, prompt_version, analysis_mode], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class DocumentService:
+    """
+    文档服务
+
+    审查任务是文档的子实体：相同内容的文件对应同一文档，
+    文档保存提取文本并指向持有段落和向量的任务，换角色或合同类型重新审查时只需重做风险分析
+    """
+
+    def __init__(self):
+        self.result_cache_enabled = os.getenv("REVIEW_RESULT_CACHE_ENABLED", "true").lower() == "true"
+
+    def ensure_task_document(self, task_id: int) -> Optional[Dict]:
+        """
+        返回任务所属文档，尚未关联时按文件内容哈希关联（不存在则创建）
+
+        文件没有内容哈希（历史数据）时返回None，按独立任务处理
+        """
+        db = SessionLocal()
+        try:
+            task = db.query(Task).filter(Task.id == task_id).first()
+            if not task:
+                return None
+            if task.document_id:
+                document = db.get(Document, task.document_id)
+                if document:
+                    return self._document_info(document)
+
+            file_record = db.query(File).filter(File.task_id == task_id).first()
+            if not file_record or not file_record.content_hash:
+                return None
+            document = self._get_or_create(db, file_record.content_hash, file_record.ocr_text)
+            task.document_id = document.id
+            db.commit()
+            return self._document_info(document)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _get_or_create(self, db, content_hash: str, ocr_text: Optional[str]) -> Document:
+        document = db.query(Document).filter(Document.content_hash == content_hash).first()
+        if document:
+            return document
+        document = Document(content_hash=content_hash, ocr_text=ocr_text or None)
+        db.add(document)
+        try:
+            db.flush()
+        except IntegrityError:
+            # 并发上传相同文件时另一请求已创建
+            db.rollback()
+            document = db.query(Document).filter(Document.content_hash == content_hash).one()
+        return document
+
+    def save_text(self, document_id: int, ocr_text: str):
+        """保存文档提取文本（已有文本时不覆盖）"""
+        if not ocr_text:
+            return
+        db = SessionLocal()
+        try:
+            db.query(Document).filter(Document.id == document_id, Document.ocr_text.is_(None)).update(
+                {Document.ocr_text: ocr_text}, synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def shared_paragraphs_task(self, document_id: int, paragraphs_hash: str) -> Optional[int]:
+        """文档已向量化且段落切分结果一致时，返回持有共享段落的任务ID"""
+        db = SessionLocal()
+        try:
+            document = db.get(Document, document_id)
+            if not document or not document.paragraphs_task_id or document.paragraphs_hash != paragraphs_hash:
+                return None
+            stored = db.query(Paragraph).filter(Paragraph.task_id == document.paragraphs_task_id).count()
+            return document.paragraphs_task_id if stored == document.paragraph_count else None
+        finally:
+            db.close()
+
+    def register_paragraphs(self, document_id: int, task_id: int, paragraphs_hash: str, paragraph_count: int):
+        """登记任务的段落和向量为文档共享段落（文档已有有效的共享段落时保持不变）"""
+        if self.shared_paragraphs_task(document_id, paragraphs_hash) is not None:
+            return
+        db = SessionLocal()
+        try:
+            document = db.get(Document, document_id)
+            if document:
+                document.paragraphs_task_id = task_id
+                document.paragraphs_hash = paragraphs_hash
+                document.paragraph_count = paragraph_count
+                document.vectorized_at = datetime.utcnow()
+                db.commit()
+                logger.info(f"📚 Document {document_id} paragraphs now shared from task {task_id}")
+        finally:
+            db.close()
+
+    def paragraphs_task_id(self, task_id: int) -> int:
+        """任务分析时使用的段落所属任务：文档共享段落的持有者，没有时为任务本身"""
+        db = SessionLocal()
+        try:
+            row = db.query(Document.paragraphs_task_id).join(Task, Task.document_id == Document.id).filter(
+                Task.id == task_id
+            ).first()
+            if row and row.paragraphs_task_id:
+                return row.paragraphs_task_id
+            return task_id
+        finally:
+            db.close()
+
+    def get_cached_review(self, key: str, paragraphs_task_id: int) -> Optional[List[Dict]]:
+        """
+        读取审查结果缓存，段落序号换回paragraphs_task_id的段落ID
+
+        缓存的段落序号超出当前段落范围时视为未命中
+        """
+        if not self.result_cache_enabled:
+            return None
+        db = SessionLocal()
+        try:
+            entry = db.get(ReviewResultCacheEntry, key)
+            if entry is None:
+                REVIEW_RESULT_CACHE_REQUESTS.labels(result="miss").inc()
+                return None
+            by_index = {index: paragraph_id for paragraph_id, index in self._paragraph_positions(db, paragraphs_task_id)}
+        finally:
+            db.close()
+
+        risks = []
+        for cached in entry.risks or []:
+            indexes = cached.get("paragraph_indexes") or []
+            if any(index not in by_index for index in indexes):
+                REVIEW_RESULT_CACHE_REQUESTS.labels(result="miss").inc()
+                return None
+            risk = {k: v for k, v in cached.items() if k != "paragraph_indexes"}
+            risk["paragraph_refs"] = [by_index[index] for index in indexes]
+            risks.append(risk)
+        REVIEW_RESULT_CACHE_REQUESTS.labels(result="hit").inc()
+        return risks
+
+    def save_cached_review(self, key: str, content_hash: str, role: str, contract_type: str,
+                           analysis_mode: str, risks: List[Dict], paragraphs_task_id: int, task_id: int):
+        """保存审查结果缓存（段落ID换成段落序号，与具体任务的段落行无关）"""
+        if not self.result_cache_enabled:
+            return
+        db = SessionLocal()
+        try:
+            index_by_id = dict(self._paragraph_positions(db, paragraphs_task_id))
+            cached = []
+            for risk in risks:
+                item = {k: v for k, v in risk.items() if k not in ("id", "paragraph_refs")}
+                item["paragraph_indexes"] = [index_by_id[ref] for ref in risk.get("paragraph_refs") or []
+                                             if ref in index_by_id]
+                cached.append(item)
+
+            entry = db.get(ReviewResultCacheEntry, key)
+            if entry is None:
+                entry = ReviewResultCacheEntry(cache_key=key)
+                db.add(entry)
+            entry.content_hash = content_hash
+            entry.role = role
+            entry.contract_type = contract_type
+            entry.prompt_version = RISK_PROMPT_VERSION
+            entry.analysis_mode = analysis_mode
+            entry.risks = cached
+            entry.source_task_id = task_id
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"Failed to cache review result for task {task_id}: {e}")
+        finally:
+            db.close()
+
+    @staticmethod
+    def _paragraph_positions(db, task_id: int) -> List:
+        """任务段落的(段落ID, 段落序号)"""
+        return db.query(Paragraph.id, Paragraph.paragraph_index).filter(Paragraph.task_id == task_id).all()
+
+    @staticmethod
+    def _document_info(document: Document) -> Dict:
+        return {
+            "id": document.id,
+            "content_hash": document.content_hash,
+            "ocr_text": document.ocr_text,
+            "paragraphs_task_id": document.paragraphs_task_id,
+        }
+
+
+# 全局文档服务实例 - 延迟初始化
+_document_service_instance = None
+
+
+def get_document_service() -> DocumentService:
+    """获取文档服务实例（延迟初始化）"""
+    global _document_service_instance
+    if _document_service_instance is None:
+        _document_service_instance = DocumentService()
+    return _document_service_instance
@@ -0,0 +1,331 @@
+import os
+import re
+import unicodedata
+from collections import Counter, deque
+from typing import Dict, Iterator, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 合同当事方标题，如“甲方（全称）：”“委托方:”“出租方（以下简称甲方）：”
+ROLE_HEADER_PATTERN = re.compile(
+    r"(?:甲方|乙方|丙方|委托方|受托方|委托人|受托人|出租方|承租方|买方|卖方|采购方|供应方|供货方|"
+    r"发包方|承包方|转让方|受让方|许可方|被许可方)[ \t]*(?:[（(][^）)\n]{0,12}[）)])?[ \t]*[：:][ \t]*"
+    r"([\u4e00-\u9fa5A-Za-z0-9]{2,30}(?:[（(][\u4e00-\u9fa5]{2,6}[）)][\u4e00-\u9fa5A-Za-z0-9]{1,20})?)"
+)
+# 签约代表，如“法定代表人：张三”
+PERSON_HEADER_PATTERN = re.compile(
+    r"(?:法定代表人|授权代表|委托代理人|联系人|负责人)[ \t]*[：:][ \t]*([\u4e00-\u9fa5]{2,4})(?![\u4e00-\u9fa5])"
+)
+
+ORGANIZATION_SUFFIXES = ("律师事务所", "会计师事务所", "事务所", "研究院", "研究所", "大学", "学院", "医院",
+                         "委员会", "协会", "基金会", "中心", "局")
+COMPANY_SUFFIXES = ("股份有限公司", "有限责任公司", "集团有限公司", "有限公司", "集团", "公司", "合伙企业（有限合伙）",
+                    "合伙企业", "工作室", "商行", "厂")
+
+# 以后缀结尾的机构名称，前缀为中文/字母数字，可含括号地名，如“华为技术（深圳）有限公司”；
+# 非贪婪匹配避免把“A有限公司与B有限公司”合并成一个名称
+_NAME_BODY = r"[\u4e00-\u9fa5A-Za-z0-9]{2,30}?(?:[（(][\u4e00-\u9fa5]{2,6}[）)][\u4e00-\u9fa5A-Za-z0-9]{0,20}?)?"
+COMPANY_SUFFIX_PATTERN = re.compile(
+    rf"({_NAME_BODY}(?:{'|'.join(re.escape(s) for s in sorted(COMPANY_SUFFIXES, key=len, reverse=True))}))"
+)
+ORGANIZATION_SUFFIX_PATTERN = re.compile(
+    rf"({_NAME_BODY}(?:{'|'.join(re.escape(s) for s in sorted(ORGANIZATION_SUFFIXES, key=len, reverse=True))}))"
+)
+PERSON_NAME_PATTERN = re.compile(r"^[\u4e00-\u9fa5]{2,4}$")
+
+# 后缀匹配从句子开头起算时带入的前导词，如“本合同由北京某某有限公司…”
+_LEADING_NOISE = ("本合同", "本协议", "合同", "协议", "双方", "签订", "以下简称", "根据", "委托", "授权",
+                  "甲方", "乙方", "由", "与", "和", "及", "向", "经", "为", "是", "即", "同", "在")
+# 名称中间出现时表示前面是句子成分的分隔词，如“争议提交某某仲裁委员会”“本项目由某某中心”
+_SPLIT_TOKENS = ("提交", "交由", "由", "与", "向", "委托")
+
+ENTITY_TYPES = ("companies", "persons", "organizations")
+
+# 归一化比较时视为同一主体的公司形式后缀，如“某某有限公司”与“某某有限责任公司”
+_COMPANY_FORM_PATTERN = re.compile(r"(股份有限公司|有限责任公司|有限公司|股份公司|公司)$")
+
+# 各类证据的置信度
+SCORE_ROLE_HEADER = 0.6
+SCORE_SUFFIX = 0.3
+SCORE_DICTIONARY = 0.5
+
+
+class AhoCorasick:
+    """Aho-Corasick多模式匹配自动机，一次扫描文本即可找出全部词典命中"""
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[Tuple[str, str]]] = [[]]
+        self._size = 0
+        self._built = False
+
+    def add(self, word: str, payload: str):
+        """添加一个模式及其附带信息（如实体类型）"""
+        state = 0
+        for char in word:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append((word, payload))
+        self._size += 1
+        self._built = False
+
+    def build(self):
+        """构建失败指针"""
+        queue = deque(self._goto[0].values())
+        for state in queue:
+            self._fail[state] = 0
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                candidate = self._goto[fail].get(char, 0)
+                self._fail[next_state] = candidate if candidate != next_state else 0
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+        self._built = True
+
+    def __len__(self) -> int:
+        return self._size
+
+    def find_all(self, text: str) -> Iterator[Tuple[int, str, str]]:
+        """扫描文本，产出(起始位置, 匹配词, 附带信息)"""
+        if not self._built:
+            self.build()
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for word, payload in self._output[state]:
+                yield index - len(word) + 1, word, payload
+
+
+def _classify(name: str) -> Optional[str]:
+    """根据后缀判断实体类型"""
+    if name.endswith(COMPANY_SUFFIXES):
+        return "companies"
+    if name.endswith(ORGANIZATION_SUFFIXES):
+        return "organizations"
+    if PERSON_NAME_PATTERN.match(name):
+        return "persons"
+    return None
+
+
+def _clean_name(name: str) -> str:
+    name = name.strip().strip("“”\"'《》【】[]")
+    stripped = True
+    while stripped:
+        stripped = False
+        for noise in _LEADING_NOISE:
+            # 去掉前导词后仍需保留足够长的名称
+            if name.startswith(noise) and len(name) - len(noise) >= 4:
+                name = name[len(noise):]
+                stripped = True
+    for token in _SPLIT_TOKENS:
+        index = name.rfind(token)
+        if index > 0 and len(name) - index - len(token) >= 4:
+            name = name[index + len(token):]
+    return name
+
+
+def normalize_entity_name(name: str) -> str:
+    """
+    规范化实体名称用于展示：全角字母数字转半角，括号统一为中文全角括号，去除空白
+    """
+    normalized = unicodedata.normalize("NFKC", name or "")
+    normalized = re.sub(r"\s+", "", normalized).strip("“”\"'《》【】[]")
+    return normalized.replace("(", "（").replace(")", "）")
+
+
+def entity_key(name: str) -> str:
+    """实体去重键：规范化后去掉公司形式后缀并转小写"""
+    normalized = normalize_entity_name(name).lower()
+    stripped = _COMPANY_FORM_PATTERN.sub("", normalized)
+    return stripped if len(stripped) >= 2 else normalized
+
+
+def merge_entities(results: List[Dict[str, List[str]]]) -> Dict[str, List[str]]:
+    """
+    合并多个分块的实体结果
+
+    同一主体的不同写法（全/半角、“有限公司”/“有限责任公司”等）只保留一个，
+    取出现次数最多的写法，次数相同取较完整（较长）的写法；按首次出现顺序输出
+    """
+    merged: Dict[str, List[str]] = {}
+    for entity_type in ENTITY_TYPES:
+        variants: Dict[str, Counter] = {}
+        for result in results:
+            for name in (result or {}).get(entity_type) or []:
+                if not isinstance(name, str):
+                    continue
+                normalized = normalize_entity_name(name)
+                if len(normalized) < 2:
+                    continue
+                variants.setdefault(entity_key(normalized), Counter())[normalized] += 1
+        merged[entity_type] = [
+            max(counter, key=lambda n: (counter[n], len(n))) for counter in variants.values()
+        ]
+    return merged
+
+
+def chunk_text(text: str, chunk_chars: int, overlap: int = 200) -> List[str]:
+    """
+    将全文按长度切分为相邻重叠的块，尽量在换行处切分
+
+    重叠部分避免跨块的名称被截断；重叠长度最多为块长度的一半，保证每块都向前推进
+    """
+    if len(text) <= chunk_chars:
+        return [text]
+    overlap = max(0, min(overlap, chunk_chars // 2))
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(len(text), start + chunk_chars)
+        if end < len(text):
+            newline = text.rfind("\n", start + chunk_chars // 2, end)
+            if newline != -1:
+                end = newline + 1
+        chunks.append(text[start:end])
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+    return chunks
+
+
+class LocalEntityExtractor:
+    """
+    本地实体提取器（首轮NER）
+
+    综合三类证据并给出置信度：当事方标题（甲方/乙方/委托方/受托方等）、
+    公司/机构后缀匹配，以及Aho-Corasick自动机匹配的交易对手词典
+    """
+
+    def __init__(self, dictionary_path: Optional[str] = None):
+        self.automaton = AhoCorasick()
+        path = dictionary_path or os.getenv("ENTITY_DICTIONARY_PATH")
+        if path:
+            self.load_dictionary(path)
+
+    def load_dictionary(self, path: str):
+        """
+        加载交易对手词典
+
+        每行一个名称；可用制表符指定类型，如“organizations\\t某某仲裁委员会”
+        """
+        if not os.path.exists(path):
+            logger.warning(f"Entity dictionary not found: {path}")
+            return
+        count = 0
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                entity_type, _, name = line.rpartition("\t")
+                self.add_name(name, entity_type or None)
+                count += 1
+        logger.info(f"📖 Loaded {count} counterparties from {path}")
+
+    def add_name(self, name: str, entity_type: Optional[str] = None):
+        """向词典添加一个名称（与待提取文本一样规范化）"""
+        name = normalize_entity_name(name)
+        if len(name) >= 2:
+            self.automaton.add(name, entity_type or _classify(name) or "companies")
+
+    def extract(self, text: str) -> Dict:
+        """
+        提取实体
+
+        Returns:
+            {"entities": {companies, persons, organizations}, "scores": {名称: 置信度}, "confidence": 整体置信度}
+        """
+        # 扫描件/OCR文本常见全角字母数字，先转半角，否则名称中的全角字母会被截掉；
+        # 括号与normalize_entity_name一致统一为中文全角括号
+        text = unicodedata.normalize("NFKC", text).replace("(", "（").replace(")", "）")
+        scores: Dict[str, float] = {}
+        types: Dict[str, str] = {}
+        role_parties: List[str] = []
+
+        def add(name: str, entity_type: Optional[str], score: float):
+            name = _clean_name(name)
+            entity_type = entity_type or _classify(name)
+            if not entity_type or len(name) < 2:
+                return
+            scores[name] = min(1.0, scores.get(name, 0.0) + score)
+            types.setdefault(name, entity_type)
+
+        for match in ROLE_HEADER_PATTERN.finditer(text):
+            name = _clean_name(match.group(1))
+            if _classify(name):
+                add(name, None, SCORE_ROLE_HEADER)
+                role_parties.append(name)
+
+        for match in PERSON_HEADER_PATTERN.finditer(text):
+            add(match.group(1), "persons", SCORE_ROLE_HEADER)
+
+        for pattern in (COMPANY_SUFFIX_PATTERN, ORGANIZATION_SUFFIX_PATTERN):
+            for match in pattern.finditer(text):
+                add(match.group(1), None, SCORE_SUFFIX)
+
+        if len(self.automaton):
+            for _, word, entity_type in self.automaton.find_all(text):
+                if scores.get(word, 0.0) < 1.0:
+                    add(word, entity_type, SCORE_DICTIONARY)
+
+        # 互相包含的名称只保留得分高的一个，同分保留较长的
+        for name in sorted(scores, key=len):
+            if name not in scores or types[name] == "persons":
+                continue
+            for other in [o for o in scores if o != name and name in o]:
+                if scores[name] > scores[other]:
+                    scores.pop(other)
+                else:
+                    scores.pop(name)
+                    break
+
+        entities = {"companies": [], "persons": [], "organizations": []}
+        for name in sorted(scores, key=lambda n: (-scores[n], text.find(n))):
+            if scores[name] >= SCORE_SUFFIX:
+                entities[types[name]].append(name)
+
+        return {
+            "entities": entities,
+            "scores": {name: round(score, 2) for name, score in scores.items()},
+            "confidence": self._confidence(scores, role_parties),
+        }
+
+    @staticmethod
+    def _confidence(scores: Dict[str, float], role_parties: List[str]) -> float:
+        """
+        整体置信度：合同通常至少有两个当事方，
+        取得分最高的两个当事方的平均分；只识别出一方时减半
+        """
+        parties = sorted((scores[name] for name in set(role_parties) if name in scores), reverse=True)
+        if not parties:
+            top = sorted(scores.values(), reverse=True)[:2]
+            return round(sum(top) / 4, 2) if top else 0.0
+        if len(parties) == 1:
+            return round(parties[0] / 2, 2)
+        return round((parties[0] + parties[1]) / 2, 2)
+
+
+# 全局提取器实例 - 延迟初始化
+_entity_extractor_instance = None
+
+
+def get_entity_extractor() -> LocalEntityExtractor:
+    """获取本地实体提取器实例（延迟初始化）"""
+    global _entity_extractor_instance
+    if _entity_extractor_instance is None:
+        _entity_extractor_instance = LocalEntityExtractor()
+    return _entity_extractor_instance
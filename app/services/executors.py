@@ -0,0 +1,109 @@
+import asyncio
+import contextvars
+import functools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Optional, TypeVar
+import logging
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_lock = threading.Lock()
+_thread_pool: Optional[ThreadPoolExecutor] = None
+_process_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_thread_pool() -> ThreadPoolExecutor:
+    """阻塞I/O线程池（同步数据库、文件读写），大小由BLOCKING_IO_THREADS配置"""
+    global _thread_pool
+    with _lock:
+        if _thread_pool is None:
+            _thread_pool = ThreadPoolExecutor(
+                max_workers=int(os.getenv("BLOCKING_IO_THREADS", "16")),
+                thread_name_prefix="blocking-io"
+            )
+        return _thread_pool
+
+
+def get_process_pool() -> Optional[ProcessPoolExecutor]:
+    """
+    CPU密集任务进程池（文本提取/OCR、段落切分、向量计算）
+
+    CPU_POOL_WORKERS=0时不启用进程池，CPU任务退回线程池执行；
+    默认使用spawn启动，避免fork继承数据库连接和线程锁
+    """
+    global _process_pool
+    workers = int(os.getenv("CPU_POOL_WORKERS", str(min(4, os.cpu_count() or 1))))
+    if workers <= 0:
+        return None
+    with _lock:
+        if _process_pool is None:
+            context = multiprocessing.get_context(os.getenv("CPU_POOL_START_METHOD", "spawn"))
+            _process_pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+        return _process_pool
+
+
+async def run_blocking(fn: Callable[..., T], *args, **kwargs) -> T:
+    """在线程池中执行阻塞调用，保留当前上下文（如LLM用量归属）"""
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(get_thread_pool(), functools.partial(context.run, fn, *args, **kwargs))
+
+
+async def run_cpu_bound(fn: Callable[..., T], *args) -> T:
+    """
+    在进程池中执行CPU密集调用，fn和参数必须可pickle（模块级函数）
+
+    进程池未启用或已损坏（子进程被杀）时退回线程池，避免审查失败。
+    调用方被取消（如审查被取消）时，尚未开始的计算直接撤销，已在子进程中运行的计算连同进程池一起终止
+    """
+    global _process_pool
+    pool = get_process_pool()
+    if pool is None:
+        return await run_blocking(fn, *args)
+    try:
+        future = pool.submit(fn, *args)
+        return await asyncio.wrap_future(future)
+    except BrokenProcessPool:
+        logger.warning("CPU process pool is broken, recreating it and running in a thread")
+        _discard_process_pool(pool)
+        return await run_blocking(fn, *args)
+    except asyncio.CancelledError:
+        if not future.cancel():
+            logger.warning("Cancelled CPU task is still running, terminating the process pool")
+            _discard_process_pool(pool, terminate=True)
+        raise
+
+
+def _discard_process_pool(pool: ProcessPoolExecutor, terminate: bool = False):
+    """
+    丢弃进程池，下次调用时重新创建
+
+    terminate=True时终止其子进程：进程池无法单独终止某个任务，
+    同一进程池中其他调用方会收到BrokenProcessPool并退回线程池重做
+    """
+    global _process_pool
+    with _lock:
+        if _process_pool is pool:
+            _process_pool = None
+    if terminate:
+        for process in list((getattr(pool, "_processes", None) or {}).values()):
+            process.terminate()
+    pool.shutdown(wait=False)
+
+
+def shutdown_executors():
+    """关闭线程池和进程池（应用关闭时调用）"""
+    global _thread_pool, _process_pool
+    with _lock:
+        thread_pool, process_pool = _thread_pool, _process_pool
+        _thread_pool = _process_pool = None
+    if process_pool is not None:
+        process_pool.shutdown(wait=True, cancel_futures=True)
+    if thread_pool is not None:
+        thread_pool.shutdown(wait=False, cancel_futures=True)
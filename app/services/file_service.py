@@ -1,6 +1,7 @@
+import hashlib
 import os
 import shutil
-from typing import Optional
+from typing import Dict, Optional
 from fastapi import UploadFile
 from sqlalchemy.orm import Session
 import pytesseract
@@ -32,8 +33,9 @@ class FileService:
         self.upload_dir = os.getenv("UPLOAD_DIR", "./uploads")
         os.makedirs(self.upload_dir, exist_ok=True)
     
-    async def save_and_enqueue(self, file: UploadFile, contract_type: str, user_id: int = None) -> int:
-        """保存文件并创建任务"""
+    async def save_and_enqueue(self, file: UploadFile, contract_type: str, user_id: int = None,
+                               parent_task_id: int = None) -> int:
+        """保存文件并创建任务（parent_task_id为上一版合同的任务，复审时增量分析）"""
         db = SessionLocal()
         try:
             # 获取文件信息
@@ -48,6 +50,7 @@ class FileService:
             # 先创建一个临时任务来获取ID
             temp_task = Task(
                 user_id=user_id,  # 允许为None
+                parent_task_id=parent_task_id,
                 file_name=file.filename,
                 file_path="temp",  # 临时路径，稍后更新
                 file_size=file_size,
@@ -74,6 +77,12 @@ class FileService:
             filename = f"{task.id}_{file.filename}"
             file_path = os.path.join(self.upload_dir, filename)
             
+            # 计算内容哈希，用于复用相同文件的提取结果
+            hasher = hashlib.sha256()
+            for block in iter(lambda: file.file.read(1024 * 1024), b""):
+                hasher.update(block)
+            file.file.seek(0)
+            
             with open(file_path, "wb") as buffer:
                 shutil.copyfileobj(file.file, buffer)
             
@@ -82,7 +91,8 @@ class FileService:
                 task_id=task.id,
                 filename=file.filename,
                 path=file_path,
-                file_type=file_extension[1:] if file_extension else "unknown"
+                file_type=file_extension[1:] if file_extension else "unknown",
+                content_hash=hasher.hexdigest()
             )
             db.add(file_record)
             db.commit()
@@ -178,6 +188,43 @@ class FileService:
         logger.warning("PDF OCR not fully implemented")
         return ""
     
+    def count_pages(self, file_path: str) -> int:
+        """文件页数（仅PDF按页提取，其他格式视为一页）"""
+        if os.path.splitext(file_path)[1].lower() != '.pdf' or PDF_LIBRARY is None:
+            return 1
+        try:
+            if PDF_LIBRARY == "pdfplumber":
+                with pdfplumber.open(file_path) as pdf:
+                    return len(pdf.pages)
+            with open(file_path, 'rb') as file:
+                return len(PyPDF2.PdfReader(file).pages)
+        except Exception as e:
+            logger.warning(f"Failed to count pages of {file_path}: {e}")
+            return 1
+    
+    def extract_page_text(self, file_path: str, page_index: int, page_count: Optional[int] = None) -> str:
+        """
+        提取单页文本（流式流水线使用）
+        
+        各页文本按双换行拼接即为extract_text_from_file的结果；非PDF文件只有一页，返回全文。
+        page_count为调用方已知的页数，避免逐页重复打开文件计数
+        """
+        if page_count is None:
+            page_count = self.count_pages(file_path)
+        if page_count == 1:
+            return self.extract_text_from_file(file_path)
+        try:
+            if PDF_LIBRARY == "pdfplumber":
+                with pdfplumber.open(file_path) as pdf:
+                    text = pdf.pages[page_index].extract_text()
+            else:
+                with open(file_path, 'rb') as file:
+                    text = PyPDF2.PdfReader(file).pages[page_index].extract_text()
+            return (text or "").strip()
+        except Exception as e:
+            logger.error(f"Error extracting page {page_index} from {file_path}: {e}")
+            return ""
+    
     def split_text_into_paragraphs(self, text: str) -> list[str]:
         """将文本分割为段落"""
         # 按双换行符分割段落
@@ -207,6 +254,41 @@ class FileService:
         finally:
             db.close()
 
+    def find_ocr_text_by_hash(self, content_hash: str, exclude_task_id: int = None) -> Optional[str]:
+        """查找相同内容文件已提取的OCR文本"""
+        if not content_hash:
+            return None
+        db = SessionLocal()
+        try:
+            query = db.query(File.ocr_text).filter(
+                File.content_hash == content_hash,
+                File.ocr_text.isnot(None),
+                File.ocr_text != ""
+            )
+            if exclude_task_id is not None:
+                query = query.filter(File.task_id != exclude_task_id)
+            row = query.order_by(File.id.desc()).first()
+            return row.ocr_text if row else None
+        finally:
+            db.close()
+    
+    def find_entities_by_hash(self, content_hash: str, exclude_task_id: int = None) -> Optional[Dict]:
+        """查找相同内容文件已提取的实体数据"""
+        if not content_hash:
+            return None
+        db = SessionLocal()
+        try:
+            query = db.query(Task.entities_data).join(File, File.task_id == Task.id).filter(
+                File.content_hash == content_hash,
+                Task.entities_data.isnot(None)
+            )
+            if exclude_task_id is not None:
+                query = query.filter(Task.id != exclude_task_id)
+            row = query.order_by(Task.id.desc()).first()
+            return row.entities_data if row else None
+        finally:
+            db.close()
+
 # 延迟初始化的文件服务实例
 _file_service_instance = None
 
@@ -215,4 +297,24 @@ def get_file_service() -> FileService:
     global _file_service_instance
     if _file_service_instance is None:
         _file_service_instance = FileService()
-    return _file_service_instance
\ No newline at end of file
+    return _file_service_instance
+
+# 进程池入口：模块级函数可被pickle，在子进程中使用各自的文件服务实例
+def extract_text(file_path: str) -> str:
+    """从文件中提取文本（CPU密集，供进程池调用）"""
+    return get_file_service().extract_text_from_file(file_path)
+
+
+def split_paragraphs(text: str) -> list[str]:
+    """将文本分割为段落（供进程池调用）"""
+    return get_file_service().split_text_into_paragraphs(text)
+
+
+def count_pages(file_path: str) -> int:
+    """文件页数（供进程池调用）"""
+    return get_file_service().count_pages(file_path)
+
+
+def extract_page_text(file_path: str, page_index: int, page_count: Optional[int] = None) -> str:
+    """提取单页文本（CPU密集，供进程池调用）"""
+    return get_file_service().extract_page_text(file_path, page_index, page_count)
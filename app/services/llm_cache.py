@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+import logging
+
+from ..metrics import LLM_CACHE_REQUESTS, LLM_CACHE_LATENCY_SAVED
+from ..models import LLMCacheEntry
+from ..database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+
+def make_cache_key(model: str, messages: List[Dict], temperature: float) -> str:
+    """根据(model, messages, temperature)生成缓存键"""
+    payload = json.dumps(
+        {"model": model, "messages": messages, "temperature": temperature},
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """LLM响应缓存：进程内LRU + Postgres两级"""
+
+    def __init__(self):
+        self.enabled = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+        self.ttl = int(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+        self.max_entries = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "512"))
+        self.db_enabled = os.getenv("LLM_CACHE_DB_ENABLED", "true").lower() == "true"
+        # key -> (response, latency_ms, expires_at monotonic)
+        self._lru: "OrderedDict[str, Tuple[str, float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_memory(self, key: str) -> Optional[Tuple[str, float]]:
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is None:
+                return None
+            response, latency_ms, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._lru[key]
+                return None
+            self._lru.move_to_end(key)
+            return response, latency_ms
+
+    def _put_memory(self, key: str, response: str, latency_ms: float, ttl: int):
+        with self._lock:
+            self._lru[key] = (response, latency_ms, time.monotonic() + ttl)
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.max_entries:
+                self._lru.popitem(last=False)
+
+    def _get_db(self, key: str) -> Optional[Tuple[str, float, float]]:
+        db = SessionLocal()
+        try:
+            entry = db.query(LLMCacheEntry).filter(
+                LLMCacheEntry.cache_key == key,
+                LLMCacheEntry.expires_at > datetime.utcnow()
+            ).first()
+            if entry is None:
+                return None
+            remaining = (entry.expires_at - datetime.utcnow()).total_seconds()
+            return entry.response, entry.latency_ms or 0.0, remaining
+        except Exception as e:
+            logger.warning(f"LLM cache DB lookup failed: {e}")
+            return None
+        finally:
+            db.close()
+
+    def _put_db(self, key: str, model: str, response: str, latency_ms: float, ttl: int):
+        db = SessionLocal()
+        try:
+            db.merge(LLMCacheEntry(
+                cache_key=key,
+                model=model,
+                response=response,
+                latency_ms=latency_ms,
+                expires_at=datetime.utcnow() + timedelta(seconds=ttl)
+            ))
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"LLM cache DB write failed: {e}")
+        finally:
+            db.close()
+
+    def get(self, key: str) -> Optional[str]:
+        """查询缓存，命中时记录节省的延迟"""
+        if not self.enabled:
+            return None
+
+        cached = self._get_memory(key)
+        if cached is not None:
+            LLM_CACHE_REQUESTS.labels(tier="memory", result="hit").inc()
+            LLM_CACHE_LATENCY_SAVED.inc(cached[1] / 1000)
+            return cached[0]
+        LLM_CACHE_REQUESTS.labels(tier="memory", result="miss").inc()
+
+        if not self.db_enabled:
+            return None
+        cached = self._get_db(key)
+        if cached is None:
+            LLM_CACHE_REQUESTS.labels(tier="postgres", result="miss").inc()
+            return None
+        response, latency_ms, remaining = cached
+        LLM_CACHE_REQUESTS.labels(tier="postgres", result="hit").inc()
+        LLM_CACHE_LATENCY_SAVED.inc(latency_ms / 1000)
+        # 回填进程内缓存
+        self._put_memory(key, response, latency_ms, int(remaining))
+        return response
+
+    def put(self, key: str, model: str, response: str, latency_ms: float, ttl: Optional[int] = None):
+        """写入两级缓存"""
+        if not self.enabled or not response:
+            return
+        ttl = ttl or self.ttl
+        self._put_memory(key, response, latency_ms, ttl)
+        if self.db_enabled:
+            self._put_db(key, model, response, latency_ms, ttl)
+
+    def clear_memory(self):
+        """清空进程内缓存"""
+        with self._lock:
+            self._lru.clear()
+
+
+# 全局缓存实例 - 延迟初始化
+_llm_cache_instance = None
+
+
+def get_llm_cache() -> LLMCache:
+    """获取LLM缓存实例（延迟初始化）"""
+    global _llm_cache_instance
+    if _llm_cache_instance is None:
+        _llm_cache_instance = LLMCache()
+    return _llm_cache_instance
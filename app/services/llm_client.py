@@ -0,0 +1,262 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from typing import AsyncIterator, Dict, List, Optional
+import logging
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASE_URL = "https://openrouter.ai/api/v1"
+
+
+class LLMAPIError(Exception):
+    """OpenRouter接口返回非200状态"""
+
+    def __init__(self, status_code: int, body: str = "", retry_after: Optional[float] = None):
+        super().__init__(f"API call failed: {status_code}")
+        self.status_code = status_code
+        self.body = body
+        self.retry_after = retry_after
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析Retry-After响应头（仅支持秒数格式）"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+
+class LLMClient:
+    """OpenRouter HTTP客户端，进程内复用连接池（keep-alive）"""
+
+    def __init__(self, api_key: str, base_url: Optional[str] = None):
+        self.api_key = api_key
+        self.base_url = (base_url or os.getenv("OPENROUTER_BASE_URL", DEFAULT_BASE_URL)).rstrip("/")
+        self.chat_url = f"{self.base_url}/chat/completions"
+
+        self.connect_timeout = float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))
+        self.read_timeout = float(os.getenv("LLM_READ_TIMEOUT", "120"))
+        # 单次调用的总耗时上限（含排队、连接、读取）
+        self.total_timeout = float(os.getenv("LLM_TOTAL_TIMEOUT", "180"))
+        self.limits = httpx.Limits(
+            max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "20")),
+            max_keepalive_connections=int(os.getenv("LLM_MAX_KEEPALIVE", "10")),
+            keepalive_expiry=float(os.getenv("LLM_KEEPALIVE_EXPIRY", "30")),
+        )
+        self.timeout = httpx.Timeout(
+            connect=self.connect_timeout,
+            read=self.read_timeout,
+            write=self.connect_timeout,
+            pool=self.connect_timeout,
+        )
+
+        self._sync_client: Optional[httpx.Client] = None
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self._async_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._async_guard: Optional[asyncio.Task] = None
+        self._lock = threading.Lock()
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+        }
+
+    def _get_sync_client(self) -> httpx.Client:
+        with self._lock:
+            if self._sync_client is None:
+                self._sync_client = httpx.Client(headers=self.headers, timeout=self.timeout, limits=self.limits)
+            return self._sync_client
+
+    def _get_async_client(self) -> httpx.AsyncClient:
+        # AsyncClient绑定创建它的事件循环，循环变化时关闭旧连接池并重建
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_loop is not loop:
+            self._discard_async_client()
+            client = httpx.AsyncClient(headers=self.headers, timeout=self.timeout, limits=self.limits)
+            self._async_client = client
+            self._async_loop = loop
+            # 循环结束时（asyncio.run收尾会取消剩余任务）在该循环上关闭连接池
+            self._async_guard = loop.create_task(self._close_when_loop_ends(client))
+        return self._async_client
+
+    @staticmethod
+    async def _close_when_loop_ends(client: httpx.AsyncClient):
+        try:
+            await asyncio.get_running_loop().create_future()
+        finally:
+            await client.aclose()
+
+    def _discard_async_client(self):
+        """
+        丢弃旧事件循环上的连接池
+
+        旧循环已结束时连接池已由守护任务关闭；旧循环仍在其他线程运行时提交到该循环关闭
+        """
+        guard, loop = self._async_guard, self._async_loop
+        self._async_client = None
+        self._async_loop = None
+        self._async_guard = None
+        if guard is not None and not guard.done() and loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(guard.cancel)
+
+    def _build_payload(self, messages: List[Dict], model: str, temperature: float, **extra) -> Dict:
+        # usage.include让OpenRouter在响应中返回token用量和费用
+        payload = {"model": model, "messages": messages, "temperature": temperature, "usage": {"include": True}}
+        payload.update(extra)
+        return payload
+
+    def _handle_response(self, response: httpx.Response) -> Dict:
+        if response.status_code != 200:
+            logger.error(f"OpenRouter API error: {response.status_code} - {response.text}")
+            raise LLMAPIError(
+                response.status_code,
+                response.text,
+                _parse_retry_after(response.headers.get("Retry-After")),
+            )
+        return response.json()
+
+    def _total_timeout(self, timeout: Optional[float]) -> float:
+        # 调用方给出的延迟预算不超过全局总超时
+        return min(timeout, self.total_timeout) if timeout else self.total_timeout
+
+    def chat(self, messages: List[Dict], model: str, temperature: float = 0.1,
+             timeout: Optional[float] = None, **extra) -> Dict:
+        """
+        同步调用chat/completions，返回完整响应JSON
+
+        httpx的超时只约束单次连接、读写等待，响应体边读边检查总耗时，缓慢逐段返回的响应也不会超过总超时
+        """
+        total = self._total_timeout(timeout)
+        deadline = time.monotonic() + total
+        request_timeout = httpx.Timeout(
+            connect=min(self.connect_timeout, total),
+            read=min(self.read_timeout, total),
+            write=min(self.connect_timeout, total),
+            pool=min(self.connect_timeout, total),
+        )
+        with self._get_sync_client().stream(
+            "POST",
+            self.chat_url,
+            json=self._build_payload(messages, model, temperature, **extra),
+            timeout=request_timeout,
+        ) as response:
+            chunks = []
+            for chunk in response.iter_bytes():
+                if time.monotonic() > deadline:
+                    raise httpx.ReadTimeout("LLM response exceeded total timeout", request=response.request)
+                chunks.append(chunk)
+            if time.monotonic() > deadline:
+                raise httpx.ReadTimeout("LLM response exceeded total timeout", request=response.request)
+            body = b"".join(chunks)
+        if response.status_code != 200:
+            text = body.decode(response.encoding or "utf-8", errors="replace")
+            logger.error(f"OpenRouter API error: {response.status_code} - {text}")
+            raise LLMAPIError(
+                response.status_code,
+                text,
+                _parse_retry_after(response.headers.get("Retry-After")),
+            )
+        return json.loads(body)
+
+    async def achat(self, messages: List[Dict], model: str, temperature: float = 0.1,
+                    timeout: Optional[float] = None, **extra) -> Dict:
+        """异步调用chat/completions，受总超时（或调用方延迟预算）约束"""
+        client = self._get_async_client()
+        response = await asyncio.wait_for(
+            client.post(self.chat_url, json=self._build_payload(messages, model, temperature, **extra)),
+            timeout=self._total_timeout(timeout),
+        )
+        return self._handle_response(response)
+
+    async def astream_chat(self, messages: List[Dict], model: str, temperature: float = 0.1,
+                           usage: Optional[Dict] = None, timeout: Optional[float] = None,
+                           **extra) -> AsyncIterator[str]:
+        """
+        流式调用chat/completions（SSE），逐段产出增量文本
+
+        总超时约束整个流的读取过程；传入usage字典时写入最后一个事件携带的用量
+        """
+        client = self._get_async_client()
+        payload = self._build_payload(messages, model, temperature, stream=True, **extra)
+        deadline = asyncio.get_running_loop().time() + self._total_timeout(timeout)
+        async with client.stream("POST", self.chat_url, json=payload) as response:
+            if response.status_code != 200:
+                body = (await response.aread()).decode("utf-8", errors="replace")
+                logger.error(f"OpenRouter API error: {response.status_code} - {body}")
+                raise LLMAPIError(
+                    response.status_code,
+                    body,
+                    _parse_retry_after(response.headers.get("Retry-After")),
+                )
+            async for line in response.aiter_lines():
+                if asyncio.get_running_loop().time() > deadline:
+                    raise asyncio.TimeoutError("LLM stream exceeded total timeout")
+                # 以冒号开头的是SSE注释（如OpenRouter的处理中提示）
+                if not line or line.startswith(":") or not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                try:
+                    event = json.loads(data)
+                except json.JSONDecodeError:
+                    logger.warning(f"Invalid SSE payload: {data[:200]}")
+                    continue
+                if "error" in event:
+                    error = event["error"]
+                    raise LLMAPIError(int(error.get("code") or 500), json.dumps(error, ensure_ascii=False))
+                if usage is not None and event.get("usage"):
+                    usage.update(event["usage"])
+                choices = event.get("choices") or []
+                if choices:
+                    delta = (choices[0].get("delta") or {}).get("content")
+                    if delta:
+                        yield delta
+
+    def close(self):
+        """关闭同步连接池"""
+        with self._lock:
+            if self._sync_client is not None:
+                self._sync_client.close()
+                self._sync_client = None
+
+    async def aclose(self):
+        """关闭全部连接池"""
+        self.close()
+        client, guard = self._async_client, self._async_guard
+        self._async_client = None
+        self._async_loop = None
+        self._async_guard = None
+        if guard is not None:
+            guard.cancel()
+        if client is not None:
+            await client.aclose()
+
+
+# 全局客户端实例 - 延迟初始化
+_llm_client_instance = None
+
+
+def get_llm_client(api_key: Optional[str] = None) -> LLMClient:
+    """获取LLM客户端实例（延迟初始化）"""
+    global _llm_client_instance
+    if _llm_client_instance is None:
+        _llm_client_instance = LLMClient(api_key or os.getenv("OPENROUTER_API_KEY", ""))
+    return _llm_client_instance
+
+
+async def close_llm_client():
+    """应用关闭时释放连接池"""
+    global _llm_client_instance
+    if _llm_client_instance is not None:
+        await _llm_client_instance.aclose()
+        _llm_client_instance = None
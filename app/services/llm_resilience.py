@@ -0,0 +1,271 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+import logging
+
+import httpx
+
+from ..metrics import (
+    LLM_REQUESTS, LLM_RETRIES, LLM_CIRCUIT_STATE, LLM_CIRCUIT_REJECTIONS, LLM_RATE_LIMIT_WAIT
+)
+from .llm_client import LLMAPIError
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class CircuitOpenError(Exception):
+    """熔断器打开，上游暂不可用"""
+
+
+class TokenBucket:
+    """令牌桶限流器（进程内共享，线程安全）"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """预留一个令牌，返回需要等待的秒数"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self):
+        """同步获取令牌"""
+        if self.rate <= 0:
+            return
+        wait = self._reserve()
+        if wait > 0:
+            LLM_RATE_LIMIT_WAIT.inc(wait)
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        """异步获取令牌"""
+        if self.rate <= 0:
+            return
+        wait = self._reserve()
+        if wait > 0:
+            LLM_RATE_LIMIT_WAIT.inc(wait)
+            await asyncio.sleep(wait)
+
+
+class CircuitBreaker:
+    """熔断器：连续失败达到阈值后打开，冷却后半开试探（每个模型一个，name为模型名）"""
+
+    CLOSED = "closed"
+    HALF_OPEN = "half_open"
+    OPEN = "open"
+    _STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, failure_threshold: int, recovery_timeout: float, name: str = "default"):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.name = name
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._half_open_in_flight = False
+        self._lock = threading.Lock()
+        LLM_CIRCUIT_STATE.labels(model=name).set(0)
+
+    def _set_state(self, state: str):
+        if state != self.state:
+            logger.warning(f"⚡ LLM circuit breaker ({self.name}): {self.state} -> {state}")
+        self.state = state
+        LLM_CIRCUIT_STATE.labels(model=self.name).set(self._STATE_VALUES[state])
+
+    def before_call(self):
+        """调用前检查，打开状态时快速失败"""
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.recovery_timeout:
+                    LLM_CIRCUIT_REJECTIONS.labels(model=self.name).inc()
+                    raise CircuitOpenError(f"LLM upstream circuit is open for {self.name}")
+                self._set_state(self.HALF_OPEN)
+            if self.state == self.HALF_OPEN:
+                # 半开状态只放行一个试探请求
+                if self._half_open_in_flight:
+                    LLM_CIRCUIT_REJECTIONS.labels(model=self.name).inc()
+                    raise CircuitOpenError(f"LLM upstream circuit is half-open for {self.name}")
+                self._half_open_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._half_open_in_flight = False
+            self._set_state(self.CLOSED)
+
+    def release_probe(self):
+        """调用被取消等非错误中止时释放半开试探名额（不计成功也不计失败）"""
+        with self._lock:
+            self._half_open_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._half_open_in_flight = False
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._set_state(self.OPEN)
+
+
+class LLMResilience:
+    """
+    LLM调用弹性层：限流、重试退避、熔断
+
+    限流器全局共享；熔断器按模型区分，一个模型熔断时模型路由仍可回退到其他候选模型
+    """
+
+    def __init__(self):
+        self.max_retries = int(os.getenv("LLM_MAX_RETRIES", "3"))
+        self.base_delay = float(os.getenv("LLM_RETRY_BASE_DELAY", "1.0"))
+        self.max_delay = float(os.getenv("LLM_RETRY_MAX_DELAY", "30"))
+        self.rate_limiter = TokenBucket(
+            rate=float(os.getenv("LLM_RATE_LIMIT_PER_SEC", "2")),
+            capacity=float(os.getenv("LLM_RATE_LIMIT_BURST", "5")),
+        )
+        self.failure_threshold = int(os.getenv("LLM_BREAKER_FAILURE_THRESHOLD", "5"))
+        self.recovery_timeout = float(os.getenv("LLM_BREAKER_RECOVERY_TIMEOUT", "30"))
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._breakers_lock = threading.Lock()
+        # 未指定模型的调用使用的熔断器
+        self.breaker = self.breaker_for("default")
+
+    def breaker_for(self, model: Optional[str]) -> CircuitBreaker:
+        """获取模型的熔断器（首次使用时创建）"""
+        name = model or "default"
+        with self._breakers_lock:
+            breaker = self._breakers.get(name)
+            if breaker is None:
+                breaker = self._breakers[name] = CircuitBreaker(
+                    self.failure_threshold, self.recovery_timeout, name=name
+                )
+            return breaker
+
+    @staticmethod
+    def retry_reason(error: Exception) -> Optional[str]:
+        """判断异常是否可重试，返回重试原因"""
+        if isinstance(error, LLMAPIError):
+            if error.status_code == 429:
+                return "rate_limited"
+            if error.status_code >= 500:
+                return "server_error"
+            return None
+        if isinstance(error, (httpx.TimeoutException, asyncio.TimeoutError)):
+            return "timeout"
+        if isinstance(error, httpx.TransportError):
+            return "transport"
+        return None
+
+    def compute_delay(self, attempt: int, error: Exception) -> float:
+        """指数退避 + 全抖动，优先遵循Retry-After"""
+        retry_after = getattr(error, "retry_after", None)
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        ceiling = min(self.max_delay, self.base_delay * (2 ** attempt))
+        return random.uniform(0, ceiling)
+
+    def _on_error(self, attempt: int, error: Exception, breaker: CircuitBreaker,
+                  deadline: Optional[float] = None) -> float:
+        """记录失败，返回下一次重试前的等待时间；不可重试或重试会超出deadline时重新抛出"""
+        reason = self.retry_reason(error)
+        # 4xx客户端错误说明上游可达、请求本身有问题，不计入熔断
+        if reason is not None:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        if reason is None or attempt >= self.max_retries:
+            LLM_REQUESTS.labels(outcome="failure").inc()
+            raise error
+        delay = self.compute_delay(attempt, error)
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            logger.warning(f"⏰ LLM call failed ({reason}), latency budget exhausted, not retrying")
+            LLM_REQUESTS.labels(outcome="failure").inc()
+            raise error
+        LLM_RETRIES.labels(reason=reason).inc()
+        logger.warning(f"🔁 LLM call failed ({reason}), retry {attempt + 1}/{self.max_retries} in {delay:.2f}s")
+        return delay
+
+    def call(self, fn: Callable[[], T], stats: Optional[Dict] = None, model: Optional[str] = None,
+             deadline: Optional[float] = None) -> T:
+        """
+        同步执行带弹性保护的调用，stats["retries"]记录重试次数，model决定使用的熔断器
+
+        deadline为time.monotonic()时刻，重试（含退避等待）不会超过该时刻；fn自身的超时由调用方按剩余时间设置
+        """
+        breaker = self.breaker_for(model)
+        attempt = 0
+        while True:
+            if stats is not None:
+                stats["retries"] = attempt
+            try:
+                breaker.before_call()
+            except CircuitOpenError:
+                LLM_REQUESTS.labels(outcome="rejected").inc()
+                raise
+            try:
+                self.rate_limiter.acquire()
+                result = fn()
+            except Exception as e:
+                time.sleep(self._on_error(attempt, e, breaker, deadline))
+                attempt += 1
+                continue
+            except BaseException:
+                breaker.release_probe()
+                raise
+            breaker.record_success()
+            LLM_REQUESTS.labels(outcome="success").inc()
+            return result
+
+    async def acall(self, fn: Callable[[], Awaitable[T]], stats: Optional[Dict] = None,
+                    model: Optional[str] = None, deadline: Optional[float] = None) -> T:
+        """异步执行带弹性保护的调用，参数同call"""
+        breaker = self.breaker_for(model)
+        attempt = 0
+        while True:
+            if stats is not None:
+                stats["retries"] = attempt
+            try:
+                breaker.before_call()
+            except CircuitOpenError:
+                LLM_REQUESTS.labels(outcome="rejected").inc()
+                raise
+            try:
+                await self.rate_limiter.acquire_async()
+                result = await fn()
+            except Exception as e:
+                await asyncio.sleep(self._on_error(attempt, e, breaker, deadline))
+                attempt += 1
+                continue
+            except BaseException:
+                # 取消（审查SLA超时、作业取消、流水线阶段失败）不是上游故障，只释放试探名额
+                breaker.release_probe()
+                raise
+            breaker.record_success()
+            LLM_REQUESTS.labels(outcome="success").inc()
+            return result
+
+
+# 全局弹性层实例 - 进程内共享
+_resilience_instance = None
+
+
+def get_llm_resilience() -> LLMResilience:
+    """获取LLM弹性层实例（延迟初始化）"""
+    global _resilience_instance
+    if _resilience_instance is None:
+        _resilience_instance = LLMResilience()
+    return _resilience_instance
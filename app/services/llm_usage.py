@@ -0,0 +1,162 @@
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+import logging
+
+from sqlalchemy import func, case, cast, Date
+
+from ..metrics import LLM_TOKENS
+from ..models import LLMCall
+from ..database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# 当前调用所属的任务和阶段，随asyncio任务自动传播
+_call_context: ContextVar[Dict] = ContextVar("llm_call_context", default={})
+
+
+@contextmanager
+def llm_call_scope(task_id: Optional[int] = None, stage: Optional[str] = None):
+    """标记作用域内LLM调用所属的任务和阶段"""
+    token = _call_context.set({"task_id": task_id, "stage": stage})
+    try:
+        yield
+    finally:
+        _call_context.reset(token)
+
+
+@contextmanager
+def shared_llm_call_scope(task_ids: List[Optional[int]], stage: Optional[str] = None):
+    """
+    标记作用域内LLM调用由多个任务共享（如实体提取微批）
+
+    task_ids为每份合并文档所属的任务（可重复），记录时用量按各任务的文档数分摊
+    """
+    token = _call_context.set({"task_id": None, "stage": stage, "shares": dict(Counter(task_ids))})
+    try:
+        yield
+    finally:
+        _call_context.reset(token)
+
+
+def _split_int(total: int, weights: List[int]) -> List[int]:
+    """按权重拆分整数，余数计入第一份，各份之和等于total"""
+    shares = [total * weight // sum(weights) for weight in weights]
+    shares[0] += total - sum(shares)
+    return shares
+
+
+def current_call_context() -> Dict:
+    """获取当前LLM调用上下文"""
+    return _call_context.get()
+
+
+def record_llm_call(model: str, usage: Optional[Dict] = None, latency_ms: float = 0.0, retries: int = 0,
+                    cache_hit: bool = False, success: bool = True, error: Optional[str] = None):
+    """
+    记录一次LLM调用（尽力而为，失败不影响主流程）
+
+    共享调用（见shared_llm_call_scope）为每个任务各记一行，token、费用和耗时按权重分摊，重试次数计入第一行
+    """
+    usage = usage or {}
+    context = current_call_context()
+    prompt_tokens = int(usage.get("prompt_tokens") or 0)
+    completion_tokens = int(usage.get("completion_tokens") or 0)
+    LLM_TOKENS.labels(model=model, type="prompt").inc(prompt_tokens)
+    LLM_TOKENS.labels(model=model, type="completion").inc(completion_tokens)
+
+    shares = context.get("shares") or {context.get("task_id"): 1}
+    task_ids = list(shares)
+    weights = [shares[task_id] for task_id in task_ids]
+    total_weight = sum(weights)
+    prompt_shares = _split_int(prompt_tokens, weights)
+    completion_shares = _split_int(completion_tokens, weights)
+    cost = usage.get("cost")
+
+    db = SessionLocal()
+    try:
+        db.add_all([
+            LLMCall(
+                task_id=task_id,
+                stage=context.get("stage"),
+                model=model,
+                prompt_tokens=prompt_shares[i],
+                completion_tokens=completion_shares[i],
+                cost=cost * weights[i] / total_weight if cost is not None else None,
+                latency_ms=latency_ms * weights[i] / total_weight,
+                retries=retries if i == 0 else 0,
+                cache_hit=cache_hit,
+                success=success,
+                error=error[:1000] if error else None
+            )
+            for i, task_id in enumerate(task_ids)
+        ])
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"Failed to record LLM call: {e}")
+    finally:
+        db.close()
+
+
+def _aggregate_columns():
+    return [
+        func.count(LLMCall.id).label("calls"),
+        func.coalesce(func.sum(LLMCall.prompt_tokens), 0).label("prompt_tokens"),
+        func.coalesce(func.sum(LLMCall.completion_tokens), 0).label("completion_tokens"),
+        func.coalesce(func.sum(LLMCall.cost), 0).label("cost"),
+        func.coalesce(func.sum(LLMCall.latency_ms), 0).label("latency_ms"),
+        func.coalesce(func.sum(LLMCall.retries), 0).label("retries"),
+        func.coalesce(func.sum(case((LLMCall.cache_hit.is_(True), 1), else_=0)), 0).label("cache_hits"),
+        func.coalesce(func.sum(case((LLMCall.success.is_(False), 1), else_=0)), 0).label("failures"),
+    ]
+
+
+def _row_to_totals(row) -> Dict:
+    return {
+        "calls": int(row.calls or 0),
+        "prompt_tokens": int(row.prompt_tokens or 0),
+        "completion_tokens": int(row.completion_tokens or 0),
+        "total_tokens": int((row.prompt_tokens or 0) + (row.completion_tokens or 0)),
+        "cost": float(row.cost or 0),
+        "latency_ms": float(row.latency_ms or 0),
+        "retries": int(row.retries or 0),
+        "cache_hits": int(row.cache_hits or 0),
+        "failures": int(row.failures or 0),
+    }
+
+
+def get_task_usage(task_id: int) -> Dict:
+    """获取单个任务的LLM用量（总计及按阶段、模型拆分）"""
+    db = SessionLocal()
+    try:
+        totals = db.query(*_aggregate_columns()).filter(LLMCall.task_id == task_id).one()
+        breakdown = db.query(LLMCall.stage, LLMCall.model, *_aggregate_columns()).filter(
+            LLMCall.task_id == task_id
+        ).group_by(LLMCall.stage, LLMCall.model).all()
+        return {
+            "task_id": task_id,
+            "totals": _row_to_totals(totals),
+            "by_stage": [
+                {"stage": row.stage, "model": row.model, **_row_to_totals(row)}
+                for row in breakdown
+            ]
+        }
+    finally:
+        db.close()
+
+
+def get_daily_usage(days: int = 30) -> List[Dict]:
+    """获取最近若干天的每日LLM用量"""
+    db = SessionLocal()
+    try:
+        day = cast(LLMCall.created_at, Date)
+        since = datetime.utcnow() - timedelta(days=days)
+        rows = db.query(day.label("day"), *_aggregate_columns()).filter(
+            LLMCall.created_at >= since
+        ).group_by(day).order_by(day).all()
+        return [{"date": row.day.isoformat(), **_row_to_totals(row)} for row in rows]
+    finally:
+        db.close()
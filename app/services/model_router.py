@@ -0,0 +1,170 @@
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+import logging
+
+from ..metrics import LLM_CALL_DURATION, LLM_MODEL_FALLBACKS, LLM_MODEL_LATENCY_P95
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHAT_MODEL = "qwen/qwen3-235b-a22b:free"
+
+# 实体提取是简单任务，优先使用小模型，失败或变慢时回退到大模型
+DEFAULT_ROUTES = {
+    "ner": ["qwen/qwen3-8b:free", DEFAULT_CHAT_MODEL],
+    "risk_analysis": [DEFAULT_CHAT_MODEL],
+    "risk_analysis_degraded": ["qwen/qwen3-8b:free", DEFAULT_CHAT_MODEL],
+}
+
+DEFAULT_LATENCY_BUDGETS_MS = {
+    "ner": 20000,
+    "risk_analysis": 120000,
+    "risk_analysis_degraded": 30000,
+}
+
+
+def _load_json_env(name: str, default: Dict) -> Dict:
+    raw = os.getenv(name)
+    if not raw:
+        return dict(default)
+    try:
+        return json.loads(raw)
+    except json.JSONDecodeError:
+        logger.warning(f"Invalid JSON in {name}, using defaults")
+        return dict(default)
+
+
+class ModelStats:
+    """单个模型的滚动延迟和错误率统计（时间窗口内）"""
+
+    def __init__(self, window_seconds: float, max_samples: int = 200):
+        self.window_seconds = window_seconds
+        # (timestamp, latency_ms, success)
+        self._samples: Deque[Tuple[float, float, bool]] = deque(maxlen=max_samples)
+        self._lock = threading.Lock()
+
+    def record(self, latency_ms: float, success: bool):
+        with self._lock:
+            self._samples.append((time.monotonic(), latency_ms, success))
+
+    def _recent(self) -> List[Tuple[float, float, bool]]:
+        cutoff = time.monotonic() - self.window_seconds
+        with self._lock:
+            while self._samples and self._samples[0][0] < cutoff:
+                self._samples.popleft()
+            return list(self._samples)
+
+    def snapshot(self) -> Dict:
+        """返回窗口内的样本数、p50/p95延迟和错误率"""
+        samples = self._recent()
+        latencies = sorted(latency for _, latency, success in samples if success)
+        failures = sum(1 for _, _, success in samples if not success)
+
+        def percentile(p: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return latencies[min(len(latencies) - 1, math.ceil(p * len(latencies)) - 1)]
+
+        return {
+            "samples": len(samples),
+            "p50_ms": percentile(0.5),
+            "p95_ms": percentile(0.95),
+            "error_rate": failures / len(samples) if samples else 0.0,
+        }
+
+
+class ModelRouter:
+    """
+    按审查阶段路由模型
+
+    每个阶段配置有序模型列表和单次调用延迟预算；
+    模型窗口内p95延迟超预算或错误率超阈值时降级到列表末尾，
+    窗口过期后样本不足，模型自动恢复原有顺序重新试探
+    """
+
+    def __init__(self, default_model: str = DEFAULT_CHAT_MODEL):
+        self.default_model = os.getenv("LLM_DEFAULT_MODEL", default_model)
+        self.routes: Dict[str, List[str]] = _load_json_env("LLM_MODEL_ROUTES", DEFAULT_ROUTES)
+        self.budgets_ms: Dict[str, float] = _load_json_env("LLM_LATENCY_BUDGETS_MS", DEFAULT_LATENCY_BUDGETS_MS)
+        self.max_error_rate = float(os.getenv("LLM_MODEL_MAX_ERROR_RATE", "0.5"))
+        self.min_samples = int(os.getenv("LLM_MODEL_MIN_SAMPLES", "5"))
+        self.window_seconds = float(os.getenv("LLM_MODEL_STATS_WINDOW", "300"))
+        self._stats: Dict[str, ModelStats] = {}
+        self._lock = threading.Lock()
+
+    def _get_stats(self, model: str) -> ModelStats:
+        with self._lock:
+            if model not in self._stats:
+                self._stats[model] = ModelStats(self.window_seconds)
+            return self._stats[model]
+
+    def models_for(self, stage: str) -> List[str]:
+        """阶段配置的模型列表（未配置时使用默认模型）"""
+        return list(self.routes.get(stage) or [self.default_model])
+
+    def budget_seconds(self, stage: str) -> Optional[float]:
+        """阶段的延迟预算（秒），约束每个候选模型的全部尝试（含重试）"""
+        budget = self.budgets_ms.get(stage)
+        return budget / 1000 if budget else None
+
+    def is_healthy(self, model: str, stage: str) -> bool:
+        snapshot = self._get_stats(model).snapshot()
+        if snapshot["samples"] < self.min_samples:
+            return True
+        if snapshot["error_rate"] > self.max_error_rate:
+            return False
+        budget = self.budgets_ms.get(stage)
+        return not (budget and snapshot["p95_ms"] is not None and snapshot["p95_ms"] > budget)
+
+    def candidates(self, stage: str) -> List[str]:
+        """按健康状况排序的候选模型，健康模型保持配置顺序在前"""
+        models = self.models_for(stage)
+        healthy = [m for m in models if self.is_healthy(m, stage)]
+        return healthy + [m for m in models if m not in healthy]
+
+    def record(self, model: str, latency_ms: float, success: bool):
+        """记录一次调用结果"""
+        stats = self._get_stats(model)
+        stats.record(latency_ms, success)
+        LLM_CALL_DURATION.labels(model=model, outcome="success" if success else "error").observe(latency_ms / 1000)
+        p95 = stats.snapshot()["p95_ms"]
+        if p95 is not None:
+            LLM_MODEL_LATENCY_P95.labels(model=model).set(p95 / 1000)
+
+    def record_fallback(self, stage: str, model: str):
+        """记录一次从model回退到下一个候选模型"""
+        LLM_MODEL_FALLBACKS.labels(stage=stage, model=model).inc()
+        logger.warning(f"🔀 Model {model} failed for stage {stage}, falling back")
+
+    def snapshot(self) -> Dict:
+        """路由表及各模型滚动统计"""
+        stages = set(self.routes) | set(self.budgets_ms)
+        with self._lock:
+            models = list(self._stats)
+        return {
+            "routes": {
+                stage: {
+                    "models": self.models_for(stage),
+                    "candidates": self.candidates(stage),
+                    "latency_budget_ms": self.budgets_ms.get(stage),
+                }
+                for stage in sorted(stages)
+            },
+            "models": {model: self._get_stats(model).snapshot() for model in models},
+        }
+
+
+# 全局路由实例 - 延迟初始化
+_model_router_instance = None
+
+
+def get_model_router() -> ModelRouter:
+    """获取模型路由实例（延迟初始化）"""
+    global _model_router_instance
+    if _model_router_instance is None:
+        _model_router_instance = ModelRouter()
+    return _model_router_instance
@@ -0,0 +1,145 @@
+import asyncio
+import json
+import os
+import re
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+import logging
+
+from ..metrics import NER_BATCH_SIZE
+from .llm_usage import current_call_context, llm_call_scope, shared_llm_call_scope
+
+logger = logging.getLogger(__name__)
+
+_JSON_OBJECT_PATTERN = re.compile(r"\{.*\}", re.DOTALL)
+
+
+def build_batch_entity_messages(texts: List[str], doc_chars: int) -> List[Dict]:
+    """构建多文档实体提取的对话消息，每份文档带编号，结果按编号返回"""
+    documents = "\n\n".join(
+        f"【文档{index}】\n{text[:doc_chars]}" for index, text in enumerate(texts, start=1)
+    )
+    prompt = f"""
+        以下是{len(texts)}份相互独立的合同文本，每份以【文档编号】开头。
+        请分别提取每份文档中所有可能的当事方名称（公司名称、个人姓名、其他组织机构名称），
+        不同文档的实体不要混在一起。
+
+        {documents}
+
+        请严格按照以下JSON格式返回，documents中每份文档一项，id为文档编号，不要添加任何其他内容：
+        {{
+            "documents": [
+                {{"id": 1, "companies": ["公司名称"], "persons": ["姓名"], "organizations": ["组织名称"]}}
+            ]
+        }}
+        """
+    return [
+        {"role": "system", "content": "你是一个专业的合同实体提取专家。请仔细分析每份文本并准确提取所有当事方信息。"},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def split_batch_entity_response(result_text: str, count: int) -> List[Optional[str]]:
+    """将批量响应拆回每份文档的实体JSON，缺失的文档返回None"""
+    results: List[Optional[str]] = [None] * count
+    match = _JSON_OBJECT_PATTERN.search(result_text or "")
+    if not match:
+        return results
+    try:
+        documents = json.loads(match.group()).get("documents") or []
+    except (json.JSONDecodeError, AttributeError):
+        return results
+    for document in documents:
+        if not isinstance(document, dict):
+            continue
+        try:
+            index = int(document.get("id")) - 1
+        except (TypeError, ValueError):
+            continue
+        if 0 <= index < count:
+            results[index] = json.dumps({
+                "companies": document.get("companies") or [],
+                "persons": document.get("persons") or [],
+                "organizations": document.get("organizations") or [],
+            }, ensure_ascii=False)
+    return results
+
+
+class EntityBatcher:
+    """
+    实体提取微批处理器
+
+    在BATCH_WINDOW_MS时间窗口内（或凑满NER_BATCH_MAX_DOCS份文档时）收集请求，
+    合并为一个多文档提示调用LLM，再把结果拆回各调用方。
+    窗口内只有一个请求时按单文档提示调用；批量响应中缺失的文档单独补调。
+    call_llm(messages, use_cache)：批内任一请求跳过缓存时整批跳过缓存。
+    提交时记录调用方的任务上下文，合并调用的用量按各文档所属任务分摊，单文档调用计入其任务
+    """
+
+    def __init__(self, call_llm: Callable[[List[Dict], bool], Awaitable[str]],
+                 build_single_messages: Callable[[str], List[Dict]]):
+        self.call_llm = call_llm
+        self.build_single_messages = build_single_messages
+        self.window = float(os.getenv("NER_BATCH_WINDOW_MS", "200")) / 1000
+        self.max_docs = int(os.getenv("NER_BATCH_MAX_DOCS", "8"))
+        self.doc_chars = int(os.getenv("NER_BATCH_DOC_CHARS", "3000"))
+        self._pending: List[Tuple[str, bool, Optional[int], asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flushes: Set[asyncio.Task] = set()
+
+    async def submit(self, text: str, use_cache: bool = True) -> str:
+        """提交一份文档，返回该文档的实体JSON文本（use_cache为False时不读取LLM响应缓存）"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, use_cache, current_call_context().get("task_id"), future))
+
+        if len(self._pending) >= self.max_docs:
+            self._schedule_flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._schedule_flush)
+
+        return await future
+
+    def _schedule_flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        task = asyncio.ensure_future(self._flush(batch))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _call_single(self, text: str, use_cache: bool, task_id: Optional[int]) -> str:
+        with llm_call_scope(task_id, "ner"):
+            return await self.call_llm(self.build_single_messages(text), use_cache)
+
+    async def _flush(self, batch: List[Tuple[str, bool, Optional[int], asyncio.Future]]):
+        NER_BATCH_SIZE.observe(len(batch))
+        try:
+            if len(batch) == 1:
+                text, use_cache, task_id, _ = batch[0]
+                results = [await self._call_single(text, use_cache, task_id)]
+            else:
+                logger.info(f"📦 Batched entity extraction for {len(batch)} documents")
+                with shared_llm_call_scope([task_id for _, _, task_id, _ in batch], "ner"):
+                    result_text = await self.call_llm(
+                        build_batch_entity_messages([text for text, _, _, _ in batch], self.doc_chars),
+                        all(use_cache for _, use_cache, _, _ in batch)
+                    )
+                results = split_batch_entity_response(result_text, len(batch))
+                missing = [i for i, result in enumerate(results) if result is None]
+                if missing:
+                    logger.warning(f"Batch response missing {len(missing)} documents, retrying individually")
+                    retried = await asyncio.gather(*(self._call_single(*batch[i][:3]) for i in missing))
+                    for i, result in zip(missing, retried):
+                        results[i] = result
+        except Exception as e:
+            for _, _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, _, _, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
@@ -0,0 +1,218 @@
+import math
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter, OrderedDict, defaultdict
+from typing import Dict, List, Optional, Sequence, Tuple
+from sqlalchemy import text
+import logging
+
+from ..models import Paragraph
+from ..database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# 去除空白和常见中英文标点，避免产生无意义的二元组
+_NOISE_PATTERN = re.compile(r"[\s　，。、；：？！“”‘’（）《》【】,.;:?!\"'()\[\]<>]+")
+
+# RRF常数，取自原论文的经验值
+RRF_K = 60
+
+
+def char_bigrams(text_value: str) -> List[str]:
+    """将文本切分为字符二元组（中文合同术语以二元组匹配最稳定）"""
+    normalized = unicodedata.normalize("NFKC", text_value or "").lower()
+    normalized = _NOISE_PATTERN.sub("", normalized)
+    if len(normalized) < 2:
+        return [normalized] if normalized else []
+    return [normalized[i:i + 2] for i in range(len(normalized) - 1)]
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]], k: int = RRF_K,
+                           weights: Optional[Sequence[float]] = None) -> List[Tuple[int, float]]:
+    """倒数排名融合：score(d) = Σ w_i / (k + rank_i(d))"""
+    weights = weights or [1.0] * len(rankings)
+    scores: Dict[int, float] = defaultdict(float)
+    for ranking, weight in zip(rankings, weights):
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] += weight / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class BigramIndex:
+    """字符二元组倒排索引，使用BM25打分"""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+        self.doc_lengths: Dict[int, int] = {}
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    def add(self, doc_id: int, text_value: str):
+        """加入一个文档"""
+        grams = char_bigrams(text_value)
+        for gram, tf in Counter(grams).items():
+            self.postings[gram][doc_id] = tf
+        self.doc_lengths[doc_id] = len(grams)
+        self._total_length += len(grams)
+
+    def search(self, query: str, limit: int = 10) -> List[Tuple[int, float]]:
+        """按BM25分数检索，返回 (doc_id, score) 列表"""
+        if not self.doc_lengths:
+            return []
+        doc_count = len(self.doc_lengths)
+        avg_length = self._total_length / doc_count or 1.0
+        scores: Dict[int, float] = defaultdict(float)
+        for gram in set(char_bigrams(query)):
+            postings = self.postings.get(gram)
+            if not postings:
+                continue
+            idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, tf in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / avg_length)
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return ranked[:limit]
+
+
+class RetrievalService:
+    """混合检索服务：字符二元组词法检索 + 向量检索，通过RRF融合"""
+
+    def __init__(self):
+        self.max_cached_tasks = int(os.getenv("RETRIEVAL_INDEX_CACHE_SIZE", "64"))
+        # 每路召回的候选数量 = limit * candidate_multiplier
+        self.candidate_multiplier = int(os.getenv("RETRIEVAL_CANDIDATE_MULTIPLIER", "4"))
+        self._indexes: "OrderedDict[int, Tuple[BigramIndex, Dict[int, Dict]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def invalidate(self, task_id: int):
+        """段落变化后使任务索引失效"""
+        with self._lock:
+            self._indexes.pop(task_id, None)
+
+    def _get_index(self, db, task_id: int) -> Tuple[BigramIndex, Dict[int, Dict]]:
+        """获取（必要时构建）任务的词法索引"""
+        with self._lock:
+            cached = self._indexes.get(task_id)
+            if cached is not None:
+                self._indexes.move_to_end(task_id)
+                return cached
+
+        rows = db.query(Paragraph.id, Paragraph.text, Paragraph.paragraph_index).filter(
+            Paragraph.task_id == task_id
+        ).all()
+        index = BigramIndex()
+        paragraphs = {}
+        for row in rows:
+            index.add(row.id, row.text or "")
+            paragraphs[row.id] = {"id": row.id, "text": row.text, "paragraph_index": row.paragraph_index}
+
+        with self._lock:
+            self._indexes[task_id] = (index, paragraphs)
+            while len(self._indexes) > self.max_cached_tasks:
+                self._indexes.popitem(last=False)
+        logger.info(f"Built bigram index for task {task_id}: {len(index)} paragraphs")
+        return index, paragraphs
+
+    def _vector_rankings(self, db, queries: List[str], task_id: int, limit: int) -> List[List[Tuple[int, float]]]:
+        """一次往返完成多条查询的向量检索"""
+        from .ai_service import get_ai_service
+
+        embeddings = [str(get_ai_service().get_embedding_sync(q)) for q in queries]
+        sql = text("""
+            SELECT q.idx, p.id, p.distance
+            FROM unnest(CAST(:idxs AS integer[]), CAST(:embeddings AS text[])) AS q(idx, embedding)
+            CROSS JOIN LATERAL (
+                SELECT id, embedding <-> CAST(q.embedding AS vector) AS distance
+                FROM paragraphs
+                WHERE task_id = :task_id
+                ORDER BY embedding <-> CAST(q.embedding AS vector)
+                LIMIT :limit
+            ) p
+            ORDER BY q.idx, p.distance
+        """)
+        result = db.execute(sql, {
+            'idxs': list(range(len(queries))),
+            'embeddings': embeddings,
+            'task_id': task_id,
+            'limit': limit
+        })
+        rankings: List[List[Tuple[int, float]]] = [[] for _ in queries]
+        for row in result:
+            rankings[row.idx].append((row.id, row.distance))
+        return rankings
+
+    def search(self, query_text: str, task_id: int, limit: int = 5) -> List[Dict]:
+        """混合检索单条查询"""
+        return self.search_batch([query_text], task_id, limit)[0]
+
+    def search_batch(self, queries: List[str], task_id: int, limit: int = 5) -> List[List[Dict]]:
+        """混合检索多条查询，共享同一个索引和数据库连接"""
+        if not queries:
+            return []
+        db = SessionLocal()
+        try:
+            index, paragraphs = self._get_index(db, task_id)
+            if not paragraphs:
+                return [[] for _ in queries]
+
+            candidates = limit * self.candidate_multiplier
+            try:
+                vector_rankings = self._vector_rankings(db, queries, task_id, candidates)
+            except Exception as e:
+                # 向量检索不可用时退化为纯词法检索
+                logger.warning(f"Vector ranking failed, falling back to lexical only: {e}")
+                db.rollback()
+                vector_rankings = [[] for _ in queries]
+
+            results = []
+            for query, vector_ranking in zip(queries, vector_rankings):
+                lexical_ranking = index.search(query, candidates)
+                results.append(self._fuse(lexical_ranking, vector_ranking, paragraphs, limit))
+            return results
+
+        except Exception as e:
+            logger.error(f"Error in hybrid search: {e}")
+            return [[] for _ in queries]
+        finally:
+            db.close()
+
+    def _fuse(self, lexical_ranking: List[Tuple[int, float]], vector_ranking: List[Tuple[int, float]],
+              paragraphs: Dict[int, Dict], limit: int) -> List[Dict]:
+        """融合两路排名并组装返回结果"""
+        lexical_scores = dict(lexical_ranking)
+        distances = dict(vector_ranking)
+        fused = reciprocal_rank_fusion([
+            [doc_id for doc_id, _ in lexical_ranking],
+            [doc_id for doc_id, _ in vector_ranking],
+        ])
+        results = []
+        for doc_id, score in fused[:limit]:
+            paragraph = paragraphs.get(doc_id)
+            if paragraph is None:
+                continue
+            distance = distances.get(doc_id)
+            results.append({
+                **paragraph,
+                'score': score,
+                'lexical_score': lexical_scores.get(doc_id, 0.0),
+                'similarity_score': 1 - distance if distance is not None else None
+            })
+        return results
+
+
+# 延迟初始化的检索服务实例
+_retrieval_service_instance = None
+
+
+def get_retrieval_service() -> RetrievalService:
+    """获取检索服务实例（延迟初始化）"""
+    global _retrieval_service_instance
+    if _retrieval_service_instance is None:
+        _retrieval_service_instance = RetrievalService()
+    return _retrieval_service_instance
@@ -0,0 +1,104 @@
+import asyncio
+import json
+import os
+import time
+from typing import Awaitable, Dict, Optional, TypeVar
+import logging
+
+from ..metrics import REVIEW_DEADLINE_EXCEEDED
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# 各阶段默认截止时间（秒），可通过REVIEW_STAGE_DEADLINES（JSON）覆盖
+DEFAULT_STAGE_DEADLINES = {
+    "ocr": 300,
+    "segmentation": 60,
+    "vectorize": 300,
+    "analysis": 600,
+    "streaming": 800,
+}
+
+
+class StageDeadlineExceeded(Exception):
+    """审查阶段超出截止时间或整体时间预算"""
+
+    def __init__(self, stage: str, seconds: float):
+        super().__init__(f"Review stage '{stage}' exceeded its deadline of {seconds:.0f}s")
+        self.stage = stage
+        self.seconds = seconds
+
+
+def load_stage_deadlines() -> Dict[str, float]:
+    """读取各阶段截止时间配置（配置无效时使用默认值）"""
+    deadlines = dict(DEFAULT_STAGE_DEADLINES)
+    raw = os.getenv("REVIEW_STAGE_DEADLINES")
+    if raw:
+        try:
+            deadlines.update({stage: float(seconds) for stage, seconds in json.loads(raw).items()})
+        except (ValueError, AttributeError) as e:
+            logger.warning(f"Invalid REVIEW_STAGE_DEADLINES, using defaults: {e}")
+    return deadlines
+
+
+class ReviewBudget:
+    """
+    单次审查的时间预算
+
+    整体SLA从审查开始计时，每个阶段的超时取阶段截止时间与剩余预算中的较小值；
+    剩余时间不足时风险分析降级：reduced只分析关键词命中最多的块并使用更小的模型，rules仅按规则标记需人工复核的条款
+    """
+
+    def __init__(self, sla_seconds: Optional[float] = None, stage_deadlines: Optional[Dict[str, float]] = None):
+        self.sla_seconds = sla_seconds if sla_seconds is not None else float(os.getenv("REVIEW_SLA_SECONDS", "900"))
+        self.stage_deadlines = stage_deadlines if stage_deadlines is not None else load_stage_deadlines()
+        # 剩余时间低于该值时风险分析降级为reduced
+        self.degrade_threshold = float(os.getenv("REVIEW_DEGRADE_THRESHOLD_SECONDS", "180"))
+        # 为规则兜底预留的时间，LLM分析必须在此之前结束
+        self.rules_reserve = float(os.getenv("REVIEW_RULES_RESERVE_SECONDS", "30"))
+        self.started_at = time.monotonic()
+
+    def remaining(self) -> float:
+        """剩余预算（秒）"""
+        return max(0.0, self.sla_seconds - (time.monotonic() - self.started_at))
+
+    def timeout_for(self, stage: str, reserve: float = 0) -> float:
+        """阶段可用时间：阶段截止时间与扣除预留后的剩余预算中的较小值"""
+        available = self.remaining() - reserve
+        deadline = self.stage_deadlines.get(stage)
+        if deadline is not None:
+            available = min(available, deadline)
+        return max(0.0, available)
+
+    async def run(self, stage: str, awaitable: Awaitable[T], reserve: float = 0) -> T:
+        """
+        在阶段可用时间内执行，超时取消执行并抛出StageDeadlineExceeded
+
+        只有阶段截止时间本身到期才转换为StageDeadlineExceeded；执行中抛出的异常（包括单次LLM调用超时的
+        asyncio.TimeoutError）原样抛出
+        """
+        timeout = self.timeout_for(stage, reserve)
+        task = asyncio.ensure_future(awaitable)
+        try:
+            done, _ = await asyncio.wait({task}, timeout=timeout)
+        except asyncio.CancelledError:
+            task.cancel()
+            await asyncio.wait({task})
+            raise
+        if not done:
+            task.cancel()
+            await asyncio.wait({task})
+            REVIEW_DEADLINE_EXCEEDED.labels(stage=stage).inc()
+            logger.warning(f"⏰ Review stage {stage} exceeded {timeout:.1f}s")
+            raise StageDeadlineExceeded(stage, timeout)
+        return task.result()
+
+    def analysis_level(self) -> str:
+        """按剩余预算选择风险分析级别：full、reduced或rules"""
+        remaining = self.remaining() - self.rules_reserve
+        if remaining <= 0:
+            return "rules"
+        if remaining < self.degrade_threshold:
+            return "reduced"
+        return "full"
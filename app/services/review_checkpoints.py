@@ -0,0 +1,113 @@
+import hashlib
+import json
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+import logging
+
+from ..database import SessionLocal
+from ..models import ReviewCheckpoint
+
+logger = logging.getLogger(__name__)
+
+# 流水线阶段，按执行顺序
+PIPELINE_STAGES = ("ocr", "segmentation", "vectorize", "analysis")
+
+
+def stage_input_hash(*parts) -> str:
+    """计算阶段输入的sha256（各部分按JSON序列化）"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(json.dumps(part, ensure_ascii=False, sort_keys=True, default=str).encode("utf-8"))
+        digest.update(b"\x1f")
+    return digest.hexdigest()
+
+
+class CheckpointStore:
+    """
+    审查流水线检查点
+
+    每个阶段完成后记录(阶段, 输入哈希, 完成时间)；
+    重试或恢复时输入哈希一致的阶段直接跳过，只重做剩余阶段
+    """
+
+    def get(self, task_id: int, stage: str) -> Optional[Dict]:
+        """获取阶段检查点，不存在时返回None"""
+        db = SessionLocal()
+        try:
+            checkpoint = db.query(ReviewCheckpoint).filter(
+                ReviewCheckpoint.task_id == task_id,
+                ReviewCheckpoint.stage == stage
+            ).first()
+            if not checkpoint:
+                return None
+            return {
+                "stage": checkpoint.stage,
+                "input_hash": checkpoint.input_hash,
+                "output": checkpoint.output,
+                "completed_at": checkpoint.completed_at,
+            }
+        finally:
+            db.close()
+
+    def is_complete(self, task_id: int, stage: str, input_hash: str) -> bool:
+        """阶段是否已在相同输入上完成"""
+        checkpoint = self.get(task_id, stage)
+        return checkpoint is not None and checkpoint["input_hash"] == input_hash
+
+    def record(self, task_id: int, stage: str, input_hash: str, output: Optional[Dict] = None):
+        """记录阶段完成（同一任务同一阶段只保留最新一条）"""
+        db = SessionLocal()
+        try:
+            checkpoint = db.query(ReviewCheckpoint).filter(
+                ReviewCheckpoint.task_id == task_id,
+                ReviewCheckpoint.stage == stage
+            ).first()
+            if checkpoint is None:
+                checkpoint = ReviewCheckpoint(task_id=task_id, stage=stage)
+                db.add(checkpoint)
+            checkpoint.input_hash = input_hash
+            checkpoint.output = output
+            checkpoint.completed_at = datetime.utcnow()
+            db.commit()
+            logger.info(f"📌 Checkpoint {stage} recorded for task {task_id}")
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def clear(self, task_id: int, stages: Optional[Iterable[str]] = None):
+        """清除任务的检查点（默认全部阶段），用于强制重新审查"""
+        db = SessionLocal()
+        try:
+            query = db.query(ReviewCheckpoint).filter(ReviewCheckpoint.task_id == task_id)
+            if stages is not None:
+                query = query.filter(ReviewCheckpoint.stage.in_(list(stages)))
+            query.delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def completed_stages(self, task_id: int) -> Dict[str, Dict]:
+        """任务已完成的阶段及其产出摘要"""
+        db = SessionLocal()
+        try:
+            checkpoints = db.query(ReviewCheckpoint).filter(ReviewCheckpoint.task_id == task_id).all()
+            return {
+                c.stage: {"output": c.output, "completed_at": c.completed_at.isoformat() if c.completed_at else None}
+                for c in checkpoints
+            }
+        finally:
+            db.close()
+
+
+# 全局检查点实例 - 延迟初始化
+_checkpoint_store_instance = None
+
+
+def get_checkpoint_store() -> CheckpointStore:
+    """获取检查点存储实例（延迟初始化）"""
+    global _checkpoint_store_instance
+    if _checkpoint_store_instance is None:
+        _checkpoint_store_instance = CheckpointStore()
+    return _checkpoint_store_instance
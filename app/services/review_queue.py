@@ -0,0 +1,563 @@
+import asyncio
+import math
+import os
+import socket
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+import logging
+
+from sqlalchemy import func, select, text
+
+from ..database import SessionLocal
+from ..metrics import (
+    REVIEW_QUEUE_DEPTH, REVIEW_JOBS_RUNNING, REVIEW_QUEUE_WAIT, REVIEW_QUEUE_REJECTIONS, REVIEW_JOBS
+)
+from ..models import ReviewJob, Task
+from .executors import run_blocking
+from .single_flight import _lock_id
+
+logger = logging.getLogger(__name__)
+
+# 领取作业时串行化各worker的咨询锁，保证全局并发上限
+_CLAIM_LOCK_KEY = "review_queue:claim"
+
+# 优先级类别：interactive为用户在线等待的审查，bulk为批量提交
+PRIORITY_CLASSES = ("interactive", "bulk")
+DEFAULT_PRIORITY = "interactive"
+
+
+def parse_priority_weights(value: str) -> Dict[str, float]:
+    """解析 "interactive:4,bulk:1" 格式的类别权重，未配置的类别权重为1"""
+    weights = {priority: 1.0 for priority in PRIORITY_CLASSES}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        priority, _, weight = item.partition(":")
+        if priority.strip() in weights and weight:
+            weights[priority.strip()] = max(float(weight), 0.01)
+    return weights
+
+
+def pick_fair_share(queued: Iterable, running: Iterable[Tuple[Optional[int], str]], slots: int,
+                    user_cap: int, weights: Dict[str, float]) -> List:
+    """
+    从排队作业中按公平份额挑选最多slots个
+
+    类别之间按加权公平：选运行数/权重最小的类别，bulk不会被饿死；
+    同一类别内按用户公平：选当前运行数最少的用户，相同时取入队最早的作业。
+    单用户运行数不超过user_cap（user_id为空的匿名任务不受此限制）
+
+    Args:
+        queued: 按入队顺序排列的排队作业（需有user_id、priority属性）
+        running: 运行中作业的(user_id, priority)
+        slots: 可领取的作业数
+        user_cap: 单用户并发上限
+        weights: 各类别权重
+
+    Returns:
+        选中的作业列表
+    """
+    user_running = Counter()
+    class_running = Counter()
+    for user_id, priority in running:
+        user_running[user_id] += 1
+        class_running[priority or DEFAULT_PRIORITY] += 1
+
+    def under_cap(job) -> bool:
+        return job.user_id is None or user_running[job.user_id] < user_cap
+
+    remaining = list(queued)
+    picked = []
+    while len(picked) < slots:
+        eligible = [job for job in remaining if under_cap(job)]
+        if not eligible:
+            break
+        classes = {job.priority or DEFAULT_PRIORITY for job in eligible}
+        priority = min(classes, key=lambda c: (class_running[c] / weights.get(c, 1.0),
+                                               PRIORITY_CLASSES.index(c) if c in PRIORITY_CLASSES else len(PRIORITY_CLASSES)))
+        # eligible保持入队顺序，min取到的是运行数最少用户中最早入队的作业
+        job = min((job for job in eligible if (job.priority or DEFAULT_PRIORITY) == priority),
+                  key=lambda job: user_running[job.user_id] if job.user_id is not None else 0)
+        remaining.remove(job)
+        picked.append(job)
+        user_running[job.user_id] += 1
+        class_running[priority] += 1
+    return picked
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    """已排序数值的p分位数（最近秩法），无数据时返回None"""
+    if not values:
+        return None
+    return round(values[min(len(values) - 1, math.ceil(p * len(values)) - 1)], 3)
+
+
+class QueueFullError(Exception):
+    """审查队列已满，retry_after为建议的重试等待秒数"""
+
+    def __init__(self, depth: int, retry_after: int):
+        super().__init__(f"Review queue is full ({depth} jobs waiting)")
+        self.depth = depth
+        self.retry_after = retry_after
+
+
+class UserQuotaExceededError(Exception):
+    """单个用户排队的审查作业超过上限，retry_after为建议的重试等待秒数"""
+
+    def __init__(self, user_id: int, queued: int, retry_after: int):
+        super().__init__(f"User {user_id} has too many review jobs queued ({queued})")
+        self.user_id = user_id
+        self.queued = queued
+        self.retry_after = retry_after
+
+
+class ReviewQueue:
+    """
+    持久化审查作业队列（review_jobs表）
+
+    Web进程只负责入队；worker按全局并发上限领取作业，运行中定期写心跳，
+    进程重启后心跳超时的作业重新入队，超过最大尝试次数则标记失败。
+    领取时按优先级类别加权、按用户公平分配并发，单用户有排队数和并发上限。
+    取消时排队作业直接结束，运行中作业记录取消请求，由执行它的worker轮询到后中止
+    """
+
+    def __init__(self):
+        self.max_depth = int(os.getenv("REVIEW_QUEUE_MAX_DEPTH", "50"))
+        self.bulk_max_depth = int(os.getenv("REVIEW_BULK_QUEUE_MAX_DEPTH", "1000"))
+        self.max_concurrency = int(os.getenv("REVIEW_MAX_CONCURRENCY", "4"))
+        self.user_max_concurrency = int(os.getenv("REVIEW_USER_MAX_CONCURRENCY", "2"))
+        self.user_max_queued = int(os.getenv("REVIEW_USER_MAX_QUEUED", "200"))
+        self.priority_weights = parse_priority_weights(os.getenv("REVIEW_PRIORITY_WEIGHTS", "interactive:4,bulk:1"))
+        self.stale_seconds = float(os.getenv("REVIEW_JOB_STALE_SECONDS", "120"))
+        self.max_attempts = int(os.getenv("REVIEW_JOB_MAX_ATTEMPTS", "3"))
+        self.estimated_job_seconds = float(os.getenv("REVIEW_ESTIMATED_JOB_SECONDS", "120"))
+        self.max_retry_after = int(os.getenv("REVIEW_MAX_RETRY_AFTER", "300"))
+
+    def enqueue(self, task_id: int, priority: str = DEFAULT_PRIORITY, use_cache: bool = True) -> Dict:
+        """
+        将任务加入审查队列
+
+        use_cache为False时作业执行审查时跳过缓存。
+        同一任务已在队列中或运行中时直接返回现有作业（排队中的作业按本次请求关闭缓存）；该类别队列已满时抛出QueueFullError，
+        任务所属用户排队作业过多时抛出UserQuotaExceededError
+        """
+        if priority not in PRIORITY_CLASSES:
+            raise ValueError(f"Unknown review priority: {priority}")
+        db = SessionLocal()
+        try:
+            existing = db.query(ReviewJob).filter(
+                ReviewJob.task_id == task_id,
+                ReviewJob.status.in_(["QUEUED", "RUNNING"])
+            ).first()
+            if existing:
+                if not use_cache and existing.status == "QUEUED" and existing.use_cache is not False:
+                    existing.use_cache = False
+                    db.commit()
+                return self._job_info(db, existing)
+
+            task = db.query(Task).filter(Task.id == task_id).first()
+            user_id = task.user_id if task else None
+            if user_id is not None:
+                user_queued = db.query(ReviewJob).filter(
+                    ReviewJob.status == "QUEUED", ReviewJob.user_id == user_id
+                ).count()
+                if user_queued >= self.user_max_queued:
+                    REVIEW_QUEUE_REJECTIONS.labels(reason="user_quota").inc()
+                    waves = user_queued / max(1, self.user_max_concurrency)
+                    retry_after = max(1, min(self.max_retry_after, math.ceil(waves * self._average_job_seconds(db))))
+                    raise UserQuotaExceededError(user_id, user_queued, retry_after)
+
+            depth = self._depth(db, priority)
+            max_depth = self.bulk_max_depth if priority == "bulk" else self.max_depth
+            if depth >= max_depth:
+                REVIEW_QUEUE_REJECTIONS.labels(reason="queue_full").inc()
+                raise QueueFullError(depth, self.retry_after(db, depth))
+
+            job = ReviewJob(task_id=task_id, user_id=user_id, priority=priority, use_cache=use_cache,
+                            status="QUEUED", attempts=0, enqueued_at=datetime.utcnow())
+            db.add(job)
+            if task:
+                task.status = "QUEUED"
+            db.commit()
+            db.refresh(job)
+            REVIEW_QUEUE_DEPTH.labels(priority=priority).set(depth + 1)
+            logger.info(f"📥 Review job {job.id} queued for task {task_id} "
+                        f"(user {user_id}, {priority}, depth {depth + 1})")
+            return self._job_info(db, job)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def claim(self, worker_id: str, limit: int) -> List[ReviewJob]:
+        """领取最多limit个排队作业（受全局和单用户并发上限约束），按公平份额挑选"""
+        db = SessionLocal()
+        try:
+            if db.get_bind().dialect.name == "postgresql":
+                # 事务级咨询锁：各worker依次计算剩余并发额度，避免超出全局上限
+                db.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": _lock_id(_CLAIM_LOCK_KEY)})
+
+            running = db.query(ReviewJob.user_id, ReviewJob.priority).filter(ReviewJob.status == "RUNNING").all()
+            available = min(limit, self.max_concurrency - len(running))
+            if available <= 0:
+                db.commit()
+                return []
+
+            # 候选为每个(用户, 类别)最早的available个作业，大批量提交不会挤掉其他用户的作业
+            ranked = db.query(
+                ReviewJob.id.label("id"),
+                func.row_number().over(
+                    partition_by=(ReviewJob.user_id, ReviewJob.priority), order_by=ReviewJob.id
+                ).label("rank")
+            ).filter(ReviewJob.status == "QUEUED").subquery()
+            candidates = db.query(ReviewJob).filter(
+                ReviewJob.id.in_(select(ranked.c.id).where(ranked.c.rank <= available))
+            ).order_by(ReviewJob.id).with_for_update(skip_locked=True).all()
+            jobs = pick_fair_share(candidates, running, available,
+                                   self.user_max_concurrency, self.priority_weights)
+
+            now = datetime.utcnow()
+            for job in jobs:
+                job.status = "RUNNING"
+                job.worker_id = worker_id
+                job.attempts = (job.attempts or 0) + 1
+                job.started_at = now
+                job.heartbeat_at = now
+                REVIEW_QUEUE_WAIT.labels(priority=job.priority or DEFAULT_PRIORITY).observe(
+                    (now - job.enqueued_at).total_seconds()
+                )
+            db.commit()
+            for job in jobs:
+                db.refresh(job)
+                db.expunge(job)
+            self._refresh_gauges(db)
+            return jobs
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def heartbeat(self, job_ids: List[int]):
+        """更新运行中作业的心跳时间"""
+        if not job_ids:
+            return
+        db = SessionLocal()
+        try:
+            db.query(ReviewJob).filter(ReviewJob.id.in_(job_ids)).update(
+                {ReviewJob.heartbeat_at: datetime.utcnow()}, synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def finish(self, job_id: int, error: Optional[str] = None, cancelled: bool = False):
+        """作业结束：根据任务最终状态标记DONE或FAILED，被取消的作业和任务标记CANCELLED"""
+        db = SessionLocal()
+        try:
+            job = db.query(ReviewJob).filter(ReviewJob.id == job_id).first()
+            if not job:
+                return
+            task = db.query(Task).filter(Task.id == job.task_id).first()
+            if cancelled:
+                job.status = "CANCELLED"
+                job.error = None
+                if task:
+                    task.status = "CANCELLED"
+            else:
+                succeeded = error is None and task is not None and task.status == "COMPLETED"
+                job.status = "DONE" if succeeded else "FAILED"
+                job.error = error or (None if succeeded else f"task status: {task.status if task else 'missing'}")
+                if error and task and task.status != "FAILED":
+                    task.status = "FAILED"
+            job.finished_at = datetime.utcnow()
+            db.commit()
+            REVIEW_JOBS.labels(outcome=job.status.lower()).inc()
+            self._refresh_gauges(db)
+        finally:
+            db.close()
+
+    def cancel(self, task_id: int) -> Optional[Dict]:
+        """
+        取消任务的审查作业
+
+        排队中的作业直接标记CANCELLED；运行中的作业只记录取消请求，由执行它的worker中止后标记。
+        任务没有排队或运行中的作业时返回None
+        """
+        db = SessionLocal()
+        try:
+            job = db.query(ReviewJob).filter(
+                ReviewJob.task_id == task_id,
+                ReviewJob.status.in_(["QUEUED", "RUNNING"])
+            ).with_for_update().first()
+            if not job:
+                return None
+
+            now = datetime.utcnow()
+            if job.status == "QUEUED":
+                job.status = "CANCELLED"
+                job.finished_at = now
+                task = db.query(Task).filter(Task.id == task_id).first()
+                if task:
+                    task.status = "CANCELLED"
+                REVIEW_JOBS.labels(outcome="cancelled").inc()
+            elif job.cancel_requested_at is None:
+                job.cancel_requested_at = now
+            db.commit()
+            logger.info(f"🛑 Cancel requested for review job {job.id} (task {task_id}, {job.status})")
+            self._refresh_gauges(db)
+            return self._job_info(db, job)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def cancel_requested(self, job_ids: List[int]) -> List[int]:
+        """运行中作业里已请求取消的作业ID"""
+        if not job_ids:
+            return []
+        db = SessionLocal()
+        try:
+            rows = db.query(ReviewJob.id).filter(
+                ReviewJob.id.in_(job_ids),
+                ReviewJob.cancel_requested_at.isnot(None)
+            ).all()
+            return [row.id for row in rows]
+        finally:
+            db.close()
+
+    def requeue_stale(self) -> int:
+        """心跳超时的运行中作业（worker崩溃或重启）重新入队，超过最大尝试次数则标记失败"""
+        db = SessionLocal()
+        try:
+            cutoff = datetime.utcnow() - timedelta(seconds=self.stale_seconds)
+            stale = db.query(ReviewJob).filter(
+                ReviewJob.status == "RUNNING",
+                ReviewJob.heartbeat_at < cutoff
+            ).with_for_update(skip_locked=True).all()
+            for job in stale:
+                task = db.query(Task).filter(Task.id == job.task_id).first()
+                if job.cancel_requested_at is not None:
+                    # worker在中止前退出，不再重新入队
+                    job.status = "CANCELLED"
+                    job.finished_at = datetime.utcnow()
+                    if task:
+                        task.status = "CANCELLED"
+                    REVIEW_JOBS.labels(outcome="cancelled").inc()
+                elif (job.attempts or 0) >= self.max_attempts:
+                    job.status = "FAILED"
+                    job.error = "worker lost, max attempts reached"
+                    job.finished_at = datetime.utcnow()
+                    if task:
+                        task.status = "FAILED"
+                    REVIEW_JOBS.labels(outcome="failed").inc()
+                else:
+                    job.status = "QUEUED"
+                    job.worker_id = None
+                    job.enqueued_at = datetime.utcnow()
+                    if task:
+                        task.status = "QUEUED"
+                logger.warning(f"♻️ Stale review job {job.id} for task {job.task_id} -> {job.status}")
+            db.commit()
+            return len(stale)
+        finally:
+            db.close()
+
+    def _depth(self, db, priority: Optional[str] = None) -> int:
+        query = db.query(ReviewJob).filter(ReviewJob.status == "QUEUED")
+        if priority is not None:
+            query = query.filter(ReviewJob.priority == priority)
+        return query.count()
+
+    def _average_job_seconds(self, db) -> float:
+        """最近完成作业的平均耗时，无记录时使用REVIEW_ESTIMATED_JOB_SECONDS"""
+        recent = db.query(ReviewJob).filter(
+            ReviewJob.status == "DONE",
+            ReviewJob.started_at.isnot(None),
+            ReviewJob.finished_at.isnot(None)
+        ).order_by(ReviewJob.id.desc()).limit(20).all()
+        durations = [(job.finished_at - job.started_at).total_seconds() for job in recent]
+        return sum(durations) / len(durations) if durations else self.estimated_job_seconds
+
+    def retry_after(self, db, depth: int) -> int:
+        """按队列深度、并发上限和平均耗时估算需要等待的秒数"""
+        waves = depth / max(1, self.max_concurrency)
+        return max(1, min(self.max_retry_after, math.ceil(waves * self._average_job_seconds(db))))
+
+    def _job_info(self, db, job: ReviewJob) -> Dict:
+        position = None
+        if job.status == "QUEUED":
+            # 同类别内的入队顺序位置（公平调度下为近似值）
+            position = db.query(ReviewJob).filter(
+                ReviewJob.status == "QUEUED", ReviewJob.priority == job.priority, ReviewJob.id <= job.id
+            ).count()
+        return {"job_id": job.id, "task_id": job.task_id, "status": job.status,
+                "priority": job.priority, "position": position}
+
+    def _refresh_gauges(self, db):
+        for priority in PRIORITY_CLASSES:
+            REVIEW_QUEUE_DEPTH.labels(priority=priority).set(self._depth(db, priority))
+        REVIEW_JOBS_RUNNING.set(db.query(ReviewJob).filter(ReviewJob.status == "RUNNING").count())
+
+    def stats(self) -> Dict:
+        """队列深度、运行数、最长等待时间及最近作业的排队等待分位数（总体和按优先级类别）"""
+        db = SessionLocal()
+        try:
+            now = datetime.utcnow()
+            queued = db.query(ReviewJob.priority, ReviewJob.enqueued_at).filter(
+                ReviewJob.status == "QUEUED"
+            ).all()
+            running = db.query(ReviewJob.priority).filter(ReviewJob.status == "RUNNING").all()
+            recent = db.query(ReviewJob.priority, ReviewJob.enqueued_at, ReviewJob.started_at).filter(
+                ReviewJob.started_at.isnot(None)
+            ).order_by(ReviewJob.id.desc()).limit(500).all()
+
+            def summarize(selected: Optional[str]) -> Dict:
+                def matches(priority) -> bool:
+                    return selected is None or (priority or DEFAULT_PRIORITY) == selected
+
+                enqueued = [row.enqueued_at for row in queued if matches(row.priority)]
+                waits = sorted((row.started_at - row.enqueued_at).total_seconds()
+                               for row in recent if matches(row.priority))
+                return {
+                    "depth": len(enqueued),
+                    "running": sum(1 for row in running if matches(row.priority)),
+                    "oldest_wait_seconds": round((now - min(enqueued)).total_seconds(), 3) if enqueued else 0.0,
+                    "wait_p50_seconds": percentile(waits, 0.5),
+                    "wait_p95_seconds": percentile(waits, 0.95),
+                    "wait_p99_seconds": percentile(waits, 0.99),
+                }
+
+            self._refresh_gauges(db)
+            overall = summarize(None)
+            return {
+                **overall,
+                "max_depth": self.max_depth,
+                "bulk_max_depth": self.bulk_max_depth,
+                "max_concurrency": self.max_concurrency,
+                "user_max_concurrency": self.user_max_concurrency,
+                "retry_after_estimate": self.retry_after(db, self._depth(db, DEFAULT_PRIORITY)),
+                "classes": {priority: summarize(priority) for priority in PRIORITY_CLASSES},
+            }
+        finally:
+            db.close()
+
+
+class ReviewWorker:
+    """
+    审查作业执行器
+
+    从ReviewQueue领取作业并在本进程事件循环中执行，本地槽位数为REVIEW_WORKER_CONCURRENCY；
+    可嵌入Web进程运行（REVIEW_EXECUTOR_MODE=embedded），也可通过 python -m app.worker 独立运行。
+    每轮轮询检查运行中作业的取消请求，取消作业的asyncio任务：审查在下一个await处中止
+    （页、块、LLM调用之间），进行中的HTTP请求随之断开，进程池中的计算由run_cpu_bound终止。
+    队列操作都是同步数据库调用（领取时还会等待跨worker的咨询锁），一律在线程池执行，
+    嵌入Web进程时不阻塞事件循环。run_review按run_review(task_id, use_cache=作业的缓存开关)调用
+    """
+
+    def __init__(self, run_review: Callable[..., Awaitable[None]], queue: Optional["ReviewQueue"] = None,
+                 concurrency: Optional[int] = None, worker_id: Optional[str] = None,
+                 on_cancelled: Optional[Callable[[int], Awaitable[None]]] = None):
+        self.run_review = run_review
+        self.on_cancelled = on_cancelled
+        self.queue = queue or get_review_queue()
+        self.concurrency = concurrency or int(os.getenv("REVIEW_WORKER_CONCURRENCY", "2"))
+        self.poll_interval = float(os.getenv("REVIEW_WORKER_POLL_INTERVAL", "1"))
+        self.heartbeat_interval = float(os.getenv("REVIEW_JOB_HEARTBEAT_SECONDS", "15"))
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._running: Dict[int, asyncio.Task] = {}
+        self._cancelling: set = set()
+        self._last_heartbeat = 0.0
+
+    async def run_once(self) -> int:
+        """中止已请求取消的作业，回收超时作业并按空闲槽位领取新作业，返回本次领取数"""
+        await self._cancel_requested()
+        await run_blocking(self.queue.requeue_stale)
+        free = self.concurrency - len(self._running)
+        if free <= 0:
+            return 0
+        jobs = await run_blocking(self.queue.claim, self.worker_id, free)
+        for job in jobs:
+            logger.info(f"🏃 Worker {self.worker_id} picked review job {job.id} (task {job.task_id})")
+            task = asyncio.ensure_future(self._execute(job.id, job.task_id, job.use_cache is not False))
+            self._running[job.id] = task
+        return len(jobs)
+
+    async def _cancel_requested(self):
+        for job_id in await run_blocking(self.queue.cancel_requested, list(self._running)):
+            task = self._running.get(job_id)
+            if task is not None and job_id not in self._cancelling:
+                logger.info(f"🛑 Cancelling review job {job_id}")
+                self._cancelling.add(job_id)
+                task.cancel()
+
+    async def _execute(self, job_id: int, task_id: int, use_cache: bool = True):
+        error = None
+        cancelled = False
+        try:
+            await self.run_review(task_id, use_cache=use_cache)
+        except asyncio.CancelledError:
+            # 用户取消的作业正常结束；进程退出时不标记结束，心跳超时后由其他worker重新领取
+            if job_id not in self._cancelling:
+                raise
+            cancelled = True
+        except Exception as e:
+            logger.error(f"Review job {job_id} failed: {e}")
+            error = str(e)
+        finally:
+            self._running.pop(job_id, None)
+            self._cancelling.discard(job_id)
+        await run_blocking(self.queue.finish, job_id, error, cancelled=cancelled)
+        if cancelled:
+            logger.info(f"Review job {job_id} cancelled (task {task_id})")
+            if self.on_cancelled:
+                await self.on_cancelled(task_id)
+
+    async def _heartbeat(self):
+        loop_time = asyncio.get_running_loop().time()
+        if loop_time - self._last_heartbeat >= self.heartbeat_interval:
+            self._last_heartbeat = loop_time
+            try:
+                await run_blocking(self.queue.heartbeat, list(self._running))
+            except Exception as e:
+                logger.warning(f"Review job heartbeat failed: {e}")
+
+    async def run(self, stop: Optional[asyncio.Event] = None):
+        """轮询队列直到stop被设置；退出时取消本地运行中的作业"""
+        stop = stop or asyncio.Event()
+        logger.info(f"🚀 Review worker {self.worker_id} started (concurrency {self.concurrency})")
+        try:
+            while not stop.is_set():
+                try:
+                    await self.run_once()
+                    await self._heartbeat()
+                except Exception as e:
+                    logger.error(f"Review worker poll failed: {e}")
+                try:
+                    await asyncio.wait_for(stop.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            for task in list(self._running.values()):
+                task.cancel()
+            await asyncio.gather(*self._running.values(), return_exceptions=True)
+            logger.info(f"Review worker {self.worker_id} stopped")
+
+    async def drain(self):
+        """等待本地运行中的作业全部结束"""
+        while self._running:
+            await asyncio.gather(*list(self._running.values()), return_exceptions=True)
+
+
+# 全局队列实例 - 延迟初始化
+_review_queue_instance = None
+
+
+def get_review_queue() -> ReviewQueue:
+    """获取审查队列实例（延迟初始化）"""
+    global _review_queue_instance
+    if _review_queue_instance is None:
+        _review_queue_instance = ReviewQueue()
+    return _review_queue_instance
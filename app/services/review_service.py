@@ -1,13 +1,26 @@
 import asyncio
-from typing import Dict, List
-from sqlalchemy.orm import Session
+import os
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from sqlalchemy import Text, cast
+from sqlalchemy.orm import Session, selectinload
 import logging
 
-from ..models import Task, File, Role
+from ..models import Task, File, Role, Risk, ReviewCheckpoint
 from ..database import SessionLocal
+from ..metrics import REVIEW_DEGRADED, REVIEW_DURATION, observe_stage, record_ocr_throughput
 from ..websocket_manager import manager
-from .file_service import get_file_service
+from .file_service import get_file_service, extract_text, split_paragraphs, count_pages
+from .executors import run_blocking, run_cpu_bound
 from .ai_service import get_ai_service
+from .llm_usage import llm_call_scope
+from .single_flight import get_single_flight, flight_key
+from .review_checkpoints import get_checkpoint_store, stage_input_hash
+from .streaming_pipeline import StreamingReviewPipeline
+from .document_service import get_document_service, review_cache_key, RISK_PROMPT_VERSION
+from .review_queue import get_review_queue
+from .review_budget import ReviewBudget, StageDeadlineExceeded
 
 logger = logging.getLogger(__name__)
 
@@ -15,7 +28,8 @@ class ReviewService:
     """审查服务，协调整个审查流程"""
     
     def __init__(self):
-        pass
+        # map_reduce模式下首次审查走流式流水线（各阶段重叠执行）
+        self.streaming_pipeline = os.getenv("REVIEW_STREAMING_PIPELINE", "true").lower() == "true"
     
     def get_draft_roles(self, task_id: int) -> Dict:
         """获取草稿角色识别结果"""
@@ -34,16 +48,14 @@ class ReviewService:
                 if not file_record or not file_record.ocr_text:
                     raise ValueError(f"No OCR text found for task {task_id}")
                 
-                # 重新提取实体
-                entities = get_ai_service().extract_entities_ner(file_record.ocr_text)
-                
-                # 保存到数据库
-                from sqlalchemy import func
-                task.entities_data = entities
-                task.entities_extracted_at = func.now()
-                task.status = "ENTITY_READY"
-                db.commit()
-                logger.info(f"Re-extracted entities for task {task_id}: {entities}")
+                # 重新提取实体（同一任务的并发请求只提取一次）
+                ocr_text = file_record.ocr_text
+                entities = get_single_flight().run_sync(
+                    flight_key("ner", f"task:{task_id}"),
+                    lambda: self._extract_and_save_entities(task_id, ocr_text),
+                    lookup=lambda: self._load_task_entities(task_id)
+                )
+                db.refresh(task)
             
             # 构建候选角色
             candidates = self._build_role_candidates(entities, task.contract_type)
@@ -61,6 +73,84 @@ class ReviewService:
         finally:
             db.close()
     
+    async def get_draft_roles_async(self, task_id: int, use_cache: bool = True) -> Dict:
+        """
+        异步获取草稿角色识别结果（API使用）
+        
+        数据库读写在阻塞I/O线程池中执行，缺失实体时走异步实体提取，不阻塞事件循环；
+        use_cache为False时重新提取实体不读取LLM响应缓存
+        """
+        contract_type, entities, extracted_at = await run_blocking(self._load_draft_task, task_id)
+        if not entities:
+            _, ocr_text = await run_blocking(self._load_file_text, task_id)
+            if not ocr_text:
+                raise ValueError(f"No OCR text found for task {task_id}")
+            
+            # 重新提取实体（同一任务的并发请求只提取一次）
+            entities = await get_single_flight().run(
+                flight_key("ner", f"task:{task_id}"),
+                lambda: self._aextract_and_save_entities(task_id, ocr_text, use_cache),
+                lookup=lambda: self._load_task_entities(task_id)
+            )
+            contract_type, _, extracted_at = await run_blocking(self._load_draft_task, task_id)
+        
+        return {
+            "task_id": task_id,
+            "contract_type": contract_type,
+            "candidates": self._build_role_candidates(entities, contract_type),
+            "entities_extracted_at": extracted_at.isoformat() if extracted_at else None
+        }
+    
+    def _load_draft_task(self, task_id: int) -> Tuple[str, Optional[Dict], Optional[datetime]]:
+        """读取角色识别需要的任务字段（合同类型、实体数据、实体提取时间）"""
+        db = SessionLocal()
+        try:
+            task = db.query(Task).filter(Task.id == task_id).first()
+            if not task:
+                raise ValueError(f"Task {task_id} not found")
+            return task.contract_type, task.entities_data, task.entities_extracted_at
+        finally:
+            db.close()
+    
+    def _load_task_entities(self, task_id: int):
+        """读取任务已保存的实体数据"""
+        db = SessionLocal()
+        try:
+            task = db.query(Task).filter(Task.id == task_id).first()
+            return task.entities_data if task and task.entities_data else None
+        finally:
+            db.close()
+    
+    def _extract_and_save_entities(self, task_id: int, ocr_text: str) -> Dict:
+        """提取实体并保存到任务"""
+        with llm_call_scope(task_id, "ner"):
+            entities = get_ai_service().extract_entities_ner(ocr_text)
+        return self._save_entities(task_id, entities)
+    
+    async def _aextract_and_save_entities(self, task_id: int, ocr_text: str, use_cache: bool = True) -> Dict:
+        """异步提取实体并保存到任务"""
+        with llm_call_scope(task_id, "ner"):
+            entities = await get_ai_service().extract_entities_ner_async(ocr_text, use_cache=use_cache)
+        return await run_blocking(self._save_entities, task_id, entities)
+    
+    def _save_entities(self, task_id: int, entities: Dict) -> Dict:
+        """保存重新提取的实体到任务"""
+        db = SessionLocal()
+        try:
+            from sqlalchemy import func
+            task = db.query(Task).filter(Task.id == task_id).first()
+            task.entities_data = entities
+            task.entities_extracted_at = func.now()
+            task.status = "ENTITY_READY"
+            db.commit()
+            logger.info(f"Re-extracted entities for task {task_id}: {entities}")
+            return entities
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+    
     def confirm_roles(self, task_id: int, role: str, party_names: List[str] = None, selected_entity_index: int = 0) -> Dict:
         """确认角色信息"""
         logger.info(f"🔧 ReviewService.confirm_roles called - task_id: {task_id}, role: {role}, party_names: {party_names}, selected_entity_index: {selected_entity_index}")
@@ -159,18 +249,17 @@ class ReviewService:
         finally:
             db.close()
     
-    async def start_review(self, task_id: int):
-        """开始异步审查流程"""
-        db = SessionLocal()
+    async def start_review(self, task_id: int, use_cache: bool = True):
+        """
+        开始异步审查流程
+        
+        use_cache为False时不读取LLM响应缓存（内存和数据库两层）和文档级审查结果缓存，重新调用模型；新结果仍写入缓存
+        """
         try:
             # 更新任务状态
-            task = db.query(Task).filter(Task.id == task_id).first()
-            if not task:
+            if not await run_blocking(self._set_task_status, task_id, "IN_PROGRESS"):
                 raise ValueError(f"Task {task_id} not found")
             
-            task.status = "IN_PROGRESS"
-            db.commit()
-            
             # 发送开始消息
             await manager.send_progress(task_id, {
                 "stage": "start",
@@ -178,108 +267,505 @@ class ReviewService:
                 "message": "开始审查流程"
             })
             
-            # 执行审查流程
-            await self._run_review_pipeline(task_id)
+            # 执行审查流程（整体不超过SLA，超时的任务置为失败而不是一直处于进行中）
+            budget = ReviewBudget()
+            await budget.run("review", self._run_review_pipeline(task_id, budget, use_cache))
             
         except Exception as e:
             logger.error(f"Error starting review: {e}")
             # 更新任务状态为失败
-            task = db.query(Task).filter(Task.id == task_id).first()
-            if task:
-                task.status = "FAILED"
-                db.commit()
+            await run_blocking(self._set_task_status, task_id, "FAILED")
             
             await manager.send_error(task_id, str(e))
+    
+    async def cancel_review(self, task_id: int) -> Optional[Dict]:
+        """
+        取消任务的审查
+        
+        排队中的审查立即取消；运行中的审查由执行它的worker在下一次轮询时中止，返回状态为CANCELLING。
+        没有排队或运行中的审查时返回None
+        """
+        job = await run_blocking(get_review_queue().cancel, task_id)
+        if job is None:
+            return None
+        if job["status"] == "CANCELLED":
+            await self.notify_cancelled(task_id)
+            return {"task_id": task_id, "job_id": job["job_id"], "status": "CANCELLED"}
+        return {"task_id": task_id, "job_id": job["job_id"], "status": "CANCELLING"}
+    
+    async def notify_cancelled(self, task_id: int):
+        """推送审查已取消消息（已识别的风险保留）"""
+        risks_count = await run_blocking(self._count_risks, task_id)
+        await manager.send_cancelled(task_id, {
+            "risks_count": risks_count,
+            "message": "审查已取消，已识别的风险已保留"
+        })
+    
+    def _count_risks(self, task_id: int) -> int:
+        db = SessionLocal()
+        try:
+            return db.query(Risk).filter(Risk.task_id == task_id).count()
         finally:
             db.close()
     
-    async def _run_review_pipeline(self, task_id: int):
-        """执行完整的审查管道"""
+    def _set_task_status(self, task_id: int, status: str) -> bool:
+        """更新任务状态，任务不存在时返回False"""
+        db = SessionLocal()
         try:
-            # 阶段1: OCR和文本提取
-            await manager.send_progress(task_id, {
-                "stage": "ocr",
-                "progress": 20,
-                "message": "正在提取文本内容"
-            })
-            
-            ocr_text = await self._ensure_ocr_text(task_id)
+            task = db.query(Task).filter(Task.id == task_id).first()
+            if not task:
+                return False
+            task.status = status
+            db.commit()
+            return True
+        finally:
+            db.close()
+    
+    def _complete_task(self, task_id: int):
+        """任务置为完成，同一事务中把审查结果物化到tasks.review_result，结果接口直接读取"""
+        db = SessionLocal()
+        try:
+            task = db.query(Task).filter(Task.id == task_id).first()
+            if not task:
+                return
+            task.status = "COMPLETED"
+            task.review_result = self._build_review_result(db, task_id, task.status, task.contract_type, task.role)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+    
+    def _get_review_params(self, task_id: int) -> Tuple[str, str]:
+        """读取任务的合同类型和角色"""
+        db = SessionLocal()
+        try:
+            task = db.query(Task).filter(Task.id == task_id).first()
+            return task.contract_type, task.role
+        finally:
+            db.close()
+    
+    def _get_base_task_id(self, task_id: int) -> Optional[int]:
+        """
+        增量复审的基准任务：上一版合同属于同一用户且已审查完成，合同类型和角色与本次一致
+        
+        不满足条件时返回None，按全量审查处理
+        """
+        db = SessionLocal()
+        try:
+            task = db.query(Task).filter(Task.id == task_id).first()
+            if not task or not task.parent_task_id:
+                return None
+            parent = db.query(Task).filter(Task.id == task.parent_task_id, Task.user_id == task.user_id).first()
+            if not parent:
+                logger.info(f"Base task {task.parent_task_id} of task {task_id} not found for its user, running full review")
+                return None
+            if parent.status != "COMPLETED":
+                logger.info(f"Base task {task.parent_task_id} of task {task_id} is not completed, running full review")
+                return None
+            if parent.role != task.role or parent.contract_type != task.contract_type:
+                logger.info(f"Base task {parent.id} of task {task_id} has a different role or contract type, "
+                            f"running full review")
+                return None
+            return parent.id
+        finally:
+            db.close()
+    
+    async def _run_review_pipeline(self, task_id: int, budget: Optional[ReviewBudget] = None,
+                                   use_cache: bool = True):
+        """
+        执行完整的审查管道
+        
+        每个阶段完成后记录检查点（阶段、输入哈希、完成时间），
+        重试或恢复时输入未变的已完成阶段直接跳过；各阶段写库均为替换语义，可安全重做。
+        CPU密集阶段（文本提取、段落切分、向量计算）在进程池执行，同步数据库调用在线程池执行，
+        事件循环只负责调度和LLM调用，审查期间WebSocket心跳和其他请求不受影响。
+        map_reduce模式的首次审查走流式流水线，提取、分段、向量化和分析重叠执行。
+        各阶段耗时和整体耗时记录到Prometheus直方图。
+        各阶段在时间预算内执行，剩余时间不足时风险分析降级，见ReviewBudget
+        """
+        try:
+            start = time.perf_counter()
+            budget = budget or ReviewBudget()
+            checkpoints = get_checkpoint_store()
+            if await self._can_stream(task_id, checkpoints):
+                mode = "streaming"
+                risks_count, degraded = await self._run_streaming_stages(task_id, checkpoints, budget, use_cache)
+            else:
+                mode = "sequential"
+                risks_count, degraded = await self._run_sequential_stages(task_id, checkpoints, budget, use_cache)
+            REVIEW_DURATION.labels(mode=mode).observe(time.perf_counter() - start)
             
-            # 阶段2: 段落分割
+            # 阶段5: 完成
             await manager.send_progress(task_id, {
-                "stage": "segmentation",
-                "progress": 40,
-                "message": "正在分割段落"
+                "stage": "complete",
+                "progress": 100,
+                "message": "审查完成"
             })
             
-            paragraphs = get_file_service().split_text_into_paragraphs(ocr_text)
+            # 更新任务状态并物化审查结果
+            await run_blocking(self._complete_task, task_id)
             
-            # 阶段3: 向量化
+            # 发送完成消息
+            completion = {
+                "risks_count": risks_count,
+                "message": "合同审查已完成"
+            }
+            if degraded:
+                completion["degraded"] = degraded
+                completion["message"] = "合同审查已完成（时间预算不足，部分条款需人工复核）"
+            await manager.send_completion(task_id, completion)
+            
+        except Exception as e:
+            logger.error(f"Error in review pipeline: {e}")
+            raise
+    
+    async def _run_sequential_stages(self, task_id: int, checkpoints, budget: ReviewBudget,
+                                     use_cache: bool = True) -> Tuple[int, Optional[str]]:
+        """
+        逐阶段执行审查（支持按检查点跳过已完成阶段），返回风险数和降级级别（未降级为None）
+        
+        同一文档（相同文件内容）已有的提取文本、段落向量和相同角色/合同类型的审查结果直接复用
+        """
+        documents = get_document_service()
+        document = await run_blocking(documents.ensure_task_document, task_id)
+        
+        # 阶段1: OCR和文本提取（文本持久化在文件记录和文档上，重做时直接复用）
+        await manager.send_progress(task_id, {
+            "stage": "ocr",
+            "progress": 20,
+            "message": "正在提取文本内容"
+        })
+        
+        ocr_text = await budget.run("ocr", self._ensure_ocr_text(task_id, document))
+        ocr_hash = await run_blocking(self._ocr_input_hash, task_id)
+        if not await run_blocking(checkpoints.is_complete, task_id, "ocr", ocr_hash):
+            await run_blocking(checkpoints.record, task_id, "ocr", ocr_hash, {"chars": len(ocr_text)})
+        
+        # 阶段2: 段落分割（纯计算，结果哈希作为后续阶段的输入）
+        await manager.send_progress(task_id, {
+            "stage": "segmentation",
+            "progress": 40,
+            "message": "正在分割段落"
+        })
+        
+        with observe_stage("segmentation"):
+            paragraphs = await budget.run("segmentation", run_cpu_bound(split_paragraphs, ocr_text))
+        text_hash = stage_input_hash(ocr_text)
+        paragraphs_hash = stage_input_hash(paragraphs)
+        if not await run_blocking(checkpoints.is_complete, task_id, "segmentation", text_hash):
+            await run_blocking(checkpoints.record, task_id, "segmentation", text_hash, {"paragraphs": len(paragraphs)})
+        
+        # 阶段3: 向量化（同一文档已有相同切分结果的段落向量时直接共享）
+        vectorized = False
+        paragraphs_task_id = task_id
+        shared_task_id = None
+        if document:
+            shared_task_id = await run_blocking(documents.shared_paragraphs_task, document["id"], paragraphs_hash)
+        if shared_task_id and shared_task_id != task_id:
+            paragraphs_task_id = shared_task_id
+            await self._send_stage_skipped(task_id, "vectorize", 60, "复用同一文档已有的段落向量，跳过")
+        elif await run_blocking(checkpoints.is_complete, task_id, "vectorize", paragraphs_hash):
+            await self._send_stage_skipped(task_id, "vectorize", 60, "向量化已完成，跳过")
+        else:
             await manager.send_progress(task_id, {
                 "stage": "vectorize",
                 "progress": 60,
                 "message": "正在进行向量化处理"
             })
             
-            get_ai_service().vectorize_paragraphs(task_id, paragraphs)
-            
-            # 阶段4: 风险分析
+            with observe_stage("vectorize"):
+                await budget.run("vectorize", get_ai_service().avectorize_paragraphs(task_id, paragraphs))
+            await run_blocking(checkpoints.record, task_id, "vectorize", paragraphs_hash, {"paragraphs": len(paragraphs)})
+            vectorized = True
+        if document and paragraphs_task_id == task_id:
+            await run_blocking(documents.register_paragraphs, document["id"], task_id, paragraphs_hash, len(paragraphs))
+        
+        # 阶段4: 风险分析
+        contract_type, role = await run_blocking(self._get_review_params, task_id)
+        
+        ai_service = get_ai_service()
+        base_task_id = await run_blocking(self._get_base_task_id, task_id)
+        # 增量复审的上一版任务、共享段落的来源任务作为分析输入的一部分；独立首审的哈希保持不变
+        analysis_hash = stage_input_hash(paragraphs_hash, contract_type, role, ai_service.analysis_mode,
+                                         *([base_task_id] if base_task_id else []),
+                                         *([{"paragraphs_task_id": paragraphs_task_id}]
+                                           if paragraphs_task_id != task_id else []))
+        analysis_checkpoint = await run_blocking(checkpoints.get, task_id, "analysis")
+        analysis_output = (analysis_checkpoint or {}).get("output") or {}
+        # 段落重新入库后ID会变化，已有风险的段落引用失效，必须重新分析；降级完成的分析重试时也重新分析
+        if (not vectorized and analysis_checkpoint and analysis_checkpoint["input_hash"] == analysis_hash
+                and not analysis_output.get("degraded")):
+            await self._send_stage_skipped(task_id, "analysis", 80, "风险分析已完成，跳过")
+            risks_count = analysis_output.get("risks", 0)
+            output = analysis_output
+        else:
             await manager.send_progress(task_id, {
                 "stage": "analysis",
                 "progress": 80,
                 "message": "正在进行风险分析"
             })
             
-            db = SessionLocal()
-            task = db.query(Task).filter(Task.id == task_id).first()
-            risks = get_ai_service().analyze_contract_risks(
-                task_id, 
-                task.contract_type, 
-                task.role
+            with observe_stage("analysis"):
+                # 替换上一次未完成分析留下的风险
+                await run_blocking(ai_service.clear_task_risks, task_id)
+                output = {}
+                cache_key = None
+                cached_risks = None
+                if document:
+                    cache_key = review_cache_key(document["content_hash"], role, contract_type,
+                                                 RISK_PROMPT_VERSION, ai_service.analysis_mode)
+                    if use_cache:
+                        cached_risks = await run_blocking(documents.get_cached_review, cache_key, paragraphs_task_id)
+                
+                if cached_risks is not None:
+                    logger.info(f"🎯 Review result cache hit for task {task_id} ({role}, {contract_type})")
+                    risks = await run_blocking(ai_service.save_task_risks, task_id, cached_risks)
+                    push_risk = self._risk_pusher(task_id, 80)
+                    for risk in risks:
+                        await push_risk(risk, True)
+                    output["cached"] = True
+                else:
+                    with llm_call_scope(task_id, "risk_analysis"):
+                        risks, analysis_output = await self._analyze_within_budget(
+                            task_id, budget, contract_type, role, paragraphs_task_id, base_task_id, use_cache
+                        )
+                    output.update(analysis_output)
+                    # 降级结果不写入审查结果缓存
+                    if cache_key and not output.get("degraded"):
+                        await run_blocking(documents.save_cached_review, cache_key, document["content_hash"], role,
+                                           contract_type, ai_service.analysis_mode, risks, paragraphs_task_id, task_id)
+            risks_count = len(risks)
+            await run_blocking(checkpoints.record, task_id, "analysis", analysis_hash, {"risks": risks_count, **output})
+        
+        return risks_count, output.get("degraded")
+    
+    async def _analyze_within_budget(self, task_id: int, budget: ReviewBudget, contract_type: str, role: str,
+                                     paragraphs_task_id: int, base_task_id: Optional[int],
+                                     use_cache: bool = True) -> Tuple[List[Dict], Dict]:
+        """
+        在时间预算内执行风险分析，返回风险列表和检查点输出
+        
+        剩余时间充足时完整分析（增量复审或全量），不足时降级为精简分析；
+        LLM分析超时或剩余时间只够规则标记时，保留已写入的风险并按规则补充需人工复核的条款
+        """
+        ai_service = get_ai_service()
+        push_risk = self._risk_pusher(task_id, 80)
+        output = {}
+        level = budget.analysis_level()
+        try:
+            if level == "full" and base_task_id:
+                base_paragraphs_task_id = await run_blocking(get_document_service().paragraphs_task_id, base_task_id)
+                risks, output["incremental"] = await budget.run("analysis", ai_service.analyze_contract_risks_incremental(
+                    task_id, base_task_id, contract_type, role,
+                    use_cache=use_cache,
+                    on_risk=push_risk,
+                    paragraphs_task_id=paragraphs_task_id,
+                    base_paragraphs_task_id=base_paragraphs_task_id
+                ), reserve=budget.rules_reserve)
+            elif level == "full":
+                risks = await budget.run("analysis", ai_service.analyze_contract_risks_async(
+                    task_id, contract_type, role, use_cache=use_cache, on_risk=push_risk,
+                    paragraphs_task_id=paragraphs_task_id
+                ), reserve=budget.rules_reserve)
+            elif level == "reduced":
+                risks = await budget.run("analysis", ai_service.analyze_contract_risks_reduced(
+                    task_id, contract_type, role, use_cache=use_cache, on_risk=push_risk,
+                    paragraphs_task_id=paragraphs_task_id
+                ), reserve=budget.rules_reserve)
+        except StageDeadlineExceeded:
+            level = "rules"
+        
+        if level == "rules":
+            risks = await ai_service.analyze_contract_risks_rules(
+                task_id, on_risk=push_risk, paragraphs_task_id=paragraphs_task_id
             )
-            db.close()
-            
-            # 阶段5: 完成
+        if level != "full":
+            await self._mark_degraded(task_id, level)
+            output["degraded"] = level
+        return risks, output
+    
+    async def _mark_degraded(self, task_id: int, level: str):
+        """记录并推送审查降级"""
+        logger.warning(f"⏬ Review of task {task_id} degraded to {level} analysis due to time budget")
+        REVIEW_DEGRADED.labels(level=level).inc()
+        await manager.send_progress(task_id, {
+            "stage": "analysis",
+            "progress": 90,
+            "degraded": level,
+            "message": "审查时间预算不足，已降级分析，部分条款需人工复核"
+        })
+    
+    async def _can_stream(self, task_id: int, checkpoints) -> bool:
+        """
+        是否走流式流水线
+        
+        仅map_reduce分析模式可按块边到达边分析；已有向量化检查点说明是恢复运行，
+        走逐阶段路径以便跳过已完成阶段；增量复审需要全部段落入库后才能比对，
+        文档已有共享段落时逐阶段路径可直接复用，也不走流式
+        """
+        if not self.streaming_pipeline or get_ai_service().analysis_mode != "map_reduce":
+            return False
+        if await run_blocking(self._get_base_task_id, task_id):
+            return False
+        document = await run_blocking(get_document_service().ensure_task_document, task_id)
+        if document and document["paragraphs_task_id"]:
+            return False
+        return await run_blocking(checkpoints.get, task_id, "vectorize") is None
+    
+    async def _run_streaming_stages(self, task_id: int, checkpoints, budget: ReviewBudget,
+                                    use_cache: bool = True) -> Tuple[int, Optional[str]]:
+        """
+        流式执行提取、分段、向量化和风险分析，返回风险数和降级级别（未降级为None）
+        
+        结束后补记与逐阶段路径一致的检查点，并把段落向量和审查结果登记到文档供后续审查复用；
+        流水线超出时间预算时保留已写入的风险，按已入库的段落规则补充，不登记文档也不记录前序阶段检查点，重试时重新执行
+        """
+        ai_service = get_ai_service()
+        documents = get_document_service()
+        document = await run_blocking(documents.ensure_task_document, task_id)
+        file_path, ocr_text = await run_blocking(self._load_file_text, task_id)
+        if not ocr_text and document:
+            ocr_text = document["ocr_text"]
+        contract_type, role = await run_blocking(self._get_review_params, task_id)
+        
+        await manager.send_progress(task_id, {
+            "stage": "ocr",
+            "progress": 20,
+            "message": "正在流式提取、分析合同内容"
+        })
+        
+        async def push_progress(stage: str, done: int, total: Optional[int]):
+            if stage == "ocr":
+                await manager.send_progress(task_id, {
+                    "stage": "ocr",
+                    "progress": 20 + int(40 * done / max(total, 1)),
+                    "message": f"已提取 {done}/{total} 页"
+                })
+        
+        # 替换上一次未完成运行留下的风险（段落由流水线在向量化前清理）
+        await run_blocking(ai_service.clear_task_risks, task_id)
+        try:
+            with observe_stage("streaming"), llm_call_scope(task_id, "risk_analysis"):
+                result = await budget.run("streaming", StreamingReviewPipeline(ai_service).run(
+                    task_id, file_path, ocr_text, contract_type, role,
+                    use_cache=use_cache,
+                    on_risk=self._risk_pusher(task_id, 80),
+                    on_progress=push_progress
+                ), reserve=budget.rules_reserve)
+        except StageDeadlineExceeded:
+            risks = await ai_service.analyze_contract_risks_rules(task_id, on_risk=self._risk_pusher(task_id, 80))
+            await self._mark_degraded(task_id, "rules")
+            await run_blocking(
+                checkpoints.record, task_id, "analysis",
+                stage_input_hash(contract_type, role, ai_service.analysis_mode),
+                {"risks": len(risks), "degraded": "rules"}
+            )
+            return len(risks), "rules"
+        
+        ocr_text = result["ocr_text"]
+        paragraphs = result["paragraphs"]
+        if result["extracted"]:
+            await run_blocking(get_file_service().update_file_ocr_text, task_id, ocr_text)
+        
+        ocr_hash = await run_blocking(self._ocr_input_hash, task_id)
+        text_hash = stage_input_hash(ocr_text)
+        paragraphs_hash = stage_input_hash(paragraphs)
+        risks_count = len(result["risks"])
+        if document:
+            await run_blocking(documents.save_text, document["id"], ocr_text)
+            await run_blocking(documents.register_paragraphs, document["id"], task_id, paragraphs_hash, len(paragraphs))
+            await run_blocking(
+                documents.save_cached_review,
+                review_cache_key(document["content_hash"], role, contract_type, RISK_PROMPT_VERSION,
+                                 ai_service.analysis_mode),
+                document["content_hash"], role, contract_type, ai_service.analysis_mode, result["risks"],
+                task_id, task_id
+            )
+        await run_blocking(checkpoints.record, task_id, "ocr", ocr_hash, {"chars": len(ocr_text)})
+        await run_blocking(checkpoints.record, task_id, "segmentation", text_hash, {"paragraphs": len(paragraphs)})
+        await run_blocking(checkpoints.record, task_id, "vectorize", paragraphs_hash, {"paragraphs": len(paragraphs)})
+        await run_blocking(
+            checkpoints.record, task_id, "analysis",
+            stage_input_hash(paragraphs_hash, contract_type, role, ai_service.analysis_mode),
+            {"risks": risks_count}
+        )
+        return risks_count, None
+    
+    def _risk_pusher(self, task_id: int, progress: int) -> Callable[[Dict, bool], Awaitable[None]]:
+        """流式分析时每条风险一闭合就推送给前端"""
+        async def push_risk(risk: Dict, is_new: bool):
             await manager.send_progress(task_id, {
-                "stage": "complete",
-                "progress": 100,
-                "message": "审查完成"
+                "stage": "risk",
+                "progress": progress,
+                "is_new": is_new,
+                "risk": self._format_streamed_risk(risk)
             })
-            
-            # 更新任务状态
-            db = SessionLocal()
-            task = db.query(Task).filter(Task.id == task_id).first()
-            task.status = "COMPLETED"
-            db.commit()
+        return push_risk
+    
+    async def _send_stage_skipped(self, task_id: int, stage: str, progress: int, message: str):
+        """推送阶段已由检查点完成的进度消息"""
+        logger.info(f"⏭️ Stage {stage} already completed for task {task_id}, skipping")
+        await manager.send_progress(task_id, {
+            "stage": stage,
+            "progress": progress,
+            "skipped": True,
+            "message": message
+        })
+    
+    def _format_streamed_risk(self, risk: Dict) -> Dict:
+        """将流式风险转换为与审查结果一致的格式"""
+        return {
+            "id": risk.get("id"),
+            "clause_id": risk.get("clause_id", ""),
+            "title": risk.get("title", ""),
+            "risk_level": risk.get("risk_level", "MEDIUM"),
+            "summary": risk.get("summary", ""),
+            "suggestion": risk.get("suggestion", ""),
+            "paragraph_refs": risk.get("paragraph_refs", []),
+            "statutes": [{"ref": law, "text": ""} for law in risk.get("related_laws", [])]
+        }
+    
+    async def _ensure_ocr_text(self, task_id: int, document: Optional[Dict] = None) -> str:
+        """确保OCR文本已提取（优先复用文件和文档上的文本，文本提取在进程池中执行）"""
+        file_path, ocr_text = await run_blocking(self._load_file_text, task_id)
+        if ocr_text:
+            return ocr_text
+        if document and document["ocr_text"]:
+            return document["ocr_text"]
+        
+        with observe_stage("ocr"):
+            start = time.perf_counter()
+            ocr_text = await run_cpu_bound(extract_text, file_path)
+            elapsed = time.perf_counter() - start
+        record_ocr_throughput(await run_cpu_bound(count_pages, file_path), elapsed)
+        await run_blocking(get_file_service().update_file_ocr_text, task_id, ocr_text)
+        if document:
+            await run_blocking(get_document_service().save_text, document["id"], ocr_text)
+        return ocr_text
+    
+    def _load_file_text(self, task_id: int) -> Tuple[str, str]:
+        """读取任务文件路径和已提取的文本"""
+        db = SessionLocal()
+        try:
+            file_record = db.query(File).filter(File.task_id == task_id).first()
+            if not file_record:
+                raise ValueError(f"No file found for task {task_id}")
+            return file_record.path, file_record.ocr_text
+        finally:
             db.close()
-            
-            # 发送完成消息
-            await manager.send_completion(task_id, {
-                "risks_count": len(risks),
-                "message": "合同审查已完成"
-            })
-            
-        except Exception as e:
-            logger.error(f"Error in review pipeline: {e}")
-            raise
     
-    async def _ensure_ocr_text(self, task_id: int) -> str:
-        """确保OCR文本已提取"""
+    def _ocr_input_hash(self, task_id: int) -> str:
+        """OCR阶段的输入哈希：文件路径、内容哈希和文件大小（不依赖提取出的文本）"""
         db = SessionLocal()
         try:
             file_record = db.query(File).filter(File.task_id == task_id).first()
             if not file_record:
                 raise ValueError(f"No file found for task {task_id}")
-            
-            if not file_record.ocr_text:
-                # 提取文本
-                ocr_text = get_file_service().extract_text_from_file(file_record.path)
-                file_record.ocr_text = ocr_text
-                db.commit()
-                return ocr_text
-            else:
-                return file_record.ocr_text
-                
+            path = file_record.path
+            size = os.path.getsize(path) if path and os.path.exists(path) else None
+            return stage_input_hash(path, file_record.content_hash, size)
         finally:
             db.close()
     
@@ -307,50 +793,43 @@ class ReviewService:
         
         return candidates
     
+    def load_review_result_json(self, db: Session, task_id: int) -> Optional[bytes]:
+        """
+        按主键读取已完成任务物化的审查结果JSON，不反序列化，直接作为响应体返回
+        
+        任务未完成或结果尚未物化时返回None
+        """
+        row = db.query(Task.status, cast(Task.review_result, Text).label("review_result")).filter(
+            Task.id == task_id
+        ).first()
+        if row and row.status == "COMPLETED" and row.review_result and row.review_result != "null":
+            return row.review_result.encode("utf-8")
+        return None
+    
     def get_review_result(self, task_id: int) -> Dict:
-        """获取审查结果"""
+        """
+        获取审查结果
+        
+        已完成的任务直接返回完成时物化的结果；未完成的任务实时组装。
+        物化之前完成的历史任务首次读取时组装并补写物化结果
+        """
         db = SessionLocal()
         try:
-            from ..models import Risk, Statute
-            
-            # 获取任务信息
-            task = db.query(Task).filter(Task.id == task_id).first()
+            task = db.query(Task.status, Task.contract_type, Task.role, Task.review_result).filter(
+                Task.id == task_id
+            ).first()
             if not task:
                 raise ValueError(f"Task {task_id} not found")
-            
-            # 获取风险列表
-            risks = db.query(Risk).filter(Risk.task_id == task_id).all()
-            
-            risk_list = []
-            for risk in risks:
-                # 获取相关法规
-                statutes = db.query(Statute).filter(Statute.risk_id == risk.id).all()
-                
-                risk_data = {
-                    "id": risk.id,
-                    "clause_id": risk.clause_id,
-                    "title": risk.title,
-                    "risk_level": risk.risk_level,
-                    "summary": risk.summary,
-                    "suggestion": risk.suggestion,
-                    "statutes": [{
-                        "ref": statute.statute_ref,
-                        "text": statute.statute_text
-                    } for statute in statutes]
-                }
-                risk_list.append(risk_data)
-            
-            # 生成摘要
-            summary = self._generate_summary(risk_list)
-            
-            return {
-                "task_id": task_id,
-                "status": task.status,
-                "contract_type": task.contract_type,
-                "role": task.role,
-                "risks": risk_list,
-                "summary": summary
-            }
+            if task.status == "COMPLETED" and task.review_result:
+                return task.review_result
+            
+            result = self._build_review_result(db, task_id, task.status, task.contract_type, task.role)
+            if task.status == "COMPLETED":
+                db.query(Task).filter(Task.id == task_id, Task.status == "COMPLETED").update(
+                    {Task.review_result: result}, synchronize_session=False
+                )
+                db.commit()
+            return result
             
         except Exception as e:
             logger.error(f"Error getting review result: {e}")
@@ -358,6 +837,49 @@ class ReviewService:
         finally:
             db.close()
     
+    def _build_review_result(self, db: Session, task_id: int, status: str, contract_type: str,
+                             role: str) -> Dict:
+        """组装审查结果（风险和法规引用一次预加载，查询数与风险数无关）"""
+        risks = db.query(Risk).options(selectinload(Risk.statutes)).filter(
+            Risk.task_id == task_id
+        ).order_by(Risk.id).all()
+        
+        risk_list = []
+        for risk in risks:
+            risk_list.append({
+                "id": risk.id,
+                "clause_id": risk.clause_id,
+                "title": risk.title,
+                "risk_level": risk.risk_level,
+                "summary": risk.summary,
+                "suggestion": risk.suggestion,
+                "paragraph_refs": risk.paragraph_refs or [],
+                "statutes": [{
+                    "ref": statute.statute_ref,
+                    "text": statute.statute_text
+                } for statute in sorted(risk.statutes, key=lambda statute: statute.id)]
+            })
+        
+        # 生成摘要
+        summary = self._generate_summary(risk_list)
+        
+        # 时间预算不足时的降级级别（reduced/rules），未降级为None
+        analysis_checkpoint = db.query(ReviewCheckpoint.output).filter(
+            ReviewCheckpoint.task_id == task_id,
+            ReviewCheckpoint.stage == "analysis"
+        ).first()
+        
+        return {
+            "task_id": task_id,
+            "status": status,
+            "contract_type": contract_type,
+            "role": role,
+            "degraded": ((analysis_checkpoint.output or {}).get("degraded")
+                         if analysis_checkpoint else None),
+            "risks": risk_list,
+            "summary": summary
+        }
+    
     def _generate_summary(self, risks: List[Dict]) -> Dict:
         """生成风险摘要"""
         total_risks = len(risks)
@@ -0,0 +1,227 @@
+import json
+import re
+import unicodedata
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# 条款标题，如“第一条”“第12条”“十、”
+CLAUSE_HEADING_PATTERN = re.compile(r"^\s*(第[一二三四五六七八九十百零〇\d]+[条章节]|[一二三四五六七八九十]+、|\d+[\.、])")
+
+_TITLE_NOISE_PATTERN = re.compile(r"[\s，。、；：？！“”‘’（）《》【】,.;:?!\"'()\[\]<>\-_]+")
+
+RISK_LEVEL_ORDER = {"LOW": 0, "MEDIUM": 1, "HIGH": 2}
+
+# 风险关注领域及其检索关键词（category模式下每个领域单独检索、单独分析）
+RISK_CATEGORIES = [
+    {"key": "payment", "label": "付款条款和违约责任", "keywords": ["付款", "价款支付", "违约金", "违约责任", "逾期"]},
+    {"key": "delivery", "label": "交付时间和质量标准", "keywords": ["交付", "交货期限", "验收", "质量标准", "质保"]},
+    {"key": "ip", "label": "知识产权条款", "keywords": ["知识产权", "著作权", "专利", "商标", "保密"]},
+    {"key": "liability", "label": "免责和限责条款", "keywords": ["免责", "责任限制", "赔偿上限", "间接损失", "不可抗力"]},
+    {"key": "dispute", "label": "争议解决机制", "keywords": ["争议解决", "仲裁", "诉讼", "管辖", "适用法律"]},
+    {"key": "termination", "label": "合同变更和终止条件", "keywords": ["合同变更", "解除", "终止", "续约", "有效期"]},
+]
+
+
+class ParagraphChunker:
+    """
+    增量切块：段落逐个到达，凑满一块即返回，切分规则与chunk_paragraphs一致
+
+    超长时必须切分；块已过半且遇到新条款时优先在条款边界切分
+    """
+
+    def __init__(self, max_chars: int):
+        self.max_chars = max_chars
+        self.current: List = []
+        self.current_len = 0
+
+    def add(self, paragraph) -> Optional[List]:
+        """加入一个段落，上一块已完整时返回该块"""
+        length = len(paragraph.text or "")
+        starts_clause = bool(CLAUSE_HEADING_PATTERN.match(paragraph.text or ""))
+        completed = None
+        if self.current and (self.current_len + length > self.max_chars
+                             or (starts_clause and self.current_len >= self.max_chars // 2)):
+            completed = self.current
+            self.current = []
+            self.current_len = 0
+        self.current.append(paragraph)
+        self.current_len += length
+        return completed
+
+    def flush(self) -> Optional[List]:
+        """返回剩余的最后一块"""
+        completed, self.current, self.current_len = self.current or None, [], 0
+        return completed
+
+
+def chunk_paragraphs(paragraphs: Sequence, max_chars: int) -> List[List]:
+    """
+    按条款边界将段落分组为不超过max_chars的块
+
+    Args:
+        paragraphs: 带有text属性的段落对象（按文档顺序）
+        max_chars: 每块最大字符数
+
+    Returns:
+        段落分组列表
+    """
+    chunker = ParagraphChunker(max_chars)
+    chunks = [chunk for chunk in (chunker.add(paragraph) for paragraph in paragraphs) if chunk]
+    last = chunker.flush()
+    if last:
+        chunks.append(last)
+    return chunks
+
+
+def normalize_risk_title(title: str) -> str:
+    """归一化风险标题用于去重"""
+    normalized = unicodedata.normalize("NFKC", title or "").lower()
+    return _TITLE_NOISE_PATTERN.sub("", normalized)
+
+
+class RiskMerger:
+    """增量合并并去重各块的风险结果"""
+
+    def __init__(self):
+        self._risks: Dict[str, Dict] = {}
+
+    def add(self, risk: Dict, fallback_refs: Optional[List[int]] = None) -> Tuple[bool, Dict]:
+        """
+        合并一条风险
+
+        Returns:
+            (是否为新风险, 合并后的风险)
+        """
+        refs = [ref for ref in (risk.get("paragraph_refs") or []) if isinstance(ref, int)]
+        if not refs and fallback_refs:
+            refs = list(fallback_refs)
+
+        key = normalize_risk_title(risk.get("title", "")) or normalize_risk_title(risk.get("summary", ""))[:50]
+        existing = self._risks.get(key)
+        if existing is None:
+            merged = dict(risk)
+            merged["paragraph_refs"] = sorted(set(refs))
+            merged["related_laws"] = list(dict.fromkeys(risk.get("related_laws") or []))
+            self._risks[key] = merged
+            return True, merged
+
+        existing["paragraph_refs"] = sorted(set(existing["paragraph_refs"]) | set(refs))
+        existing["related_laws"] = list(dict.fromkeys(existing["related_laws"] + list(risk.get("related_laws") or [])))
+        # 同一风险取更高的风险等级
+        if RISK_LEVEL_ORDER.get(risk.get("risk_level"), 1) > RISK_LEVEL_ORDER.get(existing.get("risk_level"), 1):
+            existing["risk_level"] = risk["risk_level"]
+        return False, existing
+
+    @property
+    def risks(self) -> List[Dict]:
+        return list(self._risks.values())
+
+
+class IncrementalRiskParser:
+    """
+    增量JSON解析器：流式输入模型输出，每当一个风险对象闭合时立即产出
+
+    不要求输出是严格的顶层JSON，代码块标记、前置说明文字都会被跳过
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        self._in_string = False
+        self._escape = False
+        self._starts: List[int] = []
+
+    def feed(self, text: str) -> List[Dict]:
+        """输入一段增量文本，返回本次新闭合的风险对象"""
+        self._buffer += text
+        completed = []
+        while self._pos < len(self._buffer):
+            char = self._buffer[self._pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{":
+                self._starts.append(self._pos)
+            elif char == "}" and self._starts:
+                start = self._starts.pop()
+                risk = self._try_parse(self._buffer[start:self._pos + 1])
+                if risk is not None:
+                    completed.append(risk)
+            self._pos += 1
+        return completed
+
+    @staticmethod
+    def _try_parse(fragment: str) -> Optional[Dict]:
+        try:
+            value = json.loads(fragment)
+        except json.JSONDecodeError:
+            return None
+        if isinstance(value, dict) and "title" in value and "risks" not in value:
+            return value
+        return None
+
+
+def keyword_hits(text: str, categories: Sequence[Dict] = RISK_CATEGORIES) -> Dict[str, int]:
+    """文本命中各关注领域关键词的次数（只含命中的领域）"""
+    hits = {}
+    for category in categories:
+        count = sum(text.count(keyword) for keyword in category["keywords"])
+        if count:
+            hits[category["key"]] = count
+    return hits
+
+
+def select_chunks_by_keywords(chunks: List[List], max_chunks: int) -> List[List]:
+    """
+    降级分析时挑选关键词命中最多的max_chunks个块（保持文档顺序）
+
+    Args:
+        chunks: chunk_paragraphs的分块结果
+        max_chunks: 最多保留的块数
+
+    Returns:
+        保留的块
+    """
+    if len(chunks) <= max_chunks:
+        return list(chunks)
+    scores = [sum(keyword_hits(" ".join(p.text for p in chunk)).values()) for chunk in chunks]
+    keep = sorted(sorted(range(len(chunks)), key=lambda i: -scores[i])[:max_chunks])
+    return [chunks[i] for i in keep]
+
+
+def rule_based_risks(paragraphs: Sequence, covered_refs: Sequence[int] = (),
+                     categories: Sequence[Dict] = RISK_CATEGORIES) -> List[Dict]:
+    """
+    按关注领域关键词标记需人工复核的条款（不调用LLM，审查时间预算耗尽时使用）
+
+    每个命中的领域生成一条风险，关联命中的段落；命中段落已全部被已有风险引用的领域跳过
+
+    Args:
+        paragraphs: 带有id、text属性的段落对象
+        covered_refs: 已有风险引用的段落ID
+        categories: 关注领域
+
+    Returns:
+        风险列表（与LLM分析结果格式一致）
+    """
+    covered = set(covered_refs)
+    risks = []
+    for category in categories:
+        matched = [p.id for p in paragraphs if keyword_hits(p.text or "", [category])]
+        if not matched or set(matched) <= covered:
+            continue
+        risks.append({
+            "title": f"{category['label']}需人工复核",
+            "risk_level": "MEDIUM",
+            "summary": f"审查时间预算不足，以下{len(matched)}个段落涉及{category['label']}，未经模型分析",
+            "suggestion": "请人工复核相关条款，或稍后重新发起完整审查",
+            "related_laws": [],
+            "paragraph_refs": matched,
+            "clause_id": "",
+        })
+    return risks
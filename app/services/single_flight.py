@@ -0,0 +1,184 @@
+import asyncio
+import hashlib
+import os
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+import logging
+
+from sqlalchemy import text
+
+from ..metrics import SINGLE_FLIGHT_CALLS
+from ..database import SessionLocal
+from .executors import run_blocking
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def flight_key(operation: str, ident) -> str:
+    """生成单飞键，如 ner:task:12、ocr:sha256"""
+    return f"{operation}:{ident}"
+
+
+def _lock_id(key: str) -> int:
+    """将单飞键映射为Postgres咨询锁使用的64位整数"""
+    return int.from_bytes(hashlib.sha256(key.encode("utf-8")).digest()[:8], "big", signed=True)
+
+
+class _Call:
+    """一次进行中的同步计算"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    单飞去重：相同键的并发调用只执行一次，其余调用方等待同一结果
+
+    进程内通过共享Future/Event去重；跨worker通过Postgres咨询锁串行化，
+    拿到锁后先调用lookup检查其他worker是否已经持久化了结果
+    """
+
+    def __init__(self):
+        self.db_lock_enabled = os.getenv("SINGLE_FLIGHT_DB_LOCK", "true").lower() == "true"
+        self.lock_poll_interval = float(os.getenv("SINGLE_FLIGHT_LOCK_POLL_INTERVAL", "0.2"))
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._futures: Dict[str, asyncio.Future] = {}
+
+    @staticmethod
+    def _operation(key: str) -> str:
+        return key.split(":", 1)[0]
+
+    def _use_db_lock(self, db) -> bool:
+        return self.db_lock_enabled and db.get_bind().dialect.name == "postgresql"
+
+    @staticmethod
+    def _try_lock(db, key: str) -> bool:
+        return bool(db.execute(text("SELECT pg_try_advisory_lock(:id)"), {"id": _lock_id(key)}).scalar())
+
+    @staticmethod
+    def _release(db, key: str, locked: bool):
+        """释放咨询锁并关闭会话"""
+        try:
+            if locked:
+                try:
+                    db.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": _lock_id(key)})
+                    db.commit()
+                except Exception as e:
+                    logger.warning(f"Failed to release advisory lock {key}: {e}")
+        finally:
+            db.close()
+
+    @contextmanager
+    def advisory_lock(self, key: str):
+        """跨worker互斥（阻塞等待）；非Postgres数据库时不加锁"""
+        db = SessionLocal()
+        locked = False
+        try:
+            if self._use_db_lock(db):
+                db.execute(text("SELECT pg_advisory_lock(:id)"), {"id": _lock_id(key)})
+                locked = True
+            yield
+        finally:
+            self._release(db, key, locked)
+
+    @asynccontextmanager
+    async def async_advisory_lock(self, key: str):
+        """跨worker互斥（轮询try_lock，数据库调用在阻塞I/O线程池中执行，不阻塞事件循环）"""
+        db = SessionLocal()
+        attempt: Optional[asyncio.Future] = None
+        locked = False
+        try:
+            if self._use_db_lock(db):
+                while True:
+                    attempt = asyncio.ensure_future(run_blocking(self._try_lock, db, key))
+                    if await asyncio.shield(attempt):
+                        break
+                    await asyncio.sleep(self.lock_poll_interval)
+                locked = True
+            yield
+        finally:
+            # shield：调用方被取消时也要释放锁并归还连接
+            await asyncio.shield(self._arelease(db, key, locked, attempt))
+
+    async def _arelease(self, db, key: str, locked: bool, attempt: Optional[asyncio.Future]):
+        # 取消发生在try_lock执行期间时，等它结束再释放（线程里可能已经拿到锁）
+        if not locked and attempt is not None:
+            await asyncio.wait([attempt])
+            locked = not attempt.cancelled() and attempt.exception() is None and bool(attempt.result())
+        await run_blocking(self._release, db, key, locked)
+
+    def run_sync(self, key: str, fn: Callable[[], T], lookup: Optional[Callable[[], Optional[T]]] = None) -> T:
+        """
+        同步单飞执行
+
+        Args:
+            key: 单飞键
+            fn: 实际计算
+            lookup: 可选，拿到跨worker锁后检查结果是否已存在，返回None表示需要计算
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            SINGLE_FLIGHT_CALLS.labels(operation=self._operation(key), role="follower").inc()
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        SINGLE_FLIGHT_CALLS.labels(operation=self._operation(key), role="leader").inc()
+        try:
+            with self.advisory_lock(key):
+                existing = lookup() if lookup else None
+                call.result = existing if existing is not None else fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    async def run(self, key: str, fn: Callable[[], Awaitable[T]],
+                  lookup: Optional[Callable[[], Optional[T]]] = None) -> T:
+        """异步单飞执行，参数同run_sync（lookup为同步函数，在阻塞I/O线程池中执行）"""
+        future = self._futures.get(key)
+        if future is not None:
+            SINGLE_FLIGHT_CALLS.labels(operation=self._operation(key), role="follower").inc()
+            # shield：跟随者被取消不应取消领导者的计算
+            return await asyncio.shield(future)
+
+        SINGLE_FLIGHT_CALLS.labels(operation=self._operation(key), role="leader").inc()
+
+        async def lead() -> T:
+            async with self.async_advisory_lock(key):
+                existing = await run_blocking(lookup) if lookup else None
+                return existing if existing is not None else await fn()
+
+        future = asyncio.ensure_future(lead())
+        self._futures[key] = future
+        future.add_done_callback(lambda _: self._futures.pop(key, None))
+        return await asyncio.shield(future)
+
+
+# 全局单飞实例 - 延迟初始化
+_single_flight_instance = None
+
+
+def get_single_flight() -> SingleFlight:
+    """获取单飞实例（延迟初始化）"""
+    global _single_flight_instance
+    if _single_flight_instance is None:
+        _single_flight_instance = SingleFlight()
+    return _single_flight_instance
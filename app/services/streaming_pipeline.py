@@ -0,0 +1,172 @@
+import asyncio
+import os
+import time
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
+import logging
+
+from ..metrics import record_ocr_throughput
+from ..models import Paragraph
+from .executors import run_blocking, run_cpu_bound
+from .file_service import count_pages, extract_page_text, split_paragraphs
+from .ai_service import embed_texts
+
+logger = logging.getLogger(__name__)
+
+# 队列结束标记
+_DONE = object()
+
+
+def split_cached_text(text: str, page_chars: int) -> List[str]:
+    """
+    将已提取的全文按双换行边界切成约page_chars长的伪页
+
+    只在段落分隔处切分，逐页分段的结果与整篇分段一致
+    """
+    pages: List[str] = []
+    current: List[str] = []
+    current_len = 0
+    for part in text.split('\n\n'):
+        current.append(part)
+        current_len += len(part)
+        if current_len >= page_chars:
+            pages.append('\n\n'.join(current))
+            current, current_len = [], 0
+    if current:
+        pages.append('\n\n'.join(current))
+    return pages
+
+
+class StreamingReviewPipeline:
+    """
+    重叠执行的流式审查流水线
+
+    提取 → 分段 → 向量化 → 分析 四个阶段由有界队列连接、并发运行：
+    第一页提取完成即开始分段，首批段落入库后即开始切块分析，
+    队列写满时上游阶段等待（背压），长文档的端到端耗时接近最慢阶段而非各阶段之和
+    """
+
+    def __init__(self, ai_service):
+        self.ai_service = ai_service
+        self.queue_size = int(os.getenv("STREAM_QUEUE_SIZE", "8"))
+        self.extract_concurrency = int(os.getenv("STREAM_EXTRACT_CONCURRENCY", "2"))
+        self.embed_batch = int(os.getenv("STREAM_EMBED_BATCH", "16"))
+        self.page_chars = int(os.getenv("STREAM_PAGE_CHARS", "2000"))
+
+    async def run(self, task_id: int, file_path: Optional[str], ocr_text: Optional[str],
+                  contract_type: str, role: str, use_cache: bool = True,
+                  on_risk: Optional[Callable[[Dict, bool], Awaitable[None]]] = None,
+                  on_progress: Optional[Callable[[str, int, Optional[int]], Awaitable[None]]] = None) -> Dict:
+        """
+        运行流水线
+
+        已有OCR文本时按伪页输入（跳过提取），否则从文件逐页提取。
+        返回全文、段落文本列表、风险列表，以及是否执行了文本提取
+        """
+        pages_queue: asyncio.Queue = asyncio.Queue(self.queue_size)
+        paragraphs_queue: asyncio.Queue = asyncio.Queue(self.queue_size * self.embed_batch)
+        stored_queue: asyncio.Queue = asyncio.Queue(self.queue_size * self.embed_batch)
+        pages: List[str] = []
+        paragraphs: List[str] = []
+
+        async def progress(stage: str, done: int, total: Optional[int]):
+            if on_progress:
+                await on_progress(stage, done, total)
+
+        async def extract():
+            if ocr_text:
+                for page in split_cached_text(ocr_text, self.page_chars):
+                    pages.append(page)
+                    await pages_queue.put(page)
+            else:
+                start = time.perf_counter()
+                total = await run_cpu_bound(count_pages, file_path)
+                in_flight: deque = deque()
+                done = 0
+                try:
+                    # 最多extract_concurrency页并行提取，按页码顺序输出
+                    for index in range(total):
+                        in_flight.append(asyncio.ensure_future(run_cpu_bound(extract_page_text, file_path, index, total)))
+                        if len(in_flight) >= self.extract_concurrency:
+                            done += 1
+                            await emit_page(await in_flight.popleft(), done, total)
+                    while in_flight:
+                        done += 1
+                        await emit_page(await in_flight.popleft(), done, total)
+                    # 含下游背压等待，反映流水线实际的提取吞吐
+                    record_ocr_throughput(total, time.perf_counter() - start)
+                finally:
+                    for future in in_flight:
+                        future.cancel()
+            await pages_queue.put(_DONE)
+
+        async def emit_page(text: str, done: int, total: int):
+            if text:
+                pages.append(text)
+                await pages_queue.put(text)
+            await progress("ocr", done, total)
+
+        async def segment():
+            while (page := await pages_queue.get()) is not _DONE:
+                for paragraph in await run_cpu_bound(split_paragraphs, page):
+                    paragraphs.append(paragraph)
+                    await paragraphs_queue.put(paragraph)
+            await paragraphs_queue.put(_DONE)
+
+        async def embed():
+            # 替换语义：先清掉上一次未完成运行留下的段落
+            await run_blocking(self.ai_service.delete_task_paragraphs, task_id)
+            index = 0
+            finished = False
+            while not finished:
+                item = await paragraphs_queue.get()
+                if item is _DONE:
+                    break
+                # 取当前已就绪的段落凑批，不等待凑满
+                batch = [item]
+                while len(batch) < self.embed_batch and not paragraphs_queue.empty():
+                    item = paragraphs_queue.get_nowait()
+                    if item is _DONE:
+                        finished = True
+                        break
+                    batch.append(item)
+                embeddings = await run_cpu_bound(embed_texts, batch)
+                rows = await run_blocking(self.ai_service.append_paragraphs, task_id, index, batch, embeddings)
+                index += len(rows)
+                for row in rows:
+                    await stored_queue.put(row)
+                await progress("vectorize", index, None)
+            await stored_queue.put(_DONE)
+
+        async def stored_paragraphs() -> AsyncIterator[Paragraph]:
+            while (row := await stored_queue.get()) is not _DONE:
+                yield row
+
+        stages = [
+            asyncio.ensure_future(extract()),
+            asyncio.ensure_future(segment()),
+            asyncio.ensure_future(embed()),
+            asyncio.ensure_future(self.ai_service.analyze_paragraph_stream(
+                task_id, stored_paragraphs(), contract_type, role, use_cache=use_cache, on_risk=on_risk
+            )),
+        ]
+        try:
+            # 任一阶段失败立即取消其余阶段，避免上游阻塞在已满的队列上
+            done, _ = await asyncio.wait(stages, return_when=asyncio.FIRST_EXCEPTION)
+            for stage in done:
+                if stage.exception() is not None:
+                    raise stage.exception()
+        finally:
+            for stage in stages:
+                stage.cancel()
+            await asyncio.gather(*stages, return_exceptions=True)
+
+        risks = stages[-1].result()
+        logger.info(f"🌊 Streaming pipeline for task {task_id}: {len(pages)} pages, "
+                    f"{len(paragraphs)} paragraphs, {len(risks)} risks")
+        return {
+            "ocr_text": '\n\n'.join(pages),
+            "paragraphs": paragraphs,
+            "risks": risks,
+            "extracted": not ocr_text,
+        }
@@ -3,6 +3,8 @@ from fastapi import WebSocket
 import json
 import logging
 
+from .metrics import WEBSOCKET_CONNECTIONS
+
 logger = logging.getLogger(__name__)
 
 class ConnectionManager:
@@ -17,6 +19,7 @@ class ConnectionManager:
         if task_id not in self.active_connections:
             self.active_connections[task_id] = []
         self.active_connections[task_id].append(websocket)
+        WEBSOCKET_CONNECTIONS.inc()
         logger.info(f"WebSocket connected for task {task_id}")
     
     def disconnect(self, task_id: int, websocket: WebSocket):
@@ -24,6 +27,7 @@ class ConnectionManager:
         if task_id in self.active_connections:
             if websocket in self.active_connections[task_id]:
                 self.active_connections[task_id].remove(websocket)
+                WEBSOCKET_CONNECTIONS.dec()
             if not self.active_connections[task_id]:
                 del self.active_connections[task_id]
         logger.info(f"WebSocket disconnected for task {task_id}")
@@ -52,6 +56,15 @@ class ConnectionManager:
         }
         await self.send_progress(task_id, message)
     
+    async def send_cancelled(self, task_id: int, result: dict):
+        """发送取消消息"""
+        message = {
+            "stage": "cancelled",
+            "progress": 100,
+            "result": result
+        }
+        await self.send_progress(task_id, message)
+    
     async def send_error(self, task_id: int, error: str):
         """发送错误消息"""
         message = {
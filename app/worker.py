@@ -0,0 +1,80 @@
+"""
+审查作业worker
+
+独立运行（Web进程设置REVIEW_EXECUTOR_MODE=external，只负责入队）：
+    python -m app.worker
+
+默认REVIEW_EXECUTOR_MODE=embedded，Web进程启动时在自身事件循环内运行一个worker。
+独立worker进程中的WebSocket进度推送只送达连接到该进程的客户端，
+前端可通过WebSocket的get_status消息或 GET /api/v1/review/{task_id} 获取状态。
+与Web进程设置相同的PROMETHEUS_MULTIPROC_DIR时，worker的阶段耗时等指标由Web进程的/metrics汇总。
+"""
+
+import asyncio
+import logging
+import signal
+from typing import Optional
+
+from dotenv import load_dotenv
+
+from .services.review_queue import ReviewWorker
+
+logger = logging.getLogger(__name__)
+
+_embedded_worker: Optional[ReviewWorker] = None
+_embedded_stop: Optional[asyncio.Event] = None
+_embedded_task: Optional[asyncio.Task] = None
+
+
+def _create_worker() -> ReviewWorker:
+    from .services.review_service import review_service
+    return ReviewWorker(review_service.start_review, on_cancelled=review_service.notify_cancelled)
+
+
+def start_embedded_worker():
+    """在当前事件循环中启动嵌入式worker（Web进程启动时调用）"""
+    global _embedded_worker, _embedded_stop, _embedded_task
+    if _embedded_task is not None:
+        return
+    _embedded_worker = _create_worker()
+    _embedded_stop = asyncio.Event()
+    _embedded_task = asyncio.ensure_future(_embedded_worker.run(_embedded_stop))
+
+
+async def stop_embedded_worker():
+    """停止嵌入式worker"""
+    global _embedded_worker, _embedded_stop, _embedded_task
+    if _embedded_task is None:
+        return
+    _embedded_stop.set()
+    await asyncio.gather(_embedded_task, return_exceptions=True)
+    _embedded_worker = _embedded_stop = _embedded_task = None
+
+
+async def main():
+    from .database import init_db
+    from .services.llm_client import close_llm_client
+    from .services.executors import shutdown_executors
+    from .metrics import mark_process_dead
+
+    init_db()
+    worker = _create_worker()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await worker.run(stop)
+    finally:
+        await close_llm_client()
+        shutdown_executors()
+        mark_process_dead()
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    asyncio.run(main())
@@ -0,0 +1,15 @@
+-- 为review_jobs表添加取消请求字段（审查取消）
+-- 执行时间：需要在线上数据库执行
+
+-- 1. 添加cancel_requested_at字段，运行中作业收到取消请求时写入，执行它的worker轮询到后中止
+ALTER TABLE review_jobs ADD COLUMN IF NOT EXISTS cancel_requested_at TIMESTAMP;
+
+-- 添加注释说明
+COMMENT ON COLUMN review_jobs.cancel_requested_at IS '运行中作业的取消请求时间，worker中止后作业和任务标记为CANCELLED';
+COMMENT ON COLUMN review_jobs.status IS '作业状态：QUEUED, RUNNING, DONE, FAILED, CANCELLED';
+
+-- 验证字段是否添加成功
+SELECT column_name, data_type, is_nullable
+FROM information_schema.columns
+WHERE table_name = 'review_jobs'
+AND column_name = 'cancel_requested_at';
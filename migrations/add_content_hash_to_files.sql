@@ -0,0 +1,17 @@
+-- 为files表添加内容哈希字段
+-- 执行时间：需要在线上数据库执行
+
+-- 1. 添加content_hash字段，允许为NULL（历史文件没有哈希）
+ALTER TABLE files ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64);
+
+-- 2. 创建索引，用于按内容查找已处理过的相同文件
+CREATE INDEX IF NOT EXISTS ix_files_content_hash ON files(content_hash);
+
+-- 添加注释说明
+COMMENT ON COLUMN files.content_hash IS '文件内容sha256，相同内容的重复上传复用OCR和实体提取结果';
+
+-- 验证字段是否添加成功
+SELECT column_name, data_type, is_nullable
+FROM information_schema.columns
+WHERE table_name = 'files'
+AND column_name = 'content_hash';
@@ -0,0 +1,17 @@
+-- 为tasks表添加上一版任务字段（修订稿增量复审）
+-- 执行时间：需要在线上数据库执行
+
+-- 1. 添加parent_task_id字段，允许为NULL（首版合同）
+ALTER TABLE tasks ADD COLUMN IF NOT EXISTS parent_task_id INTEGER REFERENCES tasks(id) ON DELETE SET NULL;
+
+-- 2. 创建索引，用于查找某一版合同的后续修订
+CREATE INDEX IF NOT EXISTS ix_tasks_parent_task_id ON tasks(parent_task_id);
+
+-- 添加注释说明
+COMMENT ON COLUMN tasks.parent_task_id IS '上一版合同的任务ID，复审时只分析相对上一版修改和新增的条款';
+
+-- 验证字段是否添加成功
+SELECT column_name, data_type, is_nullable
+FROM information_schema.columns
+WHERE table_name = 'tasks'
+AND column_name = 'parent_task_id';
@@ -0,0 +1,23 @@
+-- 为review_jobs表添加用户和优先级字段（公平调度）
+-- 执行时间：需要在线上数据库执行
+
+-- 1. 添加user_id字段，入队时从tasks.user_id复制，允许为NULL（匿名任务）
+ALTER TABLE review_jobs ADD COLUMN IF NOT EXISTS user_id INTEGER;
+
+-- 2. 添加priority字段，历史作业视为interactive
+ALTER TABLE review_jobs ADD COLUMN IF NOT EXISTS priority VARCHAR(20) DEFAULT 'interactive';
+UPDATE review_jobs SET priority = 'interactive' WHERE priority IS NULL;
+
+-- 3. 创建索引，用于按用户统计排队数和运行数
+CREATE INDEX IF NOT EXISTS ix_review_jobs_user_id ON review_jobs(user_id);
+CREATE INDEX IF NOT EXISTS ix_review_jobs_status_priority ON review_jobs(status, priority, user_id, id);
+
+-- 添加注释说明
+COMMENT ON COLUMN review_jobs.user_id IS '提交用户，按用户公平分配并发并限制单用户排队数';
+COMMENT ON COLUMN review_jobs.priority IS '优先级类别：interactive（在线等待）、bulk（批量提交）';
+
+-- 验证字段是否添加成功
+SELECT column_name, data_type, is_nullable
+FROM information_schema.columns
+WHERE table_name = 'review_jobs'
+AND column_name IN ('user_id', 'priority');
@@ -0,0 +1,15 @@
+-- 为review_jobs表添加缓存开关字段（按请求跳过LLM响应缓存和审查结果缓存）
+-- 执行时间：需要在线上数据库执行
+
+-- 1. 添加use_cache字段，历史作业视为使用缓存
+ALTER TABLE review_jobs ADD COLUMN IF NOT EXISTS use_cache BOOLEAN DEFAULT TRUE;
+UPDATE review_jobs SET use_cache = TRUE WHERE use_cache IS NULL;
+
+-- 添加注释说明
+COMMENT ON COLUMN review_jobs.use_cache IS '为FALSE时审查不读取LLM响应缓存和文档级审查结果缓存，重新调用模型';
+
+-- 验证字段是否添加成功
+SELECT column_name, data_type, is_nullable
+FROM information_schema.columns
+WHERE table_name = 'review_jobs'
+AND column_name = 'use_cache';
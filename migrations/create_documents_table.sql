@@ -0,0 +1,53 @@
+-- 创建文档表和审查结果缓存表，任务关联所属文档
+-- 执行时间：需要在线上数据库执行
+
+CREATE TABLE IF NOT EXISTS documents (
+    id SERIAL PRIMARY KEY,
+    content_hash VARCHAR(64) NOT NULL UNIQUE,
+    ocr_text TEXT,
+    paragraphs_hash VARCHAR(64),
+    paragraphs_task_id INTEGER REFERENCES tasks(id) ON DELETE SET NULL,
+    paragraph_count INTEGER,
+    created_at TIMESTAMP DEFAULT NOW(),
+    vectorized_at TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS review_result_cache (
+    cache_key VARCHAR(64) PRIMARY KEY,
+    content_hash VARCHAR(64),
+    role VARCHAR(50),
+    contract_type VARCHAR(100),
+    prompt_version VARCHAR(50),
+    analysis_mode VARCHAR(20),
+    risks JSONB,
+    source_task_id INTEGER,
+    created_at TIMESTAMP DEFAULT NOW()
+);
+
+ALTER TABLE tasks ADD COLUMN IF NOT EXISTS document_id INTEGER REFERENCES documents(id);
+
+-- 创建索引
+CREATE INDEX IF NOT EXISTS ix_documents_id ON documents(id);
+CREATE INDEX IF NOT EXISTS ix_documents_content_hash ON documents(content_hash);
+CREATE INDEX IF NOT EXISTS ix_review_result_cache_content_hash ON review_result_cache(content_hash);
+CREATE INDEX IF NOT EXISTS ix_tasks_document_id ON tasks(document_id);
+
+-- 添加注释说明
+COMMENT ON TABLE documents IS '按文件内容去重的文档，同一文档的多次审查共享提取文本、段落和向量';
+COMMENT ON COLUMN documents.paragraphs_task_id IS '持有共享段落和向量的任务';
+COMMENT ON COLUMN documents.paragraphs_hash IS '段落切分结果的sha256，切分规则变化时不再共享';
+COMMENT ON TABLE review_result_cache IS '按文档哈希、角色、合同类型、提示词版本和分析模式缓存的风险结果';
+COMMENT ON COLUMN review_result_cache.risks IS '风险列表，段落引用存为段落序号';
+COMMENT ON COLUMN tasks.document_id IS '任务所属文档';
+
+-- 授予contractshield用户权限
+DO $$
+BEGIN
+    GRANT ALL ON documents TO contractshield;
+    GRANT ALL ON documents_id_seq TO contractshield;
+    GRANT ALL ON review_result_cache TO contractshield;
+EXCEPTION
+    WHEN OTHERS THEN
+        RAISE WARNING 'Could not grant table permissions: %', SQLERRM;
+END
+$$;
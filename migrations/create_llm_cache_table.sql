@@ -0,0 +1,28 @@
+-- 创建LLM响应缓存表
+-- 执行时间：需要在线上数据库执行
+
+CREATE TABLE IF NOT EXISTS llm_cache (
+    cache_key VARCHAR(64) PRIMARY KEY,
+    model VARCHAR(100),
+    response TEXT,
+    latency_ms DOUBLE PRECISION,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP
+);
+
+-- 创建索引（用于清理过期缓存）
+CREATE INDEX IF NOT EXISTS ix_llm_cache_expires_at ON llm_cache(expires_at);
+
+-- 添加注释说明
+COMMENT ON TABLE llm_cache IS 'LLM响应缓存，键为(model, messages, temperature)的sha256';
+COMMENT ON COLUMN llm_cache.latency_ms IS '原始调用耗时（毫秒），用于统计缓存节省的延迟';
+
+-- 授予contractshield用户权限
+DO $$
+BEGIN
+    GRANT ALL ON llm_cache TO contractshield;
+EXCEPTION
+    WHEN OTHERS THEN
+        RAISE WARNING 'Could not grant table permissions: %', SQLERRM;
+END
+$$;
@@ -0,0 +1,39 @@
+-- 创建LLM调用记录表
+-- 执行时间：需要在线上数据库执行
+
+CREATE TABLE IF NOT EXISTS llm_calls (
+    id SERIAL PRIMARY KEY,
+    task_id INTEGER REFERENCES tasks(id) ON DELETE SET NULL,
+    stage VARCHAR(50),
+    model VARCHAR(100),
+    prompt_tokens INTEGER DEFAULT 0,
+    completion_tokens INTEGER DEFAULT 0,
+    cost DOUBLE PRECISION,
+    latency_ms DOUBLE PRECISION,
+    retries INTEGER DEFAULT 0,
+    cache_hit BOOLEAN DEFAULT FALSE,
+    success BOOLEAN DEFAULT TRUE,
+    error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- 创建索引
+CREATE INDEX IF NOT EXISTS ix_llm_calls_id ON llm_calls(id);
+CREATE INDEX IF NOT EXISTS ix_llm_calls_task_id ON llm_calls(task_id);
+CREATE INDEX IF NOT EXISTS ix_llm_calls_created_at ON llm_calls(created_at);
+
+-- 添加注释说明
+COMMENT ON TABLE llm_calls IS '每次LLM调用的token、耗时、重试和缓存命中记录';
+COMMENT ON COLUMN llm_calls.stage IS '调用所属的审查阶段，如ner、risk_analysis';
+COMMENT ON COLUMN llm_calls.cost IS '上游返回的调用费用（美元）';
+
+-- 授予contractshield用户权限
+DO $$
+BEGIN
+    GRANT ALL ON llm_calls TO contractshield;
+    GRANT ALL ON llm_calls_id_seq TO contractshield;
+EXCEPTION
+    WHEN OTHERS THEN
+        RAISE WARNING 'Could not grant table permissions: %', SQLERRM;
+END
+$$;
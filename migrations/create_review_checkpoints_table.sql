@@ -0,0 +1,31 @@
+-- 创建审查流水线检查点表
+-- 执行时间：需要在线上数据库执行
+
+CREATE TABLE IF NOT EXISTS review_checkpoints (
+    id SERIAL PRIMARY KEY,
+    task_id INTEGER NOT NULL REFERENCES tasks(id) ON DELETE CASCADE,
+    stage VARCHAR(50) NOT NULL,
+    input_hash VARCHAR(64),
+    output JSONB,
+    completed_at TIMESTAMP,
+    CONSTRAINT uq_review_checkpoints_task_stage UNIQUE (task_id, stage)
+);
+
+-- 创建索引
+CREATE INDEX IF NOT EXISTS ix_review_checkpoints_id ON review_checkpoints(id);
+CREATE INDEX IF NOT EXISTS ix_review_checkpoints_task_id ON review_checkpoints(task_id);
+
+-- 添加注释说明
+COMMENT ON TABLE review_checkpoints IS '审查流水线各阶段的完成记录，重试或恢复时跳过输入未变的已完成阶段';
+COMMENT ON COLUMN review_checkpoints.input_hash IS '阶段输入的sha256，输入变化时检查点失效';
+
+-- 授予contractshield用户权限
+DO $$
+BEGIN
+    GRANT ALL ON review_checkpoints TO contractshield;
+    GRANT ALL ON review_checkpoints_id_seq TO contractshield;
+EXCEPTION
+    WHEN OTHERS THEN
+        RAISE WARNING 'Could not grant table permissions: %', SQLERRM;
+END
+$$;
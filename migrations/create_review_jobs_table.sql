@@ -0,0 +1,37 @@
+-- 创建审查作业队列表
+-- 执行时间：需要在线上数据库执行
+
+CREATE TABLE IF NOT EXISTS review_jobs (
+    id SERIAL PRIMARY KEY,
+    task_id INTEGER NOT NULL REFERENCES tasks(id) ON DELETE CASCADE,
+    status VARCHAR(20) DEFAULT 'QUEUED',
+    attempts INTEGER DEFAULT 0,
+    worker_id VARCHAR(100),
+    error TEXT,
+    enqueued_at TIMESTAMP DEFAULT (NOW() AT TIME ZONE 'utc'),
+    started_at TIMESTAMP,
+    heartbeat_at TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
+-- 创建索引
+CREATE INDEX IF NOT EXISTS ix_review_jobs_id ON review_jobs(id);
+CREATE INDEX IF NOT EXISTS ix_review_jobs_task_id ON review_jobs(task_id);
+CREATE INDEX IF NOT EXISTS ix_review_jobs_status ON review_jobs(status);
+CREATE INDEX IF NOT EXISTS ix_review_jobs_enqueued_at ON review_jobs(enqueued_at);
+
+-- 添加注释说明
+COMMENT ON TABLE review_jobs IS '持久化审查作业队列，worker按全局并发上限领取执行';
+COMMENT ON COLUMN review_jobs.status IS '作业状态：QUEUED、RUNNING、DONE、FAILED';
+COMMENT ON COLUMN review_jobs.heartbeat_at IS '运行中作业的心跳时间（UTC），超时后重新入队';
+
+-- 授予contractshield用户权限
+DO $$
+BEGIN
+    GRANT ALL ON review_jobs TO contractshield;
+    GRANT ALL ON review_jobs_id_seq TO contractshield;
+EXCEPTION
+    WHEN OTHERS THEN
+        RAISE WARNING 'Could not grant table permissions: %', SQLERRM;
+END
+$$;
@@ -9,6 +9,7 @@ ContractShield AI Backend 启动脚本
     uvicorn run:app --host 0.0.0.0 --port 8000 --reload
 """
 
+import glob
 import os
 import sys
 from dotenv import load_dotenv
@@ -19,6 +20,13 @@ load_dotenv()
 # 添加项目根目录到Python路径
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
+# 多进程指标目录：主进程导入应用前清空上次运行残留的指标文件（各worker进程以模块方式导入本文件，不会执行）
+if __name__ == "__main__" and os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+    multiproc_dir = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    os.makedirs(multiproc_dir, exist_ok=True)
+    for path in glob.glob(os.path.join(multiproc_dir, "*.db")):
+        os.remove(path)
+
 from app.main import app
 
 if __name__ == "__main__":
@@ -28,11 +36,14 @@ if __name__ == "__main__":
     host = os.getenv("APP_HOST", "0.0.0.0")
     port = int(os.getenv("APP_PORT", 8000))
     debug = os.getenv("DEBUG", "True").lower() == "true"
+    # 多worker部署需设置PROMETHEUS_MULTIPROC_DIR，否则/metrics只反映处理该次请求的worker
+    workers = 1 if debug else int(os.getenv("APP_WORKERS", 1))
     
     print(f"Starting ContractShield AI Backend...")
     print(f"Host: {host}")
     print(f"Port: {port}")
     print(f"Debug: {debug}")
+    print(f"Workers: {workers}")
     print(f"Docs: http://{host}:{port}/docs")
     print(f"Health: http://{host}:{port}/health")
     
@@ -41,6 +52,7 @@ if __name__ == "__main__":
         host=host,
         port=port,
         reload=debug,
+        workers=workers,
         log_level="info",
         access_log=True
     )
\ No newline at end of file
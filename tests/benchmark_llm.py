@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+LLM调用链路压测：在本地模拟服务上端到端测量吞吐、延迟分位数和弹性层行为
+
+使用方法：
+    # 自动在后台启动模拟服务（注入5%限流和2%错误）
+    python tests/benchmark_llm.py --start-mock --requests 200 --concurrency 16 --rate-limit-rate 0.05 --error-rate 0.02
+
+    # 指向已运行的模拟服务（或任意OpenRouter兼容服务）
+    OPENROUTER_BASE_URL=http://localhost:8900/api/v1 python tests/benchmark_llm.py --requests 100 --stream
+
+说明：
+    调用经过AIService完整链路（模型路由、重试、限流、熔断），响应缓存关闭；
+    用量记录写入临时SQLite库，避免依赖Postgres。
+    吞吐受客户端限流LLM_RATE_LIMIT_PER_SEC约束，测量链路本身开销时用--client-rate调大。
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.environ.setdefault("OPENROUTER_API_KEY", "benchmark")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.gettempdir(), 'benchmark_llm.db')}")
+os.environ["LLM_CACHE_ENABLED"] = "false"
+
+
+def start_mock_server(port: int, args) -> None:
+    """在后台线程启动模拟服务"""
+    import uvicorn
+    from tests.mock_openrouter_server import MockLLMConfig, create_app
+
+    config = MockLLMConfig(
+        latency_ms=args.latency_ms,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        seed=42,
+    )
+    server = uvicorn.Server(uvicorn.Config(create_app(config), host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+
+
+def build_messages(ai_service, index: int):
+    """构造一个合成合同片段的风险分析提示"""
+    clauses = [
+        "第一条 甲方应在验收合格后30日内付款，逾期按日万分之五支付违约金。",
+        "第二条 乙方交付成果的知识产权归甲方所有。",
+        "第三条 因本合同发生的争议提交甲方所在地仲裁委员会仲裁。",
+    ]
+    chunk = [SimpleNamespace(id=index * 10 + i, text=text) for i, text in enumerate(clauses)]
+    return ai_service._build_chunk_risk_messages(chunk, "采购合同", "buyer")
+
+
+async def run_benchmark(args):
+    from app.database import Base, engine
+    from app.services.ai_service import AIService
+
+    Base.metadata.create_all(bind=engine)
+    ai_service = AIService()
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies, failures = [], 0
+
+    async def one(index: int):
+        nonlocal failures
+        messages = build_messages(ai_service, index)
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                if args.stream:
+                    await ai_service._astream_openrouter_api(messages, use_cache=False, stage="risk_analysis")
+                else:
+                    await ai_service._acall_openrouter_api(messages, use_cache=False, stage="risk_analysis")
+                latencies.append(time.perf_counter() - start)
+            except Exception:
+                failures += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(args.requests)))
+    elapsed = time.perf_counter() - start
+
+    await ai_service.llm_client.aclose()
+    return latencies, failures, elapsed
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))] if ordered else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM调用链路压测")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--stream", action="store_true", help="使用流式调用")
+    parser.add_argument("--start-mock", action="store_true", help="在后台启动本地模拟服务")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, default=300)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--client-rate", type=float, help="覆盖客户端限流速率（req/s）")
+    args = parser.parse_args()
+
+    if args.client_rate:
+        os.environ["LLM_RATE_LIMIT_PER_SEC"] = str(args.client_rate)
+        os.environ["LLM_RATE_LIMIT_BURST"] = str(args.client_rate)
+
+    if args.start_mock:
+        start_mock_server(args.port, args)
+        os.environ["OPENROUTER_BASE_URL"] = f"http://127.0.0.1:{args.port}/api/v1"
+
+    from app.metrics import LLM_RETRIES
+
+    latencies, failures, elapsed = asyncio.run(run_benchmark(args))
+    retries = sum(sample.value for metric in LLM_RETRIES.collect() for sample in metric.samples
+                  if sample.name.endswith("_total"))
+
+    print(f"\n{'=' * 60}")
+    print(f"目标: {os.getenv('OPENROUTER_BASE_URL')}  并发: {args.concurrency}  流式: {args.stream}")
+    print(f"{'=' * 60}")
+    print(f"请求数:   {args.requests}（成功 {len(latencies)}，失败 {failures}）")
+    print(f"总耗时:   {elapsed:.2f}s，吞吐 {len(latencies) / elapsed:.1f} req/s")
+    if latencies:
+        print(f"延迟:     mean {statistics.mean(latencies) * 1000:.0f}ms  "
+              f"p50 {percentile(latencies, 0.5) * 1000:.0f}ms  "
+              f"p95 {percentile(latencies, 0.95) * 1000:.0f}ms  "
+              f"p99 {percentile(latencies, 0.99) * 1000:.0f}ms")
+    print(f"重试次数: {int(retries)}")
+
+
+if __name__ == "__main__":
+    main()
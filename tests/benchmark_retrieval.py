@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+混合检索基准测试：对比纯向量检索与 二元组+向量(RRF) 混合检索的延迟和召回率
+
+使用方法：
+    python tests/benchmark_retrieval.py [--paragraphs 400] [--limit 5]
+
+说明：
+    为了不依赖数据库，向量检索在内存中以L2距离暴力计算（与PGVector的 <-> 算子一致），
+    词法检索与融合逻辑直接复用 app.services.retrieval_service。
+"""
+
+import argparse
+import math
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.environ.setdefault("OPENROUTER_API_KEY", "benchmark")
+
+from app.services.ai_service import AIService
+from app.services.retrieval_service import BigramIndex, reciprocal_rank_fusion
+
+# 查询术语 -> 含该术语的段落模板
+TERMS = {
+    "违约金": "如任何一方逾期履行，应按合同总价的{n}%向守约方支付违约金。",
+    "不可抗力": "因地震、战争等不可抗力导致合同无法履行的，受影响方应在{n}日内书面通知对方。",
+    "知识产权": "本项目产生的全部知识产权归甲方所有，乙方保证第{n}项交付物不侵犯第三方权利。",
+    "争议解决": "双方因本合同发生的争议解决方式为提交{n}号仲裁委员会仲裁。",
+    "保密义务": "乙方应履行保密义务，保密期限为合同终止后{n}年。",
+    "验收标准": "货物到达后{n}个工作日内，甲方按附件约定的验收标准进行验收。",
+}
+
+FILLER = [
+    "本合同一式{n}份，双方各执两份，具有同等法律效力。",
+    "合同附件为本合同不可分割的组成部分，与本合同具有同等效力。",
+    "乙方应按照甲方的要求在第{n}周提供阶段性工作报告。",
+    "本合同自双方签字盖章之日起生效，有效期{n}个月。",
+    "双方联系人如有变更，应提前{n}日书面通知对方。",
+]
+
+
+def build_corpus(size: int, seed: int = 42):
+    """构造合成合同段落语料和标注"""
+    rng = random.Random(seed)
+    paragraphs = []
+    relevant = {term: set() for term in TERMS}
+    for doc_id in range(size):
+        if rng.random() < 0.3:
+            term = rng.choice(list(TERMS))
+            text = TERMS[term].format(n=rng.randint(1, 99))
+            relevant[term].add(doc_id)
+        else:
+            text = rng.choice(FILLER).format(n=rng.randint(1, 99))
+        paragraphs.append(text)
+    return paragraphs, relevant
+
+
+def l2(a, b):
+    return math.sqrt(sum((x - y) ** 2 for x, y in zip(a, b)))
+
+
+def vector_search(ai, embeddings, query, limit):
+    query_embedding = ai.get_embedding_sync(query)
+    ranked = sorted(range(len(embeddings)), key=lambda i: l2(embeddings[i], query_embedding))
+    return ranked[:limit]
+
+
+def hybrid_search(ai, index, embeddings, query, limit, multiplier=4):
+    candidates = limit * multiplier
+    vector_ranking = vector_search(ai, embeddings, query, candidates)
+    lexical_ranking = [doc_id for doc_id, _ in index.search(query, candidates)]
+    fused = reciprocal_rank_fusion([lexical_ranking, vector_ranking])
+    return [doc_id for doc_id, _ in fused[:limit]]
+
+
+def recall_at_k(results, relevant, limit):
+    if not relevant:
+        return 1.0
+    hits = len(set(results) & relevant)
+    return hits / min(len(relevant), limit)
+
+
+def run(name, search_fn, relevant, limit):
+    latencies = []
+    recalls = []
+    for term, relevant_ids in relevant.items():
+        start = time.perf_counter()
+        results = search_fn(term)
+        latencies.append((time.perf_counter() - start) * 1000)
+        recalls.append(recall_at_k(results, relevant_ids, limit))
+    latencies.sort()
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    print(f"{name:<10} recall@{limit}={statistics.mean(recalls):.3f}  "
+          f"p50={statistics.median(latencies):.2f}ms  p95={p95:.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="混合检索基准测试")
+    parser.add_argument("--paragraphs", type=int, default=400)
+    parser.add_argument("--limit", type=int, default=5)
+    args = parser.parse_args()
+
+    ai = AIService()
+    paragraphs, relevant = build_corpus(args.paragraphs)
+    embeddings = [ai.get_embedding_sync(p) for p in paragraphs]
+
+    start = time.perf_counter()
+    index = BigramIndex()
+    for doc_id, text in enumerate(paragraphs):
+        index.add(doc_id, text)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    print(f"语料: {len(paragraphs)} 段, 查询: {len(relevant)} 条, 索引构建: {build_ms:.2f}ms")
+    run("vector", lambda q: vector_search(ai, embeddings, q, args.limit), relevant, args.limit)
+    run("hybrid", lambda q: hybrid_search(ai, index, embeddings, q, args.limit), relevant, args.limit)
+
+
+if __name__ == "__main__":
+    main()
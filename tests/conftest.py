@@ -48,6 +48,41 @@ def db_session():
         Base.metadata.drop_all(bind=engine)
 
 
+# 直接打开SessionLocal的服务模块
+SESSION_LOCAL_MODULES = (
+    "app.services.ai_service",
+    "app.services.document_service",
+    "app.services.file_service",
+    "app.services.review_checkpoints",
+    "app.services.review_service",
+)
+
+
+@pytest.fixture
+def patched_session_local(db_session, monkeypatch):
+    """服务模块中的SessionLocal指向测试数据库，返回测试数据库会话"""
+    for module in SESSION_LOCAL_MODULES:
+        monkeypatch.setattr(f"{module}.SessionLocal", TestingSessionLocal)
+    return db_session
+
+
+@pytest.fixture
+def make_task(db_session):
+    """创建审查任务的工厂（默认附带文件记录），返回任务ID"""
+    def _make_task(status="QUEUED", with_file=True, ocr_text=None, content_hash=None, **fields):
+        fields.setdefault("role", "buyer")
+        fields.setdefault("contract_type", "采购合同")
+        task = Task(file_name="contract.pdf", file_path="/tmp/contract.pdf", status=status, **fields)
+        db_session.add(task)
+        db_session.commit()
+        if with_file:
+            db_session.add(File(task_id=task.id, filename="contract.pdf", path="/tmp/contract.pdf",
+                                ocr_text=ocr_text, content_hash=content_hash))
+            db_session.commit()
+        return task.id
+    return _make_task
+
+
 @pytest.fixture(scope="function")
 def client(db_session):
     """创建测试客户端"""
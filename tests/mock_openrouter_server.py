@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+本地OpenRouter兼容模拟服务：离线压测和弹性测试用，不消耗API额度
+
+实现 POST {prefix}/chat/completions（含stream=true的SSE流式输出），支持：
+    - 可配置的延迟分布（fixed / uniform / lognormal）
+    - 按比例注入500错误和带Retry-After的429限流
+    - 根据提示内容生成模板化的实体JSON和风险JSON，或从文件读取固定响应
+    - 响应中返回usage（按字符数估算token）
+
+使用方法：
+    python tests/mock_openrouter_server.py --port 8900 --latency-ms 800 --error-rate 0.05 --rate-limit-rate 0.05
+
+    # 另开终端，将后端指向模拟服务
+    OPENROUTER_BASE_URL=http://localhost:8900/api/v1 python run.py
+
+    # 查看模拟服务收到的请求统计
+    curl http://localhost:8900/stats
+
+所有参数也可用环境变量配置（MOCK_LLM_LATENCY_MS等），命令行参数优先。
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import re
+import time
+import uuid
+from collections import Counter
+from typing import Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+PARAGRAPH_REF_PATTERN = re.compile(r"\[P(\d+)\]\s*([^\n]*)")
+COMPANY_PATTERN = re.compile(r"([\u4e00-\u9fa5]{2,30}(?:股份有限公司|有限责任公司|有限公司|集团|公司))")
+PERSON_PATTERN = re.compile(r"(?:法定代表人|联系人|负责人|代表)[：:]\s*([\u4e00-\u9fa5]{2,4})")
+
+RISK_TEMPLATES = [
+    ("违约金", "违约金约定过高", "HIGH", "违约金比例明显高于实际损失，可能被请求调整。", "建议将违约金上限约定为合同总价的20%。", ["《民法典》第585条"]),
+    ("付款", "付款期限不明确", "MEDIUM", "付款节点缺少明确日期，容易引发拖欠争议。", "建议明确付款时间和逾期付款责任。", ["《民法典》第510条"]),
+    ("验收", "验收标准缺失", "MEDIUM", "未约定具体验收标准和异议期。", "建议补充验收标准、期限和视为验收条款。", ["《民法典》第620条"]),
+    ("知识产权", "知识产权归属不清", "HIGH", "交付成果的知识产权归属约定不明。", "建议明确约定知识产权归属和许可范围。", ["《著作权法》第19条"]),
+    ("免责", "免责范围过宽", "HIGH", "对方免责条款覆盖过广，可能排除其主要义务。", "建议限定免责情形并排除故意或重大过失。", ["《民法典》第506条"]),
+    ("争议", "争议解决方式不利", "LOW", "约定的管辖地对我方不便。", "建议约定我方所在地法院或仲裁机构。", ["《民事诉讼法》第35条"]),
+    ("解除", "单方解除权不对等", "MEDIUM", "仅对方享有单方解除权。", "建议约定对等的解除条件。", ["《民法典》第562条"]),
+]
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.getenv(name, str(default)))
+
+
+class MockLLMConfig:
+    """模拟服务配置"""
+
+    def __init__(self, **overrides):
+        self.prefix = os.getenv("MOCK_LLM_PREFIX", "/api/v1")
+        # 延迟分布：fixed（固定）、uniform（均值±抖动）、lognormal（长尾，均值为latency_ms）
+        self.latency_distribution = os.getenv("MOCK_LLM_LATENCY_DISTRIBUTION", "lognormal")
+        self.latency_ms = _env_float("MOCK_LLM_LATENCY_MS", 500)
+        self.latency_jitter_ms = _env_float("MOCK_LLM_LATENCY_JITTER_MS", 200)
+        self.latency_sigma = _env_float("MOCK_LLM_LATENCY_SIGMA", 0.5)
+        self.error_rate = _env_float("MOCK_LLM_ERROR_RATE", 0.0)
+        self.rate_limit_rate = _env_float("MOCK_LLM_RATE_LIMIT_RATE", 0.0)
+        self.retry_after = _env_float("MOCK_LLM_RETRY_AFTER", 1)
+        # 流式输出：每段字符数和段间隔
+        self.stream_chunk_chars = int(os.getenv("MOCK_LLM_STREAM_CHUNK_CHARS", "16"))
+        self.stream_interval_ms = _env_float("MOCK_LLM_STREAM_INTERVAL_MS", 20)
+        # 固定响应文件：{"entities": {...}, "risks": {...}, "default": "..."}
+        self.responses_file = os.getenv("MOCK_LLM_RESPONSES_FILE")
+        self.seed: Optional[int] = None
+        for key, value in overrides.items():
+            if value is not None:
+                setattr(self, key, value)
+
+
+class MockLLM:
+    """根据配置生成模拟响应"""
+
+    def __init__(self, config: MockLLMConfig):
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self.stats = Counter()
+        self.canned: Dict = {}
+        if config.responses_file:
+            with open(config.responses_file, encoding="utf-8") as f:
+                self.canned = json.load(f)
+
+    def sample_latency(self) -> float:
+        """按配置的分布采样一次延迟（秒）"""
+        config = self.config
+        if config.latency_distribution == "fixed":
+            latency_ms = config.latency_ms
+        elif config.latency_distribution == "uniform":
+            latency_ms = self.rng.uniform(config.latency_ms - config.latency_jitter_ms,
+                                          config.latency_ms + config.latency_jitter_ms)
+        else:
+            # 使对数正态分布的均值等于latency_ms
+            mu = max(config.latency_ms, 1e-3)
+            latency_ms = self.rng.lognormvariate(0, config.latency_sigma) * mu / math.exp(config.latency_sigma ** 2 / 2)
+        return max(0.0, latency_ms) / 1000
+
+    def injected_error(self) -> Optional[JSONResponse]:
+        """按比例注入429或500"""
+        roll = self.rng.random()
+        if roll < self.config.rate_limit_rate:
+            self.stats["429"] += 1
+            return JSONResponse(
+                status_code=429,
+                content={"error": {"code": 429, "message": "Rate limit exceeded (mock)"}},
+                headers={"Retry-After": str(self.config.retry_after)},
+            )
+        if roll < self.config.rate_limit_rate + self.config.error_rate:
+            self.stats["500"] += 1
+            return JSONResponse(
+                status_code=500,
+                content={"error": {"code": 500, "message": "Internal error (mock)"}},
+            )
+        return None
+
+    def generate(self, messages: List[Dict]) -> str:
+        """根据提示类型生成响应文本"""
+        prompt = "\n".join(str(m.get("content", "")) for m in messages)
+        if '"companies"' in prompt:
+            return self._entities(prompt)
+        if '"risks"' in prompt:
+            return self._risks(prompt)
+        if "default" in self.canned:
+            return self.canned["default"]
+        return "这是模拟服务的响应。"
+
+    def _entities(self, prompt: str) -> str:
+        if "entities" in self.canned:
+            return json.dumps(self.canned["entities"], ensure_ascii=False)
+        text = prompt.split("合同文本：", 1)[-1]
+        return json.dumps({
+            "companies": list(dict.fromkeys(COMPANY_PATTERN.findall(text)))[:5],
+            "persons": list(dict.fromkeys(PERSON_PATTERN.findall(text)))[:5],
+            "organizations": [],
+        }, ensure_ascii=False)
+
+    def _risks(self, prompt: str) -> str:
+        if "risks" in self.canned:
+            return json.dumps(self.canned["risks"], ensure_ascii=False)
+        risks = []
+        paragraphs = PARAGRAPH_REF_PATTERN.findall(prompt)
+        for keyword, title, level, summary, suggestion, laws in RISK_TEMPLATES:
+            refs = [int(pid) for pid, text in paragraphs if keyword in text]
+            if paragraphs and not refs:
+                continue
+            risks.append({
+                "clause_id": f"P{refs[0]}" if refs else "",
+                "title": title,
+                "risk_level": level,
+                "summary": summary,
+                "suggestion": suggestion,
+                "related_laws": laws,
+                "paragraph_ids": refs,
+            })
+        return json.dumps({"risks": risks}, ensure_ascii=False, indent=2)
+
+    @staticmethod
+    def usage(messages: List[Dict], content: str) -> Dict:
+        """按字符数粗略估算token（中文约1.5字符/token）"""
+        prompt_chars = sum(len(str(m.get("content", ""))) for m in messages)
+        return {
+            "prompt_tokens": int(prompt_chars / 1.5),
+            "completion_tokens": int(len(content) / 1.5),
+            "total_tokens": int((prompt_chars + len(content)) / 1.5),
+            "cost": 0,
+        }
+
+
+def create_app(config: Optional[MockLLMConfig] = None) -> FastAPI:
+    """创建模拟服务应用"""
+    config = config or MockLLMConfig()
+    mock = MockLLM(config)
+    app = FastAPI(title="Mock OpenRouter")
+    app.state.mock = mock
+
+    @app.post(f"{config.prefix}/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        mock.stats["requests"] += 1
+        model = body.get("model", "mock")
+        messages = body.get("messages") or []
+
+        error = mock.injected_error()
+        if error is not None:
+            return error
+
+        content = mock.generate(messages)
+        usage = mock.usage(messages, content)
+        completion_id = f"gen-mock-{uuid.uuid4().hex[:12]}"
+
+        if not body.get("stream"):
+            await asyncio.sleep(mock.sample_latency())
+            mock.stats["200"] += 1
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": usage,
+            }
+
+        async def events():
+            # 首个token前的延迟，之后按固定间隔输出
+            yield ": OPENROUTER PROCESSING\n\n"
+            await asyncio.sleep(mock.sample_latency())
+            step = max(1, config.stream_chunk_chars)
+            for start in range(0, len(content), step):
+                chunk = {
+                    "id": completion_id,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": content[start:start + step]}}],
+                }
+                yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+                await asyncio.sleep(config.stream_interval_ms / 1000)
+            final = {
+                "id": completion_id,
+                "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                "usage": usage,
+            }
+            yield f"data: {json.dumps(final, ensure_ascii=False)}\n\n"
+            yield "data: [DONE]\n\n"
+            mock.stats["200"] += 1
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/stats")
+    async def stats():
+        return dict(mock.stats)
+
+    @app.post("/stats/reset")
+    async def reset_stats():
+        mock.stats.clear()
+        return {"message": "reset"}
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地OpenRouter兼容模拟服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, dest="latency_ms")
+    parser.add_argument("--latency-jitter-ms", type=float, dest="latency_jitter_ms")
+    parser.add_argument("--latency-distribution", choices=["fixed", "uniform", "lognormal"], dest="latency_distribution")
+    parser.add_argument("--error-rate", type=float, dest="error_rate")
+    parser.add_argument("--rate-limit-rate", type=float, dest="rate_limit_rate")
+    parser.add_argument("--retry-after", type=float, dest="retry_after")
+    parser.add_argument("--responses-file", dest="responses_file")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    overrides = {k: v for k, v in vars(args).items() if k not in ("host", "port")}
+    uvicorn.run(create_app(MockLLMConfig(**overrides)), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -65,6 +65,33 @@ class TestFileUploadAPI:
             
             assert response.status_code == 500
 
+    def test_upload_previous_task_scoped_to_user(self, client, db_session, sample_upload_file):
+        """测试上传修订稿时上一版任务只能是同一用户的任务"""
+        from app.models import Task
+
+        own = Task(file_name="v1.pdf", file_path="/tmp/v1.pdf", status="COMPLETED")
+        other = Task(user_id=2, file_name="other.pdf", file_path="/tmp/other.pdf", status="COMPLETED")
+        db_session.add_all([own, other])
+        db_session.commit()
+
+        with patch('app.services.file_service.FileService.save_and_enqueue', return_value=999) as mock_save:
+            rejected = client.post(
+                "/api/v1/upload",
+                files={"file": ("v2.pdf", sample_upload_file.file, "application/pdf")},
+                data={"contract_type": "purchase", "previous_task_id": str(other.id)}
+            )
+            sample_upload_file.file.seek(0)
+            accepted = client.post(
+                "/api/v1/upload",
+                files={"file": ("v2.pdf", sample_upload_file.file, "application/pdf")},
+                data={"contract_type": "purchase", "previous_task_id": str(own.id)}
+            )
+
+        assert rejected.status_code == 400
+        assert accepted.status_code == 200
+        mock_save.assert_called_once()
+        assert mock_save.call_args.kwargs["parent_task_id"] == own.id
+
 
 @pytest.mark.api
 class TestContractReviewAPI:
@@ -183,6 +210,53 @@ class TestContractReviewAPI:
             assert data["task_id"] == sample_task.id
             assert "risks" in data
             assert "summary" in data
+    
+    def test_completed_review_served_from_materialized_result(self, client, db_session):
+        """测试已完成任务的审查结果直接返回物化结果，不再组装"""
+        from app.models import Task
+        
+        task = Task(file_name="contract.pdf", file_path="/tmp/contract.pdf", status="COMPLETED",
+                    review_result={"task_id": 1, "status": "COMPLETED", "risks": [], "summary": {"total_risks": 0}})
+        db_session.add(task)
+        db_session.commit()
+        
+        with patch('app.services.review_service.ReviewService.get_review_result') as mock_get_result:
+            response = client.get(f"/api/v1/review/{task.id}")
+        
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/json"
+        assert response.json()["summary"] == {"total_risks": 0}
+        mock_get_result.assert_not_called()
+
+    def test_review_base_task_scoped_to_user_and_upload_link_kept(self, client, db_session):
+        """测试上一版任务只能是同一用户的任务；未提供base_task_id时保留上传时建立的关联，显式传null时清除"""
+        from app.models import Task
+
+        own_base = Task(user_id=1, file_name="v1.pdf", file_path="/tmp/v1.pdf", status="COMPLETED", role="buyer")
+        other_base = Task(user_id=2, file_name="other.pdf", file_path="/tmp/other.pdf", status="COMPLETED", role="buyer")
+        db_session.add_all([own_base, other_base])
+        db_session.commit()
+        # 上传修订稿时通过previous_task_id建立的关联
+        task = Task(user_id=1, file_name="v2.pdf", file_path="/tmp/v2.pdf", status="READY", role="buyer",
+                    parent_task_id=own_base.id)
+        db_session.add(task)
+        db_session.commit()
+        job = {"job_id": 1, "task_id": task.id, "status": "QUEUED", "priority": "interactive", "position": 1}
+
+        with patch('app.services.review_queue.ReviewQueue.enqueue', return_value=job) as mock_enqueue:
+            rejected = client.post("/api/v1/review", json={"task_id": task.id, "base_task_id": other_base.id})
+            omitted = client.post("/api/v1/review", json={"task_id": task.id})
+            db_session.refresh(task)
+            kept_parent = task.parent_task_id
+            cleared = client.post("/api/v1/review", json={"task_id": task.id, "base_task_id": None})
+            db_session.refresh(task)
+
+        assert rejected.status_code == 400
+        assert omitted.status_code == 200
+        assert cleared.status_code == 200
+        assert kept_parent == own_base.id
+        assert task.parent_task_id is None
+        assert mock_enqueue.call_count == 2
 
 
 @pytest.mark.api
@@ -309,6 +383,18 @@ class TestHealthCheckAPI:
         data = response.json()
         assert "openapi" in data
         assert "info" in data
+    
+    def test_metrics_record_route_latency(self, client):
+        """测试/metrics按路由模板输出HTTP延迟直方图"""
+        with patch('app.services.review_service.ReviewService.get_review_result') as mock_get_result:
+            mock_get_result.side_effect = ValueError("任务不存在")
+            client.get("/api/v1/review/999")
+        
+        response = client.get("/metrics")
+        
+        assert response.status_code == 200
+        assert 'http_request_duration_seconds_count{method="GET",route="/api/v1/review/{task_id}",status="404"}' in response.text
+        assert "/api/v1/review/999" not in response.text
 
 
 @pytest.mark.integration
@@ -0,0 +1,563 @@
+import pytest
+import asyncio
+import json
+import httpx
+
+from app.services.llm_client import LLMClient, LLMAPIError
+
+
+def _completion(content):
+    return {"choices": [{"message": {"content": content}}]}
+
+
+def _make_client(handler):
+    """创建使用MockTransport的LLM客户端"""
+    client = LLMClient(api_key="test-key", base_url="http://llm.test/api/v1")
+    transport = httpx.MockTransport(handler)
+    client._sync_client = httpx.Client(headers=client.headers, transport=transport)
+    return client, transport
+
+
+@pytest.mark.unit
+class TestLLMClient:
+    """LLM客户端单元测试"""
+
+    def test_chat_success(self):
+        """测试同步调用返回完整响应"""
+        def handler(request):
+            assert request.url.path == "/api/v1/chat/completions"
+            assert request.headers["Authorization"] == "Bearer test-key"
+            body = json.loads(request.content)
+            assert body["model"] == "test-model"
+            return httpx.Response(200, json=_completion("你好"))
+
+        client, _ = _make_client(handler)
+        result = client.chat([{"role": "user", "content": "hi"}], model="test-model")
+
+        assert result["choices"][0]["message"]["content"] == "你好"
+
+    def test_chat_error_carries_retry_after(self):
+        """测试非200响应抛出LLMAPIError并解析Retry-After"""
+        def handler(request):
+            return httpx.Response(429, headers={"Retry-After": "3"}, text="rate limited")
+
+        client, _ = _make_client(handler)
+        with pytest.raises(LLMAPIError) as exc_info:
+            client.chat([{"role": "user", "content": "hi"}], model="test-model")
+
+        assert exc_info.value.status_code == 429
+        assert exc_info.value.retry_after == 3.0
+
+    def test_achat_reuses_client_within_loop(self):
+        """测试同一事件循环内复用异步连接池"""
+        def handler(request):
+            return httpx.Response(200, json=_completion("ok"))
+
+        client, transport = _make_client(handler)
+
+        async def run():
+            client._async_client = httpx.AsyncClient(transport=transport)
+            client._async_loop = asyncio.get_running_loop()
+            pooled = client._async_client
+            first = await client.achat([{"role": "user", "content": "hi"}], model="m")
+            second = await client.achat([{"role": "user", "content": "hi"}], model="m")
+            reused = client._get_async_client() is pooled
+            await client.aclose()
+            return first, second, reused
+
+        first, second, reused = asyncio.run(run())
+
+        assert reused
+        assert first["choices"][0]["message"]["content"] == "ok"
+        assert second == first
+
+    def test_loop_change_closes_previous_async_client(self):
+        """测试事件循环结束时关闭其连接池，新循环使用新的连接池"""
+        client = LLMClient(api_key="test-key", base_url="http://llm.test/api/v1")
+
+        async def get_client():
+            return client._get_async_client()
+
+        first = asyncio.run(get_client())
+        second = asyncio.run(get_client())
+
+        assert first.is_closed
+        assert second is not first
+        asyncio.run(client.aclose())
+        assert second.is_closed
+
+    def test_chat_total_timeout_bounds_slow_response(self):
+        """测试响应体缓慢逐段返回时同步调用受总超时约束"""
+        import time
+
+        class SlowStream(httpx.SyncByteStream):
+            def __iter__(self):
+                for _ in range(20):
+                    time.sleep(0.05)
+                    yield b" "
+
+        def handler(request):
+            return httpx.Response(200, headers={"Content-Type": "application/json"}, stream=SlowStream())
+
+        client, _ = _make_client(handler)
+        start = time.monotonic()
+        with pytest.raises(httpx.ReadTimeout):
+            client.chat([{"role": "user", "content": "hi"}], model="test-model", timeout=0.2)
+
+        assert time.monotonic() - start < 0.5
+
+
+@pytest.fixture
+def resilience(monkeypatch):
+    """创建无等待的弹性层实例"""
+    from app.services.llm_resilience import LLMResilience
+
+    monkeypatch.setenv("LLM_MAX_RETRIES", "2")
+    monkeypatch.setenv("LLM_RATE_LIMIT_PER_SEC", "0")
+    monkeypatch.setenv("LLM_BREAKER_FAILURE_THRESHOLD", "3")
+    monkeypatch.setenv("LLM_BREAKER_RECOVERY_TIMEOUT", "60")
+    instance = LLMResilience()
+    monkeypatch.setattr(instance, "compute_delay", lambda attempt, error: 0)
+    return instance
+
+
+@pytest.mark.unit
+class TestLLMResilience:
+    """LLM弹性层单元测试"""
+
+    def test_retries_server_errors_then_succeeds(self, resilience):
+        """测试5xx错误重试后成功"""
+        calls = []
+
+        def fn():
+            calls.append(1)
+            if len(calls) < 3:
+                raise LLMAPIError(503)
+            return "ok"
+
+        assert resilience.call(fn) == "ok"
+        assert len(calls) == 3
+
+    def test_client_error_not_retried(self, resilience):
+        """测试4xx错误不重试"""
+        calls = []
+
+        def fn():
+            calls.append(1)
+            raise LLMAPIError(400)
+
+        with pytest.raises(LLMAPIError):
+            resilience.call(fn)
+        assert len(calls) == 1
+
+    def test_circuit_opens_and_fails_fast(self, resilience):
+        """测试连续失败后熔断器打开并快速失败"""
+        from app.services.llm_resilience import CircuitOpenError
+
+        def fn():
+            raise LLMAPIError(500)
+
+        with pytest.raises(LLMAPIError):
+            resilience.call(fn)
+        with pytest.raises(CircuitOpenError):
+            resilience.call(lambda: "never called")
+        assert resilience.breaker.state == "open"
+
+    def test_cancelled_half_open_probe_releases_breaker(self, resilience):
+        """测试半开试探调用被取消后熔断器仍可放行下一次试探"""
+        from app.services.llm_resilience import CircuitBreaker
+
+        resilience.breaker.state = CircuitBreaker.OPEN
+        resilience.breaker._opened_at = -resilience.breaker.recovery_timeout
+
+        async def hang():
+            await asyncio.sleep(30)
+
+        async def ok():
+            return "ok"
+
+        async def run():
+            probe = asyncio.ensure_future(resilience.acall(hang))
+            await asyncio.sleep(0.05)
+            probe.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await probe
+            return await resilience.acall(ok)
+
+        assert asyncio.run(run()) == "ok"
+        assert resilience.breaker.state == "closed"
+
+    def test_retry_after_is_honored(self):
+        """测试退避时间遵循Retry-After"""
+        from app.services.llm_resilience import LLMResilience
+
+        instance = LLMResilience()
+
+        assert instance.compute_delay(0, LLMAPIError(429, retry_after=2.5)) == 2.5
+        assert 0 <= instance.compute_delay(3, LLMAPIError(500)) <= instance.max_delay
+
+    def test_token_bucket_waits_when_empty(self):
+        """测试令牌耗尽后需要等待"""
+        from app.services.llm_resilience import TokenBucket
+
+        bucket = TokenBucket(rate=10, capacity=2)
+
+        assert bucket._reserve() == 0
+        assert bucket._reserve() == 0
+        assert bucket._reserve() > 0
+
+
+@pytest.mark.unit
+class TestLLMCache:
+    """LLM响应缓存单元测试"""
+
+    @pytest.fixture
+    def cache(self, monkeypatch):
+        from app.services.llm_cache import LLMCache
+
+        monkeypatch.setenv("LLM_CACHE_DB_ENABLED", "false")
+        monkeypatch.setenv("LLM_CACHE_MAX_ENTRIES", "2")
+        return LLMCache()
+
+    def test_cache_key_depends_on_all_parameters(self):
+        """测试缓存键区分模型、消息和温度"""
+        from app.services.llm_cache import make_cache_key
+
+        messages = [{"role": "user", "content": "违约金"}]
+        key = make_cache_key("m1", messages, 0.1)
+
+        assert key == make_cache_key("m1", [dict(messages[0])], 0.1)
+        assert key != make_cache_key("m2", messages, 0.1)
+        assert key != make_cache_key("m1", messages, 0.2)
+
+    def test_memory_tier_hit_and_lru_eviction(self, cache):
+        """测试进程内缓存命中及LRU淘汰"""
+        cache.put("a", "m", "A", 100)
+        cache.put("b", "m", "B", 100)
+        assert cache.get("a") == "A"
+        cache.put("c", "m", "C", 100)
+
+        assert cache.get("b") is None
+        assert cache.get("a") == "A"
+        assert cache.get("c") == "C"
+
+    def test_expired_entry_is_miss(self, cache):
+        """测试过期条目不命中"""
+        cache.put("a", "m", "A", 100, ttl=-1)
+
+        assert cache.get("a") is None
+
+    def test_ai_service_uses_cache(self, ai_service, cache):
+        """测试相同提示第二次调用命中缓存"""
+        from unittest.mock import MagicMock
+
+        ai_service.cache = cache
+        ai_service.llm_client = MagicMock()
+        ai_service.llm_client.chat.return_value = _completion("结果")
+        messages = [{"role": "user", "content": "hi"}]
+
+        assert ai_service._call_openrouter_api(messages) == "结果"
+        assert ai_service._call_openrouter_api(messages) == "结果"
+        assert ai_service._call_openrouter_api(messages, use_cache=False) == "结果"
+        assert ai_service.llm_client.chat.call_count == 2
+
+    def test_cache_bypass_skips_both_tiers(self, ai_service, cache):
+        """测试use_cache=False时同步和异步调用都不查询内存层和数据库层缓存，新结果仍写入缓存"""
+        from unittest.mock import AsyncMock, MagicMock, patch
+
+        ai_service.cache = cache
+        ai_service.llm_client = MagicMock()
+        ai_service.llm_client.chat.return_value = _completion("新结果")
+        ai_service.llm_client.achat = AsyncMock(return_value=_completion("新结果"))
+        messages = [{"role": "user", "content": "hi"}]
+
+        with patch.object(cache, "_get_memory") as get_memory, patch.object(cache, "_get_db") as get_db:
+            assert ai_service._call_openrouter_api(messages, use_cache=False) == "新结果"
+            assert asyncio.run(ai_service._acall_openrouter_api(messages, use_cache=False)) == "新结果"
+
+        get_memory.assert_not_called()
+        get_db.assert_not_called()
+        assert ai_service.llm_client.chat.call_count == 1
+        assert ai_service.llm_client.achat.await_count == 1
+        assert ai_service._call_openrouter_api(messages) == "新结果"
+        assert ai_service.llm_client.chat.call_count == 1
+
+
+@pytest.mark.unit
+class TestLLMStreaming:
+    """LLM流式输出单元测试"""
+
+    def test_astream_chat_parses_sse(self):
+        """测试解析SSE增量并忽略注释行"""
+        events = [
+            ": OPENROUTER PROCESSING",
+            'data: {"choices": [{"delta": {"content": "{\\"risks\\""}}]}',
+            'data: {"choices": [{"delta": {"content": ": []}"}}]}',
+            "data: [DONE]",
+        ]
+
+        def handler(request):
+            assert json.loads(request.content)["stream"] is True
+            return httpx.Response(200, text="\n\n".join(events) + "\n\n")
+
+        client, transport = _make_client(handler)
+
+        async def run():
+            client._async_client = httpx.AsyncClient(transport=transport)
+            client._async_loop = asyncio.get_running_loop()
+            parts = [part async for part in client.astream_chat([{"role": "user", "content": "hi"}], model="m")]
+            await client.aclose()
+            return parts
+
+        assert "".join(asyncio.run(run())) == '{"risks": []}'
+
+    def test_astream_chat_captures_usage(self):
+        """测试流式调用从最后一个事件中获取token用量"""
+        events = [
+            'data: {"choices": [{"delta": {"content": "ok"}}]}',
+            'data: {"choices": [], "usage": {"prompt_tokens": 12, "completion_tokens": 3, "cost": 0.001}}',
+            "data: [DONE]",
+        ]
+
+        def handler(request):
+            assert json.loads(request.content)["usage"] == {"include": True}
+            return httpx.Response(200, text="\n\n".join(events) + "\n\n")
+
+        client, transport = _make_client(handler)
+        usage = {}
+
+        async def run():
+            client._async_client = httpx.AsyncClient(transport=transport)
+            client._async_loop = asyncio.get_running_loop()
+            parts = [part async for part in client.astream_chat([], model="m", usage=usage)]
+            await client.aclose()
+            return parts
+
+        assert asyncio.run(run()) == ["ok"]
+        assert usage["prompt_tokens"] == 12
+        assert usage["completion_tokens"] == 3
+
+
+@pytest.mark.unit
+class TestLLMUsage:
+    """LLM用量记录单元测试"""
+
+    @pytest.fixture
+    def usage_db(self, db_session, monkeypatch):
+        from tests.conftest import TestingSessionLocal
+        import app.services.llm_usage as llm_usage
+
+        monkeypatch.setattr(llm_usage, "SessionLocal", TestingSessionLocal)
+        return llm_usage
+
+    def test_records_calls_with_scope(self, usage_db, db_session):
+        """测试调用记录归属到当前任务和阶段并可汇总"""
+        with usage_db.llm_call_scope(7, "ner"):
+            usage_db.record_llm_call("m", {"prompt_tokens": 100, "completion_tokens": 20, "cost": 0.01}, 500, retries=1)
+        with usage_db.llm_call_scope(7, "risk_analysis"):
+            usage_db.record_llm_call("m", cache_hit=True)
+            usage_db.record_llm_call("m", latency_ms=30, success=False, error="timeout")
+        usage_db.record_llm_call("m", {"prompt_tokens": 5})
+
+        result = usage_db.get_task_usage(7)
+
+        assert result["totals"]["calls"] == 3
+        assert result["totals"]["total_tokens"] == 120
+        assert result["totals"]["retries"] == 1
+        assert result["totals"]["cache_hits"] == 1
+        assert result["totals"]["failures"] == 1
+        stages = {row["stage"]: row for row in result["by_stage"]}
+        assert stages["ner"]["prompt_tokens"] == 100
+        assert stages["risk_analysis"]["calls"] == 2
+
+    def test_shared_call_usage_is_split_across_tasks(self, usage_db):
+        """测试共享调用（实体提取微批）的用量按各任务的文档数分摊，合计等于实际用量"""
+        with usage_db.shared_llm_call_scope([7, 8, 7], "ner"):
+            usage_db.record_llm_call("m", {"prompt_tokens": 301, "completion_tokens": 30, "cost": 0.03}, 600, retries=2)
+
+        first, second = usage_db.get_task_usage(7)["totals"], usage_db.get_task_usage(8)["totals"]
+
+        assert first["prompt_tokens"] + second["prompt_tokens"] == 301
+        assert (first["completion_tokens"], second["completion_tokens"]) == (20, 10)
+        assert first["cost"] == pytest.approx(0.02)
+        assert second["latency_ms"] == pytest.approx(200)
+        assert first["retries"] + second["retries"] == 2
+
+    def test_ai_service_records_cache_hits(self, ai_service, monkeypatch):
+        """测试AI服务在调用成功和缓存命中时都记录用量"""
+        from unittest.mock import MagicMock
+        from app.services import ai_service as ai_module
+
+        recorded = []
+        monkeypatch.setattr(ai_module, "record_llm_call", lambda model, *args, **kwargs: recorded.append(kwargs))
+        ai_service.cache = MagicMock()
+        ai_service.cache.get.side_effect = [None, "结果"]
+        ai_service.llm_client = MagicMock()
+        ai_service.llm_client.chat.return_value = {**_completion("结果"), "usage": {"prompt_tokens": 1}}
+
+        ai_service._call_openrouter_api([{"role": "user", "content": "hi"}])
+        ai_service._call_openrouter_api([{"role": "user", "content": "hi"}])
+
+        assert recorded[1] == {"cache_hit": True}
+        assert len(recorded) == 2
+
+
+@pytest.mark.unit
+class TestModelRouter:
+    """模型路由单元测试"""
+
+    @pytest.fixture
+    def router(self, monkeypatch):
+        from app.services.model_router import ModelRouter
+
+        monkeypatch.setenv("LLM_MODEL_ROUTES", json.dumps({"ner": ["small", "large"]}))
+        monkeypatch.setenv("LLM_LATENCY_BUDGETS_MS", json.dumps({"ner": 1000}))
+        monkeypatch.setenv("LLM_MODEL_MIN_SAMPLES", "3")
+        return ModelRouter(default_model="large")
+
+    def test_unconfigured_stage_uses_default_model(self, router):
+        """测试未配置阶段使用默认模型"""
+        assert router.candidates("other") == ["large"]
+        assert router.budget_seconds("ner") == 1.0
+
+    def test_slow_model_is_demoted(self, router):
+        """测试p95超过延迟预算的模型被降级"""
+        for latency in (200, 300, 5000):
+            router.record("small", latency, success=True)
+
+        assert router.candidates("ner") == ["large", "small"]
+        assert router.snapshot()["models"]["small"]["p95_ms"] == 5000
+
+    def test_failing_model_is_demoted(self, router):
+        """测试错误率超过阈值的模型被降级，样本不足时不降级"""
+        router.record("small", 100, success=False)
+        router.record("small", 100, success=False)
+        assert router.candidates("ner") == ["small", "large"]
+
+        router.record("small", 100, success=False)
+        assert router.candidates("ner") == ["large", "small"]
+
+    def test_ai_service_falls_back_to_next_model(self, ai_service, router):
+        """测试首选模型失败时回退到下一个模型"""
+        from unittest.mock import MagicMock
+
+        def chat(messages, model, temperature, timeout=None):
+            if model == "small":
+                raise LLMAPIError(400, "bad model")
+            return _completion(f"来自{model}")
+
+        ai_service.model_router = router
+        ai_service.llm_client = MagicMock()
+        ai_service.llm_client.chat.side_effect = chat
+
+        assert ai_service._call_openrouter_api([], use_cache=False, stage="ner") == "来自large"
+        assert [c.kwargs["model"] for c in ai_service.llm_client.chat.call_args_list] == ["small", "large"]
+        assert router.snapshot()["models"]["small"]["error_rate"] == 1.0
+
+    def test_latency_budget_covers_retries_of_a_candidate(self, ai_service, router, resilience):
+        """测试延迟预算约束候选模型的全部重试，超出后回退且单次超时按剩余时间收紧"""
+        import time
+        from unittest.mock import MagicMock
+
+        timeouts = []
+
+        def chat(messages, model, temperature, timeout=None):
+            if model == "small":
+                timeouts.append(timeout)
+                time.sleep(0.4)
+                raise LLMAPIError(503, "slow and failing")
+            return _completion(f"来自{model}")
+
+        ai_service.model_router = router
+        ai_service.resilience = resilience
+        ai_service.llm_client = MagicMock()
+        ai_service.llm_client.chat.side_effect = chat
+
+        start = time.monotonic()
+        assert ai_service._call_openrouter_api([], use_cache=False, stage="ner") == "来自large"
+
+        assert time.monotonic() - start < 1.3
+        assert timeouts[0] <= 1.0
+        assert all(later < earlier for earlier, later in zip(timeouts, timeouts[1:]))
+
+    def test_open_breaker_of_one_model_still_falls_back(self, ai_service, router, resilience):
+        """测试首选模型熔断后仍可回退到其他模型（熔断器按模型区分）"""
+        from unittest.mock import MagicMock
+
+        def chat(messages, model, temperature, timeout=None):
+            if model == "small":
+                raise LLMAPIError(503, "unavailable")
+            return _completion(f"来自{model}")
+
+        ai_service.model_router = router
+        ai_service.resilience = resilience
+        ai_service.llm_client = MagicMock()
+        ai_service.llm_client.chat.side_effect = chat
+
+        assert ai_service._call_openrouter_api([], use_cache=False, stage="ner") == "来自large"
+        assert resilience.breaker_for("small").state == "open"
+        ai_service.llm_client.chat.reset_mock()
+
+        assert ai_service._call_openrouter_api([], use_cache=False, stage="ner") == "来自large"
+        assert resilience.breaker_for("large").state == "closed"
+
+
+@pytest.mark.unit
+class TestMockOpenRouterServer:
+    """本地模拟服务单元测试（通过ASGI直接调用，不占用端口）"""
+
+    def _run(self, config, call):
+        from tests.mock_openrouter_server import create_app
+
+        client = LLMClient(api_key="test-key", base_url="http://mock/api/v1")
+
+        async def run():
+            client._async_client = httpx.AsyncClient(transport=httpx.ASGITransport(app=create_app(config)))
+            client._async_loop = asyncio.get_running_loop()
+            try:
+                return await call(client)
+            finally:
+                await client.aclose()
+
+        return asyncio.run(run())
+
+    def _config(self, **overrides):
+        from tests.mock_openrouter_server import MockLLMConfig
+
+        return MockLLMConfig(latency_distribution="fixed", latency_ms=0, stream_interval_ms=0, seed=1, **overrides)
+
+    def test_templated_risk_response(self):
+        """测试根据段落编号生成带来源段落的风险JSON"""
+        messages = [{"role": "user", "content": '返回"risks"\n[P7] 逾期付款按日支付违约金\n[P8] 本合同一式两份'}]
+
+        result = self._run(self._config(), lambda client: client.achat(messages, model="m"))
+        risks = json.loads(result["choices"][0]["message"]["content"])["risks"]
+
+        assert {risk["title"] for risk in risks} == {"违约金约定过高", "付款期限不明确"}
+        assert all(risk["paragraph_ids"] == [7] for risk in risks)
+        assert result["usage"]["prompt_tokens"] > 0
+
+    def test_streaming_entities_and_usage(self):
+        """测试流式输出实体JSON并在最后一个事件返回用量"""
+        messages = [{"role": "user", "content": '"companies"\n合同文本：甲方：北京星河科技有限公司'}]
+        usage = {}
+
+        async def call(client):
+            return "".join([part async for part in client.astream_chat(messages, model="m", usage=usage)])
+
+        content = self._run(self._config(stream_chunk_chars=4), call)
+
+        assert json.loads(content)["companies"] == ["北京星河科技有限公司"]
+        assert usage["completion_tokens"] > 0
+
+    def test_rate_limit_injection(self):
+        """测试注入429并返回Retry-After"""
+        async def call(client):
+            with pytest.raises(LLMAPIError) as exc_info:
+                await client.achat([], model="m")
+            return exc_info.value
+
+        error = self._run(self._config(rate_limit_rate=1.0, retry_after=2), call)
+
+        assert error.status_code == 429
+        assert error.retry_after == 2.0
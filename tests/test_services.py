@@ -1,6 +1,7 @@
 import pytest
 from unittest.mock import patch, MagicMock, AsyncMock
 import asyncio
+import json
 import os
 from io import BytesIO
 from datetime import datetime
@@ -9,6 +10,8 @@ from app.services.file_service import FileService
 from app.services.ai_service import AIService
 from app.services.review_service import ReviewService
 from app.services.export_service import ExportService
+from app.services.retrieval_service import BigramIndex, char_bigrams, reciprocal_rank_fusion
+from app.services.risk_analysis import chunk_paragraphs, IncrementalRiskParser, RiskMerger
 from tests.conftest import SAMPLE_CONTRACT_TEXT
 
 
@@ -109,9 +112,28 @@ class TestFileService:
             mock_ocr.side_effect = Exception("OCR failed")
             
             text = file_service.extract_text_from_file(file_path)
-            
+
             assert text == ""
 
+    def test_extract_page_text_uses_known_page_count(self, file_service):
+        """测试传入页数时逐页提取不再重复打开文件计数"""
+        file_path = "/test/path/test.pdf"
+
+        with patch('app.services.file_service.PDF_LIBRARY', 'pdfplumber'), \
+             patch('pdfplumber.open') as mock_open, \
+             patch.object(file_service, 'count_pages') as mock_count:
+
+            mock_pdf = MagicMock()
+            mock_pdf.pages = [MagicMock(), MagicMock()]
+            mock_pdf.pages[1].extract_text.return_value = " 第二页文本 "
+            mock_open.return_value.__enter__.return_value = mock_pdf
+
+            text = file_service.extract_page_text(file_path, 1, page_count=2)
+
+            assert text == "第二页文本"
+            mock_count.assert_not_called()
+            mock_open.assert_called_once()
+
 
 @pytest.mark.unit
 class TestAIService:
@@ -153,6 +175,176 @@ class TestAIService:
         assert result1 != result2  # 不同文本应该产生不同的向量
 
 
+@pytest.mark.unit
+class TestHybridRetrieval:
+    """混合检索单元测试"""
+    
+    def test_char_bigrams_normalization(self):
+        """测试二元组切分忽略空白和标点"""
+        assert char_bigrams("违约 金。") == ["违约", "约金"]
+        assert char_bigrams("Ａ") == ["a"]
+        assert char_bigrams("") == []
+    
+    def test_bigram_index_exact_term_ranks_first(self):
+        """测试包含精确术语的段落排名最高"""
+        index = BigramIndex()
+        index.add(1, "本合同一式两份，双方各执一份。")
+        index.add(2, "逾期付款的，应按日支付千分之一的违约金。")
+        index.add(3, "因不可抗力导致无法履行的，双方互不承担责任。")
+        
+        results = index.search("违约金", limit=3)
+        
+        assert results[0][0] == 2
+        assert all(doc_id != 1 for doc_id, _ in results)
+    
+    def test_reciprocal_rank_fusion(self):
+        """测试RRF融合两路排名"""
+        fused = reciprocal_rank_fusion([[1, 2, 3], [3, 1, 4]])
+        
+        assert [doc_id for doc_id, _ in fused][:2] == [1, 3]
+        assert {doc_id for doc_id, _ in fused} == {1, 2, 3, 4}
+
+
+@pytest.mark.unit
+class TestRiskAnalysis:
+    """Map-Reduce风险分析单元测试"""
+    
+    @staticmethod
+    def _paragraphs(texts):
+        return [MagicMock(id=i + 1, text=text) for i, text in enumerate(texts)]
+    
+    def test_chunk_paragraphs_respects_limit(self):
+        """测试分块不超过字符上限且保持顺序"""
+        paragraphs = self._paragraphs(["甲" * 40] * 10)
+        
+        chunks = chunk_paragraphs(paragraphs, max_chars=100)
+        
+        assert [len(c) for c in chunks] == [2, 2, 2, 2, 2]
+        assert [p.id for c in chunks for p in c] == list(range(1, 11))
+    
+    def test_chunk_paragraphs_prefers_clause_boundary(self):
+        """测试块过半后在条款标题处切分"""
+        paragraphs = self._paragraphs(["第一条 " + "甲" * 60, "补充说明" + "乙" * 10, "第二条 " + "丙" * 10])
+        
+        chunks = chunk_paragraphs(paragraphs, max_chars=120)
+        
+        assert [[p.id for p in c] for c in chunks] == [[1, 2], [3]]
+    
+    def test_risk_merger_deduplicates(self):
+        """测试合并去重：合并段落引用、法规并取更高等级"""
+        merger = RiskMerger()
+        
+        assert merger.add({"title": "付款期限不明确", "risk_level": "MEDIUM",
+                           "related_laws": ["民法典第510条"], "paragraph_refs": [3]})[0]
+        assert not merger.add({"title": "付款期限不明确。", "risk_level": "HIGH",
+                               "related_laws": ["民法典第511条"], "paragraph_refs": [7]})[0]
+        
+        assert len(merger.risks) == 1
+        risk = merger.risks[0]
+        assert risk["risk_level"] == "HIGH"
+        assert risk["paragraph_refs"] == [3, 7]
+        assert risk["related_laws"] == ["民法典第510条", "民法典第511条"]
+    
+    def test_link_chunk_risks(self, ai_service):
+        """测试风险关联回片段段落ID"""
+        chunk = [MagicMock(id=11), MagicMock(id=12)]
+        risks = [{"title": "a", "paragraph_ids": ["P12", 99]}, {"title": "b"}]
+        
+        linked = ai_service._link_chunk_risks(risks, chunk)
+        
+        assert linked[0]["paragraph_refs"] == [12]
+        assert linked[1]["paragraph_refs"] == [11, 12]
+    
+    def test_map_reduce_runs_chunks_concurrently(self, ai_service):
+        """测试各块并发分析，总耗时接近单块耗时"""
+        import time
+        
+        paragraphs = [MagicMock(id=i, text="第%d条 " % i + "甲" * 50) for i in range(1, 9)]
+        ai_service.chunk_chars = 60
+        ai_service.analysis_concurrency = 8
+        ai_service.streaming = False
+        
+        async def fake_call(messages, temperature=0.1, use_cache=True, stage="default"):
+            await asyncio.sleep(0.2)
+            return '{"risks": [{"title": "违约金过高", "risk_level": "HIGH"}]}'
+        
+        with patch('app.services.ai_service.SessionLocal') as mock_session, \
+             patch.object(ai_service, '_acall_openrouter_api', side_effect=fake_call), \
+             patch.object(ai_service, '_save_risks_to_db') as mock_save:
+            mock_session.return_value.query.return_value.filter.return_value.order_by.return_value.all.return_value = paragraphs
+            
+            start = time.perf_counter()
+            risks = asyncio.run(ai_service.analyze_contract_risks_map_reduce(1, "采购合同", "buyer"))
+            elapsed = time.perf_counter() - start
+        
+        assert elapsed < 0.6
+        assert len(risks) == 1
+        assert risks[0]["paragraph_refs"] == list(range(1, 9))
+        mock_save.assert_called_once()
+    
+    def test_incremental_parser_emits_each_closed_risk(self):
+        """测试增量解析器在风险对象闭合时立即产出"""
+        output = '```json\n{"risks": [{"title": "违约金{过高}", "related_laws": ["民法典"]}, {"title": "付款\\"期限\\""}]}\n```'
+        parser = IncrementalRiskParser()
+        emitted = []
+        
+        for i in range(0, len(output), 7):
+            emitted.extend(parser.feed(output[i:i + 7]))
+            if i + 7 < output.index('}, {'):
+                assert emitted == []
+        
+        assert [r["title"] for r in emitted] == ["违约金{过高}", '付款"期限"']
+    
+    def test_streaming_map_reduce_persists_and_emits_risks(self, ai_service):
+        """测试流式分析逐条入库并回调"""
+        paragraphs = [MagicMock(id=1, text="第一条 付款方式")]
+        ai_service.streaming = True
+        
+        async def fake_stream(messages, temperature=0.1, on_delta=None, on_retry=None, use_cache=True, stage="default"):
+            for part in ['{"risks": [{"title": "A", "paragraph_ids": [1]}', ', {"title": "B"}', ']}']:
+                await on_delta(part)
+        
+        emitted = []
+        
+        async def on_risk(risk, is_new):
+            emitted.append((risk["title"], risk["id"], is_new))
+        
+        with patch('app.services.ai_service.SessionLocal') as mock_session, \
+             patch.object(ai_service, '_astream_openrouter_api', side_effect=fake_stream), \
+             patch.object(ai_service, '_upsert_risk', side_effect=[101, 102]), \
+             patch.object(ai_service, '_save_risks_to_db') as mock_save:
+            mock_session.return_value.query.return_value.filter.return_value.order_by.return_value.all.return_value = paragraphs
+            
+            risks = asyncio.run(ai_service.analyze_contract_risks_map_reduce(1, "采购合同", "buyer", on_risk=on_risk))
+        
+        assert emitted == [("A", 101, True), ("B", 102, True)]
+        assert len(risks) == 2
+        mock_save.assert_not_called()
+    
+    def test_category_mode_builds_one_small_prompt_per_category(self, ai_service):
+        """测试按类别检索相关条款，每个类别一个只含相关条款的提示"""
+        from app.services.risk_analysis import RISK_CATEGORIES
+        
+        paragraphs = [MagicMock(id=i, text=f"段落{i}", paragraph_index=i) for i in range(1, 21)]
+        ai_service.category_top_k = 2
+        
+        def fake_batch(queries, task_id, limit):
+            # 第n个关键词命中段落n和n+1
+            return [[{"id": n % 20 + 1}, {"id": (n + 1) % 20 + 1}] for n in range(len(queries))]
+        
+        with patch.object(ai_service, '_load_paragraphs', return_value=paragraphs), \
+             patch.object(ai_service, 'hybrid_search_paragraphs_batch', side_effect=fake_batch), \
+             patch.object(ai_service, '_run_sharded_analysis', new_callable=AsyncMock, return_value=[]) as mock_run:
+            asyncio.run(ai_service.analyze_contract_risks_by_category(1, "采购合同", "buyer"))
+        
+        shards = mock_run.call_args[0][1]
+        assert len(shards) == len(RISK_CATEGORIES)
+        for shard, messages in shards:
+            assert len(shard) == 2
+            assert all(f"[P{p.id}]" in messages[1]["content"] for p in shard)
+            assert "段落20" not in messages[1]["content"] or any(p.id == 20 for p in shard)
+
+
 @pytest.mark.unit
 class TestReviewService:
     """审查服务单元测试"""
@@ -195,7 +387,42 @@ class TestReviewService:
             assert "entities" in result
             assert len(result["candidates"]) > 0
             assert result["entities"] == {}
-    
+
+    def test_get_draft_roles_async_extracts_missing_entities(self, review_service, db_session, monkeypatch):
+        """测试异步获取草稿角色：缺失实体时走异步实体提取并保存到任务"""
+        from tests.conftest import TestingSessionLocal
+        from app.models import Task, File
+        import app.services.review_service as review_service_module
+        import app.services.single_flight as single_flight_module
+
+        task = Task(file_name="contract.pdf", file_path="/tmp/contract.pdf", status="PENDING",
+                    contract_type="采购合同")
+        db_session.add(task)
+        db_session.commit()
+        db_session.add(File(task_id=task.id, filename="contract.pdf", path="/tmp/contract.pdf",
+                            ocr_text="甲方：北京星河科技有限公司，乙方：上海云帆贸易有限公司"))
+        db_session.commit()
+
+        entities = {"parties": ["北京星河科技有限公司", "上海云帆贸易有限公司"]}
+        fake_ai = MagicMock()
+        fake_ai.extract_entities_ner_async = AsyncMock(return_value=entities)
+        monkeypatch.setattr(review_service_module, "SessionLocal", TestingSessionLocal)
+        monkeypatch.setattr(single_flight_module, "SessionLocal", TestingSessionLocal)
+        monkeypatch.setattr(review_service_module, "run_blocking", _run_inline)
+        monkeypatch.setattr(single_flight_module, "run_blocking", _run_inline)
+        monkeypatch.setattr(review_service_module, "get_ai_service", lambda: fake_ai)
+
+        result = asyncio.run(review_service.get_draft_roles_async(task.id))
+
+        fake_ai.extract_entities_ner.assert_not_called()
+        fake_ai.extract_entities_ner_async.assert_awaited_once()
+        assert result["task_id"] == task.id
+        assert result["contract_type"] == "采购合同"
+        assert result["entities_extracted_at"] is not None
+        db_session.refresh(task)
+        assert task.entities_data == entities
+        assert task.status == "ENTITY_READY"
+
     def test_confirm_roles_auto_selection(self, review_service, sample_task):
         """测试角色确认自动选择"""
         sample_task.entities_data = {
@@ -324,4 +551,1531 @@ class TestExportService:
             mock_db.query.return_value.filter.return_value.first.return_value = None
             
             with pytest.raises(ValueError, match="任务不存在"):
-                export_service.generate_report(999, "pdf")
\ No newline at end of file
+                export_service.generate_report(999, "pdf")
+
+@pytest.mark.unit
+class TestSingleFlight:
+    """单飞去重单元测试"""
+    
+    @pytest.fixture
+    def single_flight(self, monkeypatch):
+        from tests.conftest import TestingSessionLocal
+        import app.services.single_flight as single_flight_module
+        
+        monkeypatch.setattr(single_flight_module, "SessionLocal", TestingSessionLocal)
+        return single_flight_module.SingleFlight()
+    
+    def test_async_concurrent_callers_share_result(self, single_flight):
+        """测试并发异步调用只执行一次计算"""
+        calls = []
+        
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return {"parties": ["甲公司"]}
+        
+        async def run():
+            return await asyncio.gather(*[single_flight.run("ner:task:1", compute) for _ in range(5)])
+        
+        results = asyncio.run(run())
+        
+        assert len(calls) == 1
+        assert all(result == {"parties": ["甲公司"]} for result in results)
+        assert single_flight._futures == {}
+    
+    def test_async_error_propagates_to_followers(self, single_flight):
+        """测试计算失败时所有等待方都收到异常，且失败后可重试"""
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("OCR失败")
+        
+        async def run():
+            return await asyncio.gather(*[single_flight.run("ocr:abc", fail) for _ in range(3)],
+                                        return_exceptions=True)
+        
+        results = asyncio.run(run())
+        
+        assert all(isinstance(result, RuntimeError) for result in results)
+        
+        async def ok():
+            return "文本"
+        
+        assert asyncio.run(single_flight.run("ocr:abc", ok)) == "文本"
+    
+    def test_lookup_skips_computation(self, single_flight):
+        """测试已有持久化结果时不再计算"""
+        compute = MagicMock(return_value="新结果")
+        
+        assert single_flight.run_sync("ner:task:2", compute, lookup=lambda: "已有结果") == "已有结果"
+        compute.assert_not_called()
+    
+    def test_sync_concurrent_callers_share_result(self, single_flight):
+        """测试多线程并发同步调用只执行一次计算"""
+        import threading
+        import time
+        
+        calls = []
+        
+        def compute():
+            calls.append(1)
+            time.sleep(0.05)
+            return "实体"
+        
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(single_flight.run_sync("ner:task:3", compute)))
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        assert len(calls) == 1
+        assert results == ["实体"] * 4
+
+    def test_async_lock_and_lookup_run_off_event_loop(self, single_flight, monkeypatch):
+        """测试异步单飞的咨询锁轮询、释放和lookup都不在事件循环线程上执行"""
+        import threading
+
+        threads = {}
+        attempts = []
+
+        def try_lock(db, key):
+            threads.setdefault("lock", set()).add(threading.get_ident())
+            attempts.append(key)
+            return len(attempts) >= 2
+
+        def release(db, key, locked):
+            threads["release"] = (threading.get_ident(), locked)
+            db.close()
+
+        def lookup():
+            threads["lookup"] = threading.get_ident()
+            return "已有结果"
+
+        monkeypatch.setattr(single_flight, "_use_db_lock", lambda db: True)
+        monkeypatch.setattr(single_flight, "_try_lock", try_lock)
+        monkeypatch.setattr(single_flight, "_release", release)
+        single_flight.lock_poll_interval = 0.01
+
+        async def run():
+            threads["loop"] = threading.get_ident()
+            return await single_flight.run("ner:task:4", AsyncMock(), lookup=lookup)
+
+        assert asyncio.run(run()) == "已有结果"
+        assert len(attempts) == 2
+        assert threads["loop"] not in threads["lock"]
+        assert threads["lookup"] != threads["loop"]
+        assert threads["release"][0] != threads["loop"]
+        assert threads["release"][1] is True
+
+    def test_flight_key(self):
+        """测试单飞键格式"""
+        from app.services.single_flight import flight_key
+        
+        assert flight_key("ner", "task:5") == "ner:task:5"
+
+
+@pytest.mark.unit
+class TestLocalEntityExtractor:
+    """本地实体提取器单元测试"""
+    
+    CONTRACT = (
+        "采购合同\n"
+        "甲方（采购方）：北京星河科技有限公司\n"
+        "法定代表人：张三\n"
+        "乙方：华为技术（深圳）有限公司\n"
+        "本合同由北京星河科技有限公司与华为技术（深圳）有限公司签订，"
+        "争议提交中国国际经济贸易仲裁委员会仲裁。\n"
+        "甲方（盖章）：\n"
+    )
+    
+    def test_aho_corasick_finds_overlapping_matches(self):
+        """测试自动机一次扫描找出全部重叠命中"""
+        from app.services.entity_extractor import AhoCorasick
+        
+        automaton = AhoCorasick()
+        for word in ["he", "she", "his", "hers"]:
+            automaton.add(word, "x")
+        
+        assert sorted((start, word) for start, word, _ in automaton.find_all("ushers")) == [
+            (1, "she"), (2, "he"), (2, "hers")
+        ]
+    
+    def test_role_headers_give_high_confidence(self):
+        """测试当事方标题+公司后缀得到高置信度结果"""
+        from app.services.entity_extractor import LocalEntityExtractor
+        
+        result = LocalEntityExtractor().extract(self.CONTRACT)
+        
+        assert result["entities"]["companies"] == ["北京星河科技有限公司", "华为技术（深圳）有限公司"]
+        assert result["entities"]["persons"] == ["张三"]
+        assert result["entities"]["organizations"] == ["中国国际经济贸易仲裁委员会"]
+        assert result["confidence"] >= 0.8
+    
+    def test_full_width_names_are_not_truncated(self):
+        """测试OCR文本中的全角字母数字先规范化，名称不被截断"""
+        from app.services.entity_extractor import LocalEntityExtractor
+
+        result = LocalEntityExtractor().extract(
+            "甲方：ＡＢＣ科技(深圳)有限公司\n乙方：上海１号仓储有限公司\n法定代表人：张三\n"
+        )
+
+        assert result["entities"]["companies"] == ["ABC科技（深圳）有限公司", "上海1号仓储有限公司"]
+
+    def test_dictionary_boosts_counterparty(self):
+        """测试词典命中的交易对手提高得分"""
+        from app.services.entity_extractor import LocalEntityExtractor
+        
+        extractor = LocalEntityExtractor()
+        extractor.add_name("云端数据服务中心", "organizations")
+        result = extractor.extract("委托方：李四\n受托方：王五\n本项目由云端数据服务中心监督")
+        
+        assert result["entities"]["organizations"] == ["云端数据服务中心"]
+        assert result["scores"]["云端数据服务中心"] == 0.8
+        assert result["confidence"] < 0.8
+    
+    def test_ai_service_skips_llm_when_confident(self, ai_service):
+        """测试本地提取置信度足够时不调用LLM"""
+        with patch.object(ai_service, '_call_openrouter_api') as mock_call:
+            entities = ai_service.extract_entities_ner(self.CONTRACT)
+        
+        mock_call.assert_not_called()
+        assert "北京星河科技有限公司" in entities["companies"]
+    
+    def test_ai_service_consults_llm_when_unsure(self, ai_service):
+        """测试本地提取置信度不足时调用LLM"""
+        llm_result = '{"companies": ["某某公司"], "persons": [], "organizations": []}'
+        with patch.object(ai_service, '_call_openrouter_api', return_value=llm_result) as mock_call:
+            entities = ai_service.extract_entities_ner("本合同双方就软件开发事宜达成如下协议。")
+        
+        mock_call.assert_called_once()
+        assert entities["companies"] == ["某某公司"]
+
+
+@pytest.mark.unit
+class TestEntityBatcher:
+    """实体提取微批处理单元测试"""
+    
+    def _batcher(self, call_llm, monkeypatch, window_ms="50", max_docs="8"):
+        from app.services.ner_batcher import EntityBatcher
+        
+        monkeypatch.setenv("NER_BATCH_WINDOW_MS", window_ms)
+        monkeypatch.setenv("NER_BATCH_MAX_DOCS", max_docs)
+        return EntityBatcher(call_llm, lambda text: [{"role": "user", "content": f"single:{text}"}])
+    
+    def test_burst_is_merged_into_one_call(self, monkeypatch):
+        """测试窗口内的多个请求合并为一次调用并按编号拆回"""
+        calls = []
+        
+        async def call_llm(messages, use_cache=True):
+            calls.append(messages)
+            return json.dumps({"documents": [
+                {"id": 2, "companies": ["乙公司"]},
+                {"id": 1, "companies": ["甲公司"]},
+                {"id": 3, "persons": ["张三"]},
+            ]}, ensure_ascii=False)
+        
+        batcher = self._batcher(call_llm, monkeypatch)
+        
+        async def run():
+            return await asyncio.gather(*(batcher.submit(text) for text in ["文档A", "文档B", "文档C"]))
+        
+        results = [json.loads(r) for r in asyncio.run(run())]
+        
+        assert len(calls) == 1
+        assert "【文档3】" in calls[0][1]["content"]
+        assert results[0]["companies"] == ["甲公司"]
+        assert results[1]["companies"] == ["乙公司"]
+        assert results[2]["persons"] == ["张三"]
+    
+    def test_single_request_uses_single_prompt(self, monkeypatch):
+        """测试窗口内只有一个请求时使用单文档提示"""
+        async def call_llm(messages, use_cache=True):
+            return messages[0]["content"]
+        
+        batcher = self._batcher(call_llm, monkeypatch)
+        
+        assert asyncio.run(batcher.submit("文档A")) == "single:文档A"
+    
+    def test_full_batch_flushes_without_waiting(self, monkeypatch):
+        """测试凑满批次立即发送，缺失的文档单独补调"""
+        import time
+        
+        async def call_llm(messages, use_cache=True):
+            content = messages[-1]["content"]
+            if content.startswith("single:"):
+                return content
+            return json.dumps({"documents": [{"id": 1, "companies": ["甲公司"]}]}, ensure_ascii=False)
+        
+        batcher = self._batcher(call_llm, monkeypatch, window_ms="5000", max_docs="2")
+        
+        async def run():
+            return await asyncio.gather(batcher.submit("文档A"), batcher.submit("文档B"))
+        
+        start = time.perf_counter()
+        results = asyncio.run(run())
+        
+        assert time.perf_counter() - start < 1
+        assert json.loads(results[0])["companies"] == ["甲公司"]
+        assert results[1] == "single:文档B"
+    
+    def test_error_propagates_to_all_callers(self, monkeypatch):
+        """测试调用失败时所有等待方收到异常"""
+        async def call_llm(messages, use_cache=True):
+            raise RuntimeError("LLM不可用")
+        
+        batcher = self._batcher(call_llm, monkeypatch)
+        
+        async def run():
+            return await asyncio.gather(batcher.submit("A"), batcher.submit("B"), return_exceptions=True)
+        
+        assert all(isinstance(r, RuntimeError) for r in asyncio.run(run()))
+
+    def test_cache_bypass_applies_to_whole_batch(self, monkeypatch):
+        """测试批内任一请求跳过缓存时合并调用跳过缓存，单独补调按各自的缓存开关"""
+        calls = []
+
+        async def call_llm(messages, use_cache=True):
+            content = messages[-1]["content"]
+            calls.append((content.startswith("single:"), use_cache))
+            if content.startswith("single:"):
+                return content
+            return json.dumps({"documents": [{"id": 2, "companies": ["乙公司"]}]}, ensure_ascii=False)
+
+        batcher = self._batcher(call_llm, monkeypatch)
+
+        async def run():
+            return await asyncio.gather(batcher.submit("文档A"), batcher.submit("文档B", use_cache=False))
+
+        asyncio.run(run())
+
+        assert calls == [(False, False), (True, True)]
+
+    def test_usage_is_attributed_to_submitting_tasks(self, monkeypatch):
+        """测试合并调用的用量上下文包含各文档所属任务，单独补调归属到其任务"""
+        from app.services.llm_usage import current_call_context, llm_call_scope
+
+        contexts = []
+
+        async def call_llm(messages, use_cache=True):
+            content = messages[-1]["content"]
+            contexts.append(dict(current_call_context()))
+            if content.startswith("single:"):
+                return content
+            return json.dumps({"documents": [{"id": 1, "companies": ["甲公司"]}]}, ensure_ascii=False)
+
+        batcher = self._batcher(call_llm, monkeypatch)
+
+        async def submit(task_id, text):
+            with llm_call_scope(task_id, "ner"):
+                return await batcher.submit(text)
+
+        async def run():
+            return await asyncio.gather(submit(1, "文档A"), submit(2, "文档B"))
+
+        asyncio.run(run())
+
+        assert contexts[0]["shares"] == {1: 1, 2: 1}
+        assert contexts[1] == {"task_id": 2, "stage": "ner"}
+
+
+@pytest.mark.unit
+class TestChunkedEntityExtraction:
+    """全文分块实体提取单元测试"""
+    
+    def test_merge_normalizes_and_dedups_variants(self):
+        """测试合并时归一化全半角、括号和公司形式后缀"""
+        from app.services.entity_extractor import merge_entities
+        
+        merged = merge_entities([
+            {"companies": ["华为技术(深圳)有限公司", "ＡＢＣ科技有限公司"], "persons": ["张三"], "organizations": []},
+            {"companies": ["华为技术（深圳）有限公司", "ABC科技有限责任公司"], "persons": [" 张三 ", "李四"]},
+            {"companies": ["华为技术（深圳）有限公司"], "persons": [], "organizations": ["仲裁委员会"]},
+        ])
+        
+        assert merged["companies"] == ["华为技术（深圳）有限公司", "ABC科技有限责任公司"]
+        assert merged["persons"] == ["张三", "李四"]
+        assert merged["organizations"] == ["仲裁委员会"]
+    
+    def test_chunk_text_covers_whole_document_with_overlap(self):
+        """测试分块覆盖全文，相邻块重叠"""
+        from app.services.entity_extractor import chunk_text
+        
+        text = "".join(f"第{i}条 条款内容{'。' * 40}\n" for i in range(200))
+        chunks = chunk_text(text, 1000, overlap=100)
+        
+        assert len(chunks) > 1
+        assert all(len(chunk) <= 1000 for chunk in chunks)
+        assert chunks[0] == text[:len(chunks[0])]
+        assert chunks[-1].endswith(text[-50:])
+        assert chunks[1].startswith(chunks[0][-100:][:20])
+    
+    def test_chunk_text_clamps_overlap_to_half_chunk(self):
+        """测试重叠长度不小于块长度时按块长度的一半截断，分块数不会退化为逐字符推进"""
+        from app.services.entity_extractor import chunk_text
+        
+        text = "本合同条款内容。" * 500
+        chunks = chunk_text(text, 1000, overlap=3000)
+        
+        assert len(chunks) == len(chunk_text(text, 1000, overlap=500))
+        assert len(chunks) < 10
+        assert all(len(chunk) <= 1000 for chunk in chunks)
+        assert chunks[-1].endswith(text[-50:])
+    
+    def test_async_extraction_reads_whole_document(self, ai_service, monkeypatch):
+        """测试异步提取首块先发出，末尾签署页的当事方也被提取"""
+        monkeypatch.setattr(ai_service, "local_ner_enabled", False)
+        monkeypatch.setattr(ai_service, "entity_chunk_chars", 500)
+        monkeypatch.setattr(ai_service, "entity_chunk_overlap", 50)
+        text = "甲方：北京星河科技有限公司\n" + "本合同条款内容。\n" * 150 + "签署页 丙方：上海远洋物流有限公司\n"
+        calls, previews = [], []
+        
+        async def fake_call(messages, temperature=0.7, use_cache=True, stage="default"):
+            content = messages[1]["content"]
+            calls.append(content)
+            companies = [name for name in ["北京星河科技有限公司", "上海远洋物流有限公司"] if name in content]
+            return json.dumps({"companies": companies, "persons": [], "organizations": []}, ensure_ascii=False)
+        
+        async def on_preview(entities):
+            previews.append(entities)
+        
+        monkeypatch.setattr(ai_service, "_acall_openrouter_api", fake_call)
+        entities = asyncio.run(ai_service.extract_entities_ner_async(text, on_preview=on_preview))
+        
+        assert len(calls) > 2
+        assert "北京星河科技有限公司" in calls[0]
+        assert previews == [{"companies": ["北京星河科技有限公司"], "persons": [], "organizations": []}]
+        assert entities["companies"] == ["北京星河科技有限公司", "上海远洋物流有限公司"]
+    
+    def test_failed_chunk_does_not_drop_other_results(self, ai_service, monkeypatch):
+        """测试单个非首块失败时保留其他块的结果"""
+        monkeypatch.setattr(ai_service, "local_ner_enabled", False)
+        monkeypatch.setattr(ai_service, "entity_chunk_chars", 500)
+        text = "甲方：北京星河科技有限公司\n" + "本合同条款内容。\n" * 150
+        
+        def fake_call(messages, temperature=0.7, use_cache=True, stage="default"):
+            if "北京星河" not in messages[1]["content"]:
+                raise RuntimeError("chunk failed")
+            return '{"companies": ["北京星河科技有限公司"], "persons": [], "organizations": []}'
+        
+        monkeypatch.setattr(ai_service, "_call_openrouter_api", fake_call)
+        entities = ai_service.extract_entities_ner(text)
+        
+        assert entities["companies"] == ["北京星河科技有限公司"]
+
+
+async def _run_inline(fn, *args, **kwargs):
+    """在事件循环线程中直接执行（测试库是单连接SQLite，不能在线程池中与测试会话并发使用）"""
+    return fn(*args, **kwargs)
+
+
+@pytest.mark.unit
+class TestReviewQueue:
+    """审查作业队列和worker单元测试"""
+    
+    @pytest.fixture
+    def queue(self, db_session, monkeypatch):
+        from tests.conftest import TestingSessionLocal
+        import app.services.review_queue as review_queue_module
+        
+        monkeypatch.setattr(review_queue_module, "SessionLocal", TestingSessionLocal)
+        monkeypatch.setattr(review_queue_module, "run_blocking", _run_inline)
+        monkeypatch.setenv("REVIEW_QUEUE_MAX_DEPTH", "3")
+        monkeypatch.setenv("REVIEW_MAX_CONCURRENCY", "2")
+        monkeypatch.setenv("REVIEW_ESTIMATED_JOB_SECONDS", "60")
+        return review_queue_module.ReviewQueue()
+    
+    def _task(self, db_session, status="READY"):
+        from app.models import Task
+        
+        task = Task(file_name="contract.pdf", file_path="/tmp/contract.pdf", status=status, role="buyer")
+        db_session.add(task)
+        db_session.commit()
+        return task.id
+    
+    def test_enqueue_is_idempotent_and_bounded(self, queue, db_session):
+        """测试同一任务重复入队返回现有作业，队列满时给出Retry-After估算"""
+        from app.services.review_queue import QueueFullError
+        
+        task_ids = [self._task(db_session) for _ in range(4)]
+        first = queue.enqueue(task_ids[0])
+        
+        assert first["status"] == "QUEUED" and first["position"] == 1
+        assert queue.enqueue(task_ids[0])["job_id"] == first["job_id"]
+        
+        queue.enqueue(task_ids[1])
+        queue.enqueue(task_ids[2])
+        with pytest.raises(QueueFullError) as exc_info:
+            queue.enqueue(task_ids[3])
+        
+        # 3个排队作业 / 并发2 * 60秒
+        assert exc_info.value.retry_after == 90
+    
+    def test_worker_respects_global_concurrency(self, queue, db_session):
+        """测试worker按全局并发上限领取作业并按任务结果结束作业"""
+        from app.models import ReviewJob, Task
+        from app.services.review_queue import ReviewWorker
+        from tests.conftest import TestingSessionLocal
+        
+        task_ids = [self._task(db_session) for _ in range(3)]
+        for task_id in task_ids:
+            queue.enqueue(task_id)
+        
+        started = []
+        
+        async def run_review(task_id, use_cache=True):
+            started.append(task_id)
+            session = TestingSessionLocal()
+            session.query(Task).filter(Task.id == task_id).update({Task.status: "COMPLETED"})
+            session.commit()
+            session.close()
+        
+        async def run():
+            worker = ReviewWorker(run_review, queue=queue, concurrency=5)
+            claimed = await worker.run_once()
+            running = queue.stats()["running"]
+            await worker.drain()
+            claimed_after = await worker.run_once()
+            await worker.drain()
+            return claimed, running, claimed_after
+        
+        first, running, second = asyncio.run(run())
+        db_session.expire_all()
+        
+        assert (first, running, second) == (2, 2, 1)
+        assert started == task_ids
+        assert {job.status for job in db_session.query(ReviewJob).all()} == {"DONE"}
+        assert queue.stats()["wait_p95_seconds"] is not None
+
+    def test_cache_bypass_is_passed_to_review(self, queue, db_session):
+        """测试入队时关闭缓存的作业执行审查时传入use_cache=False，排队中的作业可被后续请求关闭缓存"""
+        from app.services.review_queue import ReviewWorker
+
+        cached_id, bypass_id, upgraded_id = [self._task(db_session) for _ in range(3)]
+        queue.enqueue(cached_id)
+        queue.enqueue(bypass_id, use_cache=False)
+        first = queue.enqueue(upgraded_id)
+        assert queue.enqueue(upgraded_id, use_cache=False)["job_id"] == first["job_id"]
+
+        run_review = AsyncMock()
+
+        async def run():
+            worker = ReviewWorker(run_review, queue=queue, concurrency=3)
+            # 全局并发上限为2，分两轮领取
+            for _ in range(2):
+                await worker.run_once()
+                await worker.drain()
+
+        asyncio.run(run())
+
+        calls = {call.args[0]: call.kwargs["use_cache"] for call in run_review.await_args_list}
+        assert calls == {cached_id: True, bypass_id: False, upgraded_id: False}
+
+    def test_worker_queue_calls_do_not_block_event_loop(self):
+        """测试worker的队列操作（如等待领取锁）在线程池执行，不阻塞事件循环"""
+        import time
+        from app.services.review_queue import ReviewWorker
+        
+        fake_queue = MagicMock()
+        fake_queue.cancel_requested.return_value = []
+        fake_queue.claim.side_effect = lambda worker_id, limit: time.sleep(0.3) or []
+        
+        async def run():
+            worker = ReviewWorker(AsyncMock(), queue=fake_queue, concurrency=1)
+            ticks = 0
+            
+            async def ticker():
+                nonlocal ticks
+                while True:
+                    await asyncio.sleep(0.01)
+                    ticks += 1
+            
+            tick = asyncio.ensure_future(ticker())
+            await worker.run_once()
+            tick.cancel()
+            return ticks
+        
+        assert asyncio.run(run()) >= 10
+        fake_queue.claim.assert_called_once()
+    
+    def test_stale_running_job_is_requeued(self, queue, db_session):
+        """测试心跳超时的作业重新入队，超过尝试次数后标记失败"""
+        from datetime import datetime, timedelta
+        from app.models import ReviewJob, Task
+        
+        task_id = self._task(db_session)
+        queue.enqueue(task_id)
+        job = queue.claim("worker-a", 1)[0]
+        
+        stale = datetime.utcnow() - timedelta(seconds=queue.stale_seconds + 1)
+        db_session.query(ReviewJob).filter(ReviewJob.id == job.id).update({ReviewJob.heartbeat_at: stale})
+        db_session.commit()
+        
+        assert queue.requeue_stale() == 1
+        db_session.expire_all()
+        assert db_session.get(ReviewJob, job.id).status == "QUEUED"
+        assert db_session.get(Task, task_id).status == "QUEUED"
+        
+        queue.max_attempts = 1
+        queue.claim("worker-b", 1)
+        db_session.query(ReviewJob).filter(ReviewJob.id == job.id).update({ReviewJob.heartbeat_at: stale})
+        db_session.commit()
+        queue.requeue_stale()
+        db_session.expire_all()
+        
+        assert db_session.get(ReviewJob, job.id).status == "FAILED"
+        assert db_session.get(Task, task_id).status == "FAILED"
+    
+    def test_review_endpoint_returns_503_when_full(self, queue, client, db_session, monkeypatch):
+        """测试队列已满时审查接口返回503和Retry-After"""
+        import app.routes.review as review_routes
+        
+        monkeypatch.setattr(review_routes, "get_review_queue", lambda: queue)
+        queue.max_depth = 1
+        first, second = self._task(db_session), self._task(db_session)
+        
+        response = client.post("/api/v1/review", json={"task_id": first})
+        assert response.status_code == 200
+        assert response.json()["status"] == "QUEUED"
+        
+        response = client.post("/api/v1/review", json={"task_id": second})
+        assert response.status_code == 503
+        assert int(response.headers["Retry-After"]) >= 1
+
+    
+    def _user_task(self, db_session, user_id):
+        from app.models import Task
+        
+        task = Task(file_name="contract.pdf", file_path="/tmp/contract.pdf", status="READY",
+                    role="buyer", user_id=user_id)
+        db_session.add(task)
+        db_session.commit()
+        return task.id
+    
+    def test_pick_fair_share_interleaves_users_and_classes(self):
+        """测试公平挑选：类别按权重分配，类别内按用户轮流，单用户不超过并发上限"""
+        from types import SimpleNamespace
+        from app.services.review_queue import pick_fair_share
+        
+        queued = [SimpleNamespace(id=i, user_id=1, priority="bulk") for i in range(1, 7)]
+        queued += [SimpleNamespace(id=10, user_id=2, priority="interactive"),
+                   SimpleNamespace(id=11, user_id=3, priority="interactive"),
+                   SimpleNamespace(id=12, user_id=2, priority="interactive")]
+        weights = {"interactive": 2.0, "bulk": 1.0}
+        
+        picked = pick_fair_share(queued, [], 4, 2, weights)
+        assert [job.id for job in picked] == [10, 1, 11, 12]
+        
+        # 用户1已有2个运行中作业，只能继续挑其他用户的作业
+        picked = pick_fair_share(queued, [(1, "bulk"), (1, "bulk")], 4, 2, weights)
+        assert [job.id for job in picked] == [10, 11, 12]
+    
+    def test_bulk_batch_does_not_starve_other_users(self, queue, db_session):
+        """测试一个用户的大批量作业不会挡住其他用户后提交的交互式作业"""
+        queue.max_concurrency = 3
+        queue.user_max_concurrency = 2
+        queue.bulk_max_depth = 100
+        bulk = [self._user_task(db_session, 1) for _ in range(20)]
+        for task_id in bulk:
+            queue.enqueue(task_id, priority="bulk")
+        interactive = self._user_task(db_session, 2)
+        queue.enqueue(interactive)
+        
+        claimed = queue.claim("worker-a", 3)
+        
+        assert [job.task_id for job in claimed] == [interactive, bulk[0], bulk[1]]
+        assert queue.claim("worker-a", 3) == []
+        stats = queue.stats()
+        assert stats["classes"]["bulk"]["depth"] == 18
+        assert stats["classes"]["interactive"]["running"] == 1
+        assert stats["classes"]["interactive"]["wait_p95_seconds"] is not None
+    
+    def test_review_endpoint_returns_429_for_user_quota(self, queue, client, db_session, monkeypatch):
+        """测试单用户排队数超限时返回429，其他用户不受影响"""
+        import app.routes.review as review_routes
+        
+        monkeypatch.setattr(review_routes, "get_review_queue", lambda: queue)
+        queue.user_max_queued = 1
+        first, second, other = (self._user_task(db_session, 7), self._user_task(db_session, 7),
+                                self._user_task(db_session, 8))
+        
+        assert client.post("/api/v1/review", json={"task_id": first, "priority": "bulk"}).status_code == 200
+        response = client.post("/api/v1/review", json={"task_id": second, "priority": "bulk"})
+        assert response.status_code == 429
+        assert int(response.headers["Retry-After"]) >= 1
+        assert client.post("/api/v1/review", json={"task_id": other, "priority": "urgent"}).status_code == 400
+        assert client.post("/api/v1/review", json={"task_id": other}).status_code == 200
+
+@pytest.mark.unit
+class TestReviewCheckpoints:
+    """审查流水线检查点单元测试"""
+    
+    def test_stage_input_hash_is_stable(self):
+        """测试输入哈希与字典键顺序无关，内容变化时改变"""
+        from app.services.review_checkpoints import stage_input_hash
+        
+        assert stage_input_hash({"a": 1, "b": 2}, "x") == stage_input_hash({"b": 2, "a": 1}, "x")
+        assert stage_input_hash(["段落一"]) != stage_input_hash(["段落二"])
+    
+    def test_vectorize_replaces_existing_paragraphs(self, ai_service, patched_session_local, make_task,
+                                                    monkeypatch):
+        """测试重复向量化替换而不是追加段落"""
+        from app.models import Paragraph
+        
+        task_id = make_task(ocr_text="")
+        monkeypatch.setattr(ai_service, "get_embedding_sync", lambda text: [0.0] * 1536)
+        
+        ai_service.vectorize_paragraphs(task_id, ["第一条", "第二条", "第三条"])
+        ai_service.vectorize_paragraphs(task_id, ["第一条", "第二条"])
+        
+        texts = [p.text for p in patched_session_local.query(Paragraph).filter(Paragraph.task_id == task_id)
+                 .order_by(Paragraph.paragraph_index)]
+        assert texts == ["第一条", "第二条"]
+    
+    def test_resumed_pipeline_skips_completed_stages(self, review_service, patched_session_local, make_task,
+                                                     monkeypatch):
+        """测试分析失败后重试只重做分析阶段，全部完成后再次执行不重复任何阶段"""
+        import app.services.review_service as review_service_module
+        from app.models import Task
+        
+        task_id = make_task(ocr_text="第一条 付款\n\n第二条 验收\n\n第三条 违约责任")
+        monkeypatch.setenv("CPU_POOL_WORKERS", "0")
+        fake_ai = MagicMock()
+        fake_ai.analysis_mode = "map_reduce"
+        fake_ai.avectorize_paragraphs = AsyncMock()
+        fake_ai.analyze_contract_risks_async = AsyncMock(side_effect=[RuntimeError("LLM超时"), [{"title": "风险"}]])
+        monkeypatch.setattr(review_service_module, "get_ai_service", lambda: fake_ai)
+        monkeypatch.setattr(review_service, "streaming_pipeline", False)
+        monkeypatch.setattr(review_service_module.manager, "send_progress", AsyncMock())
+        
+        with pytest.raises(RuntimeError):
+            asyncio.run(review_service._run_review_pipeline(task_id))
+        asyncio.run(review_service._run_review_pipeline(task_id))
+        asyncio.run(review_service._run_review_pipeline(task_id))
+        
+        assert fake_ai.avectorize_paragraphs.call_count == 1
+        assert fake_ai.analyze_contract_risks_async.call_count == 2
+        assert fake_ai.clear_task_risks.call_count == 2
+        patched_session_local.expire_all()
+        assert patched_session_local.get(Task, task_id).status == "COMPLETED"
+        
+        from app.services.review_checkpoints import get_checkpoint_store
+        stages = get_checkpoint_store().completed_stages(task_id)
+        assert set(stages) == {"ocr", "segmentation", "vectorize", "analysis"}
+        assert stages["analysis"]["output"] == {"risks": 1}
+    
+    def test_ocr_checkpoint_hashes_file_inputs(self, review_service, patched_session_local, make_task,
+                                               monkeypatch):
+        """测试OCR阶段检查点按文件输入（路径、内容哈希、大小）计算哈希，而不是按提取出的文本"""
+        import app.services.review_service as review_service_module
+        from app.models import File, ReviewCheckpoint
+        from app.services.review_checkpoints import stage_input_hash
+        
+        text = "第一条 付款\n\n第二条 验收"
+        task_id = make_task(ocr_text=text)
+        monkeypatch.setenv("CPU_POOL_WORKERS", "0")
+        fake_ai = MagicMock()
+        fake_ai.analysis_mode = "map_reduce"
+        fake_ai.avectorize_paragraphs = AsyncMock()
+        fake_ai.analyze_contract_risks_async = AsyncMock(return_value=[])
+        monkeypatch.setattr(review_service_module, "get_ai_service", lambda: fake_ai)
+        monkeypatch.setattr(review_service, "streaming_pipeline", False)
+        monkeypatch.setattr(review_service_module.manager, "send_progress", AsyncMock())
+        
+        asyncio.run(review_service._run_review_pipeline(task_id))
+        
+        checkpoint = patched_session_local.query(ReviewCheckpoint).filter(
+            ReviewCheckpoint.task_id == task_id, ReviewCheckpoint.stage == "ocr"
+        ).one()
+        assert checkpoint.input_hash == review_service._ocr_input_hash(task_id)
+        assert checkpoint.input_hash != stage_input_hash(text)
+        
+        file_record = patched_session_local.query(File).filter(File.task_id == task_id).one()
+        file_record.content_hash = "b" * 64
+        patched_session_local.commit()
+        assert review_service._ocr_input_hash(task_id) != checkpoint.input_hash
+
+
+@pytest.mark.unit
+class TestAsyncPipeline:
+    """审查流水线不阻塞事件循环的单元测试"""
+    
+    def test_cpu_bound_work_runs_in_process_pool(self, monkeypatch):
+        """测试CPU密集任务在子进程中执行"""
+        from app.services.executors import run_cpu_bound, shutdown_executors
+        
+        monkeypatch.setenv("CPU_POOL_WORKERS", "1")
+        try:
+            child_pid = asyncio.run(run_cpu_bound(os.getpid))
+        finally:
+            shutdown_executors()
+        
+        assert child_pid != os.getpid()
+    
+    def test_event_loop_stays_responsive_during_review(self, review_service, patched_session_local, make_task,
+                                                        monkeypatch):
+        """测试审查期间事件循环延迟保持在较低水平"""
+        import time
+        import app.services.review_service as review_service_module
+        from app.models import Task
+        
+        monkeypatch.setenv("CPU_POOL_WORKERS", "0")
+        task_id = make_task()
+        
+        def slow_extract(path):
+            time.sleep(0.3)
+            return "第一条 甲方应在验收合格后三十日内付清全部合同价款。\n\n第二条 乙方逾期交付的按日支付违约金。"
+        
+        async def slow_vectorize(task_id, paragraphs):
+            await review_service_module.run_blocking(time.sleep, 0.2)
+        
+        fake_ai = MagicMock()
+        fake_ai.analysis_mode = "map_reduce"
+        fake_ai.avectorize_paragraphs = slow_vectorize
+        fake_ai.clear_task_risks = lambda task_id: time.sleep(0.1)
+        fake_ai.analyze_contract_risks_async = AsyncMock(return_value=[])
+        monkeypatch.setattr(review_service_module, "extract_text", slow_extract)
+        monkeypatch.setattr(review_service, "streaming_pipeline", False)
+        monkeypatch.setattr(review_service_module, "get_ai_service", lambda: fake_ai)
+        monkeypatch.setattr(review_service_module.manager, "send_progress", AsyncMock())
+        monkeypatch.setattr(review_service_module.manager, "send_completion", AsyncMock())
+        
+        async def run():
+            max_lag = 0.0
+            done = asyncio.Event()
+            
+            async def ticker():
+                nonlocal max_lag
+                interval = 0.01
+                while not done.is_set():
+                    expected = time.perf_counter() + interval
+                    await asyncio.sleep(interval)
+                    max_lag = max(max_lag, time.perf_counter() - expected)
+            
+            tick = asyncio.ensure_future(ticker())
+            start = time.perf_counter()
+            await review_service.start_review(task_id)
+            elapsed = time.perf_counter() - start
+            done.set()
+            await tick
+            return elapsed, max_lag
+        
+        elapsed, max_lag = asyncio.run(run())
+        patched_session_local.expire_all()
+        
+        assert patched_session_local.get(Task, task_id).status == "COMPLETED"
+        assert elapsed >= 0.6
+        assert max_lag < 0.1
+
+
+@pytest.mark.unit
+class TestStreamingPipeline:
+    """流式审查流水线单元测试"""
+    
+    def _fake_ai(self, analyze_delay=0.0, append_delay=0.0, events=None):
+        import time
+        from types import SimpleNamespace
+        
+        class FakeAI:
+            analysis_mode = "map_reduce"
+            
+            def __init__(self):
+                self.stored = []
+                self.delete_task_paragraphs = MagicMock()
+                self.clear_task_risks = MagicMock()
+                self.avectorize_paragraphs = AsyncMock()
+                self.analyze_contract_risks_async = AsyncMock(return_value=[])
+            
+            def append_paragraphs(self, task_id, start_index, paragraphs, embeddings):
+                time.sleep(append_delay)
+                rows = [SimpleNamespace(id=start_index + i + 1, text=text, paragraph_index=start_index + i)
+                        for i, text in enumerate(paragraphs)]
+                self.stored.extend(rows)
+                return rows
+            
+            async def analyze_paragraph_stream(self, task_id, paragraphs, contract_type, role,
+                                               use_cache=True, on_risk=None):
+                risks = []
+                async for paragraph in paragraphs:
+                    if events is not None:
+                        events.append(("analyze", time.perf_counter()))
+                    await asyncio.sleep(analyze_delay)
+                    risks.append({"title": paragraph.text[:4], "paragraph_refs": [paragraph.id]})
+                return risks
+        
+        return FakeAI()
+    
+    def test_paragraph_chunker_matches_chunk_paragraphs(self):
+        """测试增量切块与一次性切块结果一致"""
+        from types import SimpleNamespace
+        from app.services.risk_analysis import ParagraphChunker, chunk_paragraphs
+        
+        paragraphs = [SimpleNamespace(text=text) for text in [
+            "第一条 付款方式" + "甲" * 40, "付款细则" + "乙" * 70, "第二条 交付" + "丙" * 20,
+            "第三条 违约责任" + "丁" * 90, "补充说明" + "戊" * 10,
+        ]]
+        chunker = ParagraphChunker(100)
+        incremental = [chunk for chunk in map(chunker.add, paragraphs) if chunk] + [chunker.flush()]
+        
+        assert incremental == chunk_paragraphs(paragraphs, 100)
+        assert chunker.flush() is None
+    
+    def test_cached_text_pages_split_like_whole_document(self):
+        """测试已有文本切成伪页后逐页分段与整篇分段一致"""
+        from app.services.file_service import split_paragraphs
+        from app.services.streaming_pipeline import split_cached_text
+        
+        text = "\n\n".join(f"第{i}条 双方约定的第{i}项权利义务条款内容" for i in range(1, 30))
+        pages = split_cached_text(text, 100)
+        
+        assert len(pages) > 1
+        assert "\n\n".join(pages) == text
+        assert [p for page in pages for p in split_paragraphs(page)] == split_paragraphs(text)
+    
+    def test_stages_overlap(self, monkeypatch):
+        """测试分析在提取完成前开始，总耗时明显小于各阶段耗时之和"""
+        import time
+        import app.services.streaming_pipeline as streaming_module
+        from app.services.streaming_pipeline import StreamingReviewPipeline
+        
+        monkeypatch.setenv("CPU_POOL_WORKERS", "0")
+        monkeypatch.setenv("STREAM_EXTRACT_CONCURRENCY", "1")
+        events = []
+        
+        def slow_page(path, index, page_count):
+            time.sleep(0.1)
+            events.append(("extract", time.perf_counter()))
+            return f"第{index + 1}条 乙方应按照本合同约定的期限和质量标准交付第{index + 1}批货物"
+        
+        monkeypatch.setattr(streaming_module, "count_pages", lambda path: 5)
+        monkeypatch.setattr(streaming_module, "extract_page_text", slow_page)
+        fake_ai = self._fake_ai(analyze_delay=0.1, append_delay=0.1, events=events)
+        
+        start = time.perf_counter()
+        result = asyncio.run(StreamingReviewPipeline(fake_ai).run(1, "/tmp/contract.pdf", None, "采购合同", "buyer"))
+        elapsed = time.perf_counter() - start
+        
+        first_analyzed = min(t for stage, t in events if stage == "analyze")
+        last_extracted = max(t for stage, t in events if stage == "extract")
+        assert first_analyzed < last_extracted
+        assert elapsed < 1.1  # 顺序执行约1.5秒
+        assert len(result["paragraphs"]) == 5 and len(result["risks"]) == 5
+        assert result["extracted"] is True
+        assert [row.paragraph_index for row in fake_ai.stored] == list(range(5))
+        fake_ai.delete_task_paragraphs.assert_called_once_with(1)
+    
+    def test_failed_stage_cancels_pipeline(self, monkeypatch):
+        """测试任一阶段失败时整个流水线立即失败而不是挂起"""
+        import app.services.streaming_pipeline as streaming_module
+        from app.services.streaming_pipeline import StreamingReviewPipeline
+        
+        monkeypatch.setenv("CPU_POOL_WORKERS", "0")
+        fake_ai = self._fake_ai()
+        fake_ai.append_paragraphs = MagicMock(side_effect=RuntimeError("数据库不可用"))
+        text = "\n\n".join(f"第{i}条 双方约定的第{i}项权利义务条款内容" for i in range(1, 200))
+        
+        with pytest.raises(RuntimeError, match="数据库不可用"):
+            asyncio.run(asyncio.wait_for(
+                StreamingReviewPipeline(fake_ai).run(1, None, text, "采购合同", "buyer"), timeout=5
+            ))
+    
+    def test_streamed_review_records_checkpoints(self, review_service, patched_session_local, make_task, monkeypatch):
+        """测试流式审查补记检查点，再次执行时走逐阶段路径并跳过全部阶段"""
+        import app.services.review_checkpoints as checkpoints_module
+        import app.services.review_service as review_service_module
+        from app.models import Task
+        
+        monkeypatch.setenv("CPU_POOL_WORKERS", "0")
+        monkeypatch.setattr(review_service_module.manager, "send_progress", AsyncMock())
+        monkeypatch.setattr(review_service_module.manager, "send_completion", AsyncMock())
+        fake_ai = self._fake_ai()
+        monkeypatch.setattr(review_service_module, "get_ai_service", lambda: fake_ai)
+        
+        text = "第一条 甲方应在验收合格后三十日内付清全部合同价款。\n\n第二条 乙方逾期交付的，每日按合同总价的千分之一支付违约金。"
+        task_id = make_task(ocr_text=text)
+        
+        asyncio.run(review_service._run_review_pipeline(task_id))
+        asyncio.run(review_service._run_review_pipeline(task_id))
+        patched_session_local.expire_all()
+        
+        assert len(fake_ai.stored) == 2
+        assert set(checkpoints_module.get_checkpoint_store().completed_stages(task_id)) == {
+            "ocr", "segmentation", "vectorize", "analysis"
+        }
+        fake_ai.avectorize_paragraphs.assert_not_called()
+        fake_ai.analyze_contract_risks_async.assert_not_called()
+        review_service_module.manager.send_completion.assert_awaited_with(
+            task_id, {"risks_count": 2, "message": "合同审查已完成"}
+        )
+        assert patched_session_local.get(Task, task_id).status == "COMPLETED"
+
+@pytest.mark.unit
+class TestIncrementalReview:
+    """修订稿增量复审单元测试"""
+    
+    CLAUSES = [
+        f"第{i}条 双方就第{i}项事宜约定：乙方应在收到甲方书面通知后{i + 5}个工作日内完成相应义务。"
+        for i in range(1, 21)
+    ]
+    
+    @pytest.fixture
+    def incremental_db(self, patched_session_local, monkeypatch):
+        monkeypatch.setenv("CPU_POOL_WORKERS", "0")
+        return patched_session_local
+    
+    def _paragraphs(self, db_session, task_id, texts):
+        from app.models import Paragraph
+        
+        db_session.add_all([Paragraph(task_id=task_id, text=text, paragraph_index=i) for i, text in enumerate(texts)])
+        db_session.commit()
+        return [p.id for p in db_session.query(Paragraph).filter(Paragraph.task_id == task_id)
+                .order_by(Paragraph.paragraph_index)]
+    
+    def _risk(self, db_session, task_id, title, refs, laws=()):
+        from app.models import Risk, Statute
+        
+        risk = Risk(task_id=task_id, title=title, risk_level="MEDIUM", summary=title, suggestion="",
+                    clause_id="", paragraph_refs=refs)
+        db_session.add(risk)
+        db_session.commit()
+        db_session.add_all([Statute(risk_id=risk.id, statute_ref=law, statute_text="") for law in laws])
+        db_session.commit()
+    
+    def test_diff_paragraphs(self):
+        """测试段落比对识别未改动、移动、修改、新增和删除的条款"""
+        from app.services.clause_diff import diff_paragraphs
+        
+        old = self.CLAUSES[:5]
+        new = [old[0], old[1].replace("书面通知", "书面或电子邮件通知"), old[3], old[2],
+               "第九十九条 本合同未尽事宜由双方另行签订补充协议，补充协议与本合同具有同等法律效力。", old[4] + " "]
+        
+        diff = diff_paragraphs(old, new)
+        
+        assert diff.unchanged == {0: 0, 2: 3, 3: 2, 5: 4}
+        assert diff.modified == {1: 1}
+        assert diff.added == [4]
+        assert diff.removed == []
+        assert diff.changed == [1, 4]
+    
+    def test_only_changed_clauses_are_analyzed(self, ai_service, incremental_db, make_task, monkeypatch):
+        """测试5%改动只分析改动条款，未改动条款的风险沿用并换成新段落ID"""
+        from app.models import Risk
+        
+        base_id = make_task(status="COMPLETED", with_file=False)
+        base_ids = self._paragraphs(incremental_db, base_id, self.CLAUSES)
+        self._risk(incremental_db, base_id, "付款期限风险", [base_ids[2]], laws=["民法典第509条"])
+        self._risk(incremental_db, base_id, "通知义务风险", [base_ids[7]])
+        revised = list(self.CLAUSES)
+        revised[7] = revised[7].replace("书面通知", "口头或书面通知")
+        new_id = make_task(status="IN_PROGRESS", with_file=False, parent_task_id=base_id)
+        new_ids = self._paragraphs(incremental_db, new_id, revised)
+        
+        ai_service.streaming = False
+        ai_service._acall_openrouter_api = AsyncMock(return_value=json.dumps({"risks": [{
+            "title": "口头通知举证风险", "risk_level": "HIGH", "summary": "口头通知难以举证",
+            "suggestion": "删除口头通知", "related_laws": [], "paragraph_ids": [new_ids[7]]
+        }]}, ensure_ascii=False))
+        
+        risks, summary = asyncio.run(ai_service.analyze_contract_risks_incremental(new_id, base_id, "采购合同", "buyer"))
+        
+        assert ai_service._acall_openrouter_api.await_count == 1
+        prompt = ai_service._acall_openrouter_api.await_args.args[0][1]["content"]
+        assert revised[7] in prompt and self.CLAUSES[2] not in prompt
+        assert summary["mode"] == "incremental"
+        assert (summary["unchanged"], summary["modified"], summary["carried_risks"]) == (19, 1, 1)
+        
+        stored = {r.title: r for r in incremental_db.query(Risk).filter(Risk.task_id == new_id)}
+        assert set(stored) == {"付款期限风险", "口头通知举证风险"}
+        assert stored["付款期限风险"].paragraph_refs == [new_ids[2]]
+        assert stored["口头通知举证风险"].paragraph_refs == [new_ids[7]]
+        assert len(risks) == 2
+    
+    def test_large_change_falls_back_to_full_review(self, ai_service, incremental_db, make_task):
+        """测试改动比例过大时退回全量分析"""
+        base_id = make_task(status="COMPLETED", with_file=False)
+        self._paragraphs(incremental_db, base_id, self.CLAUSES[:4])
+        new_id = make_task(status="IN_PROGRESS", with_file=False, parent_task_id=base_id)
+        self._paragraphs(incremental_db, new_id, [text[::-1] for text in self.CLAUSES[:4]])
+        ai_service.analyze_contract_risks_async = AsyncMock(return_value=[])
+        
+        _, summary = asyncio.run(ai_service.analyze_contract_risks_incremental(new_id, base_id, "采购合同", "buyer"))
+        
+        assert summary["mode"] == "full"
+        ai_service.analyze_contract_risks_async.assert_awaited_once()
+    
+    def test_base_task_requires_completed_review_with_same_role(self, review_service, incremental_db, make_task):
+        """测试只有已完成且角色一致的上一版任务才作为增量基准"""
+        from app.models import Task
+        
+        base_id = make_task(status="COMPLETED", with_file=False)
+        new_id = make_task(status="READY", with_file=False, parent_task_id=base_id)
+        
+        assert review_service._get_base_task_id(new_id) == base_id
+        
+        incremental_db.query(Task).filter(Task.id == base_id).update({Task.role: "seller"})
+        incremental_db.commit()
+        assert review_service._get_base_task_id(new_id) is None
+
+        incremental_db.query(Task).filter(Task.id == base_id).update({Task.role: "buyer", Task.user_id: 2})
+        incremental_db.commit()
+        assert review_service._get_base_task_id(new_id) is None
+
+
+@pytest.mark.unit
+class TestSharedDocuments:
+    """文档级段落共享和审查结果缓存单元测试"""
+    
+    TEXT = ("第一条 甲方应在验收合格后三十日内付清全部合同价款。\n\n"
+            "第二条 乙方逾期交付的，每逾期一日按合同总价的千分之一支付违约金。")
+    
+    @pytest.fixture
+    def document_db(self, patched_session_local, monkeypatch):
+        import app.services.review_service as review_service_module
+        
+        monkeypatch.setenv("CPU_POOL_WORKERS", "0")
+        monkeypatch.setattr(review_service_module.manager, "send_progress", AsyncMock())
+        monkeypatch.setattr(review_service_module.manager, "send_completion", AsyncMock())
+        return patched_session_local
+    
+    def _fake_ai(self, db_session):
+        from app.models import Paragraph
+        
+        async def vectorize(task_id, paragraphs):
+            db_session.add_all([Paragraph(task_id=task_id, text=text, paragraph_index=i)
+                                for i, text in enumerate(paragraphs)])
+            db_session.commit()
+        
+        async def analyze(task_id, contract_type, role, use_cache=True, on_risk=None, paragraphs_task_id=None):
+            second = db_session.query(Paragraph).filter(Paragraph.task_id == paragraphs_task_id,
+                                                        Paragraph.paragraph_index == 1).one()
+            return [{"id": 1, "title": f"{role}违约金风险", "risk_level": "HIGH", "summary": "违约金偏低",
+                     "suggestion": "", "related_laws": [], "paragraph_refs": [second.id]}]
+        
+        fake_ai = MagicMock()
+        fake_ai.analysis_mode = "map_reduce"
+        fake_ai.avectorize_paragraphs = AsyncMock(side_effect=vectorize)
+        fake_ai.analyze_contract_risks_async = AsyncMock(side_effect=analyze)
+        fake_ai.save_task_risks = MagicMock(side_effect=lambda task_id, risks: risks)
+        return fake_ai
+    
+    def test_role_switch_reuses_document_paragraphs(self, review_service, document_db, make_task, monkeypatch):
+        """测试同一文档换角色审查只做风险分析，段落和向量复用首次审查的结果"""
+        import app.services.review_service as review_service_module
+        from app.models import Task
+        
+        fake_ai = self._fake_ai(document_db)
+        monkeypatch.setattr(review_service_module, "get_ai_service", lambda: fake_ai)
+        monkeypatch.setattr(review_service, "streaming_pipeline", False)
+        buyer_id = make_task(role="buyer", ocr_text=self.TEXT, content_hash="a" * 64)
+        seller_id = make_task(role="seller", ocr_text=self.TEXT, content_hash="a" * 64)
+        
+        asyncio.run(review_service._run_review_pipeline(buyer_id))
+        asyncio.run(review_service._run_review_pipeline(seller_id))
+        
+        assert fake_ai.avectorize_paragraphs.await_count == 1
+        assert fake_ai.analyze_contract_risks_async.await_count == 2
+        assert fake_ai.analyze_contract_risks_async.await_args.kwargs["paragraphs_task_id"] == buyer_id
+        document_db.expire_all()
+        buyer, seller = document_db.get(Task, buyer_id), document_db.get(Task, seller_id)
+        assert buyer.document_id == seller.document_id is not None
+        assert seller.status == "COMPLETED"
+    
+    def test_same_review_is_served_from_result_cache(self, review_service, document_db, make_task, monkeypatch):
+        """测试相同文档、角色、合同类型的再次审查命中结果缓存，不调用LLM"""
+        import app.services.review_service as review_service_module
+        from app.models import Paragraph
+        
+        fake_ai = self._fake_ai(document_db)
+        monkeypatch.setattr(review_service_module, "get_ai_service", lambda: fake_ai)
+        monkeypatch.setattr(review_service, "streaming_pipeline", False)
+        first_id = make_task(role="buyer", ocr_text=self.TEXT, content_hash="a" * 64)
+        second_id = make_task(role="buyer", ocr_text=self.TEXT, content_hash="a" * 64)
+        
+        asyncio.run(review_service._run_review_pipeline(first_id))
+        asyncio.run(review_service._run_review_pipeline(second_id))
+        
+        assert fake_ai.analyze_contract_risks_async.await_count == 1
+        saved_task_id, saved = fake_ai.save_task_risks.call_args.args
+        shared = document_db.query(Paragraph).filter(Paragraph.task_id == first_id,
+                                                     Paragraph.paragraph_index == 1).one()
+        assert saved_task_id == second_id
+        assert saved[0]["title"] == "buyer违约金风险"
+        assert saved[0]["paragraph_refs"] == [shared.id]
+        assert "id" not in saved[0]
+    
+    def test_task_without_content_hash_has_no_document(self, document_db, make_task):
+        """测试没有内容哈希的历史文件不关联文档"""
+        from app.services.document_service import get_document_service
+        
+        task_id = make_task(status="READY")
+        
+        assert get_document_service().ensure_task_document(task_id) is None
+
+
+@pytest.mark.unit
+class TestPipelineMetrics:
+    """审查流水线指标单元测试"""
+    
+    def _sample(self, name, labels=None):
+        from prometheus_client import REGISTRY
+        return REGISTRY.get_sample_value(name, labels or {}) or 0.0
+    
+    def test_sequential_review_records_stage_durations(self, review_service, patched_session_local, make_task,
+                                                        monkeypatch):
+        """测试逐阶段审查记录各阶段耗时、整体耗时和OCR页数"""
+        import app.services.review_service as review_service_module
+        
+        monkeypatch.setenv("CPU_POOL_WORKERS", "0")
+        task_id = make_task()
+        
+        fake_ai = MagicMock()
+        fake_ai.analysis_mode = "map_reduce"
+        fake_ai.avectorize_paragraphs = AsyncMock()
+        fake_ai.analyze_contract_risks_async = AsyncMock(return_value=[])
+        monkeypatch.setattr(review_service_module, "extract_text",
+                            lambda path: "第一条 甲方应在验收合格后三十日内付清全部合同价款。")
+        monkeypatch.setattr(review_service_module, "count_pages", lambda path: 3)
+        monkeypatch.setattr(review_service, "streaming_pipeline", False)
+        monkeypatch.setattr(review_service_module, "get_ai_service", lambda: fake_ai)
+        monkeypatch.setattr(review_service_module.manager, "send_progress", AsyncMock())
+        monkeypatch.setattr(review_service_module.manager, "send_completion", AsyncMock())
+        
+        stages = ("ocr", "segmentation", "vectorize", "analysis")
+        before = {stage: self._sample("review_stage_duration_seconds_count", {"stage": stage}) for stage in stages}
+        reviews_before = self._sample("review_duration_seconds_count", {"mode": "sequential"})
+        pages_before = self._sample("ocr_pages_total")
+        
+        asyncio.run(review_service._run_review_pipeline(task_id))
+        
+        for stage in stages:
+            assert self._sample("review_stage_duration_seconds_count", {"stage": stage}) == before[stage] + 1
+        assert self._sample("review_duration_seconds_count", {"mode": "sequential"}) == reviews_before + 1
+        assert self._sample("ocr_pages_total") == pages_before + 3
+    
+    def test_llm_call_latency_by_model(self):
+        """测试模型路由记录按模型和结果区分的调用耗时"""
+        from app.services.model_router import ModelRouter
+        
+        labels = {"model": "test/latency-model", "outcome": "error"}
+        before = self._sample("llm_call_duration_seconds_count", labels)
+        
+        ModelRouter().record("test/latency-model", 1500, success=False)
+        
+        assert self._sample("llm_call_duration_seconds_count", labels) == before + 1
+        assert self._sample("llm_call_duration_seconds_bucket", {**labels, "le": "2.5"}) >= 1
+    
+    def test_websocket_connection_gauge(self):
+        """测试WebSocket连接数随连接和断开增减"""
+        from app.websocket_manager import ConnectionManager
+        
+        connections = ConnectionManager()
+        websocket = AsyncMock()
+        before = self._sample("websocket_connections_active")
+        
+        asyncio.run(connections.connect(1, websocket))
+        assert self._sample("websocket_connections_active") == before + 1
+        connections.disconnect(1, websocket)
+        connections.disconnect(1, websocket)
+        assert self._sample("websocket_connections_active") == before
+
+
+@pytest.mark.unit
+class TestReviewCancellation:
+    """审查取消单元测试"""
+    
+    @pytest.fixture
+    def queue(self, db_session, monkeypatch):
+        from tests.conftest import TestingSessionLocal
+        import app.services.review_queue as review_queue_module
+        import app.services.review_service as review_service_module
+        
+        for module in (review_queue_module, review_service_module):
+            monkeypatch.setattr(module, "SessionLocal", TestingSessionLocal)
+        monkeypatch.setattr(review_queue_module, "run_blocking", _run_inline)
+        queue = review_queue_module.ReviewQueue()
+        monkeypatch.setattr(review_service_module, "get_review_queue", lambda: queue)
+        return queue
+    
+    def _task(self, db_session):
+        from app.models import Task
+        
+        task = Task(file_name="contract.pdf", file_path="/tmp/contract.pdf", status="READY", role="buyer")
+        db_session.add(task)
+        db_session.commit()
+        return task.id
+    
+    def test_cancel_queued_review(self, queue, client, db_session):
+        """测试排队中的审查立即取消，没有进行中的审查时返回409，取消后可重新提交"""
+        from app.models import ReviewJob, Task
+        
+        task_id = self._task(db_session)
+        queue.enqueue(task_id)
+        
+        response = client.post(f"/api/v1/review/{task_id}/cancel")
+        
+        assert response.status_code == 200
+        assert response.json()["status"] == "CANCELLED"
+        db_session.expire_all()
+        assert db_session.get(Task, task_id).status == "CANCELLED"
+        assert db_session.query(ReviewJob).filter(ReviewJob.task_id == task_id).one().status == "CANCELLED"
+        assert queue.claim("worker-a", 1) == []
+        assert client.post(f"/api/v1/review/{task_id}/cancel").status_code == 409
+        assert queue.enqueue(task_id)["status"] == "QUEUED"
+    
+    def test_cancel_running_review_keeps_partial_results(self, queue, db_session):
+        """测试运行中的审查被worker中止，进行中的调用被取消，已识别的风险保留"""
+        from app.models import ReviewJob, Risk, Task
+        from app.services.review_queue import ReviewWorker
+        from tests.conftest import TestingSessionLocal
+        
+        task_id = self._task(db_session)
+        queue.enqueue(task_id)
+        call_cancelled = []
+        notified = []
+        
+        async def run_review(task_id, use_cache=True):
+            session = TestingSessionLocal()
+            session.add(Risk(task_id=task_id, title="付款期限风险", risk_level="HIGH", summary="", suggestion=""))
+            session.commit()
+            session.close()
+            try:
+                # 模拟进行中的LLM请求
+                await asyncio.sleep(30)
+            except asyncio.CancelledError:
+                call_cancelled.append(task_id)
+                raise
+        
+        async def on_cancelled(task_id):
+            notified.append(task_id)
+        
+        async def run():
+            worker = ReviewWorker(run_review, queue=queue, concurrency=1, on_cancelled=on_cancelled)
+            await worker.run_once()
+            await asyncio.sleep(0.05)
+            assert queue.cancel(task_id)["status"] == "RUNNING"
+            await worker.run_once()
+            await asyncio.wait_for(worker.drain(), timeout=5)
+        
+        asyncio.run(run())
+        db_session.expire_all()
+        
+        assert call_cancelled == [task_id] and notified == [task_id]
+        assert db_session.get(Task, task_id).status == "CANCELLED"
+        assert db_session.query(ReviewJob).filter(ReviewJob.task_id == task_id).one().status == "CANCELLED"
+        assert db_session.query(Risk).filter(Risk.task_id == task_id).count() == 1
+    
+    def test_cancel_terminates_running_process_pool_work(self, monkeypatch):
+        """测试取消时终止已在子进程中运行的计算，之后的调用使用新的进程池"""
+        import time
+        import app.services.executors as executors
+        
+        monkeypatch.setenv("CPU_POOL_WORKERS", "1")
+        
+        async def run():
+            pending = asyncio.ensure_future(executors.run_cpu_bound(time.sleep, 30))
+            while executors._process_pool is None or not executors._process_pool._processes:
+                await asyncio.sleep(0.05)
+            await asyncio.sleep(1)
+            pending.cancel()
+            start = time.perf_counter()
+            with pytest.raises(asyncio.CancelledError):
+                await pending
+            return time.perf_counter() - start, await executors.run_cpu_bound(os.getpid)
+        
+        try:
+            elapsed, child_pid = asyncio.run(run())
+        finally:
+            executors.shutdown_executors()
+        
+        assert elapsed < 5
+        assert child_pid != os.getpid()
+
+
+@pytest.mark.unit
+class TestReviewBudget:
+    """审查时间预算和降级单元测试"""
+    
+    @pytest.fixture
+    def budget_db(self, patched_session_local, make_task, monkeypatch):
+        import app.services.review_service as review_service_module
+        
+        monkeypatch.setenv("CPU_POOL_WORKERS", "0")
+        monkeypatch.setenv("REVIEW_RULES_RESERVE_SECONDS", "0")
+        monkeypatch.setenv("REVIEW_DEGRADE_THRESHOLD_SECONDS", "0")
+        for method in ("send_progress", "send_completion", "send_error"):
+            monkeypatch.setattr(review_service_module.manager, method, AsyncMock())
+        return make_task(ocr_text="第一条 乙方逾期交付的，按日支付违约金。")
+    
+    async def _hang(self, *args, **kwargs):
+        await asyncio.sleep(30)
+    
+    def _paragraph(self, paragraph_id, text):
+        from app.models import Paragraph
+        return Paragraph(id=paragraph_id, text=text, paragraph_index=paragraph_id)
+    
+    def test_analysis_level_follows_remaining_budget(self, monkeypatch):
+        """测试剩余时间不足时依次降级为reduced和rules，阶段超时不超过剩余预算"""
+        from app.services.review_budget import ReviewBudget
+        
+        monkeypatch.setenv("REVIEW_DEGRADE_THRESHOLD_SECONDS", "180")
+        monkeypatch.setenv("REVIEW_RULES_RESERVE_SECONDS", "30")
+        
+        assert ReviewBudget(sla_seconds=900).analysis_level() == "full"
+        assert ReviewBudget(sla_seconds=100).analysis_level() == "reduced"
+        assert ReviewBudget(sla_seconds=20).analysis_level() == "rules"
+        budget = ReviewBudget(sla_seconds=100, stage_deadlines={"analysis": 600, "ocr": 10})
+        assert budget.timeout_for("ocr") <= 10
+        assert 60 < budget.timeout_for("analysis", reserve=30) <= 70
+    
+    def test_rule_based_risks_skip_covered_categories(self):
+        """测试规则标记按关注领域生成风险，已被风险覆盖的领域不重复标记"""
+        from app.services.risk_analysis import rule_based_risks, select_chunks_by_keywords
+        
+        paragraphs = [
+            self._paragraph(1, "第一条 合同价款为十万元。"),
+            self._paragraph(2, "第二条 乙方逾期交付的，按日支付违约金。"),
+            self._paragraph(3, "第三条 争议提交仲裁委员会仲裁。"),
+        ]
+        
+        risks = rule_based_risks(paragraphs, covered_refs=[3])
+        
+        assert {risk["title"] for risk in risks} == {"付款条款和违约责任需人工复核", "交付时间和质量标准需人工复核"}
+        assert all(risk["paragraph_refs"] == [2] for risk in risks)
+        assert select_chunks_by_keywords([[p] for p in paragraphs], 2) == [[paragraphs[1]], [paragraphs[2]]]
+    
+    def test_inner_timeout_is_not_a_budget_overrun(self):
+        """测试执行中抛出的asyncio.TimeoutError原样抛出，不被当作阶段截止时间到期"""
+        from app.services.review_budget import ReviewBudget, StageDeadlineExceeded
+        
+        async def llm_call_timed_out():
+            raise asyncio.TimeoutError()
+        
+        budget = ReviewBudget(sla_seconds=60, stage_deadlines={"analysis": 30})
+        with pytest.raises(asyncio.TimeoutError) as exc_info:
+            asyncio.run(budget.run("analysis", llm_call_timed_out()))
+        assert not isinstance(exc_info.value, StageDeadlineExceeded)
+    
+    def test_stage_deadline_raises_stage_deadline_exceeded(self):
+        """测试阶段截止时间到期时取消执行并抛出StageDeadlineExceeded"""
+        from app.services.review_budget import ReviewBudget, StageDeadlineExceeded
+        
+        cancelled = []
+        
+        async def hang():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+        
+        budget = ReviewBudget(sla_seconds=60, stage_deadlines={"analysis": 0.1})
+        with pytest.raises(StageDeadlineExceeded):
+            asyncio.run(budget.run("analysis", hang()))
+        assert cancelled == [True]
+    
+    def test_hung_analysis_degrades_to_rules(self, review_service, budget_db, db_session, monkeypatch):
+        """测试风险分析超出截止时间时取消LLM分析，按规则标记后仍完成审查"""
+        import app.services.review_service as review_service_module
+        from app.services.review_budget import ReviewBudget
+        
+        rule_risk = {"id": 7, "title": "付款条款和违约责任需人工复核", "risk_level": "MEDIUM",
+                     "paragraph_refs": []}
+        fake_ai = MagicMock()
+        fake_ai.analysis_mode = "map_reduce"
+        fake_ai.avectorize_paragraphs = AsyncMock()
+        fake_ai.analyze_contract_risks_async = AsyncMock(side_effect=self._hang)
+        fake_ai.analyze_contract_risks_rules = AsyncMock(return_value=[rule_risk])
+        monkeypatch.setattr(review_service_module, "get_ai_service", lambda: fake_ai)
+        monkeypatch.setattr(review_service, "streaming_pipeline", False)
+        
+        budget = ReviewBudget(sla_seconds=60, stage_deadlines={"analysis": 0.2})
+        asyncio.run(review_service._run_review_pipeline(budget_db, budget))
+        
+        fake_ai.analyze_contract_risks_rules.assert_awaited_once()
+        review_service_module.manager.send_completion.assert_awaited_once()
+        assert review_service_module.manager.send_completion.await_args.args[1]["degraded"] == "rules"
+        result = review_service.get_review_result(budget_db)
+        assert result["status"] == "COMPLETED"
+        assert result["degraded"] == "rules"
+    
+    def test_stage_over_deadline_fails_review(self, review_service, budget_db, db_session, monkeypatch):
+        """测试没有降级方案的阶段超时后任务置为失败，而不是一直处于进行中"""
+        import app.services.review_service as review_service_module
+        from app.models import Task
+        
+        fake_ai = MagicMock()
+        fake_ai.analysis_mode = "map_reduce"
+        fake_ai.avectorize_paragraphs = AsyncMock(side_effect=self._hang)
+        monkeypatch.setattr(review_service_module, "get_ai_service", lambda: fake_ai)
+        monkeypatch.setattr(review_service, "streaming_pipeline", False)
+        monkeypatch.setenv("REVIEW_SLA_SECONDS", "0.3")
+        
+        asyncio.run(review_service.start_review(budget_db))
+        
+        db_session.expire_all()
+        assert db_session.get(Task, budget_db).status == "FAILED"
+        review_service_module.manager.send_error.assert_awaited_once()
+
+
+@pytest.mark.unit
+class TestMaterializedReviewResult:
+    """审查结果预加载和物化单元测试"""
+    
+    def _risks(self, db_session, task_id, risks_count):
+        from app.models import Risk, Statute
+        
+        for i in range(risks_count):
+            risk = Risk(task_id=task_id, title=f"风险{i}", risk_level="HIGH", summary="", suggestion="")
+            db_session.add(risk)
+            db_session.flush()
+            db_session.add_all([Statute(risk_id=risk.id, statute_ref=f"《民法典》第{i}{j}条", statute_text="")
+                                for j in range(2)])
+        db_session.commit()
+    
+    def _count_queries(self, fn):
+        from sqlalchemy import event
+        from tests.conftest import engine
+        
+        statements = []
+        
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+        
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+        try:
+            result = fn()
+        finally:
+            event.remove(engine, "before_cursor_execute", before_cursor_execute)
+        return result, statements
+    
+    def test_live_result_query_count_is_independent_of_risks(self, review_service, patched_session_local, make_task):
+        """测试实时组装审查结果时法规引用一次预加载，查询数不随风险数增长"""
+        few_id = make_task(status="IN_PROGRESS", with_file=False)
+        many_id = make_task(status="IN_PROGRESS", with_file=False)
+        self._risks(patched_session_local, few_id, 1)
+        self._risks(patched_session_local, many_id, 5)
+        
+        _, few_queries = self._count_queries(lambda: review_service.get_review_result(few_id))
+        result, many_queries = self._count_queries(lambda: review_service.get_review_result(many_id))
+        
+        assert len(many_queries) == len(few_queries)
+        assert len(result["risks"]) == 5
+        assert [s["ref"] for s in result["risks"][4]["statutes"]] == ["《民法典》第40条", "《民法典》第41条"]
+    
+    def test_completed_task_serves_materialized_result(self, review_service, patched_session_local, make_task):
+        """测试完成时物化审查结果，之后按主键单次读取"""
+        task_id = make_task(status="IN_PROGRESS", with_file=False)
+        self._risks(patched_session_local, task_id, 3)
+        
+        review_service._complete_task(task_id)
+        result, queries = self._count_queries(lambda: review_service.get_review_result(task_id))
+        content, raw_queries = self._count_queries(
+            lambda: review_service.load_review_result_json(patched_session_local, task_id)
+        )
+        
+        assert result["status"] == "COMPLETED"
+        assert result["summary"]["high_risks"] == 3
+        assert len(queries) == 1 and len(raw_queries) == 1
+        assert json.loads(content) == result